@@ -12,7 +12,14 @@ sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
 from app.core.config import settings
 from app.db.base import Base
-from app.db.models import Session, Message, DiagnosticResult  # Import all models
+from app.db.models import (  # Import all models
+    Session,
+    Message,
+    DiagnosticResult,
+    GraphCheckpoint,
+    GraphCheckpointBlob,
+    GraphCheckpointWrite,
+)
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,67 @@
+"""graph checkpoints
+
+Revision ID: 002
+Revises: 001
+Create Date: 2024-02-10 00:02:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '002'
+down_revision: Union[str, None] = '001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Create graph_checkpoints table
+    op.create_table(
+        'graph_checkpoints',
+        sa.Column('thread_id', sa.String(), nullable=False),
+        sa.Column('checkpoint_ns', sa.String(), nullable=False),
+        sa.Column('checkpoint_id', sa.String(), nullable=False),
+        sa.Column('parent_checkpoint_id', sa.String(), nullable=True),
+        sa.Column('checkpoint_type', sa.String(), nullable=False),
+        sa.Column('checkpoint', sa.LargeBinary(), nullable=False),
+        sa.Column('metadata_type', sa.String(), nullable=False),
+        sa.Column('metadata', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('thread_id', 'checkpoint_ns', 'checkpoint_id')
+    )
+
+    # Create graph_checkpoint_blobs table
+    op.create_table(
+        'graph_checkpoint_blobs',
+        sa.Column('thread_id', sa.String(), nullable=False),
+        sa.Column('checkpoint_ns', sa.String(), nullable=False),
+        sa.Column('channel', sa.String(), nullable=False),
+        sa.Column('version', sa.String(), nullable=False),
+        sa.Column('value_type', sa.String(), nullable=False),
+        sa.Column('blob', sa.LargeBinary(), nullable=True),
+        sa.PrimaryKeyConstraint('thread_id', 'checkpoint_ns', 'channel', 'version')
+    )
+
+    # Create graph_checkpoint_writes table
+    op.create_table(
+        'graph_checkpoint_writes',
+        sa.Column('thread_id', sa.String(), nullable=False),
+        sa.Column('checkpoint_ns', sa.String(), nullable=False),
+        sa.Column('checkpoint_id', sa.String(), nullable=False),
+        sa.Column('task_id', sa.String(), nullable=False),
+        sa.Column('idx', sa.Integer(), nullable=False),
+        sa.Column('channel', sa.String(), nullable=False),
+        sa.Column('value_type', sa.String(), nullable=False),
+        sa.Column('blob', sa.LargeBinary(), nullable=True),
+        sa.PrimaryKeyConstraint('thread_id', 'checkpoint_ns', 'checkpoint_id', 'task_id', 'idx')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('graph_checkpoint_writes')
+    op.drop_table('graph_checkpoint_blobs')
+    op.drop_table('graph_checkpoints')
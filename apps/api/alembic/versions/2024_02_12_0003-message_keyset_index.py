@@ -0,0 +1,26 @@
+"""message keyset index
+
+Revision ID: 003
+Revises: 002
+Create Date: 2024-02-12 00:03:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '003'
+down_revision: Union[str, None] = '002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Keyset pagination of messages by (session_id, id)
+    op.create_index('ix_messages_session_id_id', 'messages', ['session_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_session_id_id', table_name='messages')
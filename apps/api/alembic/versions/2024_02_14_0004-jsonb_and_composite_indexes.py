@@ -0,0 +1,85 @@
+"""jsonb and composite indexes
+
+Revision ID: 004
+Revises: 003
+Create Date: 2024-02-14 00:04:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '004'
+down_revision: Union[str, None] = '003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+JSON_COLUMNS = [
+    ('sessions', 'patient_info', True),
+    ('messages', 'images', True),
+    ('messages', 'message_metadata', True),
+    ('diagnostic_results', 'assessment_json', False),
+]
+
+
+def upgrade() -> None:
+    # JSON -> JSONB
+    for table, column, nullable in JSON_COLUMNS:
+        op.alter_column(
+            table,
+            column,
+            type_=postgresql.JSONB(),
+            existing_type=sa.JSON(),
+            existing_nullable=nullable,
+            postgresql_using=f'{column}::jsonb',
+        )
+
+    # Composite indexes for the ordered per-session / per-user reads
+    op.create_index('ix_messages_session_id_timestamp', 'messages', ['session_id', 'timestamp'], unique=False)
+    op.create_index(
+        'ix_diagnostic_results_session_id_created_at',
+        'diagnostic_results',
+        ['session_id', sa.text('created_at DESC')],
+        unique=False,
+    )
+    op.create_index('ix_sessions_user_id_updated_at', 'sessions', ['user_id', 'updated_at'], unique=False)
+
+    # Assessments by differential name (containment on the differentials array)
+    op.create_index(
+        'ix_diagnostic_results_differentials',
+        'diagnostic_results',
+        [sa.text("(assessment_json -> 'differentials') jsonb_path_ops")],
+        unique=False,
+        postgresql_using='gin',
+    )
+
+    # Single-column indexes made redundant by the composites above
+    op.drop_index('ix_messages_session_id', table_name='messages')
+    op.drop_index('ix_diagnostic_results_session_id', table_name='diagnostic_results')
+    op.drop_index('ix_sessions_user_id', table_name='sessions')
+
+
+def downgrade() -> None:
+    op.create_index('ix_sessions_user_id', 'sessions', ['user_id'], unique=False)
+    op.create_index('ix_diagnostic_results_session_id', 'diagnostic_results', ['session_id'], unique=False)
+    op.create_index('ix_messages_session_id', 'messages', ['session_id'], unique=False)
+
+    op.drop_index('ix_diagnostic_results_differentials', table_name='diagnostic_results')
+    op.drop_index('ix_sessions_user_id_updated_at', table_name='sessions')
+    op.drop_index('ix_diagnostic_results_session_id_created_at', table_name='diagnostic_results')
+    op.drop_index('ix_messages_session_id_timestamp', table_name='messages')
+
+    for table, column, nullable in JSON_COLUMNS:
+        op.alter_column(
+            table,
+            column,
+            type_=sa.JSON(),
+            existing_type=postgresql.JSONB(),
+            existing_nullable=nullable,
+            postgresql_using=f'{column}::json',
+        )
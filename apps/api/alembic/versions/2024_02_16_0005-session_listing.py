@@ -0,0 +1,52 @@
+"""session listing
+
+Revision ID: 005
+Revises: 004
+Create Date: 2024-02-16 00:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '005'
+down_revision: Union[str, None] = '004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'sessions',
+        sa.Column('has_critical_red_flags', sa.Boolean(), server_default=sa.text('false'), nullable=False),
+    )
+
+    # Backfill from the stored assessments
+    op.execute("""
+        UPDATE sessions SET has_critical_red_flags = true
+        WHERE id IN (
+            SELECT session_id FROM diagnostic_results
+            WHERE assessment_json -> 'red_flags' @> '[{"severity": "critical"}]'::jsonb
+        )
+    """)
+
+    # Keyset listing on (updated_at, id)
+    op.create_index('ix_sessions_updated_at_id', 'sessions', ['updated_at', 'id'], unique=False)
+    op.create_index('ix_sessions_status_updated_at_id', 'sessions', ['status', 'updated_at', 'id'], unique=False)
+    op.create_index(
+        'ix_sessions_critical_updated_at_id',
+        'sessions',
+        ['updated_at', 'id'],
+        unique=False,
+        postgresql_where=sa.text('has_critical_red_flags'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sessions_critical_updated_at_id', table_name='sessions')
+    op.drop_index('ix_sessions_status_updated_at_id', table_name='sessions')
+    op.drop_index('ix_sessions_updated_at_id', table_name='sessions')
+    op.drop_column('sessions', 'has_critical_red_flags')
@@ -0,0 +1,70 @@
+"""assessment analytics
+
+Revision ID: 006
+Revises: 005
+Create Date: 2024-02-18 00:06:00.000000
+
+Existing diagnostic results are not backfilled here; load their facts with
+`python -m app.services.analytics --backfill` after upgrading.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '006'
+down_revision: Union[str, None] = '005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('sessions', sa.Column('clinic_id', sa.String(), nullable=True))
+
+    fact_kind = sa.Enum('DIFFERENTIAL', 'RED_FLAG', 'ACTION', name='factkind')
+
+    op.create_table(
+        'assessment_facts',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('diagnostic_result_id', sa.Integer(), nullable=False),
+        sa.Column('session_id', sa.String(), nullable=False),
+        sa.Column('clinic_id', sa.String(), nullable=True),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('kind', fact_kind, nullable=False),
+        sa.Column('label', sa.String(length=255), nullable=False),
+        sa.Column('level', sa.String(length=16), nullable=False),
+        sa.Column('likelihood', sa.Integer(), nullable=True),
+        sa.Column('rank', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['diagnostic_result_id'], ['diagnostic_results.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_assessment_facts_diagnostic_result_id'), 'assessment_facts', ['diagnostic_result_id'], unique=False)
+    op.create_index('ix_assessment_facts_kind_day', 'assessment_facts', ['kind', 'day'], unique=False)
+
+    op.create_table(
+        'assessment_daily_stats',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('clinic_id', sa.String(), server_default='', nullable=False),
+        sa.Column('kind', fact_kind, nullable=False),
+        sa.Column('level', sa.String(length=16), nullable=False),
+        sa.Column('label', sa.String(length=255), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('likelihood_sum', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('kind', 'day', 'clinic_id', 'level', 'label', name='uq_assessment_daily_stats_key')
+    )
+    op.create_index('ix_assessment_daily_stats_clinic_kind_day', 'assessment_daily_stats', ['clinic_id', 'kind', 'day'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_assessment_daily_stats_clinic_kind_day', table_name='assessment_daily_stats')
+    op.drop_table('assessment_daily_stats')
+    op.drop_index('ix_assessment_facts_kind_day', table_name='assessment_facts')
+    op.drop_index(op.f('ix_assessment_facts_diagnostic_result_id'), table_name='assessment_facts')
+    op.drop_table('assessment_facts')
+    sa.Enum(name='factkind').drop(op.get_bind(), checkfirst=True)
+    op.drop_column('sessions', 'clinic_id')
@@ -0,0 +1,81 @@
+"""full text search
+
+Revision ID: 007
+Revises: 006
+Create Date: 2024-02-20 00:07:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '007'
+down_revision: Union[str, None] = '006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'sessions',
+        sa.Column('symptoms', postgresql.JSONB(astext_type=sa.Text()), server_default=sa.text("'[]'"), nullable=False),
+    )
+
+    op.create_table(
+        'search_documents',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('session_id', sa.String(), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=True),
+        sa.Column('diagnostic_result_id', sa.Integer(), nullable=True),
+        sa.Column('source', sa.String(length=20), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(['session_id'], ['sessions.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['message_id'], ['messages.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['diagnostic_result_id'], ['diagnostic_results.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_search_documents_session_id'), 'search_documents', ['session_id'], unique=False)
+    op.create_index(op.f('ix_search_documents_message_id'), 'search_documents', ['message_id'], unique=False)
+    op.create_index(op.f('ix_search_documents_diagnostic_result_id'), 'search_documents', ['diagnostic_result_id'], unique=False)
+
+    # Backfill from existing transcripts and assessments (symptom lists were
+    # not stored before this revision)
+    op.execute("""
+        INSERT INTO search_documents (session_id, message_id, source, content)
+        SELECT session_id, id, CASE role WHEN 'USER' THEN 'user_message' ELSE 'assistant_message' END, content
+        FROM messages
+        WHERE content <> ''
+    """)
+    op.execute("""
+        INSERT INTO search_documents (session_id, diagnostic_result_id, source, content)
+        SELECT r.session_id, r.id, 'diagnosis', string_agg(dx ->> 'name', '. ' ORDER BY position)
+        FROM diagnostic_results r
+        CROSS JOIN LATERAL jsonb_array_elements(
+            CASE jsonb_typeof(r.assessment_json -> 'differentials')
+                WHEN 'array' THEN r.assessment_json -> 'differentials' ELSE '[]'::jsonb END
+        ) WITH ORDINALITY AS d(dx, position)
+        WHERE jsonb_typeof(dx) = 'object' AND coalesce(dx ->> 'name', '') <> ''
+        GROUP BY r.session_id, r.id
+    """)
+
+    # Built after the backfill: one pass instead of per-row index updates
+    op.create_index(
+        'ix_search_documents_content_tsv',
+        'search_documents',
+        [sa.text("to_tsvector('spanish', translate(content, 'ÁÉÍÓÚÜáéíóúü', 'AEIOUUaeiouu'))")],
+        unique=False,
+        postgresql_using='gin',
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_search_documents_content_tsv', table_name='search_documents')
+    op.drop_index(op.f('ix_search_documents_diagnostic_result_id'), table_name='search_documents')
+    op.drop_index(op.f('ix_search_documents_message_id'), table_name='search_documents')
+    op.drop_index(op.f('ix_search_documents_session_id'), table_name='search_documents')
+    op.drop_table('search_documents')
+    op.drop_column('sessions', 'symptoms')
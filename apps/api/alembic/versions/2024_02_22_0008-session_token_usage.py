@@ -0,0 +1,38 @@
+"""session token usage
+
+Revision ID: 008
+Revises: 007
+Create Date: 2024-02-22 00:08:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '008'
+down_revision: Union[str, None] = '007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('sessions', sa.Column('input_tokens', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('sessions', sa.Column('output_tokens', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('sessions', sa.Column('llm_calls', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('sessions', sa.Column('cost_usd', sa.Float(), server_default=sa.text('0'), nullable=False))
+    op.add_column(
+        'sessions',
+        sa.Column('token_usage', postgresql.JSONB(), server_default=sa.text("'{}'"), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('sessions', 'token_usage')
+    op.drop_column('sessions', 'cost_usd')
+    op.drop_column('sessions', 'llm_calls')
+    op.drop_column('sessions', 'output_tokens')
+    op.drop_column('sessions', 'input_tokens')
@@ -0,0 +1,33 @@
+"""coordination flags
+
+Revision ID: 009
+Revises: 008
+Create Date: 2024-02-24 00:09:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '009'
+down_revision: Union[str, None] = '008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Unlogged: the flags expire within seconds, no need to WAL-log them
+    op.create_table(
+        'coordination_flags',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+        prefixes=['UNLOGGED'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('coordination_flags')
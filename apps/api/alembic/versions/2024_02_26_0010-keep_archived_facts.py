@@ -0,0 +1,38 @@
+"""keep archived facts
+
+Revision ID: 010
+Revises: 009
+Create Date: 2024-02-26 00:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '010'
+down_revision: Union[str, None] = '009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Facts outlive their archived results (the rollup is rebuilt from them)
+    op.drop_constraint('assessment_facts_diagnostic_result_id_fkey', 'assessment_facts', type_='foreignkey')
+    op.alter_column('assessment_facts', 'diagnostic_result_id', existing_type=sa.Integer(), nullable=True)
+    op.create_foreign_key(
+        'assessment_facts_diagnostic_result_id_fkey', 'assessment_facts', 'diagnostic_results',
+        ['diagnostic_result_id'], ['id'], ondelete='SET NULL'
+    )
+
+
+def downgrade() -> None:
+    op.execute('DELETE FROM assessment_facts WHERE diagnostic_result_id IS NULL')
+    op.drop_constraint('assessment_facts_diagnostic_result_id_fkey', 'assessment_facts', type_='foreignkey')
+    op.alter_column('assessment_facts', 'diagnostic_result_id', existing_type=sa.Integer(), nullable=False)
+    op.create_foreign_key(
+        'assessment_facts_diagnostic_result_id_fkey', 'assessment_facts', 'diagnostic_results',
+        ['diagnostic_result_id'], ['id'], ondelete='CASCADE'
+    )
@@ -0,0 +1,32 @@
+"""session last activity
+
+Revision ID: 011
+Revises: 010
+Create Date: 2024-02-28 00:11:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '011'
+down_revision: Union[str, None] = '010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Retention counts from the last activity, so updated_at can move with
+    # maintenance status changes (and reach incremental exports)
+    op.add_column('sessions', sa.Column('last_activity_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE sessions SET last_activity_at = updated_at')
+    op.alter_column('sessions', 'last_activity_at', existing_type=sa.DateTime(), nullable=False)
+    op.create_index('ix_sessions_status_last_activity_at', 'sessions', ['status', 'last_activity_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sessions_status_last_activity_at', table_name='sessions')
+    op.drop_column('sessions', 'last_activity_at')
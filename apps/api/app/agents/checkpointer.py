@@ -0,0 +1,408 @@
+"""
+Checkpointer: Durable LangGraph checkpoints stored through SQLAlchemy.
+
+Checkpoints are keyed by thread_id (the session id). Each checkpoint row
+stores only channel versions; channel values are stored once per
+(channel, version) in graph_checkpoint_blobs, so a step writes just the
+channels it changed. Pending task writes are stored too, which lets an
+interrupted run resume without re-running the nodes that already finished.
+
+Works with the application's async engine (PostgreSQL/asyncpg) or with a
+separate SQLite database (aiosqlite) for local runs.
+"""
+
+import asyncio
+import random
+from typing import Any, AsyncIterator, Dict, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+from langgraph.checkpoint.serde.types import TASKS, ChannelProtocol
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core import tracing
+from app.core.config import settings
+from app.db.models import GraphCheckpoint, GraphCheckpointBlob, GraphCheckpointWrite
+
+
+class SQLAlchemyCheckpointSaver(BaseCheckpointSaver[str]):
+    """Async checkpoint saver on top of a SQLAlchemy async engine"""
+
+    def __init__(self, engine: AsyncEngine, create_tables: bool = False):
+        super().__init__()
+        self.engine = engine
+        self.create_tables = create_tables
+        self._setup_lock = asyncio.Lock()
+        self._is_setup = not create_tables
+
+    async def setup(self) -> None:
+        """Create the checkpoint tables (standalone databases only; the main DB uses Alembic)"""
+        if self._is_setup:
+            return
+        async with self._setup_lock:
+            if self._is_setup:
+                return
+            async with self.engine.begin() as conn:
+                await conn.run_sync(
+                    GraphCheckpoint.metadata.create_all,
+                    tables=[
+                        GraphCheckpoint.__table__,
+                        GraphCheckpointBlob.__table__,
+                        GraphCheckpointWrite.__table__,
+                    ],
+                )
+            self._is_setup = True
+
+    def _insert(self, model):
+        if self.engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif self.engine.dialect.name == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise ValueError(f"Unsupported checkpoint database dialect: {self.engine.dialect.name}")
+        return insert(model.__table__)
+
+    # ----- Versions -----
+
+    def get_next_version(self, current: Optional[str], channel: ChannelProtocol) -> str:
+        """Zero-padded versions sort lexicographically, which pruning relies on"""
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # ----- Reads -----
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        await self.setup()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+
+        query = select(GraphCheckpoint.__table__).where(
+            GraphCheckpoint.thread_id == thread_id,
+            GraphCheckpoint.checkpoint_ns == checkpoint_ns,
+        )
+        if checkpoint_id:
+            query = query.where(GraphCheckpoint.checkpoint_id == checkpoint_id)
+        else:
+            query = query.order_by(GraphCheckpoint.checkpoint_id.desc()).limit(1)
+
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(query)).first()
+            if row is None:
+                return None
+            return await self._load_tuple(conn, row)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        await self.setup()
+        query = select(GraphCheckpoint.__table__).order_by(GraphCheckpoint.checkpoint_id.desc())
+        if config:
+            query = query.where(GraphCheckpoint.thread_id == config["configurable"]["thread_id"])
+            checkpoint_ns = config["configurable"].get("checkpoint_ns")
+            if checkpoint_ns is not None:
+                query = query.where(GraphCheckpoint.checkpoint_ns == checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                query = query.where(GraphCheckpoint.checkpoint_id == checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query = query.where(GraphCheckpoint.checkpoint_id < before_id)
+        # Metadata filters are applied after deserialization, so only push the
+        # limit down when there is nothing to filter
+        if limit is not None and not filter:
+            query = query.limit(limit)
+
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(query)).all()
+            for row in rows:
+                if limit is not None and limit <= 0:
+                    break
+                if filter:
+                    metadata = self.serde.loads_typed((row.metadata_type, row._mapping["metadata"]))
+                    if not all(metadata.get(key) == value for key, value in filter.items()):
+                        continue
+                if limit is not None:
+                    limit -= 1
+                yield await self._load_tuple(conn, row)
+
+    async def _load_tuple(self, conn, row) -> CheckpointTuple:
+        checkpoint = self.serde.loads_typed((row.checkpoint_type, row.checkpoint))
+        channel_versions = checkpoint["channel_versions"]
+
+        # Channel values for this checkpoint's versions, in one query
+        channel_values = {}
+        if channel_versions:
+            blob_rows = await conn.execute(
+                select(GraphCheckpointBlob.__table__).where(
+                    GraphCheckpointBlob.thread_id == row.thread_id,
+                    GraphCheckpointBlob.checkpoint_ns == row.checkpoint_ns,
+                    or_(*[
+                        and_(
+                            GraphCheckpointBlob.channel == channel,
+                            GraphCheckpointBlob.version == str(version),
+                        )
+                        for channel, version in channel_versions.items()
+                    ]),
+                )
+            )
+            for blob in blob_rows:
+                if blob.value_type != "empty":
+                    channel_values[blob.channel] = self.serde.loads_typed((blob.value_type, blob.blob))
+
+        # Pending writes of this checkpoint, and sends queued by its parent
+        checkpoint_ids = [row.checkpoint_id]
+        if row.parent_checkpoint_id:
+            checkpoint_ids.append(row.parent_checkpoint_id)
+        write_rows = await conn.execute(
+            select(GraphCheckpointWrite.__table__).where(
+                GraphCheckpointWrite.thread_id == row.thread_id,
+                GraphCheckpointWrite.checkpoint_ns == row.checkpoint_ns,
+                GraphCheckpointWrite.checkpoint_id.in_(checkpoint_ids),
+            ).order_by(GraphCheckpointWrite.task_id, GraphCheckpointWrite.idx)
+        )
+        pending_writes = []
+        pending_sends = []
+        for write in write_rows:
+            value = self.serde.loads_typed((write.value_type, write.blob))
+            if write.checkpoint_id == row.checkpoint_id:
+                pending_writes.append((write.task_id, write.channel, value))
+            elif write.channel == TASKS:
+                pending_sends.append(value)
+
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": row.thread_id,
+                    "checkpoint_ns": row.checkpoint_ns,
+                    "checkpoint_id": row.checkpoint_id,
+                }
+            },
+            checkpoint={
+                **checkpoint,
+                "channel_values": channel_values,
+                "pending_sends": pending_sends,
+            },
+            metadata=self.serde.loads_typed((row.metadata_type, row._mapping["metadata"])),
+            parent_config={
+                "configurable": {
+                    "thread_id": row.thread_id,
+                    "checkpoint_ns": row.checkpoint_ns,
+                    "checkpoint_id": row.parent_checkpoint_id,
+                }
+            } if row.parent_checkpoint_id else None,
+            pending_writes=pending_writes,
+        )
+
+    # ----- Writes -----
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_checkpoint_id = config["configurable"].get("checkpoint_id")
+
+        # Serialize the new channel versions only; the other channels' blobs
+        # are already stored under their current version.
+        with tracing.span("checkpoint.serialize", session_id=thread_id) as current:
+            values = checkpoint["channel_values"]
+            blobs = []
+            for channel, version in new_versions.items():
+                if channel in values:
+                    value_type, blob = self.serde.dumps_typed(values[channel])
+                else:
+                    value_type, blob = "empty", None
+                blobs.append({
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "channel": channel,
+                    "version": str(version),
+                    "value_type": value_type,
+                    "blob": blob,
+                })
+            stored = {k: v for k, v in checkpoint.items() if k not in ("channel_values", "pending_sends")}
+            checkpoint_type, checkpoint_blob = self.serde.dumps_typed(stored)
+            metadata_type, metadata_blob = self.serde.dumps_typed(metadata)
+            tracing.set_attributes(current, {
+                "checkpoint.channels": len(blobs),
+                "checkpoint.bytes": len(checkpoint_blob) + sum(len(b["blob"] or b"") for b in blobs),
+            })
+
+        await self.setup()
+        async with self.engine.begin() as conn:
+            if blobs:
+                await conn.execute(
+                    self._insert(GraphCheckpointBlob).values(blobs).on_conflict_do_nothing()
+                )
+            insert_checkpoint = self._insert(GraphCheckpoint).values(
+                thread_id=thread_id,
+                checkpoint_ns=checkpoint_ns,
+                checkpoint_id=checkpoint["id"],
+                parent_checkpoint_id=parent_checkpoint_id,
+                checkpoint_type=checkpoint_type,
+                checkpoint=checkpoint_blob,
+                metadata_type=metadata_type,
+                metadata=metadata_blob,
+            )
+            await conn.execute(
+                insert_checkpoint.on_conflict_do_update(
+                    index_elements=["thread_id", "checkpoint_ns", "checkpoint_id"],
+                    set_={
+                        "checkpoint_type": insert_checkpoint.excluded.checkpoint_type,
+                        "checkpoint": insert_checkpoint.excluded.checkpoint,
+                        "metadata_type": insert_checkpoint.excluded.metadata_type,
+                        "metadata": insert_checkpoint.excluded["metadata"],
+                    },
+                )
+            )
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+    ) -> None:
+        if not writes:
+            return
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            value_type, blob = self.serde.dumps_typed(value)
+            rows.append({
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint_id,
+                "task_id": task_id,
+                "idx": WRITES_IDX_MAP.get(channel, idx),
+                "channel": channel,
+                "value_type": value_type,
+                "blob": blob,
+            })
+
+        await self.setup()
+        async with self.engine.begin() as conn:
+            insert_writes = self._insert(GraphCheckpointWrite).values(rows)
+            await conn.execute(
+                insert_writes.on_conflict_do_update(
+                    index_elements=["thread_id", "checkpoint_ns", "checkpoint_id", "task_id", "idx"],
+                    set_={
+                        "channel": insert_writes.excluded.channel,
+                        "value_type": insert_writes.excluded.value_type,
+                        "blob": insert_writes.excluded.blob,
+                    },
+                )
+            )
+
+    async def aprune(self, thread_id: str, keep: int, checkpoint_ns: str = "") -> int:
+        """
+        Delete all but the latest `keep` checkpoints of a thread, with their
+        writes and any channel blobs no retained checkpoint references.
+
+        Returns:
+            Number of checkpoints deleted
+        """
+        await self.setup()
+        async with self.engine.begin() as conn:
+            rows = (await conn.execute(
+                select(GraphCheckpoint.checkpoint_id, GraphCheckpoint.checkpoint_type, GraphCheckpoint.checkpoint)
+                .where(
+                    GraphCheckpoint.thread_id == thread_id,
+                    GraphCheckpoint.checkpoint_ns == checkpoint_ns,
+                )
+                .order_by(GraphCheckpoint.checkpoint_id.desc())
+            )).all()
+            if len(rows) <= keep:
+                return 0
+
+            retained, stale = rows[:keep], [row.checkpoint_id for row in rows[keep:]]
+            for model in (GraphCheckpointWrite, GraphCheckpoint):
+                await conn.execute(
+                    delete(model).where(
+                        model.thread_id == thread_id,
+                        model.checkpoint_ns == checkpoint_ns,
+                        model.checkpoint_id.in_(stale),
+                    )
+                )
+
+            # Blob versions increase monotonically per channel: anything older
+            # than the oldest version still referenced can go
+            oldest_referenced: Dict[str, str] = {}
+            for row in retained:
+                versions = self.serde.loads_typed((row.checkpoint_type, row.checkpoint))["channel_versions"]
+                for channel, version in versions.items():
+                    version = str(version)
+                    if channel not in oldest_referenced or version < oldest_referenced[channel]:
+                        oldest_referenced[channel] = version
+            if oldest_referenced:
+                await conn.execute(
+                    delete(GraphCheckpointBlob).where(
+                        GraphCheckpointBlob.thread_id == thread_id,
+                        GraphCheckpointBlob.checkpoint_ns == checkpoint_ns,
+                        or_(*[
+                            and_(GraphCheckpointBlob.channel == channel, GraphCheckpointBlob.version < version)
+                            for channel, version in oldest_referenced.items()
+                        ]),
+                    )
+                )
+            return len(stale)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        """Delete every checkpoint, write and blob of a thread"""
+        await self.setup()
+        async with self.engine.begin() as conn:
+            for model in (GraphCheckpointWrite, GraphCheckpointBlob, GraphCheckpoint):
+                await conn.execute(delete(model).where(model.thread_id == thread_id))
+
+
+def create_checkpointer() -> Optional[SQLAlchemyCheckpointSaver]:
+    """
+    Build the checkpointer from settings.
+
+    Returns None when checkpoints are disabled. With CHECKPOINT_DATABASE_URL
+    unset, checkpoints share the application engine (tables from Alembic);
+    otherwise a dedicated engine is used and tables are created on first use
+    (e.g. sqlite+aiosqlite:///./checkpoints.db for local runs).
+    """
+    if not settings.CHECKPOINTS_ENABLED:
+        return None
+
+    if settings.CHECKPOINT_DATABASE_URL:
+        from app.db.base import build_engine
+        engine = build_engine(settings.CHECKPOINT_DATABASE_URL, name="checkpoints", echo=False)
+        return SQLAlchemyCheckpointSaver(engine, create_tables=True)
+
+    from app.db.base import engine
+    return SQLAlchemyCheckpointSaver(engine)
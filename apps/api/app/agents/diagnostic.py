@@ -2,13 +2,36 @@
 Diagnostic Agent: Generates the final clinical assessment.
 """
 
-from typing import Dict, Any
-from langchain_openai import ChatOpenAI
+from typing import Dict, Any, Callable, List, Optional, TypeVar
 from langchain_core.messages import SystemMessage, HumanMessage
+from pydantic import BaseModel, ValidationError
 from app.core.config import settings
+from app.agents import events
+from app.agents.json_stream import ItemStream
+from app.agents.llm import ainvoke_llm, create_chat_model
 from app.agents.state import ConversationState
-from app.models.clinical import ClinicalAssessment
+from app.models.clinical import (
+    SOAP, ActionPlanItem, AssessmentPlan, AssessmentTriage, ClinicalAssessment, DifferentialDx, RedFlag
+)
+from app.services.similar_cases import SimilarCase, format_similar_cases, similar_case_index
+from app.agents.registry import lazy_singletons
+import asyncio
 import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Parts of the assessment sent to live clients as soon as they close in the
+# streamed completion (assessment_partial events), and their models. The
+# prompts ask for the red flags first so they are out before the long part
+PARTIAL_MODELS: Dict[str, type] = {
+    "differentials": DifferentialDx,
+    "red_flags": RedFlag,
+    "action_plan": ActionPlanItem,
+    "soap": SOAP,
+}
 
 DIAGNOSTIC_SYSTEM_PROMPT = """Sos un asistente clínico experto para profesionales de la salud.
 
@@ -45,8 +68,19 @@ REGLAS DE SALIDA:
 - Completá TODOS los campos del esquema con información relevante y específica
 """
 
-def build_diagnostic_prompt(state: ConversationState) -> str:
-    """Build the prompt for diagnostic generation"""
+def build_case_prompt(
+    state: ConversationState,
+    similar_cases: Optional[List[SimilarCase]] = None
+) -> str:
+    """
+    The case part of the diagnostic prompts: patient info, symptoms,
+    conversation, image analyses and similar cases.
+
+    Args:
+        state: Current conversation state
+        similar_cases: Past cases retrieved from the similar-case index, rendered
+            under SIMILAR_CASES_TOKEN_BUDGET
+    """
     
     # Extract patient data
     patient_info = state["patient_info"]
@@ -82,10 +116,27 @@ CONVERSACIÓN COMPLETA:
     if image_summaries:
         prompt += f"\n\nANÁLISIS DE IMÁGENES:\n" + "\n".join(image_summaries)
     
+    if similar_cases:
+        similar_text = format_similar_cases(similar_cases, settings.SIMILAR_CASES_TOKEN_BUDGET)
+        if similar_text:
+            prompt += (
+                "\n\nCASOS SIMILARES PREVIOS (solo como referencia, no asumir el mismo diagnóstico):\n"
+                + similar_text
+            )
+    
+    return prompt
+
+def build_diagnostic_prompt(
+    state: ConversationState,
+    similar_cases: Optional[List[SimilarCase]] = None
+) -> str:
+    """Build the prompt for diagnostic generation (the whole assessment in one call)"""
+    prompt = build_case_prompt(state, similar_cases)
     prompt += """
 
 Generá un objeto JSON que matchee este esquema (respetar claves exactamente y completar TODOS los campos):
 {
+  "red_flags": [{"severity":"critical|warning|info","message":"...","why_it_matters":"..."}],
   "differentials": [
     {
       "name": "...",
@@ -103,7 +154,6 @@ Generá un objeto JSON que matchee este esquema (respetar claves exactamente y c
       "treatment_summary": "resumen de las opciones terapéuticas disponibles (farmacológicas, procedimientos, etc)..."
     }
   ],
-  "red_flags": [{"severity":"critical|warning|info","message":"...","why_it_matters":"..."}],
   "missing_questions": ["preguntas que quedaron sin responder..."],
   "action_plan": [{"priority":"immediate|urgent|routine","action":"...","rationale":"..."}],
   "soap": {"subjective":"...","objective":"...","assessment":"...","plan":"..."},
@@ -120,15 +170,66 @@ IMPORTANTE:
     
     return prompt
 
+# Fan-out mode (DIAGNOSTIC_FANOUT_ENABLED): the case prompt comes first in
+# every section call, so the calls share a cacheable prefix
+
+# Fields of a differential decided by the triage call; the details call fills the rest
+TRIAGE_FIELDS = {"name", "likelihood", "reasoning", "urgency"}
+
+TRIAGE_INSTRUCTIONS = """
+
+Primera etapa: generá SOLO la lista priorizada de diagnósticos diferenciales y las red flags (los detalles de cada diagnóstico se piden aparte).
+Objeto JSON con este esquema (respetar claves exactamente):
+{
+  "red_flags": [{"severity":"critical|warning|info","message":"...","why_it_matters":"..."}],
+  "differentials": [{"name": "...", "likelihood": 0-100, "reasoning": "...", "urgency": "immediate|urgent|routine"}],
+  "missing_questions": ["preguntas que quedaron sin responder..."]
+}
+
+Ordená los diferenciales de mayor a menor likelihood y sé breve en el razonamiento.
+"""
+
+DETAILS_INSTRUCTIONS = """
+
+Ampliá el diagnóstico diferencial "{name}" (likelihood {likelihood}, urgencia {urgency}).
+Razonamiento: {reasoning}
+Otros diferenciales considerados: {others}
+
+Objeto JSON con este esquema (respetar claves exactamente y completar TODOS los campos):
+{{
+  "general_causes": ["causa médica 1", "etiología general..."],
+  "patient_specific_factors": ["factor específico del paciente como edad/comorbilidades/exposiciones..."],
+  "risk_factors": ["factor de riesgo identificado..."],
+  "supporting_findings": ["hallazgo que apoya este dx..."],
+  "contradicting_findings": ["hallazgo que contradice, ausencia de síntoma esperado..."],
+  "prognosis": "pronóstico esperado si se confirma...",
+  "complications": ["complicación potencial si no se trata..."],
+  "recommended_tests": ["examen de laboratorio", "estudio de imagen..."],
+  "treatment_summary": "resumen de las opciones terapéuticas disponibles..."
+}}
+"""
+
+PLAN_INSTRUCTIONS = """
+
+Diagnósticos diferenciales y red flags ya identificados:
+{triage}
+
+Generá el plan de acción y la nota SOAP del caso. Objeto JSON con este esquema (respetar claves exactamente):
+{{
+  "action_plan": [{{"priority":"immediate|urgent|routine","action":"...","rationale":"..."}}],
+  "soap": {{"subjective":"...","objective":"...","assessment":"...","plan":"..."}},
+  "patient_summary": "resumen ejecutivo del caso...",
+  "limitations": "limitaciones de este análisis..."
+}}
+
+Incluí disclaimers apropiados y sé explícito sobre la necesidad de evaluación médica presencial.
+"""
+
 class DiagnosticAgent:
     """Agent responsible for generating the final diagnostic assessment"""
     
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model=settings.OPENAI_MODEL_TEXT,
-            temperature=0.2,
-            api_key=settings.OPENAI_API_KEY
-        )
+        self.llm = create_chat_model(settings.OPENAI_MODEL_TEXT, temperature=0.2)
     
     async def run(self, state: ConversationState, progress_callback=None) -> Dict[str, Any]:
         """
@@ -139,61 +240,209 @@ class DiagnosticAgent:
             progress_callback: Optional callback to report progress updates (deprecated, use SSE instead)
         
         Returns:
-            Updated state with final_assessment
+            State updates with final_assessment and the final message (delta)
         """
-        # Build the prompt
-        user_prompt = build_diagnostic_prompt(state)
+        # Retrieve similar past cases
+        events.emit("diagnosis_progress", stage="similar_cases", message="Consultando casos similares...")
+        similar_cases = await self._find_similar_cases(state)
+        
+        assessment = None
+        if settings.DIAGNOSTIC_FANOUT_ENABLED:
+            assessment = await self._fan_out(build_case_prompt(state, similar_cases))
+        if assessment is None:
+            assessment = await self._generate(build_diagnostic_prompt(state, similar_cases))
+        
+        # Convert assessment to dict
+        assessment_dict = assessment.model_dump()
         
+        # Create final message
+        final_message = self._create_final_message(assessment)
+        
+        return {
+            "final_assessment": assessment_dict,
+            "messages": [{
+                "role": "assistant",
+                "content": final_message
+            }],
+            "ready_for_diagnosis": True,
+            "last_agent": "diagnostic",
+        }
+    
+    async def _generate(self, user_prompt: str) -> ClinicalAssessment:
+        """The whole assessment in one call"""
         messages = [
             SystemMessage(content=DIAGNOSTIC_SYSTEM_PROMPT),
             HumanMessage(content=user_prompt)
         ]
         
         # Generate assessment
-        response = await self.llm.ainvoke(messages)
+        events.emit("diagnosis_progress", stage="assessment", message="Generando evaluación clínica estructurada...")
+        response = await self._invoke(messages, "diagnostic.assessment")
         raw_json = response.content
         
         # Parse and validate
         try:
             assessment_dict = json.loads(raw_json)
-            assessment = ClinicalAssessment.model_validate(assessment_dict)
+            return ClinicalAssessment.model_validate(assessment_dict)
         except (json.JSONDecodeError, Exception) as e:
             # Retry with repair prompt
-            assessment = await self._repair_and_parse(messages, raw_json)
+            events.emit("diagnosis_progress", stage="repair", message="Revisando el formato de la evaluación...")
+            return await self._repair_and_parse(messages, raw_json)
+    
+    async def _fan_out(self, case_prompt: str) -> Optional[ClinicalAssessment]:
+        """
+        The assessment by sections: a triage call for the ranked differentials
+        and red flags, then the details of each differential and the plan
+        (action plan, SOAP, summary) concurrently, at most
+        DIAGNOSTIC_FANOUT_CONCURRENCY calls at a time. The triage's and the
+        plan's items stream as they are generated; each differential is sent
+        again once its details land.
         
-        # Convert assessment to dict
-        assessment_dict = assessment.model_dump()
+        Returns None when the triage fails or cannot be parsed (the caller
+        falls back to the single call). A differential whose details fail
+        keeps its triage fields; a plan that fails is replaced by a manual
+        review plan. A failing section never cancels the others.
+        """
+        events.emit("diagnosis_progress", stage="triage", message="Priorizando diagnósticos diferenciales...")
+        triage = await self._section(case_prompt + TRIAGE_INSTRUCTIONS, "diagnostic.triage", AssessmentTriage.model_validate)
+        if triage is None:
+            return None
         
-        # Create final message
-        final_message = self._create_final_message(assessment)
+        events.emit("diagnosis_progress", stage="details", message="Ampliando diagnósticos y plan de acción...")
+        limit = asyncio.Semaphore(max(1, settings.DIAGNOSTIC_FANOUT_CONCURRENCY))
+        differentials = list(triage.differentials)
         
-        new_messages = state["messages"].copy()
-        new_messages.append({
-            "role": "assistant",
-            "content": final_message
-        })
+        async def details(index: int, dx: DifferentialDx) -> None:
+            others = ", ".join(other.name for other in triage.differentials if other is not dx) or "ninguno"
+            prompt = case_prompt + DETAILS_INSTRUCTIONS.format(
+                name=dx.name, likelihood=dx.likelihood, urgency=dx.urgency, reasoning=dx.reasoning, others=others
+            )
+            # The triage decides the ranking fields, whatever the details call repeats
+            ranking = dx.model_dump(include=TRIAGE_FIELDS)
+            async with limit:
+                expanded = await self._section(
+                    prompt, "diagnostic.details",
+                    lambda parsed: DifferentialDx.model_validate({**parsed, **ranking})
+                )
+            if expanded is not None:
+                differentials[index] = expanded
+                self._emit_partial("differentials", expanded, index)
         
-        return {
-            "final_assessment": assessment_dict,
-            "messages": new_messages,
-            "ready_for_diagnosis": True,
-            "last_agent": "diagnostic",
-        }
+        async def plan() -> Optional[AssessmentPlan]:
+            summary = triage.model_dump(include={"differentials": {"__all__": TRIAGE_FIELDS}, "red_flags": True})
+            prompt = case_prompt + PLAN_INSTRUCTIONS.format(triage=json.dumps(summary, indent=2, ensure_ascii=False))
+            async with limit:
+                return await self._section(prompt, "diagnostic.plan", AssessmentPlan.model_validate)
+        
+        tasks = [asyncio.ensure_future(plan())]
+        tasks += [asyncio.ensure_future(details(index, dx)) for index, dx in enumerate(triage.differentials)]
+        try:
+            plan_result = (await asyncio.gather(*tasks))[0]
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        if plan_result is None:
+            fallback = self._create_fallback_assessment("no se pudo generar el plan de acción")
+            plan_result = AssessmentPlan.model_validate(
+                fallback.model_dump(include={"action_plan", "soap", "patient_summary", "limitations"})
+            )
+        return ClinicalAssessment(
+            differentials=differentials,
+            red_flags=triage.red_flags,
+            missing_questions=triage.missing_questions,
+            **dict(plan_result)
+        )
     
-    async def _repair_and_parse(self, original_messages: list, raw_json: str) -> ClinicalAssessment:
-        """Try to repair malformed JSON"""
+    async def _section(self, user_prompt: str, operation: str, parse: Callable[[Any], T]) -> Optional[T]:
+        """
+        One section call of the fan-out, parsed, with one repair attempt. None
+        if it still cannot be parsed or a call fails, so the caller degrades
+        that section only.
+        """
+        messages = [
+            SystemMessage(content=DIAGNOSTIC_SYSTEM_PROMPT),
+            HumanMessage(content=user_prompt)
+        ]
+        try:
+            response = await self._invoke(messages, operation)
+            try:
+                return parse(json.loads(response.content))
+            except Exception:
+                pass
+            response = await self._invoke(self._repair_messages(messages, response.content), operation, attempt=2)
+            return parse(json.loads(response.content))
+        except Exception as e:
+            logger.warning(f"Diagnostic section {operation} failed: {str(e)}")
+            return None
+    
+    async def _invoke(self, messages: list, operation: str, attempt: int = 1):
+        """
+        ainvoke_llm; while someone listens the completion is streamed and each
+        differential, red flag, action plan item or SOAP note is validated and
+        emitted as soon as its object closes. The assessment is still parsed
+        and validated as a whole afterwards.
+        """
+        on_text = self._partial_emitter() if events.listening() else None
+        return await ainvoke_llm(self.llm, messages, operation, attempt=attempt, on_text=on_text)
+    
+    def _partial_emitter(self) -> Callable[[str], None]:
+        items = ItemStream(PARTIAL_MODELS)
+        
+        def on_text(chunk: str) -> None:
+            for section, index, value in items.feed(chunk):
+                try:
+                    item = PARTIAL_MODELS[section].model_validate(value)
+                except ValidationError:
+                    continue  # The final validation decides
+                self._emit_partial(section, item, index)
+        
+        return on_text
+    
+    def _emit_partial(self, section: str, item: BaseModel, index: Optional[int] = None) -> None:
+        events.emit("assessment_partial", section=section, index=index, item=item.model_dump())
+    
+    async def _find_similar_cases(self, state: ConversationState) -> List[SimilarCase]:
+        """Query the local similar-case index (never fails the diagnosis)"""
+        if not settings.SIMILAR_CASES_ENABLED:
+            return []
+        
+        complaint = next(
+            (msg["content"] for msg in state["messages"] if msg["role"] == "user"),
+            ""
+        )
+        try:
+            return await asyncio.to_thread(
+                similar_case_index.search,
+                state["symptoms"],
+                complaint,
+                settings.SIMILAR_CASES_TOP_K,
+                state["session_id"],
+                settings.SIMILAR_CASES_MIN_SCORE,
+            )
+        except Exception as e:
+            logger.warning(f"Similar-case search failed: {str(e)}")
+            return []
+    
+    def _repair_messages(self, original_messages: list, raw_json: str) -> list:
+        """The original messages plus a request to fix the malformed output"""
         repair_prompt = HumanMessage(
             content=f"El output anterior no es JSON válido o no matchea el esquema.\n\n"
                     f"Output recibido:\n{raw_json}\n\n"
                     f"Devolvé SOLO JSON válido acorde al esquema. Sin markdown, sin explicaciones."
         )
         
-        messages = original_messages + [
+        return original_messages + [
             HumanMessage(content=raw_json),
             repair_prompt
         ]
+    
+    async def _repair_and_parse(self, original_messages: list, raw_json: str) -> ClinicalAssessment:
+        """Try to repair malformed JSON"""
+        messages = self._repair_messages(original_messages, raw_json)
         
-        response = await self.llm.ainvoke(messages)
+        response = await self._invoke(messages, "diagnostic.assessment", attempt=2)
         
         try:
             assessment_dict = json.loads(response.content)
@@ -260,5 +509,5 @@ class DiagnosticAgent:
         return "\n".join(msg_parts)
 
 
-# Singleton instance
-diagnostic_agent = DiagnosticAgent()
+# Singleton instance, built on first use (app/agents/registry.py)
+__getattr__ = lazy_singletons(globals(), "diagnostic_agent")
@@ -0,0 +1,50 @@
+"""
+Events pushed to live clients while a turn runs (the WebSocket channel,
+app/services/channels.py, and the streamed messages endpoint).
+
+Whoever runs a turn for a live client installs a listener with listen(); the
+agents and graph nodes call emit() as they make progress. The listener is a
+ContextVar, so the graph's node tasks see it, and emit() is a no-op for turns
+nobody listens to (the plain HTTP endpoints). Events:
+    ready               {"ready_for_diagnosis"}: the interviewer's decision, before its message
+    token               {"text"}: next characters of the interviewer's message
+    extraction          {"symptoms", "new_symptoms", "patient_info", "confidence_score"}
+    image_analyzed      {"url", "analysis", "new_symptoms"}
+    diagnosis_progress  {"stage", "message"}
+    assessment_partial  {"section", "index", "item"}: a validated piece of the assessment
+                        (a differential, red flag, action plan item or the SOAP note)
+                        as soon as it is generated; a piece sent again under the same
+                        section and index (details, a repaired output) replaces it
+
+The interviewer only streams its reply (ready and token events), and the
+diagnostic agent its assessment, while someone listens.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional
+
+Listener = Callable[[str, Dict[str, Any]], None]
+
+_listener: ContextVar[Optional[Listener]] = ContextVar("agent_event_listener", default=None)
+
+
+@contextmanager
+def listen(listener: Listener) -> Iterator[None]:
+    """Send the events emitted in this context to listener(event, data)"""
+    token = _listener.set(listener)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
+
+
+def listening() -> bool:
+    return _listener.get() is not None
+
+
+def emit(event: str, **data: Any) -> None:
+    """Report an event to the current listener, if any"""
+    listener = _listener.get()
+    if listener is not None:
+        listener(event, data)
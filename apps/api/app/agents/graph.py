@@ -1,43 +1,114 @@
 """
 LangGraph: Main agent graph that orchestrates the medical interview and diagnosis flow.
+
+The agents, the checkpointer and the compiled graph (agent_graph,
+agent_checkpointer) are built on first use through app/agents/registry.py;
+langgraph itself is only imported by create_agent_graph.
 """
 
-from typing import Dict, Any
-from langgraph.graph import StateGraph, END
+import functools
+import time
+from typing import TYPE_CHECKING, Dict, Any, Awaitable, Callable, Optional
+from app.core import metrics, profiling, tracing
+from app.core.config import settings
+from app.agents import events
 from app.agents.state import (
     ConversationState,
     AgentPhase,
     should_proceed_to_diagnosis,
     calculate_confidence_score,
+    apply_state_updates,
+    merge_state_updates,
 )
-from app.agents.interviewer import interviewer_agent
-from app.agents.image_analyzer import image_analyzer_agent
-from app.agents.diagnostic import diagnostic_agent
 from app.agents.orchestrator import (
     route_after_user_message,
     route_after_ready_check,
 )
+from app.agents.registry import lazy_singletons, registry
+
+if TYPE_CHECKING:
+    from langgraph.checkpoint.base import BaseCheckpointSaver
+    from langgraph.graph.state import CompiledStateGraph
+
+# langgraph.graph.END (importing langgraph for a constant would undo the lazy loading)
+END = "__end__"
 
 
 # Node functions that wrap agent execution
 
+def instrument_node(name: str) -> Callable:
+    """
+    Record a node's latency in agent_node_duration_seconds{node=name} (and in
+    the breakdown of a captured slow request) and run it in a "graph.<name>"
+    span tagged with the session id
+    """
+    def decorator(node: Callable[[ConversationState], Awaitable[Dict[str, Any]]]):
+        duration = metrics.node_duration(name)
+        span_name = f"graph.{name}"
+        part = f"node.{name}"
+        
+        @functools.wraps(node)
+        async def wrapper(state: ConversationState) -> Dict[str, Any]:
+            start = time.perf_counter()
+            try:
+                with tracing.span(span_name, session_id=state.get("session_id")):
+                    return await node(state)
+            finally:
+                elapsed = time.perf_counter() - start
+                duration.observe(elapsed)
+                profiling.record(part, elapsed)
+        return wrapper
+    return decorator
+
+
+@instrument_node("interviewer")
 async def interviewer_node(state: ConversationState) -> Dict[str, Any]:
     """Node that runs the interviewer agent"""
+    extraction_updates = {}
+    
     # First, process the last user response if exists
     if state["messages"] and state["messages"][-1]["role"] == "user":
-        extraction_updates = await interviewer_agent.process_user_response(state)
-        # Apply extraction updates to state
-        state = {**state, **extraction_updates}
+        extraction_updates = await registry.get("interviewer_agent").process_user_response(state)
+        # View of the state with the extraction applied (channels stay untouched)
+        state = merge_state_updates(state, extraction_updates)
+        if extraction_updates:
+            events.emit(
+                "extraction",
+                symptoms=state["symptoms"],
+                new_symptoms=extraction_updates["symptoms"],
+                patient_info=state["patient_info"],
+                confidence_score=state["confidence_score"],
+            )
     
     # Then generate next question
-    updates = await interviewer_agent.run(state)
+    updates = await registry.get("interviewer_agent").run(state)
     
     # Update phase
     updates["current_phase"] = AgentPhase.INTERVIEW
     
+    # Emit both sets of deltas; the graph reducers fold them into the channels
+    return {**extraction_updates, **updates}
+
+
+@instrument_node("image_analyzer")
+async def image_analyzer_node(state: ConversationState) -> Dict[str, Any]:
+    """Node that analyzes the pending image"""
+    updates = await registry.get("image_analyzer_agent").run(state, state["pending_image_url"])
+    
+    # Clear the pending image
+    updates["pending_image_url"] = ""
+    
+    events.emit(
+        "image_analyzed",
+        url=state["pending_image_url"],
+        analysis=updates["images"][-1]["analysis"],
+        new_symptoms=updates["symptoms"],
+    )
+    
     return updates
 
 
+@instrument_node("ready_check")
 async def ready_check_node(state: ConversationState) -> Dict[str, Any]:
     """
     Node that checks if we're ready for diagnosis.
@@ -56,9 +127,10 @@ async def ready_check_node(state: ConversationState) -> Dict[str, Any]:
     }
 
 
+@instrument_node("diagnostic")
 async def diagnostic_node(state: ConversationState) -> Dict[str, Any]:
     """Node that runs the diagnostic agent"""
-    updates = await diagnostic_agent.run(state)
+    updates = await registry.get("diagnostic_agent").run(state)
     
     # Update phase to completed
     updates["current_phase"] = AgentPhase.COMPLETED
@@ -68,6 +140,13 @@ async def diagnostic_node(state: ConversationState) -> Dict[str, Any]:
 
 # Conditional routing functions
 
+def route_entry(state: ConversationState) -> str:
+    """Route the start of a run: analyze a pending image, or continue the interview"""
+    if state.get("pending_image_url"):
+        return "image_analyzer"
+    return "interviewer"
+
+
 def route_from_interviewer(state: ConversationState) -> str:
     """
     Route after interviewer completes.
@@ -101,23 +180,36 @@ def route_from_diagnostic(state: ConversationState) -> str:
 
 # Build the graph
 
-def create_agent_graph() -> StateGraph:
+def create_agent_graph(checkpointer: Optional["BaseCheckpointSaver"] = None) -> "CompiledStateGraph":
     """
     Create and compile the LangGraph for the medical assistant.
     
+    Args:
+        checkpointer: Optional saver; when set, runs are checkpointed per
+            thread_id (the session id) and can be resumed
+    
     Returns:
         Compiled StateGraph
     """
+    from langgraph.graph import StateGraph
+    
     # Create the graph
     workflow = StateGraph(ConversationState)
     
     # Add nodes
     workflow.add_node("interviewer", interviewer_node)
+    workflow.add_node("image_analyzer", image_analyzer_node)
     workflow.add_node("ready_check", ready_check_node)
     workflow.add_node("diagnostic", diagnostic_node)
     
-    # Set entry point
-    workflow.set_entry_point("interviewer")
+    # Set entry point: image uploads go to the analyzer, messages to the interviewer
+    workflow.set_conditional_entry_point(
+        route_entry,
+        {
+            "interviewer": "interviewer",
+            "image_analyzer": "image_analyzer",
+        }
+    )
     
     # Add edges
     # From interviewer: can go to diagnostic (if ready), ready_check (periodic), or end turn
@@ -141,84 +233,188 @@ def create_agent_graph() -> StateGraph:
         }
     )
     
-    # From diagnostic: always end
+    # From image_analyzer and diagnostic: always end
+    workflow.add_edge("image_analyzer", END)
     workflow.add_edge("diagnostic", END)
     
     # Compile the graph
-    app = workflow.compile()
+    app = workflow.compile(checkpointer=checkpointer)
     
     return app
 
 
-# Create the compiled graph
-agent_graph = create_agent_graph()
+# The compiled graph and its checkpointer, built on first use
+__getattr__ = lazy_singletons(globals(), "agent_checkpointer", "agent_graph")
+
+
+def get_agent_checkpointer() -> Optional["BaseCheckpointSaver"]:
+    """The checkpointer (None when disabled); graph.agent_checkpointer if it was set"""
+    return globals()["agent_checkpointer"] if "agent_checkpointer" in globals() else __getattr__("agent_checkpointer")
+
+
+def get_agent_graph() -> "CompiledStateGraph":
+    """The compiled graph; graph.agent_graph if it was set"""
+    return globals()["agent_graph"] if "agent_graph" in globals() else __getattr__("agent_graph")
 
 
 # Convenience functions for external use
 
+# Loads a session's state from the database when it has no checkpoint yet
+StateLoader = Callable[[], Awaitable[ConversationState]]
+
+# Counts the user messages committed to the database for a session
+UserMessageCounter = Callable[[], Awaitable[int]]
+
+
+def thread_config(session_id: str) -> Dict[str, Any]:
+    """Graph config for a session's checkpoint thread"""
+    return {"configurable": {"thread_id": session_id}}
+
+
+async def _get_snapshot(session_id: str):
+    """Latest checkpoint snapshot of a session, or None if there is none"""
+    if get_agent_checkpointer() is None:
+        return None
+    
+    with tracing.span("graph.load_checkpoint", session_id=session_id) as current:
+        snapshot = await get_agent_graph().aget_state(thread_config(session_id))
+        tracing.set_attributes(current, {"checkpoint.hit": bool(snapshot.values)})
+    return snapshot if snapshot.values else None
+
+
+async def _run_graph(session_id: str, graph_input: Optional[Dict[str, Any]]) -> ConversationState:
+    """Run the graph on a session's thread and prune old checkpoints"""
+    with tracing.span("graph.run", {"graph.resume": graph_input is None}, session_id=session_id):
+        result = await get_agent_graph().ainvoke(graph_input, thread_config(session_id))
+        
+        checkpointer = get_agent_checkpointer()
+        if checkpointer is not None:
+            await checkpointer.aprune(session_id, settings.CHECKPOINT_HISTORY)
+    
+    return result
+
+
+async def load_session_state(session_id: str, load_state: StateLoader) -> ConversationState:
+    """
+    Get the current state of a session.
+    Uses the latest checkpoint when one exists, otherwise load_state().
+    """
+    snapshot = await _get_snapshot(session_id)
+    if snapshot is not None:
+        return snapshot.values
+    return await load_state()
+
+
 async def process_user_message(
-    state: ConversationState,
-    user_message: str
+    session_id: str,
+    user_message: str,
+    load_state: StateLoader,
+    count_user_messages: Optional[UserMessageCounter] = None
 ) -> ConversationState:
     """
     Process a user message through the agent graph.
     
+    When the session has a checkpoint, only the new message is sent to the
+    graph (the rest of the state is restored from the checkpoint). If the
+    last run for this same message was interrupted, it is resumed instead.
+    
+    The checkpoint is written before the turn is committed to the database.
+    With count_user_messages, a checkpoint holding user messages that were
+    never committed (the turn's transaction failed) is reconciled: a retry of
+    that message reuses its finished run, any other message discards the
+    checkpoint and seeds the graph from the database again.
+    
     Args:
-        state: Current conversation state
+        session_id: Session (and checkpoint thread) id
         user_message: User's message
+        load_state: Loads the state from the database when there is no checkpoint
+        count_user_messages: Counts the session's committed user messages
     
     Returns:
         Updated state after agent processing
     """
-    # Add user message to state
-    new_messages = state["messages"].copy()
-    new_messages.append({
+    user_update = {"messages": [{
         "role": "user",
         "content": user_message
-    })
+    }]}
     
-    state["messages"] = new_messages
+    snapshot = await _get_snapshot(session_id)
+    if snapshot is not None and count_user_messages is not None:
+        uncommitted = _count_user_messages(snapshot.values) - await count_user_messages()
+        retry = uncommitted == 1 and _last_user_message(snapshot.values) == user_message
+        if uncommitted > 0 and not retry:
+            await get_agent_checkpointer().adelete_thread(session_id)
+            snapshot = None
+        elif retry and not snapshot.next:
+            # Finished run whose turn was not committed: reuse its answer
+            return snapshot.values
     
-    # Run the graph
-    result = await agent_graph.ainvoke(state)
+    if snapshot is None:
+        # First run for this session: seed the graph with the full state
+        graph_input = apply_state_updates(await load_state(), user_update)
+    elif snapshot.next and _last_user_message(snapshot.values) == user_message:
+        # Interrupted run for this message: resume from the last checkpoint
+        graph_input = None
+    else:
+        graph_input = user_update
     
-    return result
+    # Run the graph
+    return await _run_graph(session_id, graph_input)
+
+
+def _count_user_messages(state: ConversationState) -> int:
+    return sum(1 for msg in state["messages"] if msg["role"] == "user")
+
+
+def _last_user_message(state: ConversationState) -> Optional[str]:
+    for msg in reversed(state["messages"]):
+        if msg["role"] == "user":
+            return msg["content"]
+    return None
 
 
 async def process_image_upload(
-    state: ConversationState,
-    image_url: str
+    session_id: str,
+    image_url: str,
+    load_state: StateLoader
 ) -> ConversationState:
     """
-    Process an image upload.
+    Process an image upload through the image_analyzer node.
     
     Args:
-        state: Current conversation state
+        session_id: Session (and checkpoint thread) id
         image_url: URL of uploaded image
+        load_state: Loads the state from the database when there is no checkpoint
     
     Returns:
         Updated state after image analysis
     """
-    # Analyze the image directly
-    updates = await image_analyzer_agent.run(state, image_url)
+    image_update = {"pending_image_url": image_url}
     
-    # Apply updates to state
-    updated_state = {**state, **updates}
+    snapshot = await _get_snapshot(session_id)
+    if snapshot is None:
+        graph_input = apply_state_updates(await load_state(), image_update)
+    else:
+        graph_input = image_update
     
-    return updated_state
+    return await _run_graph(session_id, graph_input)
 
 
-async def force_diagnosis(state: ConversationState) -> ConversationState:
+async def force_diagnosis(session_id: str, load_state: StateLoader) -> ConversationState:
     """
     Force generation of diagnosis even if not ready.
     Used when user explicitly requests to finalize.
     
     Args:
-        state: Current conversation state
+        session_id: Session (and checkpoint thread) id
+        load_state: Loads the state from the database when there is no checkpoint
     
     Returns:
         Updated state with diagnosis
     """
+    snapshot = await _get_snapshot(session_id)
+    state = snapshot.values if snapshot is not None else await load_state()
+    
     # Set ready flag
     state["ready_for_diagnosis"] = True
     
@@ -226,6 +422,14 @@ async def force_diagnosis(state: ConversationState) -> ConversationState:
     updates = await diagnostic_node(state)
     
     # Apply updates
-    updated_state = {**state, **updates}
+    updated_state = apply_state_updates(state, updates)
+    
+    # Record the diagnosis in the session's checkpoint thread
+    if get_agent_checkpointer() is not None:
+        await get_agent_graph().aupdate_state(
+            thread_config(session_id),
+            updates if snapshot is not None else updated_state,
+            as_node="diagnostic",
+        )
     
     return updated_state
@@ -5,10 +5,11 @@ Extracts visual findings and integrates them into the diagnostic context.
 
 from typing import Dict, Any, List
 from datetime import datetime
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
 from app.core.config import settings
+from app.agents.llm import ainvoke_llm, create_chat_model
 from app.agents.state import ConversationState
+from app.agents.registry import lazy_singletons
 import base64
 from pathlib import Path
 import httpx
@@ -55,8 +56,8 @@ class ImageAnalyzerAgent:
         import logging
         logger = logging.getLogger(__name__)
         
-        # Validate API key is configured
-        if not settings.OPENAI_API_KEY:
+        # Validate API key is configured (not needed for a compatible server)
+        if not settings.OPENAI_API_KEY and not settings.OPENAI_BASE_URL:
             logger.error("OPENAI_API_KEY is not configured!")
             raise ValueError(
                 "OPENAI_API_KEY must be configured for image analysis. "
@@ -65,11 +66,7 @@ class ImageAnalyzerAgent:
         
         logger.info(f"Initializing ImageAnalyzerAgent with model: {settings.OPENAI_MODEL_VISION}")
         
-        self.llm = ChatOpenAI(
-            model=settings.OPENAI_MODEL_VISION,
-            temperature=0.2,
-            api_key=settings.OPENAI_API_KEY
-        )
+        self.llm = create_chat_model(settings.OPENAI_MODEL_VISION, temperature=0.2)
     
     async def analyze_image(
         self,
@@ -123,7 +120,7 @@ class ImageAnalyzerAgent:
         
         try:
             logger.info("Calling OpenAI Vision API for image analysis")
-            response = await self.llm.ainvoke([message])
+            response = await ainvoke_llm(self.llm, [message], "image_analyzer.vision")
             logger.info("Received response from OpenAI Vision API")
             
             # Parse JSON response
@@ -189,7 +186,7 @@ class ImageAnalyzerAgent:
             new_image_url: URL of the newly uploaded image
         
         Returns:
-            Updated state with image analysis
+            State updates with the new image, symptoms and summary message (deltas)
         """
         from app.services.storage import storage_service
         
@@ -206,29 +203,27 @@ class ImageAnalyzerAgent:
             local_path=local_path
         )
         
-        # Add to images list
-        new_images = state["images"].copy()
-        new_images.append({
+        # New image entry (appended by the state reducer)
+        new_images = [{
             "url": new_image_url,
             "analysis": analysis,
             "timestamp": datetime.utcnow().isoformat()
-        })
+        }]
         
         # Extract any new symptoms from image findings
-        new_symptoms = state["symptoms"].copy()
+        new_symptoms = []
         for finding in analysis.get("findings", []):
             # Simple heuristic: if finding is not already in symptoms, add it
-            if finding not in new_symptoms and len(finding) < 50:
+            if finding not in state["symptoms"] and finding not in new_symptoms and len(finding) < 50:
                 new_symptoms.append(finding)
         
         # Create a message summarizing the analysis
         summary = self._create_analysis_summary(analysis)
         
-        new_messages = state["messages"].copy()
-        new_messages.append({
+        new_messages = [{
             "role": "assistant",
             "content": summary
-        })
+        }]
         
         return {
             "images": new_images,
@@ -281,5 +276,5 @@ class ImageAnalyzerAgent:
         return " ".join(summary_parts)
 
 
-# Singleton instance
-image_analyzer_agent = ImageAnalyzerAgent()
+# Singleton instance, built on first use (app/agents/registry.py)
+__getattr__ = lazy_singletons(globals(), "image_analyzer_agent")
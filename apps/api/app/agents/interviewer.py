@@ -3,10 +3,18 @@ Interviewer Agent: Conducts the medical interview with the patient.
 """
 
 from typing import Dict, Any
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from app.core.config import settings
-from app.agents.state import ConversationState, REQUIRED_INFO_CATEGORIES, calculate_confidence_score
+from app.agents import events, usage
+from app.agents.json_stream import LiteralFieldStream, StringFieldStream
+from app.agents.llm import ainvoke_llm, create_chat_model
+from app.agents.registry import lazy_singletons
+from app.agents.state import (
+    ConversationState,
+    REQUIRED_INFO_CATEGORIES,
+    calculate_confidence_score,
+    merge_state_updates,
+)
 
 # System prompt for the interviewer agent
 INTERVIEWER_SYSTEM_PROMPT = """Sos un asistente médico experto realizando una anamnesis (entrevista clínica).
@@ -70,30 +78,44 @@ Si ready_for_diagnosis es false:
 Respondé SOLO con el JSON válido, sin texto adicional antes o después.
 """
 
+# Sent instead of a question when the session reaches TOKEN_BUDGET_FORCE_DIAGNOSIS
+BUDGET_TRANSITION_MESSAGE = (
+    "Gracias por la información. Con lo que me contaste hasta ahora voy a proceder "
+    "con el análisis diagnóstico."
+)
+
 class InterviewerAgent:
     """Agent responsible for conducting the medical interview"""
     
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model=settings.OPENAI_MODEL_TEXT,
-            temperature=0.3,
-            api_key=settings.OPENAI_API_KEY
-        )
+        self.llm = create_chat_model(settings.OPENAI_MODEL_TEXT, temperature=0.3)
     
     async def run(self, state: ConversationState) -> Dict[str, Any]:
         """
         Run the interviewer agent to generate the next question or decide to proceed to diagnosis.
         
         Returns:
-            Updated state with new assistant message and ready_for_diagnosis flag
+            State updates: the new assistant message and question (deltas),
+            turn count and ready_for_diagnosis flag
         """
         import json
         
+        # Session over its token budget: hand over to the diagnostic agent
+        if usage.budget_exceeded("force_diagnosis"):
+            return {
+                "messages": [{"role": "assistant", "content": BUDGET_TRANSITION_MESSAGE}],
+                "questions_asked": [],
+                "turn_count": state["turn_count"] + 1,
+                "last_agent": "interviewer",
+                "ready_for_diagnosis": True,
+            }
+        
         # Build the prompt
         messages = self._build_messages(state)
         
-        # Generate response
-        response = await self.llm.ainvoke(messages)
+        # Generate response (streamed to live clients: the message field, as tokens)
+        on_text = self._token_emitter() if events.listening() else None
+        response = await ainvoke_llm(self.llm, messages, "interviewer.question", on_text=on_text)
         raw_content = response.content
         
         # Parse JSON response
@@ -107,17 +129,14 @@ class InterviewerAgent:
             assistant_message = raw_content
             ready_for_diagnosis = False
         
-        # Update state
-        new_messages = state["messages"].copy()
-        new_messages.append({
+        # Return only the new items; the state reducers append them
+        new_messages = [{
             "role": "assistant",
             "content": assistant_message
-        })
+        }]
         
         # Update questions asked (only if not ready for diagnosis)
-        new_questions_asked = state["questions_asked"].copy()
-        if not ready_for_diagnosis:
-            new_questions_asked.append(assistant_message)
+        new_questions_asked = [] if ready_for_diagnosis else [assistant_message]
         
         # Increment turn count
         new_turn_count = state["turn_count"] + 1
@@ -130,16 +149,45 @@ class InterviewerAgent:
             "ready_for_diagnosis": ready_for_diagnosis,
         }
     
+    def _token_emitter(self):
+        """
+        Completion chunks -> a ready event as soon as ready_for_diagnosis is
+        decided, and token events with the new characters of the message field
+        """
+        ready = LiteralFieldStream("ready_for_diagnosis")
+        field = StringFieldStream("message")
+        
+        def on_text(chunk: str) -> None:
+            if ready.feed(chunk):
+                events.emit("ready", ready_for_diagnosis=bool(ready.value))
+            text = field.feed(chunk)
+            if text:
+                events.emit("token", text=text)
+        return on_text
+    
     def _build_messages(self, state: ConversationState) -> list:
-        """Build the message list for the LLM"""
+        """
+        Build the message list for the LLM.
+        Past TOKEN_BUDGET_SUMMARIZE the history is cut to the last
+        SUMMARY_RECENT_MESSAGES; the context summary (plus the questions
+        already asked) stands in for the rest.
+        """
         messages = [SystemMessage(content=INTERVIEWER_SYSTEM_PROMPT)]
         
+        history = state["messages"]
+        summarized = usage.budget_exceeded("summarize") and len(history) > settings.SUMMARY_RECENT_MESSAGES
+        
         # Add context about what we know so far
         context_info = self._build_context_summary(state)
+        if summarized:
+            history = history[-settings.SUMMARY_RECENT_MESSAGES:]
+            if state["questions_asked"]:
+                asked = "\n".join(f"- {q}" for q in state["questions_asked"])
+                context_info += f"\nPreguntas ya hechas:\n{asked}"
         messages.append(HumanMessage(content=f"CONTEXTO ACTUAL:\n{context_info}"))
         
         # Add conversation history
-        for msg in state["messages"]:
+        for msg in history:
             if msg["role"] == "user":
                 messages.append(HumanMessage(content=msg["content"]))
             elif msg["role"] == "assistant":
@@ -221,7 +269,8 @@ class InterviewerAgent:
     async def process_user_response(self, state: ConversationState) -> Dict[str, Any]:
         """
         Process the user's response to extract information.
-        This updates patient_info, symptoms, and categories_covered.
+        Returns deltas for patient_info, symptoms and info_categories_covered,
+        plus the recalculated confidence score.
         """
         if not state["messages"]:
             return {}
@@ -239,23 +288,28 @@ class InterviewerAgent:
         # Use LLM to extract structured information
         extraction_result = await self._extract_information(last_user_msg, state)
         
-        # Update patient info
-        new_patient_info = {**state["patient_info"], **extraction_result.get("patient_info", {})}
+        # New patient info keys (merged by the state reducer)
+        new_patient_info = extraction_result.get("patient_info", {})
         
-        # Update symptoms
-        new_symptoms = state["symptoms"].copy()
+        # New symptoms only
+        new_symptoms = []
         for symptom in extraction_result.get("symptoms", []):
-            if symptom not in new_symptoms:
+            if symptom not in state["symptoms"] and symptom not in new_symptoms:
                 new_symptoms.append(symptom)
         
-        # Update categories covered
-        new_categories = state["info_categories_covered"].copy()
-        for category in extraction_result.get("categories", []):
-            if category in new_categories:
-                new_categories[category] = True
+        # Newly covered categories only
+        new_categories = {
+            category: True
+            for category in extraction_result.get("categories", [])
+            if category in state["info_categories_covered"]
+        }
         
-        # Calculate new confidence score
-        temp_state = {**state, "info_categories_covered": new_categories, "symptoms": new_symptoms, "patient_info": new_patient_info}
+        # Calculate new confidence score on the merged view
+        temp_state = merge_state_updates(state, {
+            "info_categories_covered": new_categories,
+            "symptoms": new_symptoms,
+            "patient_info": new_patient_info,
+        })
         new_confidence = calculate_confidence_score(temp_state)
         
         return {
@@ -289,7 +343,7 @@ Respondé SOLO con el JSON, sin texto adicional.
 """
         
         try:
-            response = await self.llm.ainvoke([HumanMessage(content=extraction_prompt)])
+            response = await ainvoke_llm(self.llm, [HumanMessage(content=extraction_prompt)], "interviewer.extraction")
             
             # Parse JSON response - handle markdown code blocks
             import json
@@ -327,5 +381,5 @@ Respondé SOLO con el JSON, sin texto adicional.
             return {"symptoms": [], "patient_info": {}, "categories": []}
 
 
-# Singleton instance
-interviewer_agent = InterviewerAgent()
+# Singleton instance, built on first use (app/agents/registry.py)
+__getattr__ = lazy_singletons(globals(), "interviewer_agent")
@@ -0,0 +1,221 @@
+"""
+Incremental decoding of JSON completions while the model streams them.
+"""
+
+import json
+import re
+from typing import Any, Iterable, List, Optional, Tuple
+
+# Escapes that need more characters before they can be decoded
+_UNICODE_ESCAPE = re.compile(r"\\u[0-9a-fA-F]{4}")
+_HIGH_SURROGATE = re.compile(r"\\u[dD][89abAB][0-9a-fA-F]{2}")
+
+
+class StringFieldStream:
+    """
+    Decodes the value of one string field of a JSON object as its text
+    arrives, e.g. "message" of {"ready_for_diagnosis": false, "message": "..."}.
+
+    feed() takes the next chunk of the completion and returns the field's new
+    characters (escapes decoded), "" while there are none. Text around the
+    object (a markdown fence) is skipped. The key is matched textually, so a
+    caller must still parse the complete text to trust the value.
+    """
+
+    def __init__(self, field: str):
+        self._key = re.compile(re.escape(json.dumps(field)) + r'\s*:\s*"')
+        self._text = ""
+        # Start of the undecoded part of the value (None until the key is found)
+        self._pos: Optional[int] = None
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        if self.done:
+            return ""
+        self._text += chunk
+        if self._pos is None:
+            match = self._key.search(self._text)
+            if match is None:
+                return ""
+            self._pos = match.end()
+        return self._decode()
+
+    def _decode(self) -> str:
+        text, pos = self._text, self._pos
+        out = []
+        while pos < len(text):
+            char = text[pos]
+            if char == '"':
+                self.done = True
+                pos += 1
+                break
+            if char != "\\":
+                # Copy the run of plain characters at once
+                end = pos + 1
+                while end < len(text) and text[end] not in '"\\':
+                    end += 1
+                out.append(text[pos:end])
+                pos = end
+                continue
+            escape = self._escape_at(pos)
+            if escape is None:
+                break  # Incomplete: wait for the next chunk
+            try:
+                out.append(json.loads(f'"{escape}"'))
+            except ValueError:
+                out.append(escape)
+            pos += len(escape)
+        self._pos = pos
+        return "".join(out)
+
+    def _escape_at(self, pos: int) -> Optional[str]:
+        """The complete escape sequence starting at pos, or None if it is cut short"""
+        text = self._text
+        if pos + 1 >= len(text):
+            return None
+        if text[pos + 1] != "u":
+            return text[pos:pos + 2]
+        if not _UNICODE_ESCAPE.match(text, pos):
+            return None if len(text) < pos + 6 else text[pos:pos + 2]
+        if _HIGH_SURROGATE.match(text, pos):
+            # A surrogate pair is decoded together
+            if text.startswith("\\", pos + 6) or len(text) == pos + 6:
+                if len(text) < pos + 12:
+                    return None
+                if _UNICODE_ESCAPE.match(text, pos + 6):
+                    return text[pos:pos + 12]
+        return text[pos:pos + 6]
+
+
+class LiteralFieldStream:
+    """
+    The value of one true/false/null/number field of a JSON object, as soon
+    as it is complete in the streamed text, e.g. "ready_for_diagnosis".
+    feed() returns True on the chunk that completes it; the value is then in
+    `value`. Matched textually, like StringFieldStream.
+    """
+
+    def __init__(self, field: str):
+        self._key = re.compile(
+            re.escape(json.dumps(field))
+            + r"\s*:\s*(true|false|null|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)(?=\s*[,}])"
+        )
+        self._text = ""
+        self.value: Any = None
+        self.done = False
+
+    def feed(self, chunk: str) -> bool:
+        if self.done:
+            return False
+        self._text += chunk
+        match = self._key.search(self._text)
+        if match is None:
+            return False
+        self.value = json.loads(match.group(1))
+        self.done = True
+        self._text = ""
+        return True
+
+
+class ItemStream:
+    """
+    The complete objects of some top-level fields of a JSON object as they
+    close in the streamed text: each object element of an array field
+    ("differentials": [{...}, ...]) and object fields themselves
+    ("soap": {...}), e.g. to show parts of an assessment before the rest.
+
+    feed() takes the next chunk and returns the (field, index, value) of the
+    objects it completed; index is the object's position among the array's
+    objects, None for an object field. Text around the root object (a markdown fence) is
+    skipped. Values are decoded but not validated.
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        self._fields = set(fields)
+        self._text = ""
+        self._pos = 0
+        self._started = False
+        self._stack: List[str] = []  # Open containers, "{" or "["
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        # Current key of the root object and whether a key is expected next
+        self._key: Optional[str] = None
+        self._expect_key = False
+        # Start and depth of the object being collected
+        self._item_start: Optional[int] = None
+        self._item_depth = 0
+        self._index = 0
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Optional[int], Any]]:
+        if self.done:
+            return []
+        self._text += chunk
+        completed = []
+        text = self._text
+        pos = self._pos
+        while pos < len(text) and not self.done:
+            char = text[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._expect_key and len(self._stack) == 1:
+                        self._key = json.loads(text[self._string_start:pos + 1])
+            elif not self._started:
+                if char == "{":
+                    self._started = True
+                    self._stack.append(char)
+                    self._expect_key = True
+            elif char == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif char in "{[":
+                self._open(char, pos)
+            elif char in "}]":
+                item = self._close(pos)
+                if item is not None:
+                    completed.append(item)
+            elif len(self._stack) == 1:
+                if char == ":":
+                    self._expect_key = False
+                elif char == ",":
+                    self._expect_key = True
+            pos += 1
+        self._pos = pos
+        return completed
+
+    def _open(self, char: str, pos: int) -> None:
+        depth = len(self._stack)
+        if depth == 1 and self._key in self._fields:
+            # The field's value: an object is itself an item, an array holds them
+            self._index = 0
+            if char == "{":
+                self._item_start, self._item_depth = pos, depth
+        elif depth == 2 and char == "{" and self._stack[1] == "[" and self._key in self._fields:
+            self._item_start, self._item_depth = pos, depth
+        self._stack.append(char)
+
+    def _close(self, pos: int) -> Optional[Tuple[str, Optional[int], Any]]:
+        opened = self._stack.pop()
+        depth = len(self._stack)
+        if not self._stack:
+            self.done = True
+            return None
+        if opened != "{" or self._item_start is None or depth != self._item_depth:
+            return None
+        try:
+            value = json.loads(self._text[self._item_start:pos + 1])
+        except ValueError:
+            value = None
+        self._item_start = None
+        if depth == 1:
+            item = (self._key, None, value)
+        else:
+            item = (self._key, self._index, value)
+            self._index += 1
+        return item if value is not None else None
@@ -0,0 +1,159 @@
+"""
+Chat models shared by the agents.
+
+OPENAI_BASE_URL points every agent at an OpenAI-compatible server instead of
+api.openai.com: a proxy, a self-hosted model, or the fake server used for
+offline load tests (loadtest/fake_openai.py).
+
+Agents call the models through ainvoke_llm, which records latency, tokens,
+errors and HTTP retries per agent and model (app/core/metrics.py), adds the
+usage to the session's ledger (app/agents/usage.py) and traces each call when
+tracing is enabled. Past TOKEN_BUDGET_CHEAP_MODEL, the agents listed in
+CHEAP_MODEL_AGENTS are served by OPENAI_MODEL_CHEAP (by default not the
+diagnostic agent). With on_text the completion is streamed and its text
+passed on chunk by chunk (live clients, app/agents/events.py).
+"""
+
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import openai
+from langchain_core.messages import BaseMessage
+from langchain_openai import ChatOpenAI
+
+from app.agents import usage as usage_ledger
+from app.core import metrics, profiling, tracing
+from app.core.config import settings
+
+# Compatible servers usually ignore the key, but the client requires one
+PLACEHOLDER_API_KEY = "not-needed"
+
+# HTTP requests sent by the current ainvoke_llm call (the client retries internally)
+_http_attempts: ContextVar[Optional[List[int]]] = ContextVar("llm_http_attempts", default=None)
+
+
+async def _count_attempt(request) -> None:
+    attempts = _http_attempts.get()
+    if attempts is not None:
+        attempts[0] += 1
+
+
+def create_chat_model(model: str, temperature: float) -> ChatOpenAI:
+    """ChatOpenAI client for the configured endpoint"""
+    api_key = settings.OPENAI_API_KEY
+    if not api_key and settings.OPENAI_BASE_URL:
+        api_key = PLACEHOLDER_API_KEY
+
+    return ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        api_key=api_key,
+        base_url=settings.OPENAI_BASE_URL or None,
+        # Same defaults as the client's own, plus a hook that counts retries
+        http_async_client=openai.DefaultAsyncHttpxClient(event_hooks={"request": [_count_attempt]})
+    )
+
+
+# id(model) -> (model, variant); the model is kept so its id is not reused
+_cheap_variants: Dict[int, Tuple[Any, Any]] = {}
+
+
+def cheap_variant(llm: Any) -> Any:
+    """Copy of a chat model on OPENAI_MODEL_CHEAP (same client and settings), cached"""
+    entry = _cheap_variants.get(id(llm))
+    if entry is None:
+        if not hasattr(llm, "model_copy"):
+            return llm
+        entry = _cheap_variants[id(llm)] = (llm, llm.model_copy(update={"model_name": settings.OPENAI_MODEL_CHEAP}))
+    return entry[1]
+
+
+async def _astream(
+    llm: Any,
+    messages: List[BaseMessage],
+    on_text: Callable[[str], None],
+    first_token: Any
+) -> BaseMessage:
+    """The streamed completion, merged into one message (usage included)"""
+    start = time.perf_counter()
+    response = None
+    async for chunk in llm.astream(messages, stream_usage=True):
+        if chunk.content:
+            if response is None or not response.content:
+                first_token.observe(time.perf_counter() - start)
+            on_text(chunk.content)
+        response = chunk if response is None else response + chunk
+    return response
+
+
+async def ainvoke_llm(
+    llm: Any,
+    messages: List[BaseMessage],
+    operation: str,
+    attempt: int = 1,
+    on_text: Optional[Callable[[str], None]] = None
+) -> BaseMessage:
+    """
+    llm.ainvoke(messages), recorded in the LLM metrics of the operation's
+    agent and, when tracing is on, in an "llm.<operation>" span.
+    `attempt` numbers the agent's own retries (e.g. the diagnostic JSON repair).
+    With on_text the completion is streamed and on_text gets each chunk's text.
+    """
+    agent = operation.split(".", 1)[0]
+    if (
+        settings.OPENAI_MODEL_CHEAP
+        and agent in settings.CHEAP_MODEL_AGENTS
+        and usage_ledger.budget_exceeded("cheap_model")
+    ):
+        llm = cheap_variant(llm)
+    model = getattr(llm, "model_name", "")
+    children = metrics.llm_children(operation, model)
+    attempts = [0]
+    token = _http_attempts.set(attempts)
+    start = time.perf_counter()
+    try:
+        attributes = None
+        if tracing.tracing_enabled():
+            attributes = {"gen_ai.system": "openai", "gen_ai.request.model": model, "llm.attempt": attempt}
+        with tracing.span(f"llm.{operation}", attributes) as current:
+            try:
+                if on_text is None:
+                    response = await llm.ainvoke(messages)
+                else:
+                    response = await _astream(llm, messages, on_text, children.first_token)
+            except Exception:
+                children.errors.inc()
+                raise
+            usage = getattr(response, "usage_metadata", None)
+            if usage:
+                children.input_tokens.inc(usage.get("input_tokens", 0))
+                children.output_tokens.inc(usage.get("output_tokens", 0))
+            ledger = usage_ledger.current_ledger()
+            if ledger is not None:
+                ledger.record(operation, model, usage)
+            if current is not None:
+                tracing.set_attributes(current, usage_attributes(response, attempts[0]))
+            return response
+    finally:
+        elapsed = time.perf_counter() - start
+        children.duration.observe(elapsed)
+        profiling.record(f"llm.{operation}", elapsed)
+        if attempts[0] > 1:
+            children.retries.inc(attempts[0] - 1)
+        _http_attempts.reset(token)
+
+
+def usage_attributes(response: BaseMessage, http_attempts: int) -> dict:
+    """Span attributes of a completion: tokens, cached prompt tokens and retries"""
+    usage = getattr(response, "usage_metadata", None) or {}
+    cached = (usage.get("input_token_details") or {}).get("cache_read")
+    return {
+        "gen_ai.usage.input_tokens": usage.get("input_tokens"),
+        "gen_ai.usage.output_tokens": usage.get("output_tokens"),
+        "gen_ai.usage.cache_read_tokens": cached,
+        "llm.cache_hit": bool(cached) if cached is not None else None,
+        # Only counted for clients built by create_chat_model
+        "llm.retries": http_attempts - 1 if http_attempts else None,
+        "gen_ai.response.model": (response.response_metadata or {}).get("model_name"),
+    }
@@ -0,0 +1,97 @@
+"""
+Agent registry: the agents, the checkpointer and the compiled graph are built
+on first use instead of at import.
+
+Importing app.main no longer pulls in langchain, langgraph or openai; the
+first request that runs the graph does (or warm_up(), called from the
+lifespan so the first request does not pay for it). The module attributes
+that used to hold the singletons (interviewer.interviewer_agent,
+graph.agent_graph, ...) still work: each module resolves them through the
+registry on first access (module __getattr__).
+"""
+
+import importlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _instance(module: str, cls: str) -> Callable[[], Any]:
+    return lambda: getattr(importlib.import_module(module), cls)()
+
+
+def _checkpointer() -> Any:
+    from app.agents.checkpointer import create_checkpointer
+    return create_checkpointer()
+
+
+def _graph() -> Any:
+    from app.agents.graph import create_agent_graph, get_agent_checkpointer
+    return create_agent_graph(get_agent_checkpointer())
+
+
+class AgentRegistry:
+    """Named singletons built by their factory on first get()"""
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.RLock()  # the graph factory gets the checkpointer
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        self._factories[name] = factory
+
+    def get(self, name: str) -> Any:
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._instances:
+                self._instances[name] = self._factories[name]()
+            return self._instances[name]
+
+    def built(self, name: str) -> bool:
+        return name in self._instances
+
+    def warm_up(self, names: Optional[List[str]] = None) -> Dict[str, float]:
+        """
+        Build the given singletons (all by default) and return the seconds
+        each took. A failing factory is logged and left for its first use to
+        raise again (e.g. the image analyzer without an API key).
+        """
+        timings = {}
+        for name in names or list(self._factories):
+            start = time.perf_counter()
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.warning(f"Warm-up of {name} failed: {str(e)}")
+                continue
+            timings[name] = time.perf_counter() - start
+        return timings
+
+
+def lazy_singletons(namespace: Dict[str, Any], *names: str) -> Callable[[str], Any]:
+    """
+    Module __getattr__ resolving `names` through the registry; the instance
+    is then stored in the module so later lookups are plain attribute reads.
+    Usage: __getattr__ = lazy_singletons(globals(), "interviewer_agent")
+    """
+    def __getattr__(name: str) -> Any:
+        if name in names:
+            namespace[name] = registry.get(name)
+            return namespace[name]
+        raise AttributeError(f"module {namespace['__name__']!r} has no attribute {name!r}")
+    return __getattr__
+
+
+registry = AgentRegistry()
+registry.register("interviewer_agent", _instance("app.agents.interviewer", "InterviewerAgent"))
+registry.register("image_analyzer_agent", _instance("app.agents.image_analyzer", "ImageAnalyzerAgent"))
+registry.register("diagnostic_agent", _instance("app.agents.diagnostic", "DiagnosticAgent"))
+registry.register("agent_checkpointer", _checkpointer)
+registry.register("agent_graph", _graph)
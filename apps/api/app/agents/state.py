@@ -1,6 +1,38 @@
-from typing import TypedDict, List, Dict, Any, Literal
+from typing import TypedDict, List, Dict, Any, Literal, Annotated, get_type_hints, get_origin
 from enum import Enum
 
+
+# Reducers for the append/merge channels of ConversationState.
+# Nodes return only the new items (deltas) and LangGraph folds them into the
+# channel value with these functions. Reducers must not mutate their inputs:
+# LangGraph re-applies a node's writes onto copies of the channels that share
+# the same containers (e.g. when evaluating conditional edges).
+
+def add_items(left: List[Any], right: List[Any]) -> List[Any]:
+    """Append new items to an append-only list channel"""
+    if not right:
+        return left
+    return left + right
+
+
+def add_unique_items(left: List[Any], right: List[Any]) -> List[Any]:
+    """Append new items, skipping ones already present"""
+    new_items = []
+    for item in right or []:
+        if item not in left and item not in new_items:
+            new_items.append(item)
+    if not new_items:
+        return left
+    return left + new_items
+
+
+def merge_dict(left: Dict[str, Any], right: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge new keys into a dict channel"""
+    if not right:
+        return left
+    return {**left, **right}
+
+
 class AgentPhase(str, Enum):
     """Current phase of the conversation"""
     INITIAL = "initial"
@@ -19,26 +51,29 @@ class ConversationState(TypedDict):
     # Session identification
     session_id: str
     
-    # Conversation messages
-    messages: List[Dict[str, str]]  # [{"role": "user/assistant", "content": "..."}]
+    # Conversation messages (append-only)
+    messages: Annotated[List[Dict[str, str]], add_items]  # [{"role": "user/assistant", "content": "..."}]
     
-    # Patient information collected
-    patient_info: Dict[str, Any]  # {"age": 45, "sex": "M", "medical_history": [...]}
+    # Patient information collected (merged)
+    patient_info: Annotated[Dict[str, Any], merge_dict]  # {"age": 45, "sex": "M", "medical_history": [...]}
     
-    # Symptoms mentioned
-    symptoms: List[str]
+    # Symptoms mentioned (append-only, deduplicated)
+    symptoms: Annotated[List[str], add_unique_items]
     
-    # Images uploaded with analysis
-    images: List[Dict[str, Any]]  # [{"url": "...", "analysis": {...}, "timestamp": "..."}]
+    # Images uploaded with analysis (append-only)
+    images: Annotated[List[Dict[str, Any]], add_items]  # [{"url": "...", "analysis": {...}, "timestamp": "..."}]
+    
+    # Image waiting to be analyzed by the image_analyzer node ("" if none)
+    pending_image_url: str
     
     # Current phase of conversation
     current_phase: str  # AgentPhase value
     
-    # Questions already asked (to avoid repetition)
-    questions_asked: List[str]
+    # Questions already asked (to avoid repetition, append-only)
+    questions_asked: Annotated[List[str], add_items]
     
-    # Categories of information collected
-    info_categories_covered: Dict[str, bool]  # {"chief_complaint": True, "duration": True, ...}
+    # Categories of information collected (merged)
+    info_categories_covered: Annotated[Dict[str, bool], merge_dict]  # {"chief_complaint": True, "duration": True, ...}
     
     # Confidence that we have enough information
     confidence_score: float  # 0.0 to 1.0
@@ -54,6 +89,37 @@ class ConversationState(TypedDict):
     last_agent: str  # Which agent last acted
 
 
+# Reducer for each annotated channel, keyed by state field
+STATE_REDUCERS = {
+    name: hint.__metadata__[0]
+    for name, hint in get_type_hints(ConversationState, include_extras=True).items()
+    if get_origin(hint) is Annotated
+}
+
+
+def apply_state_updates(state: ConversationState, updates: Dict[str, Any]) -> ConversationState:
+    """
+    Apply node updates (deltas) to a state owned by the caller, in place.
+    Mirrors how the graph channels fold updates, for code running outside the graph.
+    Updated channels get new containers, so views taken before the call are not affected.
+    """
+    for key, value in updates.items():
+        reducer = STATE_REDUCERS.get(key)
+        if reducer is not None and key in state:
+            state[key] = reducer(state[key], value)
+        else:
+            state[key] = value
+    return state
+
+
+def merge_state_updates(state: ConversationState, updates: Dict[str, Any]) -> ConversationState:
+    """
+    Return a view of the state with updates applied, leaving the original untouched.
+    Unchanged channels share their containers with the original state.
+    """
+    return apply_state_updates(dict(state), updates)
+
+
 # Required information categories for a complete assessment
 REQUIRED_INFO_CATEGORIES = {
     "chief_complaint": "Main reason for consultation",
@@ -76,6 +142,7 @@ def create_initial_state(session_id: str) -> ConversationState:
         patient_info={},
         symptoms=[],
         images=[],
+        pending_image_url="",
         current_phase=AgentPhase.INITIAL,
         questions_asked=[],
         info_categories_covered={cat: False for cat in REQUIRED_INFO_CATEGORIES.keys()},
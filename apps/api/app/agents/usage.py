@@ -0,0 +1,143 @@
+"""
+Token and cost accounting per session, and the budgets that degrade a
+session that has consumed too much.
+
+ainvoke_llm records every completion's usage in the ledger of the current
+request (track_usage, a ContextVar, so the graph's node tasks see it). The
+endpoints start the ledger with the session's stored total and persist it
+through SessionUnitOfWork.record_usage.
+
+Budgets compare the session's total tokens (stored + this request) with
+TOKEN_BUDGET_* (0 disables one, the default); each level keeps the
+previous ones:
+    summarize        the interviewer sends the collected facts and the last
+                     messages instead of the full history
+    cheap_model      calls of CHEAP_MODEL_AGENTS use OPENAI_MODEL_CHEAP
+    force_diagnosis  the interviewer stops asking and hands over to the
+                     diagnostic agent
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from app.core.config import settings
+
+BUDGET_MODES = ("normal", "summarize", "cheap_model", "force_diagnosis")
+
+
+def budget_thresholds() -> Dict[str, int]:
+    return {
+        "summarize": settings.TOKEN_BUDGET_SUMMARIZE,
+        "cheap_model": settings.TOKEN_BUDGET_CHEAP_MODEL,
+        "force_diagnosis": settings.TOKEN_BUDGET_FORCE_DIAGNOSIS,
+    }
+
+
+def budget_mode(session_tokens: int) -> str:
+    """Highest budget level reached by a session with this many tokens"""
+    reached = "normal"
+    thresholds = budget_thresholds()
+    for mode in BUDGET_MODES[1:]:
+        if thresholds[mode] and session_tokens >= thresholds[mode]:
+            reached = mode
+    return reached
+
+
+def model_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """USD cost of a call from LLM_PRICES (0 for models without a price)"""
+    prices = settings.LLM_PRICES.get(model)
+    if not prices:
+        return 0.0
+    input_price, output_price = prices
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def empty_totals() -> Dict[str, Any]:
+    return {"input_tokens": 0, "output_tokens": 0, "calls": 0, "cost_usd": 0.0}
+
+
+class UsageLedger:
+    """Token usage of one request, by agent, on top of the session's stored total"""
+
+    def __init__(self, base_tokens: int = 0):
+        self.base_tokens = base_tokens
+        self.by_agent: Dict[str, Dict[str, Any]] = {}
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.calls = 0
+        self.cost_usd = 0.0
+
+    def record(self, operation: str, model: str, usage: Optional[dict]) -> None:
+        """Add a completion's usage_metadata (the agent is the operation's prefix)"""
+        input_tokens = (usage or {}).get("input_tokens", 0)
+        output_tokens = (usage or {}).get("output_tokens", 0)
+        cost = model_cost(model, input_tokens, output_tokens)
+
+        agent = operation.split(".", 1)[0]
+        totals = self.by_agent.get(agent)
+        if totals is None:
+            totals = self.by_agent[agent] = empty_totals()
+        totals["input_tokens"] += input_tokens
+        totals["output_tokens"] += output_tokens
+        totals["calls"] += 1
+        totals["cost_usd"] += cost
+
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.calls += 1
+        self.cost_usd += cost
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    @property
+    def session_tokens(self) -> int:
+        """Stored total of the session plus this request's"""
+        return self.base_tokens + self.total_tokens
+
+    @property
+    def mode(self) -> str:
+        return budget_mode(self.session_tokens)
+
+    def summary(self) -> Dict[str, Any]:
+        """This request's usage, for message_metadata"""
+        return {
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "calls": self.calls,
+            "cost_usd": round(self.cost_usd, 6),
+            "session_tokens": self.session_tokens,
+            "budget_mode": self.mode,
+        }
+
+
+_ledger: ContextVar[Optional[UsageLedger]] = ContextVar("usage_ledger", default=None)
+
+
+@contextmanager
+def track_usage(base_tokens: int = 0) -> Iterator[UsageLedger]:
+    """Record the LLM calls made inside the block in a new ledger"""
+    ledger = UsageLedger(base_tokens)
+    token = _ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _ledger.reset(token)
+
+
+def current_ledger() -> Optional[UsageLedger]:
+    return _ledger.get()
+
+
+def budget_exceeded(mode: str) -> bool:
+    """
+    Whether the current session has reached a budget level (summarize,
+    cheap_model or force_diagnosis). Always False outside track_usage.
+    """
+    ledger = _ledger.get()
+    if ledger is None:
+        return False
+    threshold = budget_thresholds()[mode]
+    return bool(threshold) and ledger.session_tokens >= threshold
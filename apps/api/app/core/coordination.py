@@ -0,0 +1,259 @@
+"""
+Coordination between API processes: named locks and short-lived flags.
+
+With one process the local backend is enough. Multi-worker deployments
+(python -m app.serve --workers N, see app/serve.py) need COORDINATION_BACKEND
+set to "postgres", so every worker sees the same state:
+    session:<id>   per-session lock; a session's turns (messages, images,
+                   finalize) run one at a time, in arrival order per worker
+    maintenance    leader lock; one worker runs each maintenance round
+    written:<id>   read-your-writes flag (app/db/routing.py)
+
+The postgres backend uses session-level advisory locks, held on a connection
+of its own engine (COORDINATION_POOL_SIZE connections per worker, plus as
+many overflow) for as long as the lock is held, so a crashed worker releases
+its locks with its connection. Flags live in the coordination_flags table,
+written through a second, small pool (up to 5 connections). Advisory locks
+need a direct connection or pgbouncer in session mode.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Postgres SQLSTATE raised when lock_timeout expires
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+class LockTimeout(Exception):
+    """A lock was not acquired within its timeout"""
+
+    def __init__(self, key: str, timeout: float):
+        super().__init__(f"Lock {key!r} not acquired within {timeout:.1f}s")
+        self.key = key
+        self.timeout = timeout
+
+
+class CoordinationBackend:
+    """Locks and TTL flags; `shared` backends are visible to every process"""
+
+    name = "base"
+    shared = False
+
+    def lock(self, key: str, timeout: float):
+        """Async context manager holding `key`; raises LockTimeout after `timeout` seconds"""
+        raise NotImplementedError
+
+    def try_lock(self, key: str):
+        """Async context manager yielding whether `key` was free (and is now held)"""
+        raise NotImplementedError
+
+    async def set_flag(self, key: str, ttl: float) -> None:
+        raise NotImplementedError
+
+    async def has_flag(self, key: str) -> bool:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class _LocalLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class LocalBackend(CoordinationBackend):
+    """In-process locks and flags (a single API process)"""
+
+    name = "local"
+
+    def __init__(self):
+        self._locks: Dict[str, _LocalLock] = {}
+        self._flags: Dict[str, float] = {}
+
+    @asynccontextmanager
+    async def _held(self, key: str, timeout: Optional[float]) -> AsyncIterator[bool]:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = _LocalLock()
+        entry.users += 1
+        try:
+            if timeout is None:
+                if entry.lock.locked():
+                    yield False
+                    return
+                await entry.lock.acquire()
+            else:
+                try:
+                    await asyncio.wait_for(entry.lock.acquire(), timeout)
+                except asyncio.TimeoutError:
+                    raise LockTimeout(key, timeout) from None
+            try:
+                yield True
+            finally:
+                entry.lock.release()
+        finally:
+            entry.users -= 1
+            if not entry.users:
+                del self._locks[key]
+
+    @asynccontextmanager
+    async def lock(self, key: str, timeout: float) -> AsyncIterator[None]:
+        async with self._held(key, timeout):
+            yield
+
+    def try_lock(self, key: str):
+        return self._held(key, None)
+
+    async def set_flag(self, key: str, ttl: float) -> None:
+        now = time.monotonic()
+        # Re-insert so the dict stays ordered by expiry (ttls are per use, not per key)
+        self._flags.pop(key, None)
+        self._flags[key] = now + ttl
+        for stale, expires_at in list(self._flags.items()):
+            if expires_at > now:
+                break
+            del self._flags[stale]
+
+    async def has_flag(self, key: str) -> bool:
+        expires_at = self._flags.get(key)
+        return expires_at is not None and expires_at > time.monotonic()
+
+
+class PostgresBackend(CoordinationBackend):
+    """Advisory locks and the coordination_flags table, shared by every worker"""
+
+    name = "postgres"
+    shared = True
+
+    # Expired flags are deleted every this many set_flag calls (per process)
+    PRUNE_EVERY = 1000
+    # Flags get their own small pool: sessions write them while holding their
+    # lock, so sharing the lock pool could exhaust it with lock holders
+    FLAG_POOL_SIZE = 2
+    FLAG_MAX_OVERFLOW = 3
+
+    def __init__(self, url: str, pool_size: int):
+        self.url = url
+        self.pool_size = pool_size
+        self._lock_engine = None
+        self._flag_engine = None
+        self._writes = 0
+
+    def _build(self, name: str, pool_size: int, max_overflow: int):
+        from app.db.base import build_engine
+        return build_engine(
+            self.url, name=name, echo=False, pool_size=pool_size, max_overflow=max_overflow,
+        ).execution_options(isolation_level="AUTOCOMMIT")
+
+    @property
+    def lock_engine(self):
+        if self._lock_engine is None:
+            self._lock_engine = self._build("coordination", self.pool_size, self.pool_size)
+        return self._lock_engine
+
+    @property
+    def flag_engine(self):
+        if self._flag_engine is None:
+            self._flag_engine = self._build("coordination_flags", self.FLAG_POOL_SIZE, self.FLAG_MAX_OVERFLOW)
+        return self._flag_engine
+
+    @asynccontextmanager
+    async def _held(self, key: str, timeout: Optional[float]) -> AsyncIterator[bool]:
+        from sqlalchemy import text
+        from sqlalchemy.exc import DBAPIError
+
+        async with self.lock_engine.connect() as conn:
+            if timeout is None:
+                acquired = (await conn.execute(
+                    text("SELECT pg_try_advisory_lock(hashtextextended(:key, 0))"), {"key": key}
+                )).scalar()
+                if not acquired:
+                    yield False
+                    return
+            else:
+                await conn.execute(
+                    text("SELECT set_config('lock_timeout', :timeout, false)"),
+                    {"timeout": f"{max(int(timeout * 1000), 1)}ms"},
+                )
+                try:
+                    await conn.execute(text("SELECT pg_advisory_lock(hashtextextended(:key, 0))"), {"key": key})
+                except DBAPIError as e:
+                    if getattr(e.orig, "sqlstate", None) == LOCK_NOT_AVAILABLE:
+                        raise LockTimeout(key, timeout) from None
+                    raise
+                finally:
+                    await conn.execute(text("RESET lock_timeout"))
+            try:
+                yield True
+            finally:
+                try:
+                    await conn.execute(text("SELECT pg_advisory_unlock(hashtextextended(:key, 0))"), {"key": key})
+                except Exception as e:
+                    # Closing the connection releases the lock
+                    logger.warning(f"Releasing lock {key!r} failed, discarding its connection: {str(e)}")
+                    await conn.invalidate()
+
+    @asynccontextmanager
+    async def lock(self, key: str, timeout: float) -> AsyncIterator[None]:
+        async with self._held(key, timeout):
+            yield
+
+    def try_lock(self, key: str):
+        return self._held(key, None)
+
+    async def set_flag(self, key: str, ttl: float) -> None:
+        from sqlalchemy import text
+
+        self._writes += 1
+        async with self.flag_engine.connect() as conn:
+            await conn.execute(text("""
+                INSERT INTO coordination_flags (key, expires_at)
+                VALUES (:key, now() + make_interval(secs => :ttl))
+                ON CONFLICT (key) DO UPDATE SET expires_at = EXCLUDED.expires_at
+            """), {"key": key, "ttl": ttl})
+            if self._writes % self.PRUNE_EVERY == 0:
+                await conn.execute(text("DELETE FROM coordination_flags WHERE expires_at < now()"))
+
+    async def has_flag(self, key: str) -> bool:
+        from sqlalchemy import text
+
+        async with self.flag_engine.connect() as conn:
+            result = await conn.execute(
+                text("SELECT 1 FROM coordination_flags WHERE key = :key AND expires_at > now()"),
+                {"key": key},
+            )
+            return result.first() is not None
+
+    async def close(self) -> None:
+        for engine in (self._lock_engine, self._flag_engine):
+            if engine is not None:
+                await engine.dispose()
+        self._lock_engine = self._flag_engine = None
+
+
+def create_backend(name: Optional[str] = None) -> CoordinationBackend:
+    """Backend named by COORDINATION_BACKEND (local or postgres)"""
+    name = name or settings.COORDINATION_BACKEND
+    if name == "local":
+        return LocalBackend()
+    if name == "postgres":
+        return PostgresBackend(
+            settings.COORDINATION_DATABASE_URL or settings.DATABASE_URL,
+            settings.COORDINATION_POOL_SIZE,
+        )
+    raise ValueError(f"Unknown COORDINATION_BACKEND: {name!r} (expected local or postgres)")
+
+
+# Singleton instance (the postgres engine is created on first use)
+coordination = create_backend()
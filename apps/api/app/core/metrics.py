@@ -0,0 +1,253 @@
+"""
+Prometheus metrics served at /metrics.
+
+Series:
+    http_request_duration_seconds{method, route}
+    agent_node_duration_seconds{node}                 graph nodes (app/agents/graph.py)
+    llm_request_duration_seconds{agent, model}
+    llm_time_to_first_token_seconds{agent, model}     streamed completions only
+    llm_tokens_total{agent, model, direction}         direction: input, output
+    llm_errors_total{agent, model} / llm_retries_total{agent, model}
+    image_upload_bytes, image_processing_seconds, image_analysis_queue_depth
+    sse_stream_duration_seconds{stream, outcome}
+    websocket_connections, websocket_closes_total{reason}
+    event_loop_lag_seconds, event_loop_stalls_total,   loop monitor and slow requests
+    slow_requests_total                               (app/core/profiling.py)
+    db_pool_*{engine}                                 read from pool_stats() at scrape time
+
+With several workers (app/serve.py sets PROMETHEUS_MULTIPROC_DIR) every
+worker writes its samples to files in that directory and /metrics serves the
+sum over workers; process, platform and GC series are then omitted and the
+db_pool_* series are those of the worker that answered the scrape.
+
+Label children are bound once per label set (at import, at decoration time
+or on the first observation) and cached, so the hot path is a dict lookup
+plus observe()/inc(); no metric objects are created per request.
+"""
+
+import os
+import time
+from typing import AsyncIterator, Dict, NamedTuple
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.gc_collector import GCCollector
+from prometheus_client.platform_collector import PlatformCollector
+from prometheus_client.process_collector import ProcessCollector
+
+from app.db.metrics import pool_stats
+
+registry = CollectorRegistry()
+ProcessCollector(registry=registry)
+PlatformCollector(registry=registry)
+GCCollector(registry=registry)
+
+# Requests span from a few ms (reads) to tens of seconds (LLM turns, finalize)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+UPLOAD_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 ** 2, 2 * 1024 ** 2, 5 * 1024 ** 2, 10 * 1024 ** 2)
+
+HTTP_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route (until the response headers)",
+    ["method", "route"], buckets=LATENCY_BUCKETS, registry=registry,
+)
+NODE_DURATION = Histogram(
+    "agent_node_duration_seconds", "Agent graph node latency",
+    ["node"], buckets=LATENCY_BUCKETS, registry=registry,
+)
+LLM_DURATION = Histogram(
+    "llm_request_duration_seconds", "LLM call latency, retries included",
+    ["agent", "model"], buckets=LATENCY_BUCKETS, registry=registry,
+)
+LLM_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds", "Time until a streamed completion's first text",
+    ["agent", "model"], buckets=LATENCY_BUCKETS, registry=registry,
+)
+LLM_TOKENS = Counter(
+    "llm_tokens", "Model tokens by agent, model and direction",
+    ["agent", "model", "direction"], registry=registry,
+)
+LLM_ERRORS = Counter("llm_errors", "LLM calls that raised", ["agent", "model"], registry=registry)
+LLM_RETRIES = Counter("llm_retries", "HTTP retries made by the LLM client", ["agent", "model"], registry=registry)
+
+IMAGE_UPLOAD_BYTES = Histogram(
+    "image_upload_bytes", "Size of uploaded images", buckets=UPLOAD_BUCKETS, registry=registry,
+)
+IMAGE_PROCESSING = Histogram(
+    "image_processing_seconds", "Image upload handling: storage, analysis and persistence",
+    buckets=LATENCY_BUCKETS, registry=registry,
+)
+IMAGE_QUEUE_DEPTH = Gauge(
+    "image_analysis_queue_depth", "Image uploads waiting for or running their analysis",
+    multiprocess_mode="livesum", registry=registry,
+)
+
+SSE_DURATION = Histogram(
+    "sse_stream_duration_seconds", "Server-sent event stream duration",
+    ["stream", "outcome"], buckets=LATENCY_BUCKETS, registry=registry,
+)
+
+WEBSOCKET_CONNECTIONS = Gauge(
+    "websocket_connections", "Open WebSocket chat connections",
+    multiprocess_mode="livesum", registry=registry,
+)
+WEBSOCKET_CLOSES = Counter(
+    "websocket_closes", "Closed WebSocket chat connections by reason",
+    ["reason"], registry=registry,
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "Delay of the loop monitor's heartbeat past its schedule",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5), registry=registry,
+)
+EVENT_LOOP_STALLS = Counter(
+    "event_loop_stalls", "Heartbeats late by more than PROFILING_LOOP_STALL_MS", registry=registry,
+)
+SLOW_REQUESTS = Counter(
+    "slow_requests", "Requests slower than PROFILING_SLOW_REQUEST_MS (captured)", registry=registry,
+)
+
+
+# ============= BOUND CHILDREN =============
+
+_http_children: Dict[str, Dict[str, object]] = {}
+
+
+def http_duration(method: str, route: str):
+    """Bound histogram of one route and method"""
+    by_method = _http_children.get(route)
+    if by_method is None:
+        by_method = _http_children[route] = {}
+    child = by_method.get(method)
+    if child is None:
+        child = by_method[method] = HTTP_DURATION.labels(method=method, route=route)
+    return child
+
+
+def node_duration(node: str):
+    """Bound histogram of a graph node (bind once, at decoration time)"""
+    return NODE_DURATION.labels(node=node)
+
+
+class LLMChildren(NamedTuple):
+    duration: object
+    first_token: object
+    input_tokens: object
+    output_tokens: object
+    errors: object
+    retries: object
+
+
+_llm_children: Dict[str, Dict[str, LLMChildren]] = {}
+
+
+def llm_children(operation: str, model: str) -> LLMChildren:
+    """
+    Bound series of an LLM operation ("interviewer.question") and model; the
+    agent label is the operation's prefix, i.e. its graph node.
+    """
+    by_model = _llm_children.get(operation)
+    if by_model is None:
+        by_model = _llm_children[operation] = {}
+    children = by_model.get(model)
+    if children is None:
+        agent = operation.split(".", 1)[0]
+        children = by_model[model] = LLMChildren(
+            duration=LLM_DURATION.labels(agent=agent, model=model),
+            first_token=LLM_FIRST_TOKEN.labels(agent=agent, model=model),
+            input_tokens=LLM_TOKENS.labels(agent=agent, model=model, direction="input"),
+            output_tokens=LLM_TOKENS.labels(agent=agent, model=model, direction="output"),
+            errors=LLM_ERRORS.labels(agent=agent, model=model),
+            retries=LLM_RETRIES.labels(agent=agent, model=model),
+        )
+    return children
+
+
+SSE_OUTCOMES = ("complete", "error", "disconnected")
+
+
+def sse_durations(stream: str) -> Dict[str, object]:
+    """Bound histograms of one stream, by outcome (bind once per endpoint)"""
+    return {outcome: SSE_DURATION.labels(stream=stream, outcome=outcome) for outcome in SSE_OUTCOMES}
+
+
+async def observe_stream(events: AsyncIterator[str], durations: Dict[str, object]) -> AsyncIterator[str]:
+    """
+    Pass SSE events through and record the stream's duration under its
+    outcome: complete (last event is "complete"), error, or disconnected
+    (the client went away before the end).
+    """
+    start = time.perf_counter()
+    outcome = "disconnected"
+    last = ""
+    try:
+        async for event in events:
+            last = event
+            yield event
+        outcome = "complete" if last.startswith("event: complete") else "error"
+    finally:
+        durations[outcome].observe(time.perf_counter() - start)
+
+
+WEBSOCKET_CLOSE_REASONS = ("client", "heartbeat", "slow_client", "not_found")
+_websocket_closes = {reason: WEBSOCKET_CLOSES.labels(reason=reason) for reason in WEBSOCKET_CLOSE_REASONS}
+
+
+def websocket_closed(reason: str) -> None:
+    _websocket_closes[reason].inc()
+
+
+# ============= DB POOLS =============
+
+class PoolCollector:
+    """Connection pool gauges and counters of every instrumented engine, read at scrape time"""
+
+    GAUGES = {
+        "size": "Configured pool size",
+        "checked_out": "Connections in use",
+        "overflow": "Connections opened beyond the pool size",
+        "idle": "Idle connections in the pool",
+    }
+    COUNTERS = {
+        "checkouts": "Connection checkouts",
+        "waits": "Checkouts that found the pool exhausted",
+        "wait_seconds": "Time spent waiting for a connection",
+        "timeouts": "Checkouts that timed out",
+        "slow_queries": "Statements slower than DB_SLOW_QUERY_MS",
+    }
+
+    def collect(self):
+        stats = pool_stats()
+        for key, documentation in self.GAUGES.items():
+            family = GaugeMetricFamily(f"db_pool_{key}", documentation, labels=["engine"])
+            for engine, entry in stats.items():
+                if key in entry:
+                    family.add_metric([engine], entry[key])
+            yield family
+        for key, documentation in self.COUNTERS.items():
+            family = CounterMetricFamily(f"db_pool_{key}", documentation, labels=["engine"])
+            source = "wait_seconds_total" if key == "wait_seconds" else key
+            for engine, entry in stats.items():
+                family.add_metric([engine], entry[source])
+            yield family
+
+
+registry.register(PoolCollector())
+
+
+# ============= EXPOSITION =============
+
+def multiprocess_enabled() -> bool:
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def exposition() -> bytes:
+    """Text exposition of this process, or of every worker in multiprocess mode"""
+    if not multiprocess_enabled():
+        return generate_latest(registry)
+
+    from prometheus_client import multiprocess
+
+    combined = CollectorRegistry()
+    multiprocess.MultiProcessCollector(combined)
+    combined.register(PoolCollector())
+    return generate_latest(combined)
@@ -0,0 +1,394 @@
+"""
+Opt-in profiling of the API process (PROFILING_ENABLED).
+
+- On-demand profiles (GET /admin/profile): a statistical sampler reads the
+  event loop thread's stack (or every thread's) every few milliseconds for N
+  seconds and returns folded stacks ("frame;frame;frame count"), the input
+  format of flamegraph.pl, speedscope and inferno. Wall-clock mode counts
+  every tick, so time spent waiting on I/O shows up under the selector;
+  CPU mode weights each tick by the thread CPU time used since the previous
+  one (microseconds), so waiting drops out.
+- Slow requests (PROFILING_SLOW_REQUEST_MS): a background sampler keeps the
+  last minute of event loop stacks at PROFILING_SAMPLE_INTERVAL_MS. Requests
+  slower than the threshold keep the stacks sampled while they ran (the
+  whole loop, so concurrent requests show up too) and a breakdown of their
+  time: statements and time in the database, graph nodes and LLM calls.
+- Event loop stalls (PROFILING_LOOP_STALL_MS): a heartbeat task measures the
+  loop's lag (event_loop_lag_seconds); a watchdog thread grabs the loop
+  thread's stack while a heartbeat is overdue, i.e. the callback that is
+  blocking the loop.
+
+Samplers run in daemon threads and only read sys._current_frames(); the
+event loop itself does no work per sample.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_STACK_DEPTH = 128
+BACKGROUND_WINDOW_SECONDS = 60  # Stacks kept by the background sampler
+SAMPLER_THREAD_PREFIX = "profiling-"
+
+
+# ============= STACKS =============
+
+_frame_labels: Dict[Any, str] = {}
+
+
+def _short_path(filename: str) -> str:
+    marker = "site-packages" + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    try:
+        relative = os.path.relpath(filename)
+    except ValueError:
+        return filename
+    return relative if not relative.startswith("..") else os.path.basename(filename)
+
+
+def frame_label(code) -> str:
+    """'qualname (path:line)' of a code object, cached"""
+    label = _frame_labels.get(code)
+    if label is None:
+        name = getattr(code, "co_qualname", code.co_name)
+        label = f"{name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+        _frame_labels[code] = label
+    return label
+
+
+def fold_stack(frame) -> str:
+    """Stack of a frame, outermost first, joined with ';'"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+def folded(profile: Counter) -> str:
+    """Folded stacks text, heaviest first"""
+    return "".join(f"{stack} {count}\n" for stack, count in profile.most_common())
+
+
+class StackSampler:
+    """
+    Samples thread stacks from a daemon thread every `interval` seconds.
+
+    threads: thread ids to sample, or None for every thread (prefixed with the
+    thread name). Samples are aggregated in `profile` or, with `keep`, kept
+    as (perf_counter, stack) in a ring of that size.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        threads: Optional[List[int]] = None,
+        mode: str = "wall",
+        keep: int = 0
+    ):
+        if mode not in ("wall", "cpu"):
+            raise ValueError(f"Unknown profile mode: {mode}")
+        if mode == "cpu" and not hasattr(time, "pthread_getcpuclockid"):
+            raise ValueError("CPU profiles need per-thread CPU clocks (not available on this platform)")
+        self.interval = interval
+        self.threads = threads
+        self.mode = mode
+        self.samples = 0
+        self.profile: Optional[Counter] = Counter() if not keep else None
+        self.ring: Optional[Deque[Tuple[float, str]]] = deque(maxlen=keep) if keep else None
+        self._cpu_times: Dict[int, float] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"{SAMPLER_THREAD_PREFIX}sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+
+    def _run(self) -> None:
+        next_tick = time.perf_counter() + self.interval
+        while not self._stop.wait(max(0.0, next_tick - time.perf_counter())):
+            self.sample()
+            next_tick += self.interval
+            now = time.perf_counter()
+            if next_tick < now:
+                next_tick = now + self.interval  # fell behind: skip ticks instead of bursting
+
+    def _cpu_weight(self, thread_id: int) -> int:
+        try:
+            cpu = time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+        except OSError:
+            return 0
+        previous = self._cpu_times.get(thread_id)
+        self._cpu_times[thread_id] = cpu
+        return int((cpu - previous) * 1_000_000) if previous is not None else 0
+
+    def sample(self) -> None:
+        frames = sys._current_frames()
+        now = time.perf_counter()
+        names = None
+        if self.threads is None:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+        try:
+            for thread_id in self.threads if self.threads is not None else list(frames):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                name = ""
+                if names is not None:
+                    name = names.get(thread_id, str(thread_id))
+                    if name.startswith(SAMPLER_THREAD_PREFIX):
+                        continue
+                weight = 1 if self.mode == "wall" else self._cpu_weight(thread_id)
+                if weight <= 0:
+                    continue
+                stack = fold_stack(frame)
+                if names is not None:
+                    stack = f"thread {name};{stack}"
+                if self.profile is not None:
+                    self.profile[stack] += weight
+                else:
+                    self.ring.append((now, stack))
+            self.samples += 1
+        finally:
+            # Frames keep their locals alive
+            del frames
+
+    def window(self, start: float, end: float) -> Counter:
+        """Ring samples taken between two perf_counter() times"""
+        profile = Counter()
+        for taken, stack in tuple(self.ring):  # copied at once (the sampler keeps appending)
+            if start <= taken <= end:
+                profile[stack] += 1
+        return profile
+
+
+# ============= REQUEST BREAKDOWN =============
+
+class RequestBreakdown:
+    """Count and seconds per part of a request (graph nodes, LLM calls)"""
+
+    def __init__(self):
+        self.parts: Dict[str, List[float]] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        part = self.parts.get(name)
+        if part is None:
+            self.parts[name] = [1, seconds]
+        else:
+            part[0] += 1
+            part[1] += seconds
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {"count": int(count), "ms": round(seconds * 1000, 1)}
+            for name, (count, seconds) in sorted(self.parts.items(), key=lambda item: -item[1][1])
+        }
+
+
+_breakdown: ContextVar[Optional[RequestBreakdown]] = ContextVar("request_breakdown", default=None)
+
+
+def record(name: str, seconds: float) -> None:
+    """Add to the breakdown of the current request, if it is being captured"""
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        breakdown.add(name, seconds)
+
+
+# ============= EVENT LOOP MONITOR =============
+
+class LoopMonitor:
+    """
+    Heartbeat task on the event loop plus a watchdog thread. A heartbeat that
+    is late by the stall threshold is a stall: the watchdog captures the loop
+    thread's stack while it is still blocked, and the heartbeat reports the
+    stall with that stack once the loop runs again.
+    """
+
+    def __init__(self, interval: float, stall_threshold: float, on_stall):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.on_stall = on_stall
+        self._beat_count = 0
+        self._last_beat = time.perf_counter()
+        self._stall_stack: Optional[Tuple[int, str]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self, loop_thread: int) -> None:
+        self._loop_thread = loop_thread
+        self._last_beat = time.perf_counter()
+        self._task = asyncio.get_running_loop().create_task(self._beat())
+        self._watchdog = threading.Thread(target=self._watch, name=f"{SAMPLER_THREAD_PREFIX}watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1.0)
+            self._watchdog = None
+
+    async def _beat(self) -> None:
+        lag_histogram = metrics.EVENT_LOOP_LAG
+        while True:
+            before = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - before - self.interval)
+            lag_histogram.observe(lag)
+            beat, self._beat_count = self._beat_count, self._beat_count + 1
+            self._last_beat = now
+            if lag >= self.stall_threshold:
+                captured = self._stall_stack
+                stack = captured[1] if captured is not None and captured[0] == beat else None
+                self.on_stall(lag, stack)
+
+    def _watch(self) -> None:
+        poll = max(0.005, min(self.interval, self.stall_threshold) / 2)
+        while not self._stop.wait(poll):
+            beat = self._beat_count
+            overdue = time.perf_counter() - self._last_beat - self.interval
+            captured = self._stall_stack
+            if overdue >= self.stall_threshold and (captured is None or captured[0] != beat):
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    self._stall_stack = (beat, fold_stack(frame))
+                del frame
+
+
+# ============= RUNTIME =============
+
+class Profiler:
+    """Profiling state of the API process: the background samplers and what they captured"""
+
+    def __init__(self):
+        self.loop_thread: Optional[int] = None
+        self.background: Optional[StackSampler] = None
+        self.monitor: Optional[LoopMonitor] = None
+        self.slow_requests: Deque[Dict[str, Any]] = deque(maxlen=settings.PROFILING_KEEP)
+        self.loop_stalls: Deque[Dict[str, Any]] = deque(maxlen=settings.PROFILING_KEEP)
+        self._profile_lock = asyncio.Lock()
+
+    @property
+    def capturing_slow_requests(self) -> bool:
+        return self.background is not None
+
+    def start(self) -> None:
+        """Start the background sampler and loop monitor (call on the event loop)"""
+        self.loop_thread = threading.get_ident()
+        if settings.PROFILING_SLOW_REQUEST_MS and self.background is None:
+            interval = settings.PROFILING_SAMPLE_INTERVAL_MS / 1000
+            keep = int(BACKGROUND_WINDOW_SECONDS / interval)
+            self.background = StackSampler(interval, threads=[self.loop_thread], keep=keep).start()
+        if settings.PROFILING_LOOP_STALL_MS and self.monitor is None:
+            self.monitor = LoopMonitor(
+                settings.PROFILING_LOOP_CHECK_MS / 1000,
+                settings.PROFILING_LOOP_STALL_MS / 1000,
+                self.record_stall,
+            )
+            self.monitor.start(self.loop_thread)
+
+    async def stop(self) -> None:
+        if self.background is not None:
+            self.background.stop()
+            self.background = None
+        if self.monitor is not None:
+            await self.monitor.stop()
+            self.monitor = None
+
+    async def profile(self, seconds: float, interval: float, mode: str = "wall", all_threads: bool = False) -> StackSampler:
+        """Sample the event loop thread (or every thread) for `seconds`; one profile at a time"""
+        if self._profile_lock.locked():
+            raise RuntimeError("A profile is already running")
+        async with self._profile_lock:
+            threads = None if all_threads else [threading.get_ident()]
+            sampler = StackSampler(interval, threads=threads, mode=mode).start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                sampler.stop()
+            return sampler
+
+    @contextmanager
+    def request_breakdown(self) -> Iterator[Optional[RequestBreakdown]]:
+        """Breakdown of the current request while slow requests are captured, else None"""
+        if self.background is None:
+            yield None
+            return
+        breakdown = RequestBreakdown()
+        token = _breakdown.set(breakdown)
+        try:
+            yield breakdown
+        finally:
+            _breakdown.reset(token)
+
+    def record_slow_request(
+        self,
+        method: str,
+        route: str,
+        status_code: int,
+        start: float,
+        end: float,
+        breakdown: RequestBreakdown,
+        queries: int,
+        query_seconds: float
+    ) -> None:
+        """Keep a slow request's breakdown and the loop stacks sampled while it ran"""
+        background = self.background
+        profile = background.window(start, end) if background is not None else Counter()
+        duration = end - start
+        parts = {"db": {"count": queries, "ms": round(query_seconds * 1000, 1)}, **breakdown.as_dict()}
+        self.slow_requests.append({
+            "at": datetime.utcnow() - timedelta(seconds=duration),
+            "method": method,
+            "route": route,
+            "status_code": status_code,
+            "duration_ms": round(duration * 1000, 1),
+            "breakdown": parts,
+            "samples": sum(profile.values()),
+            "sample_interval_ms": settings.PROFILING_SAMPLE_INTERVAL_MS,
+            "profile": folded(profile),
+        })
+        metrics.SLOW_REQUESTS.inc()
+        summary = ", ".join(f"{name} {part['ms']:.0f} ms" for name, part in list(parts.items())[:4])
+        logger.warning(f"Slow request {method} {route} ({duration * 1000:.0f} ms): {summary}")
+
+    def record_stall(self, lag: float, stack: Optional[str]) -> None:
+        self.loop_stalls.append({
+            "at": datetime.utcnow() - timedelta(seconds=lag),
+            "lag_ms": round(lag * 1000, 1),
+            "stack": stack,
+        })
+        metrics.EVENT_LOOP_STALLS.inc()
+        innermost = " <- ".join(reversed(stack.split(";")[-3:])) if stack else "stack not captured"
+        logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms: {innermost}")
+
+
+profiler = Profiler()
@@ -0,0 +1,241 @@
+"""
+OpenTelemetry tracing: spans around HTTP requests, graph nodes, LLM calls,
+session_service functions, database statements, checkpoints and storage.
+
+The OpenTelemetry SDK is optional. Without it, or with TRACING_ENABLED=false,
+span() and traced() are no-ops that cost one attribute check; inside a trace
+the sampler dropped they return before creating a span. Spans started inside
+span(..., session_id=...) carry that session id as well.
+
+Exporters (TRACING_EXPORTER):
+    otlp     OTLP/HTTP (opentelemetry-exporter-otlp-proto-http) to
+             TRACING_OTLP_ENDPOINT or OTEL_EXPORTER_OTLP_ENDPOINT
+    jsonl    one JSON object per span appended to TRACING_JSONL_PATH (offline runs)
+    console  pretty-printed spans on stdout
+"""
+
+import functools
+import inspect
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    from opentelemetry import trace
+except ImportError:  # pragma: no cover - optional dependency
+    trace = None
+
+SESSION_ATTRIBUTE = "session.id"
+
+_tracer = None  # Set by configure_tracing
+_provider = None
+_session_id: ContextVar[Optional[str]] = ContextVar("trace_session_id", default=None)
+
+
+def tracing_enabled() -> bool:
+    return _tracer is not None
+
+
+def _in_unsampled_trace() -> bool:
+    """Whether the current trace was dropped by the sampler (its children would be too)"""
+    parent = trace.get_current_span().get_span_context()
+    return parent.is_valid and not parent.trace_flags.sampled
+
+
+# ============= SPANS =============
+
+@contextmanager
+def span(name: str, attributes: Optional[Dict[str, Any]] = None, session_id: Optional[str] = None) -> Iterator[Any]:
+    """
+    Run the block in a child span of the current one. Yields the span (None
+    when tracing is off); None-valued attributes are skipped.
+    """
+    if _tracer is None or _in_unsampled_trace():
+        yield None
+        return
+
+    token = _session_id.set(session_id) if session_id else None
+    try:
+        with _tracer.start_as_current_span(name) as current:
+            if current.is_recording():
+                session = _session_id.get()
+                if session:
+                    current.set_attribute(SESSION_ATTRIBUTE, session)
+                if attributes:
+                    set_attributes(current, attributes)
+            yield current
+    finally:
+        if token is not None:
+            _session_id.reset(token)
+
+
+def set_attributes(current: Any, attributes: Dict[str, Any]) -> None:
+    """Set the non-None attributes on a span (no-op for None or unsampled spans)"""
+    if current is None or not current.is_recording():
+        return
+    current.set_attributes({key: value for key, value in attributes.items() if value is not None})
+
+
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None) -> Any:
+    """
+    Start a child span of the current one without making it current, for
+    code that cannot wrap a block (e.g. SQLAlchemy before/after hooks).
+    Finish it with end_span(). Returns None when tracing is off.
+    """
+    if _tracer is None or _in_unsampled_trace():
+        return None
+    started = _tracer.start_span(name)
+    if started.is_recording():
+        session = _session_id.get()
+        if session:
+            started.set_attribute(SESSION_ATTRIBUTE, session)
+        if attributes:
+            set_attributes(started, attributes)
+    return started
+
+
+def end_span(started: Any, error: Optional[BaseException] = None) -> None:
+    """End a span from start_span(), marking it failed when `error` is set"""
+    if started is None:
+        return
+    if error is not None and started.is_recording():
+        started.record_exception(error)
+        started.set_status(trace.Status(trace.StatusCode.ERROR, str(error)))
+    started.end()
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """
+    Decorator for async functions: run each call in a span named `name`
+    (default: module.function). A `session_id` argument of the function is
+    recorded as the span's session id.
+    """
+    def decorator(fn: Callable) -> Callable:
+        span_name = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+        parameters = list(inspect.signature(fn).parameters)
+        session_index = parameters.index("session_id") if "session_id" in parameters else None
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return await fn(*args, **kwargs)
+            session_id = kwargs.get("session_id")
+            if session_id is None and session_index is not None and session_index < len(args):
+                session_id = args[session_index]
+            with span(span_name, session_id=session_id if isinstance(session_id, str) else None):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+# ============= SETUP =============
+
+def _jsonl_exporter(path: str):
+    from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+    class JsonLinesSpanExporter(SpanExporter):
+        """Appends one JSON object per finished span to a file"""
+
+        def __init__(self, path: str):
+            self.path = path
+            self._lock = threading.Lock()
+
+        def export(self, spans) -> SpanExportResult:
+            lines = [json.dumps(span_record(item), ensure_ascii=False, default=str) for item in spans]
+            with self._lock, open(self.path, "a", encoding="utf-8") as file:
+                file.write("\n".join(lines) + "\n")
+            return SpanExportResult.SUCCESS
+
+        def shutdown(self) -> None:
+            pass
+
+    return JsonLinesSpanExporter(path)
+
+
+def span_record(item) -> Dict[str, Any]:
+    """Flat dict of a finished SDK span (the JSON-lines format)"""
+    context = item.get_span_context()
+    return {
+        "name": item.name,
+        "trace_id": f"{context.trace_id:032x}",
+        "span_id": f"{context.span_id:016x}",
+        "parent_id": f"{item.parent.span_id:016x}" if item.parent else None,
+        "start_ns": item.start_time,
+        "duration_ms": round((item.end_time - item.start_time) / 1e6, 3),
+        "status": item.status.status_code.name,
+        "attributes": dict(item.attributes or {}),
+    }
+
+
+def create_exporter(kind: str):
+    """Span exporter for TRACING_EXPORTER"""
+    if kind == "jsonl":
+        return _jsonl_exporter(settings.TRACING_JSONL_PATH)
+    if kind == "console":
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+        return ConsoleSpanExporter()
+    if kind == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        return OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT or None)
+    raise ValueError(f"Unknown TRACING_EXPORTER: {kind}")
+
+
+def configure_tracing(exporter=None, sample_ratio: Optional[float] = None) -> bool:
+    """
+    Install the tracer provider when TRACING_ENABLED (or when an exporter is
+    passed, e.g. an in-memory one in tests). Returns whether tracing is on.
+    """
+    global _tracer, _provider
+
+    if exporter is None and not settings.TRACING_ENABLED:
+        return False
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    except ImportError:
+        logger.warning("Tracing is enabled but opentelemetry-sdk is not installed; spans are disabled")
+        return False
+
+    ratio = settings.TRACING_SAMPLE_RATIO if sample_ratio is None else sample_ratio
+    try:
+        exporter = exporter or create_exporter(settings.TRACING_EXPORTER)
+    except ImportError as e:
+        logger.warning(f"Tracing exporter {settings.TRACING_EXPORTER} unavailable ({e}); spans are disabled")
+        return False
+
+    shutdown_tracing()
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": settings.TRACING_SERVICE_NAME}),
+        sampler=ParentBased(TraceIdRatioBased(ratio)),
+    )
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    _tracer = _provider.get_tracer("app")
+    logger.info(f"Tracing enabled ({type(exporter).__name__}, sample ratio {ratio})")
+    return True
+
+
+def force_flush() -> None:
+    if _provider is not None:
+        _provider.force_flush()
+
+
+def shutdown_tracing() -> None:
+    """Flush pending spans and turn tracing off"""
+    global _tracer, _provider
+
+    if _provider is not None:
+        _provider.shutdown()
+    _tracer = None
+    _provider = None
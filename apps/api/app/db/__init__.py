@@ -1,4 +1,25 @@
-from app.db.base import Base, get_db, engine
-from app.db.models import Session, Message, DiagnosticResult
+from app.db.base import Base, get_db, get_read_db, get_sessionmaker, get_read_sessionmaker, engine, read_engine
+from app.db.models import (
+    Session,
+    Message,
+    DiagnosticResult,
+    GraphCheckpoint,
+    GraphCheckpointBlob,
+    GraphCheckpointWrite,
+)
 
-__all__ = ["Base", "get_db", "engine", "Session", "Message", "DiagnosticResult"]
+__all__ = [
+    "Base",
+    "get_db",
+    "get_read_db",
+    "get_sessionmaker",
+    "get_read_sessionmaker",
+    "engine",
+    "read_engine",
+    "Session",
+    "Message",
+    "DiagnosticResult",
+    "GraphCheckpoint",
+    "GraphCheckpointBlob",
+    "GraphCheckpointWrite",
+]
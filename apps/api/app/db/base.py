@@ -1,13 +1,76 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+import asyncio
+
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from app.core.config import settings
+from app.core.coordination import coordination
+from app.db.metrics import InstrumentedQueuePool, instrument_engine
+from app.db.routing import WriteTracker
+
+
+def build_engine(url: str, name: str = "primary", **overrides) -> AsyncEngine:
+    """
+    Create an instrumented async engine with the pool and statement cache
+    settings from Settings (DB_*). Keyword overrides go to create_async_engine.
+    """
+    db_url = make_url(url)
+    options = {
+        "echo": settings.DB_ECHO if settings.DB_ECHO is not None else settings.APP_ENV == "dev",
+        "future": True,
+    }
+
+    # SQLite (tests, local runs) keeps SQLAlchemy's default pool
+    if db_url.get_backend_name() != "sqlite":
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+            pool_logging_name=name,
+        )
+
+    if db_url.get_driver_name() == "asyncpg":
+        # asyncpg's own prepared statement cache (0 behind pgbouncer in
+        # transaction mode) and SQLAlchemy's per-connection cache on top
+        options["connect_args"] = {"statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+        db_url = db_url.update_query_dict({
+            "prepared_statement_cache_size": str(settings.DB_STATEMENT_CACHE_SIZE)
+        })
+
+    options.update(overrides)
+    engine = create_async_engine(db_url, **options)
+    return instrument_engine(engine, name=name, slow_query_ms=settings.DB_SLOW_QUERY_MS)
+
+
+async def warm_up_pool(engine: AsyncEngine, connections: int) -> int:
+    """
+    Open `connections` pooled connections at once and ping each (SELECT 1),
+    so the first requests find them ready. Returns the number opened.
+    """
+    async def ping(conn) -> None:
+        await conn.execute(text("SELECT 1"))
+
+    opened = await asyncio.gather(*(engine.connect() for _ in range(connections)), return_exceptions=True)
+    conns = [conn for conn in opened if not isinstance(conn, BaseException)]
+    try:
+        await asyncio.gather(*(ping(conn) for conn in conns))
+    finally:
+        # Back to the pool
+        for conn in conns:
+            await conn.close()
+    failed = [error for error in opened if isinstance(error, BaseException)]
+    if failed:
+        raise failed[0]
+    return len(conns)
+
 
 # Create async engine
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=settings.APP_ENV == "dev",
-    future=True,
-)
+engine = build_engine(settings.DATABASE_URL)
 
 # Create async session factory
 AsyncSessionLocal = async_sessionmaker(
@@ -18,6 +81,24 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False,
 )
 
+# Optional read replica (falls back to the primary)
+read_engine = build_engine(settings.READ_DATABASE_URL, name="replica") if settings.READ_DATABASE_URL else engine
+
+AsyncReadSessionLocal = async_sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False,
+)
+
+# Sessions written recently (read-your-writes): by this process, or by any
+# worker with a shared coordination backend
+write_tracker = WriteTracker(
+    settings.READ_STICKY_SECONDS,
+    backend=coordination if coordination.shared else None
+)
+
 # Create declarative base
 Base = declarative_base()
 
@@ -32,3 +113,28 @@ async def get_db() -> AsyncSession:
             raise
         finally:
             await session.close()
+
+# Dependency for read-only endpoints
+async def get_read_db(request: Request) -> AsyncSession:
+    """
+    Session on the read replica, or on the primary when there is no replica
+    or the session in the path was written within READ_STICKY_SECONDS.
+    """
+    session_id = request.path_params.get("session_id")
+    if read_engine is engine or await write_tracker.is_sticky(session_id):
+        factory = AsyncSessionLocal
+    else:
+        factory = AsyncReadSessionLocal
+    
+    async with factory() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+# Session factories for streaming responses, which outlive request dependencies
+def get_sessionmaker() -> async_sessionmaker:
+    return AsyncSessionLocal
+
+def get_read_sessionmaker() -> async_sessionmaker:
+    return AsyncReadSessionLocal
@@ -0,0 +1,186 @@
+"""
+Database instrumentation: per-request query counting, connection pool
+telemetry, slow query logging and one trace span per statement.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core import tracing
+
+logger = logging.getLogger(__name__)
+
+
+# ============= QUERY COUNTER =============
+
+class QueryCounter:
+    """Number of statements executed, and seconds spent in them, while the counter is active"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+_current_counter: ContextVar[Optional[QueryCounter]] = ContextVar("db_query_counter", default=None)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    """
+    Count the statements executed in the current context (e.g. one request).
+    Only engines registered with instrument_engine are counted.
+    """
+    counter = QueryCounter()
+    token = _current_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_counter.reset(token)
+
+
+# ============= POOL TELEMETRY =============
+
+class PoolMetrics:
+    """Checkout counters of one engine's connection pool"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.reset()
+
+    def reset(self) -> None:
+        self.checkouts = 0
+        self.waits = 0  # Checkouts that found the pool exhausted
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+        self.slow_queries = 0
+
+    def record_checkout(self, seconds: float, waited: bool) -> None:
+        self.checkouts += 1
+        if waited:
+            self.waits += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+            "timeouts": self.timeouts,
+            "slow_queries": self.slow_queries,
+        }
+
+
+_pool_metrics: Dict[str, PoolMetrics] = {}
+_engines: Dict[str, AsyncEngine] = {}
+
+
+def get_pool_metrics(name: str) -> PoolMetrics:
+    if name not in _pool_metrics:
+        _pool_metrics[name] = PoolMetrics(name)
+    return _pool_metrics[name]
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Async queue pool that records checkout waits.
+    Metrics are keyed by the pool's logging name (the engine name), which
+    survives pool re-creation on dispose().
+    """
+
+    def _do_get(self):
+        metrics = get_pool_metrics(self._orig_logging_name or "default")
+        waited = self._max_overflow > -1 and self.checkedout() >= self.size() + self._max_overflow
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            metrics.timeouts += 1
+            raise
+        metrics.record_checkout(time.perf_counter() - start, waited)
+        return connection
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Counters plus current pool gauges for every instrumented engine"""
+    stats = {}
+    for name, engine in _engines.items():
+        pool = engine.sync_engine.pool
+        entry = get_pool_metrics(name).snapshot()
+        if isinstance(pool, AsyncAdaptedQueuePool):
+            entry.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "idle": pool.checkedin(),
+            })
+        stats[name] = entry
+    return stats
+
+
+# ============= ENGINE HOOKS =============
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    counter = _current_counter.get()
+    if counter is not None:
+        counter.count += 1
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+    if tracing.tracing_enabled():
+        conn.info.setdefault("query_spans", []).append(tracing.start_span("db.query", {
+            "db.system": conn.dialect.name,
+            "db.operation": statement.split(None, 1)[0].upper() if statement else None,
+            "db.statement": " ".join(statement.split())[:500],
+            "db.executemany": executemany,
+        }))
+
+
+def _end_query_span(conn, error: Optional[BaseException] = None) -> None:
+    spans = conn.info.get("query_spans")
+    if spans:
+        tracing.end_span(spans.pop(), error)
+
+
+def _handle_error(context) -> None:
+    if context.connection is not None:
+        _end_query_span(context.connection, context.original_exception)
+
+
+def _slow_query_logger(name: str, threshold_ms: float):
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        _end_query_span(conn)
+        starts = conn.info.get("query_start_time")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        counter = _current_counter.get()
+        if counter is not None:
+            counter.seconds += elapsed
+        elapsed_ms = elapsed * 1000
+        if threshold_ms and elapsed_ms >= threshold_ms:
+            get_pool_metrics(name).slow_queries += 1
+            logger.warning(f"Slow query on {name} ({elapsed_ms:.0f} ms): {' '.join(statement.split())[:500]}")
+    return after_cursor_execute
+
+
+def instrument_engine(engine: AsyncEngine, name: str = "default", slow_query_ms: float = 0) -> AsyncEngine:
+    """
+    Attach the query counter and slow query logging to an engine and register
+    it for pool_stats(). slow_query_ms=0 disables slow query logging.
+    """
+    sync_engine = engine.sync_engine
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _slow_query_logger(name, slow_query_ms))
+        event.listen(sync_engine, "handle_error", _handle_error)
+    _engines[name] = engine
+    get_pool_metrics(name)
+    return engine
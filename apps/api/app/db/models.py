@@ -1,9 +1,13 @@
-from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, JSON, Float, Enum
+from sqlalchemy import Column, String, Integer, DateTime, Date, Text, ForeignKey, JSON, Float, Enum, LargeBinary, Index, Boolean, UniqueConstraint, DDL, event, func, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
 from app.db.base import Base
 
+# JSONB on PostgreSQL (indexable, binary storage); plain JSON elsewhere
+JSONType = JSON().with_variant(JSONB(), "postgresql")
+
 class SessionStatus(str, enum.Enum):
     ACTIVE = "active"
     COMPLETED = "completed"
@@ -18,46 +22,90 @@ class Session(Base):
     __tablename__ = "sessions"
 
     id = Column(String, primary_key=True, index=True)
-    user_id = Column(String, nullable=True, index=True)  # Optional for now
+    user_id = Column(String, nullable=True)  # Optional for now (indexed with updated_at)
+    clinic_id = Column(String, nullable=True)  # Grouping key for analytics
     status = Column(Enum(SessionStatus), default=SessionStatus.ACTIVE, nullable=False)
     
-    # Patient info collected during conversation
-    patient_info = Column(JSON, default=dict)
+    # Patient info and symptoms collected during conversation
+    patient_info = Column(JSONType, default=dict)
+    symptoms = Column(JSONType, default=list, server_default=text("'[]'"), nullable=False)
+    
+    # Set when a diagnosis with a critical red flag is saved (dashboard filter)
+    has_critical_red_flags = Column(Boolean, default=False, server_default=text("false"), nullable=False)
+    
+    # LLM usage of the session (app/agents/usage.py); token_usage breaks it down by agent
+    input_tokens = Column(Integer, default=0, server_default=text("0"), nullable=False)
+    output_tokens = Column(Integer, default=0, server_default=text("0"), nullable=False)
+    llm_calls = Column(Integer, default=0, server_default=text("0"), nullable=False)
+    cost_usd = Column(Float, default=0.0, server_default=text("0"), nullable=False)
+    token_usage = Column(JSONType, default=dict, server_default=text("'{}'"), nullable=False)
     
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # Last message, state change or diagnosis (retention counts from it);
+    # maintenance status changes move updated_at only
+    last_activity_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     
     # Relationships
     messages = relationship("Message", back_populates="session", cascade="all, delete-orphan")
     diagnostic_results = relationship("DiagnosticResult", back_populates="session", cascade="all, delete-orphan")
+    
+    @property
+    def total_tokens(self) -> int:
+        return (self.input_tokens or 0) + (self.output_tokens or 0)
+    
+    __table_args__ = (
+        # A user's sessions by recency
+        Index("ix_sessions_user_id_updated_at", "user_id", "updated_at"),
+        # Dashboard listing: keyset on (updated_at, id), optionally by status
+        # or restricted to sessions with critical red flags
+        Index("ix_sessions_updated_at_id", "updated_at", "id"),
+        Index("ix_sessions_status_updated_at_id", "status", "updated_at", "id"),
+        # Retention scans of idle sessions by status (maintenance)
+        Index("ix_sessions_status_last_activity_at", "status", "last_activity_at"),
+        Index(
+            "ix_sessions_critical_updated_at_id",
+            "updated_at",
+            "id",
+            postgresql_where=text("has_critical_red_flags"),
+            sqlite_where=text("has_critical_red_flags"),
+        ),
+    )
 
 class Message(Base):
     __tablename__ = "messages"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    session_id = Column(String, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False, index=True)
+    session_id = Column(String, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)  # Leading column of the composite indexes
     role = Column(Enum(MessageRole), nullable=False)
     content = Column(Text, nullable=False)
     
     # Optional: store image references or analysis results
-    images = Column(JSON, default=list)  # List of image URLs/paths with metadata
+    images = Column(JSONType, default=list)  # List of image URLs/paths with metadata
     
     # Store additional metadata (e.g., agent actions)
-    message_metadata = Column(JSON, default=dict)
+    message_metadata = Column(JSONType, default=dict)
     
     timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
     
     # Relationships
     session = relationship("Session", back_populates="messages")
+    
+    __table_args__ = (
+        # Keyset pagination of a session's history
+        Index("ix_messages_session_id_id", "session_id", "id"),
+        # History in timestamp order (get_session_messages)
+        Index("ix_messages_session_id_timestamp", "session_id", "timestamp"),
+    )
 
 class DiagnosticResult(Base):
     __tablename__ = "diagnostic_results"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    session_id = Column(String, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False, index=True)
+    session_id = Column(String, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)  # Leading column of the composite indexes
     
     # Store the complete ClinicalAssessment as JSON
-    assessment_json = Column(JSON, nullable=False)
+    assessment_json = Column(JSONType, nullable=False)
     
     # Store confidence score for tracking
     confidence_score = Column(Float, nullable=True)
@@ -66,3 +114,197 @@ class DiagnosticResult(Base):
     
     # Relationships
     session = relationship("Session", back_populates="diagnostic_results")
+
+
+# Latest result of a session (get_diagnostic_result)
+Index(
+    "ix_diagnostic_results_session_id_created_at",
+    DiagnosticResult.session_id,
+    DiagnosticResult.created_at.desc(),
+)
+
+# Results by differential name: assessment_json -> 'differentials' @> '[{"name": ...}]'
+Index(
+    "ix_diagnostic_results_differentials",
+    DiagnosticResult.assessment_json["differentials"].label("differentials"),
+    postgresql_using="gin",
+    postgresql_ops={"differentials": "jsonb_path_ops"},
+).ddl_if(dialect="postgresql")
+
+
+# ============= ANALYTICS =============
+# Normalized rows extracted from each saved assessment (one per differential,
+# red flag and action item) and a daily rollup updated in the same
+# transaction, so dashboards never deserialize assessment_json.
+
+class FactKind(str, enum.Enum):
+    DIFFERENTIAL = "differential"  # level = urgency, likelihood set
+    RED_FLAG = "red_flag"  # level = severity
+    ACTION = "action"  # level = priority
+
+class AssessmentFact(Base):
+    __tablename__ = "assessment_facts"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    diagnostic_result_id = Column(Integer, ForeignKey("diagnostic_results.id", ondelete="SET NULL"), nullable=True, index=True)
+    session_id = Column(String, nullable=False)
+    clinic_id = Column(String, nullable=True)
+    day = Column(Date, nullable=False)  # UTC day of the assessment
+    
+    kind = Column(Enum(FactKind), nullable=False)
+    label = Column(String(255), nullable=False)  # Differential name, red flag message or action
+    level = Column(String(16), nullable=False)
+    likelihood = Column(Integer, nullable=True)
+    rank = Column(Integer, nullable=False)  # Position in the assessment
+    
+    # Many-to-one only: facts are written once and outlive archived results
+    # (NULL result), so the rollup can always be rebuilt from them
+    diagnostic_result = relationship("DiagnosticResult")
+    
+    __table_args__ = (
+        Index("ix_assessment_facts_kind_day", "kind", "day"),
+    )
+
+class AssessmentDailyStat(Base):
+    __tablename__ = "assessment_daily_stats"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    clinic_id = Column(String, nullable=False, default="", server_default="")  # "" without clinic
+    kind = Column(Enum(FactKind), nullable=False)
+    level = Column(String(16), nullable=False)
+    label = Column(String(255), nullable=False)
+    
+    count = Column(Integer, nullable=False, default=0)
+    likelihood_sum = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        # Upsert key; also serves kind + day range lookups across clinics
+        UniqueConstraint("kind", "day", "clinic_id", "level", "label", name="uq_assessment_daily_stats_key"),
+        Index("ix_assessment_daily_stats_clinic_kind_day", "clinic_id", "kind", "day"),
+    )
+
+
+# ============= FULL-TEXT SEARCH =============
+# Searchable text of a session: one document per message, one for the
+# symptom list and one per diagnosis (differential names). PostgreSQL
+# indexes the accent-folded to_tsvector('spanish', content) with GIN; SQLite
+# mirrors the table into an FTS5 index through triggers (app/services/search.py).
+
+class SearchDocument(Base):
+    __tablename__ = "search_documents"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False, index=True)
+    message_id = Column(Integer, ForeignKey("messages.id", ondelete="CASCADE"), nullable=True, index=True)
+    diagnostic_result_id = Column(Integer, ForeignKey("diagnostic_results.id", ondelete="CASCADE"), nullable=True, index=True)
+    source = Column(String(20), nullable=False)  # user_message, assistant_message, symptoms, diagnosis
+    content = Column(Text, nullable=False)
+    
+    diagnostic_result = relationship("DiagnosticResult")
+
+
+SEARCH_CONFIG = "spanish"
+
+# Accents are folded before stemming so "neumonia" finds "neumonía" (the
+# Spanish stemmer alone keeps them apart); done with translate() rather
+# than the unaccent extension so no extension is required
+SEARCH_FOLD_FROM = "ÁÉÍÓÚÜáéíóúü"
+SEARCH_FOLD_TO = "AEIOUUaeiouu"
+
+
+# Constants are inlined (not bound) so queries match the index expression
+def search_folded(column):
+    return func.translate(column, text(f"'{SEARCH_FOLD_FROM}'"), text(f"'{SEARCH_FOLD_TO}'"))
+
+
+def search_vector(column):
+    """Expression of the GIN index below; queries must use exactly this one"""
+    return func.to_tsvector(text(f"'{SEARCH_CONFIG}'"), search_folded(column))
+
+
+Index(
+    "ix_search_documents_content_tsv",
+    search_vector(SearchDocument.content),
+    postgresql_using="gin",
+).ddl_if(dialect="postgresql")
+
+# SQLite: external-content FTS5 table kept in sync by triggers
+for statement in (
+    """CREATE VIRTUAL TABLE search_documents_fts USING fts5(
+        content, content='search_documents', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER search_documents_ai AFTER INSERT ON search_documents BEGIN
+        INSERT INTO search_documents_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER search_documents_ad AFTER DELETE ON search_documents BEGIN
+        INSERT INTO search_documents_fts(search_documents_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER search_documents_au AFTER UPDATE ON search_documents BEGIN
+        INSERT INTO search_documents_fts(search_documents_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO search_documents_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+):
+    event.listen(SearchDocument.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(
+    SearchDocument.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS search_documents_fts").execute_if(dialect="sqlite"),
+)
+
+
+# ============= LANGGRAPH CHECKPOINTS =============
+# Graph state is stored per thread (thread_id = session id). Channel values
+# live in graph_checkpoint_blobs keyed by (channel, version), so a checkpoint
+# only writes the channels that changed since the previous one.
+
+class GraphCheckpoint(Base):
+    __tablename__ = "graph_checkpoints"
+
+    thread_id = Column(String, primary_key=True)
+    checkpoint_ns = Column(String, primary_key=True, default="")
+    checkpoint_id = Column(String, primary_key=True)
+    parent_checkpoint_id = Column(String, nullable=True)
+    
+    # Serialized checkpoint (versions only, without channel values) and metadata
+    checkpoint_type = Column(String, nullable=False)
+    checkpoint = Column(LargeBinary, nullable=False)
+    metadata_type = Column(String, nullable=False)
+    checkpoint_metadata = Column("metadata", LargeBinary, nullable=False)
+    
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class GraphCheckpointBlob(Base):
+    __tablename__ = "graph_checkpoint_blobs"
+
+    thread_id = Column(String, primary_key=True)
+    checkpoint_ns = Column(String, primary_key=True, default="")
+    channel = Column(String, primary_key=True)
+    version = Column(String, primary_key=True)
+    value_type = Column(String, nullable=False)
+    blob = Column(LargeBinary, nullable=True)
+
+class GraphCheckpointWrite(Base):
+    __tablename__ = "graph_checkpoint_writes"
+
+    thread_id = Column(String, primary_key=True)
+    checkpoint_ns = Column(String, primary_key=True, default="")
+    checkpoint_id = Column(String, primary_key=True)
+    task_id = Column(String, primary_key=True)
+    idx = Column(Integer, primary_key=True)
+    channel = Column(String, nullable=False)
+    value_type = Column(String, nullable=False)
+    blob = Column(LargeBinary, nullable=True)
+
+
+# ============= COORDINATION =============
+# Short-lived flags shared by API workers (app/core/coordination.py, postgres
+# backend). UNLOGGED in PostgreSQL (see migration 009): losing them on a crash
+# only means a few reads go to the replica early.
+
+class CoordinationFlag(Base):
+    __tablename__ = "coordination_flags"
+
+    key = Column(String, primary_key=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
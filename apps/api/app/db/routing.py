@@ -0,0 +1,56 @@
+"""
+Read/write routing: read-your-writes protection for the read replica.
+
+After a session is written, reads for it go to the primary for a short
+window (READ_STICKY_SECONDS) so a lagging replica never serves a stale
+session to the client that just wrote it. With several workers the marks
+live in the shared coordination backend, since the read may land on a
+different worker than the write.
+"""
+
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    from app.core.coordination import CoordinationBackend
+
+
+class WriteTracker:
+    """
+    Last write time per key (session id), kept for the stickiness window:
+    in this process, or as flags of a shared coordination backend
+    """
+
+    def __init__(self, window_seconds: float, max_keys: int = 100_000, backend: Optional["CoordinationBackend"] = None):
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self.backend = backend
+        self._written_at: Dict[str, float] = {}
+
+    async def mark_written(self, key: Optional[str]) -> None:
+        if not key or self.window_seconds <= 0:
+            return
+        if self.backend is not None:
+            await self.backend.set_flag(f"written:{key}", self.window_seconds)
+            return
+        now = time.monotonic()
+        # Re-insert so the dict stays ordered by write time
+        self._written_at.pop(key, None)
+        self._written_at[key] = now
+        if len(self._written_at) > self.max_keys:
+            self._prune(now)
+
+    async def is_sticky(self, key: Optional[str]) -> bool:
+        if not key:
+            return False
+        if self.backend is not None:
+            return self.window_seconds > 0 and await self.backend.has_flag(f"written:{key}")
+        written_at = self._written_at.get(key)
+        return written_at is not None and time.monotonic() - written_at < self.window_seconds
+
+    def _prune(self, now: float) -> None:
+        # Oldest entries first; stop at the first one still in the window
+        for key, written_at in list(self._written_at.items()):
+            if now - written_at < self.window_seconds and len(self._written_at) <= self.max_keys:
+                break
+            del self._written_at[key]
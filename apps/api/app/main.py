@@ -1,11 +1,23 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Request, Response, Query, Header, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.datastructures import Headers
 from pathlib import Path
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional, Set, Tuple
+from datetime import date, datetime, timezone
 import asyncio
+import base64
+import io
 import json
+import logging
+import secrets
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST
 
 from app.models.clinical import AnalyzeRequest, AnalyzeResponse
 from app.models.session import (
@@ -13,17 +25,88 @@ from app.models.session import (
     SessionResponse,
     MessageCreate,
     MessageResponse,
+    MessagePageResponse,
+    SessionStatus,
+    SessionSummary,
+    SessionListResponse,
+    TokenUsage,
+    UserUsageResponse,
     ImageUploadResponse
 )
+from app.models.stats import StatsKind, StatsResponse, StatsRow
+from app.models.search import SearchHit, SearchResponse
 from app.services.analyzer import analyze_case
-from app.services import session_service
+from app.services import session_service, export, analytics, search
 from app.services.storage import storage_service
-from app.db.base import get_db
-from app.db.models import MessageRole
+from app.services.channels import SessionChannel, Subscriber, channels
+from app.services.maintenance import maintenance_runner
+from app.db.base import engine, get_db, get_read_db, get_sessionmaker, read_engine, warm_up_pool
+from app.db.models import FactKind, MessageRole, SessionStatus as DBSessionStatus
+from app.db.metrics import count_queries, pool_stats
+from app.agents import events
 from app.agents.graph import process_user_message, process_image_upload, force_diagnosis
+from app.agents.registry import registry
+from app.agents.usage import budget_mode, track_usage
+from app.core import metrics, profiling, tracing
 from app.core.config import settings
+from app.core.coordination import LockTimeout, coordination
+
+logger = logging.getLogger(__name__)
+
+async def warm_up() -> None:
+    """
+    Build the agents, checkpointer and compiled graph (in a thread: their
+    imports are the slow part) while opening pooled database connections, so
+    the first requests of a new worker do not pay for either. Failures are
+    logged; whatever failed is retried on first use.
+    """
+    start = time.perf_counter()
+    engines = {"primary": engine}
+    if read_engine is not engine:
+        engines["replica"] = read_engine
+    results = await asyncio.gather(
+        asyncio.to_thread(registry.warm_up),
+        *(warm_up_pool(db_engine, settings.WARMUP_DB_CONNECTIONS) for db_engine in engines.values()),
+        return_exceptions=True
+    )
+    for name, result in zip(engines, results[1:]):
+        if isinstance(result, BaseException):
+            logger.warning(f"Warm-up of the {name} database pool failed: {str(result)}")
+    logger.info(f"Warm-up done in {time.perf_counter() - start:.2f}s")
+
+@asynccontextmanager
+async def session_turn(session_id: str):
+    """
+    One turn of a session (message, image upload, finalize) at a time, across
+    workers with a shared coordination backend; 409 when the previous turn
+    does not finish within SESSION_LOCK_TIMEOUT_SECONDS
+    """
+    try:
+        async with coordination.lock(f"session:{session_id}", settings.SESSION_LOCK_TIMEOUT_SECONDS):
+            yield
+    except LockTimeout:
+        raise HTTPException(status_code=409, detail="Session is busy with another request")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Set up tracing and profiling, warm up agents and pools, and start
+    background maintenance jobs (retention, archival, blob GC)
+    """
+    tracing.configure_tracing()
+    if settings.WARMUP_ENABLED:
+        await warm_up()
+    if settings.PROFILING_ENABLED:
+        profiling.profiler.start()
+    if settings.MAINTENANCE_ENABLED:
+        maintenance_runner.start()
+    yield
+    await maintenance_runner.stop()
+    await profiling.profiler.stop()
+    await coordination.close()
+    tracing.shutdown_tracing()
 
-app = FastAPI(title="Medical Diagnostic Assistant", version="0.2.0")
+app = FastAPI(title="Medical Diagnostic Assistant", version="0.2.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,6 +114,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Export-Watermark"],
 )
 
 # Mount uploads directory for local storage
@@ -39,10 +123,103 @@ if not settings.use_s3:
     uploads_path.mkdir(exist_ok=True)
     app.mount("/uploads", StaticFiles(directory=str(uploads_path)), name="uploads")
 
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """
+    Per-request telemetry: database statements (X-DB-Queries header), latency
+    by route, when tracing is on the root span and, while slow requests are
+    captured, their breakdown and profile. For streamed responses (finalize)
+    latency and span end when the headers are sent; the stream's graph and
+    LLM spans stay in the same trace but end after it.
+    """
+    start = time.perf_counter()
+    with (
+        count_queries() as counter,
+        tracing.span(f"HTTP {request.method}") as current,
+        profiling.profiler.request_breakdown() as breakdown,
+    ):
+        response = await call_next(request)
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        if current is not None:
+            tracing.set_attributes(current, {
+                "http.method": request.method,
+                "http.route": route_path,
+                "http.status_code": response.status_code,
+                "session.id": request.path_params.get("session_id"),
+            })
+            current.update_name(f"{request.method} {route_path}")
+    end = time.perf_counter()
+    metrics.http_duration(request.method, route_path).observe(end - start)
+    if breakdown is not None and (end - start) * 1000 >= settings.PROFILING_SLOW_REQUEST_MS:
+        profiling.profiler.record_slow_request(
+            request.method, route_path, response.status_code, start, end,
+            breakdown, counter.count, counter.seconds
+        )
+    response.headers["X-DB-Queries"] = str(counter.count)
+    logger.debug(f"{request.method} {request.url.path}: {counter.count} queries")
+    return response
+
 @app.get("/health")
 def health():
     return {"ok": True}
 
+@app.get("/health/db")
+def health_db():
+    """Connection pool telemetry per engine (checkouts, waits, overflow, slow queries)"""
+    return {"pools": pool_stats()}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus exposition of the series in app/core/metrics.py"""
+    return Response(content=metrics.exposition(), media_type=CONTENT_TYPE_LATEST)
+
+# ============= PROFILING (PROFILING_ENABLED) =============
+
+def require_profiling(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Admin endpoints exist only with profiling enabled and PROFILING_ADMIN_TOKEN set"""
+    expected = settings.PROFILING_ADMIN_TOKEN
+    if not settings.PROFILING_ENABLED or not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(x_admin_token or "", expected):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/admin/profile", dependencies=[Depends(require_profiling)], response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(10.0, ge=1, le=1000),
+    mode: Literal["wall", "cpu"] = "wall",
+    all_threads: bool = False
+):
+    """
+    Sample the event loop thread (all_threads=true: every thread) for
+    `seconds` and return folded stacks for flamegraph.pl or speedscope.
+    mode=wall counts samples (I/O waits included); mode=cpu weights them by
+    thread CPU microseconds.
+    """
+    if seconds > settings.PROFILING_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be at most {settings.PROFILING_MAX_SECONDS}")
+    try:
+        sampler = await profiling.profiler.profile(seconds, interval_ms / 1000, mode=mode, all_threads=all_threads)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return PlainTextResponse(
+        profiling.folded(sampler.profile),
+        headers={"X-Profile-Samples": str(sampler.samples), "X-Profile-Mode": mode}
+    )
+
+@app.get("/admin/slow-requests", dependencies=[Depends(require_profiling)])
+def slow_requests():
+    """Captured requests slower than PROFILING_SLOW_REQUEST_MS, newest first"""
+    return {"slow_requests": list(reversed(profiling.profiler.slow_requests))}
+
+@app.get("/admin/loop-stalls", dependencies=[Depends(require_profiling)])
+def loop_stalls():
+    """Event loop stalls longer than PROFILING_LOOP_STALL_MS and the stack that blocked, newest first"""
+    return {"loop_stalls": list(reversed(profiling.profiler.loop_stalls))}
+
 # ============= LEGACY ENDPOINT (backward compatibility) =============
 
 @app.post("/v1/analyze", response_model=AnalyzeResponse)
@@ -66,12 +243,14 @@ async def create_session(
         session = await session_service.create_session(
             db=db,
             user_id=req.user_id,
-            patient_info=req.patient_info
+            patient_info=req.patient_info,
+            clinic_id=req.clinic_id
         )
         
         return SessionResponse(
             id=session.id,
             user_id=session.user_id,
+            clinic_id=session.clinic_id,
             status=session.status,
             patient_info=session.patient_info,
             created_at=session.created_at,
@@ -80,163 +259,518 @@ async def create_session(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def to_utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """Timestamps are stored as naive UTC"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+@app.get("/v1/sessions", response_model=SessionListResponse)
+async def list_sessions(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    user_id: Optional[str] = None,
+    status: Optional[SessionStatus] = None,
+    updated_from: Optional[datetime] = None,
+    updated_to: Optional[datetime] = None,
+    critical_red_flags: bool = False,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    List sessions by last activity, newest first (clinician dashboard).
+    Filters: user_id, status, updated_from/updated_to (last activity range),
+    critical_red_flags=true for sessions whose diagnosis has a critical flag.
+    Paginate with the returned next_cursor.
+    """
+    try:
+        sessions, next_cursor = await session_service.list_sessions(
+            db,
+            limit=limit,
+            cursor=cursor,
+            user_id=user_id,
+            status=DBSessionStatus(status.value) if status else None,
+            updated_from=to_utc_naive(updated_from),
+            updated_to=to_utc_naive(updated_to),
+            critical_only=critical_red_flags
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        counts = await session_service.count_session_activity(db, [s.id for s in sessions])
+        
+        return SessionListResponse(
+            sessions=[
+                SessionSummary(
+                    id=session.id,
+                    user_id=session.user_id,
+                    status=session.status,
+                    has_critical_red_flags=session.has_critical_red_flags,
+                    total_tokens=session.total_tokens,
+                    cost_usd=session.cost_usd,
+                    created_at=session.created_at,
+                    updated_at=session.updated_at,
+                    **counts[session.id]
+                )
+                for session in sessions
+            ],
+            next_cursor=next_cursor
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/v1/export/sessions")
+async def export_sessions(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    include_messages: bool = True,
+    chunk_size: int = Query(export.DEFAULT_CHUNK_SIZE, ge=1, le=5000),
+    session_factory = Depends(get_sessionmaker)
+):
+    """
+    Stream sessions with their assessments (and messages) as NDJSON, ordered
+    by updated_at. Incremental: pass the X-Export-Watermark of the previous
+    export as since. Reads the primary (a replica may lag behind the
+    watermark).
+    """
+    until = to_utc_naive(until) or export.default_watermark()
+    return StreamingResponse(
+        export.stream_ndjson(
+            session_factory,
+            since=to_utc_naive(since),
+            until=until,
+            include_messages=include_messages,
+            chunk_size=chunk_size
+        ),
+        media_type="application/x-ndjson",
+        headers={"X-Export-Watermark": until.isoformat()}
+    )
+
+@app.get("/v1/search", response_model=SearchResponse)
+async def search_sessions(
+    q: str = Query(..., min_length=2, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Find sessions by symptom or diagnosis text ("dolor torácico", "neumonía")
+    across messages, symptoms and differential names, best match first.
+    """
+    try:
+        hits, has_more = await search.search_sessions(db, q, limit=limit, offset=offset)
+        return SearchResponse(
+            results=[SearchHit(**hit) for hit in hits],
+            next_offset=offset + limit if has_more else None
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/v1/stats", response_model=StatsResponse)
+async def get_stats(
+    kind: StatsKind = "differential",
+    group_by: Literal["label", "level"] = "label",
+    bucket: Literal["total", "day", "week"] = "total",
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    clinic_id: Optional[str] = None,
+    level: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Most frequent differentials, red flags or action items (by label, or by
+    urgency/severity/priority with group_by=level), overall or per day/week,
+    optionally for one clinic. Served from the precomputed daily rollup.
+    """
+    try:
+        rows = await analytics.query_stats(
+            db,
+            kind=FactKind(kind),
+            group_by=group_by,
+            bucket=bucket,
+            day_from=date_from,
+            day_to=date_to,
+            clinic_id=clinic_id,
+            level=level,
+            limit=limit
+        )
+        return StatsResponse(
+            kind=kind,
+            group_by=group_by,
+            bucket=bucket,
+            rows=[StatsRow(**row) for row in rows]
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def to_token_usage(session) -> TokenUsage:
+    return TokenUsage(
+        input_tokens=session.input_tokens,
+        output_tokens=session.output_tokens,
+        total_tokens=session.total_tokens,
+        llm_calls=session.llm_calls,
+        cost_usd=session.cost_usd,
+        by_agent=session.token_usage or {},
+        budget_mode=budget_mode(session.total_tokens)
+    )
+
+def to_message_response(msg) -> MessageResponse:
+    return MessageResponse(
+        id=msg.id,
+        session_id=msg.session_id,
+        role=msg.role,
+        content=msg.content,
+        images=msg.images,
+        message_metadata=msg.message_metadata,
+        timestamp=msg.timestamp
+    )
+
 @app.get("/v1/sessions/{session_id}", response_model=SessionResponse)
 async def get_session(
     session_id: str,
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    include_messages: bool = True,
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get session details with message history"""
+    """
+    Get session details with message history.
+    Answers 304 Not Modified when If-None-Match matches the session ETag;
+    pass include_messages=false and use /messages?since= to sync the history.
+    """
     try:
-        session = await session_service.get_session(db, session_id, include_messages=True)
+        session = await session_service.get_session(db, session_id)
         
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
+        etag = session_service.session_etag(session, include_messages)
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers={"ETag": etag})
+        
         # Convert messages
-        messages = [
-            MessageResponse(
-                id=msg.id,
-                session_id=msg.session_id,
-                role=msg.role,
-                content=msg.content,
-                images=msg.images,
-                message_metadata=msg.message_metadata,
-                timestamp=msg.timestamp
-            )
-            for msg in session.messages
-        ]
+        messages = None
+        if include_messages:
+            messages = [
+                to_message_response(msg)
+                for msg in await session_service.get_session_messages(db, session_id)
+            ]
         
-        return SessionResponse(
+        response = SessionResponse(
             id=session.id,
             user_id=session.user_id,
+            clinic_id=session.clinic_id,
             status=session.status,
             patient_info=session.patient_info,
             created_at=session.created_at,
             updated_at=session.updated_at,
-            messages=messages
+            messages=messages,
+            usage=to_token_usage(session)
+        )
+        return Response(
+            content=response.model_dump_json(),
+            media_type="application/json",
+            headers={"ETag": etag}
         )
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/v1/sessions/{session_id}/messages", response_model=MessageResponse)
-async def send_message(
+@app.get("/v1/users/{user_id}/usage", response_model=UserUsageResponse)
+async def get_user_usage(
+    user_id: str,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """LLM tokens, calls and cost summed over a user's sessions"""
+    try:
+        totals = await session_service.get_user_usage(db, user_id)
+        session_count = totals.pop("session_count")
+        return UserUsageResponse(
+            user_id=user_id,
+            session_count=session_count,
+            usage=TokenUsage(**totals, total_tokens=totals["input_tokens"] + totals["output_tokens"])
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/v1/sessions/{session_id}/messages", response_model=MessagePageResponse)
+async def list_messages(
     session_id: str,
-    req: MessageCreate,
-    db: AsyncSession = Depends(get_db)
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[int] = None,
+    since: Optional[int] = None,
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
-    Send a user message and get agent response.
-    This processes the message through the agent graph.
+    Page through a session's messages (keyset on message id).
+    - since=<message_id>: messages after it, oldest first (delta sync)
+    - before=<message_id>: older messages, for scrolling back
+    - neither: the latest messages
     """
+    if before is not None and since is not None:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'since', not both")
+    
     try:
-        # Verify session exists
         session = await session_service.get_session(db, session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        # Save user message
-        await session_service.add_message(
-            db=db,
-            session_id=session_id,
-            role=MessageRole.USER,
-            content=req.content,
-            images=req.images
+        messages, has_more = await session_service.get_messages_page(
+            db, session_id, limit=limit, before=before, since=since
         )
         
-        # Load current state
-        state = await session_service.load_state_from_db(db, session_id)
-        
-        # Process through agent graph
-        updated_state = await process_user_message(state, req.content)
-        
-        # Sync state back to DB
-        await session_service.sync_state_to_db(db, updated_state)
-        
-        # Get the last assistant message
-        if updated_state["messages"] and updated_state["messages"][-1]["role"] == "assistant":
-            assistant_msg_content = updated_state["messages"][-1]["content"]
-            
-            # Save assistant message
-            assistant_msg = await session_service.add_message(
-                db=db,
-                session_id=session_id,
-                role=MessageRole.ASSISTANT,
-                content=assistant_msg_content,
-                message_metadata={
-                    "confidence_score": updated_state.get("confidence_score", 0.0),
-                    "phase": updated_state.get("current_phase", "interview")
-                }
-            )
-            
-            return MessageResponse(
-                id=assistant_msg.id,
-                session_id=assistant_msg.session_id,
-                role=assistant_msg.role,
-                content=assistant_msg.content,
-                images=assistant_msg.images,
-                message_metadata=assistant_msg.message_metadata,
-                timestamp=assistant_msg.timestamp
-            )
-        else:
-            raise HTTPException(status_code=500, detail="Agent did not generate response")
-    
+        return MessagePageResponse(
+            messages=[to_message_response(msg) for msg in messages],
+            has_more=has_more,
+            first_id=messages[0].id if messages else None,
+            last_id=messages[-1].id if messages else since
+        )
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/v1/sessions/{session_id}/images", response_model=ImageUploadResponse)
-async def upload_image(
-    session_id: str,
-    file: UploadFile = File(...),
-    db: AsyncSession = Depends(get_db)
-):
-    """Upload and analyze a medical image"""
-    try:
-        # Verify session exists
-        session = await session_service.get_session(db, session_id)
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
+async def load_turn(db: AsyncSession, session_id: str) -> session_service.SessionUnitOfWork:
+    """Load the session once for the whole turn (404 if it does not exist)"""
+    uow = await session_service.SessionUnitOfWork.load(db, session_id)
+    if not uow:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return uow
+
+async def message_turn(uow: session_service.SessionUnitOfWork, req: MessageCreate) -> MessageResponse:
+    """Run a user message through the agent graph and persist it with the answer"""
+    session_id = uow.session.id
+    
+    # Stage user message (written together with the response)
+    uow.add_message(
+        role=MessageRole.USER,
+        content=req.content,
+        images=req.images
+    )
+    
+    # Process through agent graph (resumes from the session checkpoint,
+    # falling back to the database when there is none); LLM usage is
+    # counted against the session's budget
+    with track_usage(uow.session.total_tokens) as ledger:
+        updated_state = await process_user_message(
+            session_id,
+            req.content,
+            load_state=uow.load_state,
+            count_user_messages=uow.count_user_messages
+        )
+    
+    # Stage state changes
+    uow.apply_state(updated_state)
+    uow.record_usage(ledger)
+    
+    # Get the last assistant message
+    assistant_msg = None
+    if updated_state["messages"] and updated_state["messages"][-1]["role"] == "assistant":
+        assistant_msg_content = updated_state["messages"][-1]["content"]
         
+        # Stage assistant message
+        assistant_msg = uow.add_message(
+            role=MessageRole.ASSISTANT,
+            content=assistant_msg_content,
+            message_metadata={
+                "confidence_score": updated_state.get("confidence_score", 0.0),
+                "phase": updated_state.get("current_phase", "interview"),
+                "usage": ledger.summary()
+            }
+        )
+    
+    # Write messages and state in one transaction
+    await uow.commit()
+    
+    if assistant_msg is None:
+        raise HTTPException(status_code=500, detail="Agent did not generate response")
+    
+    return to_message_response(assistant_msg)
+
+async def image_turn(
+    uow: session_service.SessionUnitOfWork,
+    file: UploadFile
+) -> Tuple[ImageUploadResponse, Optional[MessageResponse]]:
+    """Store and analyze an image; returns the upload and the analysis message"""
+    session_id = uow.session.id
+    start = time.perf_counter()
+    try:
         # Save image
         file_url, metadata = await storage_service.save_image(file, session_id)
-        
-        # Load current state
-        state = await session_service.load_state_from_db(db, session_id)
+        metrics.IMAGE_UPLOAD_BYTES.observe(metadata["size"])
         
         # Process image through analyzer
-        updated_state = await process_image_upload(state, file_url)
+        with metrics.IMAGE_QUEUE_DEPTH.track_inprogress(), track_usage(uow.session.total_tokens) as ledger:
+            updated_state = await process_image_upload(
+                session_id,
+                file_url,
+                load_state=uow.load_state
+            )
         
-        # Sync state back to DB
-        await session_service.sync_state_to_db(db, updated_state)
+        # Stage state changes
+        uow.apply_state(updated_state)
+        uow.record_usage(ledger)
         
-        # Save the analysis message if generated
+        # Stage the analysis message if generated
+        analysis_msg = None
         if updated_state["messages"] and updated_state["messages"][-1]["role"] == "assistant":
             assistant_msg_content = updated_state["messages"][-1]["content"]
             
-            await session_service.add_message(
-                db=db,
-                session_id=session_id,
+            analysis_msg = uow.add_message(
                 role=MessageRole.ASSISTANT,
                 content=assistant_msg_content,
                 images=[file_url],
-                message_metadata={"image_analysis": True}
+                message_metadata={"image_analysis": True, "usage": ledger.summary()}
             )
         
-        return ImageUploadResponse(
+        await uow.commit()
+        
+        upload = ImageUploadResponse(
             url=file_url,
             filename=metadata["filename"],
             size=metadata["size"],
             content_type=metadata["content_type"]
         )
+        return upload, to_message_response(analysis_msg) if analysis_msg is not None else None
+    finally:
+        metrics.IMAGE_PROCESSING.observe(time.perf_counter() - start)
+
+async def finalize_turn(
+    uow: session_service.SessionUnitOfWork
+) -> Tuple[Optional[dict], Optional[MessageResponse]]:
+    """Generate and persist the diagnosis; returns the assessment and the diagnosis message"""
+    # Run the actual diagnosis (recorded in the session checkpoint)
+    with track_usage(uow.session.total_tokens) as ledger:
+        updated_state = await force_diagnosis(
+            uow.session.id,
+            load_state=uow.load_state
+        )
+    
+    # Stage state changes and the diagnosis message
+    uow.apply_state(updated_state)
+    uow.record_usage(ledger)
+    
+    diagnosis_msg = None
+    if updated_state["messages"] and updated_state["messages"][-1]["role"] == "assistant":
+        assistant_msg_content = updated_state["messages"][-1]["content"]
+        
+        diagnosis_msg = uow.add_message(
+            role=MessageRole.ASSISTANT,
+            content=assistant_msg_content,
+            message_metadata={"final_diagnosis": True, "usage": ledger.summary()}
+        )
+    
+    await uow.commit()
+    
+    message = to_message_response(diagnosis_msg) if diagnosis_msg is not None else None
+    return updated_state.get("final_assessment"), message
+
+@app.post("/v1/sessions/{session_id}/messages", response_model=MessageResponse)
+async def send_message(
+    session_id: str,
+    req: MessageCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Send a user message and get agent response.
+    This processes the message through the agent graph.
+    """
+    try:
+        async with session_turn(session_id):
+            return await message_turn(await load_turn(db, session_id), req)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+MESSAGE_STREAM_DURATIONS = metrics.sse_durations("messages")
+
+# Streamed turns whose client left, kept referenced until they are persisted
+_detached_turns: Set[asyncio.Task] = set()
+
+def _detached_turn_done(task: asyncio.Task) -> None:
+    _detached_turns.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Streamed turn failed after its client left: {str(task.exception())}")
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps({'type': event, **data}, ensure_ascii=False)}\n\n"
+
+@app.post("/v1/sessions/{session_id}/messages/stream")
+async def send_message_stream(
+    session_id: str,
+    req: MessageCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Streaming variant of POST /messages, as Server-Sent Events: the
+    interviewer's reply while it is generated, then the persisted message.
+    Events: extraction, ready ({"ready_for_diagnosis"}, as soon as the
+    interviewer decides), token ({"text"}), diagnosis_progress (when the
+    interview ends in this turn), and last complete ({"message"}: the
+    MessageResponse, with its id and metadata) or error. The turn is
+    persisted even if the client disconnects.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    async def run_turn() -> MessageResponse:
+        try:
+            with events.listen(lambda event, data: queue.put_nowait((event, data))):
+                async with session_turn(session_id):
+                    return await message_turn(await load_turn(db, session_id), req)
+        finally:
+            # The request's dependencies may be torn down already: return the connection here
+            await db.close()
+            queue.put_nowait(None)
+    
+    async def generate_events():
+        turn = asyncio.create_task(run_turn())
+        try:
+            while (item := await queue.get()) is not None:
+                yield sse_event(*item)
+            message = await turn
+            yield sse_event("complete", {"message": message.model_dump(mode="json")})
+        except HTTPException as e:
+            yield sse_event("error", {"status": e.status_code, "error": e.detail})
+        except Exception as e:
+            yield sse_event("error", {"status": 500, "error": str(e)})
+        finally:
+            if not turn.done():
+                _detached_turns.add(turn)
+                turn.add_done_callback(_detached_turn_done)
+    
+    return StreamingResponse(
+        metrics.observe_stream(generate_events(), MESSAGE_STREAM_DURATIONS),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@app.post("/v1/sessions/{session_id}/images", response_model=ImageUploadResponse)
+async def upload_image(
+    session_id: str,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """Upload and analyze a medical image"""
+    try:
+        async with session_turn(session_id):
+            upload, _ = await image_turn(await load_turn(db, session_id), file)
+            return upload
     
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+FINALIZE_STREAM_DURATIONS = metrics.sse_durations("finalize")
+
 @app.get("/v1/sessions/{session_id}/finalize")
 async def finalize_diagnosis(
     session_id: str,
@@ -248,77 +782,73 @@ async def finalize_diagnosis(
     """
     async def generate_progress_stream():
         try:
-            # Verify session exists
-            session = await session_service.get_session(db, session_id)
-            if not session:
-                yield f"event: error\ndata: {json.dumps({'error': 'Session not found'})}\n\n"
-                return
-            
-            # Load current state
-            state = await session_service.load_state_from_db(db, session_id)
-            
-            # Send initial progress update
-            yield f"event: progress\ndata: {json.dumps({'type': 'progress', 'message': 'Iniciando análisis diagnóstico...'})}\n\n"
-            await asyncio.sleep(0.5)
-            
-            # Import diagnostic agent
-            from app.agents.diagnostic import diagnostic_agent
-            
-            # Set ready flag
-            state["ready_for_diagnosis"] = True
-            
-            # Phase 1
-            yield f"event: progress\ndata: {json.dumps({'type': 'progress', 'message': 'Revisando información del caso y síntomas presentados...'})}\n\n"
-            await asyncio.sleep(2.5)
+            async with session_turn(session_id):
+                # Load the session once for the whole finalization
+                uow = await session_service.SessionUnitOfWork.load(db, session_id)
+                if not uow:
+                    yield f"event: error\ndata: {json.dumps({'error': 'Session not found'})}\n\n"
+                    return
             
-            # Phase 2
-            yield f"event: progress\ndata: {json.dumps({'type': 'progress', 'message': 'Consultando base de conocimiento médico y casos similares...'})}\n\n"
-            await asyncio.sleep(2.0)
+                # Send initial progress update
+                yield f"event: progress\ndata: {json.dumps({'type': 'progress', 'message': 'Iniciando análisis diagnóstico...'})}\n\n"
+                await asyncio.sleep(0.5 * settings.FINALIZE_PROGRESS_PACING)
             
-            # Phase 3
-            yield f"event: progress\ndata: {json.dumps({'type': 'progress', 'message': 'Analizando diagnósticos diferenciales y evaluando probabilidades...'})}\n\n"
-            await asyncio.sleep(2.5)
+                # Phase 1
+                yield f"event: progress\ndata: {json.dumps({'type': 'progress', 'message': 'Revisando información del caso y síntomas presentados...'})}\n\n"
+                await asyncio.sleep(2.5 * settings.FINALIZE_PROGRESS_PACING)
             
-            # Phase 4
-            yield f"event: progress\ndata: {json.dumps({'type': 'progress', 'message': 'Generando evaluación clínica estructurada y plan de acción...'})}\n\n"
+                # Phase 2
+                yield f"event: progress\ndata: {json.dumps({'type': 'progress', 'message': 'Consultando base de conocimiento médico y casos similares...'})}\n\n"
+                await asyncio.sleep(2.0 * settings.FINALIZE_PROGRESS_PACING)
             
-            # Run the actual diagnostic agent (without the built-in delays since we're doing them here)
-            updates = await diagnostic_agent.run(state, progress_callback=None)
+                # Phase 3
+                yield f"event: progress\ndata: {json.dumps({'type': 'progress', 'message': 'Analizando diagnósticos diferenciales y evaluando probabilidades...'})}\n\n"
+                await asyncio.sleep(2.5 * settings.FINALIZE_PROGRESS_PACING)
             
-            await asyncio.sleep(1.5)
+                # Phase 4
+                yield f"event: progress\ndata: {json.dumps({'type': 'progress', 'message': 'Generando evaluación clínica estructurada y plan de acción...'})}\n\n"
             
-            # Phase 5
-            yield f"event: progress\ndata: {json.dumps({'type': 'progress', 'message': 'Finalizando evaluación y preparando recomendaciones...'})}\n\n"
-            await asyncio.sleep(1.5)
-            
-            # Apply updates
-            from app.agents.state import AgentPhase
-            updated_state = {**state, **updates}
-            updated_state["current_phase"] = AgentPhase.COMPLETED
+                # Run the diagnosis and persist it with the final message, passing
+                # on the assessment's sections as they land (fan-out mode)
+                partials: asyncio.Queue = asyncio.Queue()
+                
+                def forward(event: str, data: dict) -> None:
+                    if event == "assessment_partial":
+                        partials.put_nowait(data)
+                
+                async def run_diagnosis():
+                    try:
+                        with events.listen(forward):
+                            return await finalize_turn(uow)
+                    finally:
+                        partials.put_nowait(None)
+                
+                diagnosis = asyncio.create_task(run_diagnosis())
+                try:
+                    while (partial := await partials.get()) is not None:
+                        yield sse_event("assessment_partial", partial)
+                    assessment, _ = await diagnosis
+                finally:
+                    # The client left: stop the diagnosis with the stream, as before
+                    diagnosis.cancel()
             
-            # Sync state back to DB
-            await session_service.sync_state_to_db(db, updated_state)
+                await asyncio.sleep(1.5 * settings.FINALIZE_PROGRESS_PACING)
             
-            # Save the diagnosis message
-            if updated_state["messages"] and updated_state["messages"][-1]["role"] == "assistant":
-                assistant_msg_content = updated_state["messages"][-1]["content"]
-                
-                await session_service.add_message(
-                    db=db,
-                    session_id=session_id,
-                    role=MessageRole.ASSISTANT,
-                    content=assistant_msg_content,
-                    message_metadata={"final_diagnosis": True}
-                )
+                # Phase 5
+                yield f"event: progress\ndata: {json.dumps({'type': 'progress', 'message': 'Finalizando evaluación y preparando recomendaciones...'})}\n\n"
+                await asyncio.sleep(1.5 * settings.FINALIZE_PROGRESS_PACING)
             
-            # Send completion event
-            completion_data = {
-                "type": "complete",
-                "status": "completed",
-                "assessment": updated_state.get("final_assessment")
-            }
-            yield f"event: complete\ndata: {json.dumps(completion_data)}\n\n"
-        
+                # Send completion event
+                completion_data = {
+                    "type": "complete",
+                    "status": "completed",
+                    "assessment": assessment
+                }
+                yield f"event: complete\ndata: {json.dumps(completion_data)}\n\n"
+
+        except HTTPException as e:
+            # Another turn of the session is still running
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'error': e.detail})}\n\n"
         except Exception as e:
             error_data = {
                 "type": "error",
@@ -327,7 +857,7 @@ async def finalize_diagnosis(
             yield f"event: error\ndata: {json.dumps(error_data)}\n\n"
     
     return StreamingResponse(
-        generate_progress_stream(),
+        metrics.observe_stream(generate_progress_stream(), FINALIZE_STREAM_DURATIONS),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -336,10 +866,217 @@ async def finalize_diagnosis(
         }
     )
 
+# ============= WEBSOCKET CHAT CHANNEL =============
+
+# Close codes (4xxx: application-defined)
+WS_CLOSE_NOT_FOUND = 4404
+WS_CLOSE_HEARTBEAT = 4408
+WS_CLOSE_TRY_AGAIN_LATER = 1013
+
+def socket_message(frame: dict) -> MessageCreate:
+    """MessageCreate of a "message" frame ({"content", "images"})"""
+    try:
+        return MessageCreate.model_validate({key: frame[key] for key in ("content", "images") if key in frame})
+    except ValidationError as e:
+        problems = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+        raise HTTPException(status_code=422, detail=f"Invalid message: {problems}")
+
+def socket_upload(frame: dict) -> UploadFile:
+    """UploadFile of an "image" frame ({"filename", "content_type", "data": base64})"""
+    try:
+        content = base64.b64decode(frame["data"], validate=True)
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Image frames need base64 'data'")
+    return UploadFile(
+        file=io.BytesIO(content),
+        size=len(content),
+        filename=frame.get("filename") or "",
+        headers=Headers({"content-type": frame.get("content_type") or "application/octet-stream"})
+    )
+
+async def socket_turn(db: AsyncSession, channel: SessionChannel, frame: dict) -> None:
+    """
+    Run one turn sent over the socket. Its progress (tokens, extraction,
+    image analysis, diagnosis stages) and result are published to the
+    session's channel; the result echoes the frame's "id" as reply_to.
+    """
+    session_id = channel.session_id
+    kind = frame["type"]
+    reply = {"reply_to": frame["id"]} if "id" in frame else {}
+    try:
+        if kind == "message":
+            req = socket_message(frame)
+        elif kind == "image":
+            file = socket_upload(frame)
+        
+        with events.listen(channel.publish), tracing.span(f"ws.{kind}", session_id=session_id):
+            async with session_turn(session_id):
+                uow = await load_turn(db, session_id)
+                if kind == "message":
+                    message = await message_turn(uow, req)
+                    channel.publish("message", {"message": message.model_dump(mode="json"), **reply})
+                elif kind == "image":
+                    upload, message = await image_turn(uow, file)
+                    channel.publish("image_uploaded", {"upload": upload.model_dump(mode="json")})
+                    if message is not None:
+                        channel.publish("message", {"message": message.model_dump(mode="json"), **reply})
+                else:
+                    assessment, message = await finalize_turn(uow)
+                    if message is not None:
+                        channel.publish("message", {"message": message.model_dump(mode="json")})
+                    channel.publish("diagnosis", {"assessment": assessment, **reply})
+    except HTTPException as e:
+        await db.rollback()
+        channel.publish("error", {"status": e.status_code, "error": e.detail, **reply})
+    except Exception as e:
+        logger.exception(f"WebSocket {kind} turn of session {session_id} failed")
+        await db.rollback()
+        channel.publish("error", {"status": 500, "error": str(e), **reply})
+
+SOCKET_TURNS = ("message", "image", "finalize")
+
+async def receive_frames(websocket: WebSocket, subscriber: Subscriber, turns: asyncio.Queue) -> str:
+    """
+    Read client frames until the client leaves or stops answering pings;
+    returns the close reason. Turns are queued (at most
+    WS_MAX_PENDING_TURNS), pings answered, pongs just keep the connection
+    alive.
+    """
+    awaiting_pong = False
+    while True:
+        try:
+            message = await asyncio.wait_for(websocket.receive(), settings.WS_HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            if awaiting_pong:
+                return "heartbeat"
+            awaiting_pong = True
+            subscriber.offer({"type": "ping"})
+            continue
+        if message["type"] == "websocket.disconnect":
+            return "client"
+        awaiting_pong = False
+        
+        try:
+            frame = json.loads(message.get("text") or message.get("bytes") or "")
+            kind = frame["type"]
+        except (ValueError, TypeError, KeyError):
+            subscriber.offer({"type": "error", "status": 400, "error": "Frames are JSON objects with a 'type'"})
+            continue
+        
+        if kind == "ping":
+            subscriber.offer({"type": "pong"})
+        elif kind in SOCKET_TURNS:
+            try:
+                turns.put_nowait(frame)
+            except asyncio.QueueFull:
+                error = {"type": "error", "status": 429, "error": "Too many pending turns"}
+                if "id" in frame:
+                    error["reply_to"] = frame["id"]
+                subscriber.offer(error)
+        elif kind != "pong":
+            subscriber.offer({"type": "error", "status": 400, "error": f"Unknown frame type: {kind}"})
+
+async def send_events(websocket: WebSocket, subscriber: Subscriber, first: List[dict]) -> None:
+    """Send `first` (hello, missed events), then the subscriber's events as they come"""
+    for event in first:
+        await websocket.send_text(json.dumps(event, ensure_ascii=False))
+    while True:
+        await websocket.send_text(json.dumps(await subscriber.queue.get(), ensure_ascii=False))
+
+@app.websocket("/v1/sessions/{session_id}/ws")
+async def session_socket(
+    websocket: WebSocket,
+    session_id: str,
+    channel_id: Optional[str] = Query(None, alias="channel"),
+    last_seq: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Chat over one connection. The client sends JSON frames:
+        {"type": "message", "content": "...", "images": [...]}
+        {"type": "image", "filename": "...", "content_type": "...", "data": "<base64>"}
+        {"type": "finalize"}
+        {"type": "ping"} / {"type": "pong"}
+    (turns may carry an "id", echoed as reply_to on their result) and gets
+    a "hello" with the channel id and seq, then the session's events, each
+    with a seq: token, extraction, image_uploaded, image_analyzed,
+    diagnosis_progress, assessment_partial, message, diagnosis, error.
+    
+    Reconnect with ?channel=<id>&last_seq=<n> to get the events missed
+    meanwhile; "resync" means they are gone and the client should fetch
+    /messages?since=<its last message id>. Turns run one at a time and finish
+    even if the client leaves. Silent clients are pinged every
+    WS_HEARTBEAT_SECONDS and closed (4408) after another interval without a
+    frame; clients that fall WS_SEND_QUEUE_SIZE events behind are closed
+    (1013) and should resume.
+    """
+    await websocket.accept()
+    session = await session_service.get_session(db, session_id)
+    await db.rollback()
+    if not session:
+        await websocket.send_json({"type": "error", "status": 404, "error": "Session not found"})
+        await websocket.close(code=WS_CLOSE_NOT_FOUND)
+        metrics.websocket_closed("not_found")
+        return
+    
+    channel = channels.open(session_id)
+    subscriber = channel.subscribe(settings.WS_SEND_QUEUE_SIZE)
+    # Missed events are taken together with the subscription, so none fall in between
+    missed = channel.replay(last_seq) if last_seq is not None and channel_id == channel.id else None
+    turns: asyncio.Queue = asyncio.Queue(settings.WS_MAX_PENDING_TURNS)
+    
+    async def run_turns() -> None:
+        while True:
+            frame = await turns.get()
+            channel.running_turns += 1
+            try:
+                await socket_turn(db, channel, frame)
+            finally:
+                channel.running_turns -= 1
+                turns.task_done()
+    
+    metrics.WEBSOCKET_CONNECTIONS.inc()
+    worker = asyncio.create_task(run_turns())
+    tasks = []
+    reason = "client"
+    first = [{"type": "hello", "session_id": session_id, "channel": channel.id, "seq": channel.seq}]
+    if last_seq is not None and missed is None:
+        first.append({"type": "resync"})
+    first.extend(missed or ())
+    try:
+        receiver = asyncio.create_task(receive_frames(websocket, subscriber, turns))
+        sender = asyncio.create_task(send_events(websocket, subscriber, first))
+        overflow = asyncio.create_task(subscriber.overflowed.wait())
+        tasks = [receiver, sender, overflow]
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in tasks:
+            task.cancel()
+        
+        if overflow.done() and not overflow.cancelled():
+            reason = "slow_client"
+            await websocket.close(code=WS_CLOSE_TRY_AGAIN_LATER, reason="Too far behind; resume from last_seq")
+        elif receiver.done() and not receiver.cancelled() and receiver.exception() is None:
+            reason = receiver.result()
+            if reason == "heartbeat":
+                await websocket.close(code=WS_CLOSE_HEARTBEAT, reason="No heartbeat")
+    except (WebSocketDisconnect, RuntimeError):
+        # Closed while sending
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        channel.unsubscribe(subscriber)
+        metrics.WEBSOCKET_CONNECTIONS.dec()
+        metrics.websocket_closed(reason)
+        # Turns already received still run; their events wait in the channel
+        await turns.join()
+        worker.cancel()
+        channels.release(channel)
+
 @app.get("/v1/sessions/{session_id}/diagnosis")
 async def get_diagnosis(
     session_id: str,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get the diagnostic result for a session"""
     try:
@@ -43,6 +43,18 @@ class ClinicalAssessment(BaseModel):
     patient_summary: str
     limitations: str
 
+# Sections of a ClinicalAssessment generated separately (DIAGNOSTIC_FANOUT_ENABLED)
+class AssessmentTriage(BaseModel):
+    differentials: List[DifferentialDx] = Field(min_length=1)  # Name, likelihood, reasoning and urgency only
+    red_flags: List[RedFlag]
+    missing_questions: List[str] = Field(default_factory=list)
+
+class AssessmentPlan(BaseModel):
+    action_plan: List[ActionPlanItem]
+    soap: SOAP
+    patient_summary: str
+    limitations: str
+
 class AnalyzeRequest(BaseModel):
     case_text: str = Field(min_length=10, max_length=6000)
 
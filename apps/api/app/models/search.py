@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from typing import List, Literal, Optional
+from datetime import datetime
+from app.models.session import SessionStatus
+
+class SearchHit(BaseModel):
+    """Best matching document of a session"""
+    session_id: str
+    status: SessionStatus
+    updated_at: datetime
+    score: float
+    source: Literal["user_message", "assistant_message", "symptoms", "diagnosis"]
+    message_id: Optional[int] = None  # Set for message hits
+    snippet: str  # Matched terms between « and »
+
+class SearchResponse(BaseModel):
+    results: List[SearchHit]
+    next_offset: Optional[int] = None
@@ -16,6 +16,7 @@ class MessageRole(str, Enum):
 # Request/Response Models
 class SessionCreate(BaseModel):
     user_id: Optional[str] = None
+    clinic_id: Optional[str] = None
     patient_info: Optional[Dict[str, Any]] = Field(default_factory=dict)
 
 class MessageCreate(BaseModel):
@@ -34,18 +35,60 @@ class MessageResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class TokenUsage(BaseModel):
+    """LLM usage of a session, or of a user's sessions"""
+    input_tokens: int = 0
+    output_tokens: int = 0
+    total_tokens: int = 0
+    llm_calls: int = 0
+    cost_usd: float = 0.0
+    by_agent: Dict[str, Dict[str, Any]] = Field(default_factory=dict)  # Per agent: tokens, calls, cost
+    budget_mode: Optional[str] = None  # normal, summarize, cheap_model or force_diagnosis (sessions only)
+
 class SessionResponse(BaseModel):
     id: str
     user_id: Optional[str]
+    clinic_id: Optional[str] = None
     status: SessionStatus
     patient_info: Dict[str, Any]
     created_at: datetime
     updated_at: datetime
     messages: Optional[List[MessageResponse]] = None
+    usage: Optional[TokenUsage] = None
 
     class Config:
         from_attributes = True
 
+class SessionSummary(BaseModel):
+    """Session row for listings (no messages)"""
+    id: str
+    user_id: Optional[str]
+    status: SessionStatus
+    has_critical_red_flags: bool
+    message_count: int
+    diagnosis_count: int
+    last_message_at: Optional[datetime] = None
+    total_tokens: int = 0
+    cost_usd: float = 0.0
+    created_at: datetime
+    updated_at: datetime
+
+class SessionListResponse(BaseModel):
+    sessions: List[SessionSummary]
+    next_cursor: Optional[str] = None  # Pass as cursor= for the next page
+
+class MessagePageResponse(BaseModel):
+    messages: List[MessageResponse]
+    has_more: bool  # More messages past this page in the requested direction
+    # Cursors: before=first_id pages back, since=last_id polls for new messages
+    first_id: Optional[int] = None
+    last_id: Optional[int] = None
+
+class UserUsageResponse(BaseModel):
+    user_id: str
+    session_count: int
+    usage: TokenUsage
+
 class ImageUploadResponse(BaseModel):
     url: str
     filename: str
@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+from typing import List, Literal, Optional
+from datetime import date
+
+StatsKind = Literal["differential", "red_flag", "action"]
+
+class StatsRow(BaseModel):
+    period: Optional[date] = None  # Day or week start (None for bucket=total)
+    key: str  # Label or level
+    count: int
+    avg_likelihood: Optional[float] = None  # Differentials grouped by label
+
+class StatsResponse(BaseModel):
+    kind: StatsKind
+    group_by: Literal["label", "level"]
+    bucket: Literal["total", "day", "week"]
+    rows: List[StatsRow]
@@ -0,0 +1,80 @@
+"""
+Launcher: serve the API with uvicorn, by default one worker process per
+available core.
+
+Several workers need the shared coordination backend
+(COORDINATION_BACKEND=postgres, see app/core/coordination.py); with the local
+backend the default is a single worker and asking for more is an error.
+Prometheus samples of all workers are merged through PROMETHEUS_MULTIPROC_DIR,
+emptied at start (with several workers and the variable unset, a new
+temporary directory).
+
+Each worker opens its own pools: PostgreSQL must accept
+workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW + 2 * COORDINATION_POOL_SIZE + 5)
+connections, plus the replica's when READ_DATABASE_URL is set.
+
+Usage:
+    python -m app.serve                      # WEB_WORKERS, or one per core
+    python -m app.serve --workers 4 --port 8000
+"""
+
+import argparse
+import os
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+from app.core.config import settings
+
+
+def available_cores() -> int:
+    """Cores this process may run on (CPU affinity, e.g. a container's cpuset)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_workers() -> int:
+    if settings.WEB_WORKERS:
+        return settings.WEB_WORKERS
+    return available_cores() if settings.COORDINATION_BACKEND != "local" else 1
+
+
+def prepare_multiprocess_metrics() -> Path:
+    """Empty PROMETHEUS_MULTIPROC_DIR (set for the workers) of a previous run's files"""
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        directory = Path(path)
+        directory.mkdir(parents=True, exist_ok=True)
+        for stale in directory.glob("*.db"):
+            stale.unlink()
+    else:
+        directory = Path(tempfile.mkdtemp(prefix="prometheus-"))
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = str(directory)
+    return directory
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (default: WEB_WORKERS or one per core)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    workers = args.workers or default_workers()
+    if workers > 1 and settings.COORDINATION_BACKEND == "local":
+        parser.error(
+            f"{workers} workers need a shared coordination backend: set COORDINATION_BACKEND=postgres"
+        )
+    if workers > 1 or os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        prepare_multiprocess_metrics()
+
+    import uvicorn
+
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=workers, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
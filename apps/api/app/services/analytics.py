@@ -0,0 +1,271 @@
+"""
+Analytics over diagnostic results.
+
+Every saved assessment is normalized into AssessmentFact rows (one per
+differential, red flag and action item) and added to the AssessmentDailyStat
+rollup in the same transaction, keyed by (kind, day, clinic, level, label).
+/v1/stats reads only the rollup, so frequency questions ("top differentials
+per week for a clinic") are index range scans over a small table instead of
+full scans of assessment_json.
+
+Results saved before the fact tables existed are loaded with:
+
+    python -m app.services.analytics --backfill
+"""
+
+import argparse
+import asyncio
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import AssessmentDailyStat, AssessmentFact, DiagnosticResult, FactKind, Session
+
+LABEL_MAX_LENGTH = 255
+
+
+def normalize_label(value) -> str:
+    return " ".join(str(value).split())[:LABEL_MAX_LENGTH]
+
+
+def _likelihood(value) -> Optional[int]:
+    try:
+        return max(0, min(100, int(value)))
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_facts(assessment: Optional[dict]) -> List[dict]:
+    """Fact rows (kind, label, level, likelihood, rank) of a ClinicalAssessment dict"""
+    assessment = assessment or {}
+    sources = (
+        (FactKind.DIFFERENTIAL, "differentials", "name", "urgency"),
+        (FactKind.RED_FLAG, "red_flags", "message", "severity"),
+        (FactKind.ACTION, "action_plan", "action", "priority"),
+    )
+    facts = []
+    for kind, key, label_field, level_field in sources:
+        for rank, item in enumerate(assessment.get(key) or []):
+            if not isinstance(item, dict) or not item.get(label_field):
+                continue
+            facts.append({
+                "kind": kind,
+                "label": normalize_label(item[label_field]),
+                "level": str(item.get(level_field) or "unknown")[:16],
+                "likelihood": _likelihood(item.get("likelihood")) if kind == FactKind.DIFFERENTIAL else None,
+                "rank": rank,
+            })
+    return facts
+
+
+async def increment_rollup(db: AsyncSession, day: date, clinic_id: Optional[str], facts: List[dict]) -> None:
+    """Add facts to the daily rollup with one upsert (caller commits)"""
+    totals: Dict[Tuple, List[int]] = defaultdict(lambda: [0, 0])
+    for fact in facts:
+        entry = totals[(fact["kind"], fact["level"], fact["label"])]
+        entry[0] += 1
+        entry[1] += fact["likelihood"] or 0
+    if not totals:
+        return
+
+    dialect_insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+    # Sorted so concurrent upserts lock rollup rows in the same order
+    rows = [
+        {
+            "day": day,
+            "clinic_id": clinic_id or "",
+            "kind": kind,
+            "level": level,
+            "label": label,
+            "count": count,
+            "likelihood_sum": likelihood_sum,
+        }
+        for (kind, level, label), (count, likelihood_sum) in sorted(
+            totals.items(), key=lambda item: (item[0][0].value, item[0][1], item[0][2])
+        )
+    ]
+    stmt = dialect_insert(AssessmentDailyStat).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["kind", "day", "clinic_id", "level", "label"],
+        set_={
+            "count": AssessmentDailyStat.count + stmt.excluded.count,
+            "likelihood_sum": AssessmentDailyStat.likelihood_sum + stmt.excluded.likelihood_sum,
+        }
+    )
+    await db.execute(stmt)
+
+
+async def record_assessment(db: AsyncSession, session: Session, result: DiagnosticResult) -> None:
+    """Attach the facts of a new DiagnosticResult and update the rollup (caller commits)"""
+    day = (result.created_at or datetime.utcnow()).date()
+    facts = extract_facts(result.assessment_json)
+    db.add_all(
+        AssessmentFact(diagnostic_result=result, session_id=session.id, clinic_id=session.clinic_id, day=day, **fact)
+        for fact in facts
+    )
+    await increment_rollup(db, day, session.clinic_id, facts)
+
+
+def _day_range(column, day_from: Optional[date], day_to: Optional[date]) -> list:
+    conditions = []
+    if day_from is not None:
+        conditions.append(column >= day_from)
+    if day_to is not None:
+        conditions.append(column <= day_to)
+    return conditions
+
+
+async def rebuild_rollups(db: AsyncSession, day_from: Optional[date] = None, day_to: Optional[date] = None) -> None:
+    """Recompute the rollup from the fact table for a day range (all days by default)"""
+    await db.execute(delete(AssessmentDailyStat).where(*_day_range(AssessmentDailyStat.day, day_from, day_to)))
+    clinic = func.coalesce(AssessmentFact.clinic_id, "")
+    query = (
+        select(
+            AssessmentFact.day,
+            clinic,
+            AssessmentFact.kind,
+            AssessmentFact.level,
+            AssessmentFact.label,
+            func.count(),
+            func.coalesce(func.sum(AssessmentFact.likelihood), 0),
+        )
+        .where(*_day_range(AssessmentFact.day, day_from, day_to))
+        .group_by(AssessmentFact.day, clinic, AssessmentFact.kind, AssessmentFact.level, AssessmentFact.label)
+    )
+    await db.execute(
+        insert(AssessmentDailyStat).from_select(
+            ["day", "clinic_id", "kind", "level", "label", "count", "likelihood_sum"], query
+        )
+    )
+
+
+async def backfill_facts(db: AsyncSession, batch_size: int = 500) -> int:
+    """Extract facts for results that have none, then rebuild the rollup"""
+    total = 0
+    last_id = 0
+    while True:
+        has_facts = select(AssessmentFact.id).where(AssessmentFact.diagnostic_result_id == DiagnosticResult.id).exists()
+        result = await db.execute(
+            select(DiagnosticResult.id, DiagnosticResult.session_id, DiagnosticResult.assessment_json,
+                   DiagnosticResult.created_at, Session.clinic_id)
+            .join(Session, Session.id == DiagnosticResult.session_id)
+            .where(DiagnosticResult.id > last_id, ~has_facts)
+            .order_by(DiagnosticResult.id)
+            .limit(batch_size)
+        )
+        rows = result.all()
+        if not rows:
+            break
+        for row in rows:
+            db.add_all(
+                AssessmentFact(
+                    diagnostic_result_id=row.id,
+                    session_id=row.session_id,
+                    clinic_id=row.clinic_id,
+                    day=row.created_at.date(),
+                    **fact
+                )
+                for fact in extract_facts(row.assessment_json)
+            )
+        await db.commit()
+        total += len(rows)
+        last_id = rows[-1].id
+
+    await rebuild_rollups(db)
+    await db.commit()
+    return total
+
+
+def week_start(day: date) -> date:
+    """Monday of the ISO week"""
+    return day - timedelta(days=day.weekday())
+
+
+async def query_stats(
+    db: AsyncSession,
+    kind: FactKind,
+    group_by: str = "label",
+    bucket: str = "total",
+    day_from: Optional[date] = None,
+    day_to: Optional[date] = None,
+    clinic_id: Optional[str] = None,
+    level: Optional[str] = None,
+    limit: int = 20
+) -> List[dict]:
+    """
+    Most frequent labels (or levels) of one fact kind from the rollup, over
+    the whole range (bucket="total") or per day/week (top `limit` per period).
+    """
+    key = AssessmentDailyStat.label if group_by == "label" else AssessmentDailyStat.level
+    count = func.sum(AssessmentDailyStat.count)
+    likelihood_sum = func.sum(AssessmentDailyStat.likelihood_sum)
+
+    conditions = [AssessmentDailyStat.kind == kind, *_day_range(AssessmentDailyStat.day, day_from, day_to)]
+    if clinic_id is not None:
+        conditions.append(AssessmentDailyStat.clinic_id == clinic_id)
+    if level is not None:
+        conditions.append(AssessmentDailyStat.level == level)
+
+    def row(period, key_value, total, total_likelihood):
+        return {
+            "period": period,
+            "key": key_value,
+            "count": int(total),
+            "avg_likelihood": (
+                round(total_likelihood / total, 1)
+                if kind == FactKind.DIFFERENTIAL and group_by == "label" and total else None
+            ),
+        }
+
+    if bucket == "total":
+        result = await db.execute(
+            select(key, count, likelihood_sum)
+            .where(*conditions)
+            .group_by(key)
+            .order_by(count.desc(), key)
+            .limit(limit)
+        )
+        return [row(None, k, c, s) for k, c, s in result]
+
+    result = await db.execute(
+        select(AssessmentDailyStat.day, key, count, likelihood_sum)
+        .where(*conditions)
+        .group_by(AssessmentDailyStat.day, key)
+    )
+
+    # Days are folded into weeks here; the rollup has few rows per day
+    periods: Dict[date, Dict[str, List[int]]] = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    for day, key_value, total, total_likelihood in result:
+        period = week_start(day) if bucket == "week" else day
+        entry = periods[period][key_value]
+        entry[0] += total
+        entry[1] += total_likelihood
+
+    rows = []
+    for period in sorted(periods):
+        ranked = sorted(periods[period].items(), key=lambda item: (-item[1][0], item[0]))
+        rows.extend(row(period, k, c, s) for k, (c, s) in ranked[:limit])
+    return rows
+
+
+async def main(args) -> None:
+    from app.db.base import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        if args.backfill:
+            print(f"Backfilled facts for {await backfill_facts(db)} diagnostic results")
+        else:
+            await rebuild_rollups(db)
+            await db.commit()
+            print("Rebuilt daily rollups")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the assessment analytics tables")
+    parser.add_argument("--backfill", action="store_true", help="Extract facts for results without them")
+    asyncio.run(main(parser.parse_args()))
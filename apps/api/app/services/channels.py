@@ -0,0 +1,119 @@
+"""
+Live session channels behind the WebSocket endpoint (/v1/sessions/{id}/ws).
+
+A channel numbers the events of a session's turns (seq) and keeps the last
+WS_RESUME_BUFFER of them, so a client that reconnects with the channel id and
+the last seq it saw gets exactly what it missed, including the rest of a turn
+that kept running while it was away. A channel outlives its connections by
+WS_RESUME_TTL_SECONDS. Channels are per process: a client that reconnects to
+another worker, or too late, is told to resync from the HTTP API
+(GET /v1/sessions/{id}/messages?since=...), which holds every persisted
+message.
+
+Backpressure: each connection reads from a bounded queue
+(WS_SEND_QUEUE_SIZE). A client that lets it fill up is disconnected rather
+than buffered without limit or sent a stream with holes; it resumes from its
+last seq.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from app.core.config import settings
+
+
+class Subscriber:
+    """One connection's view of a channel: its pending events, in order"""
+
+    def __init__(self, max_pending: int):
+        self.queue: asyncio.Queue = asyncio.Queue(max_pending)
+        self.overflowed = asyncio.Event()
+
+    def offer(self, event: Dict[str, Any]) -> None:
+        if self.overflowed.is_set():
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed.set()
+
+
+class SessionChannel:
+    """Numbered events of one session, fanned out to its connections"""
+
+    def __init__(self, session_id: str, buffer_size: int):
+        self.session_id = session_id
+        self.id = uuid.uuid4().hex
+        self.seq = 0
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=buffer_size)
+        self.subscribers: Set[Subscriber] = set()
+        self.running_turns = 0
+        self.idle_since: Optional[float] = None
+
+    def publish(self, event: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Number an event, keep it for resume and queue it for every connection"""
+        self.seq += 1
+        numbered = {"seq": self.seq, "type": event, **data}
+        self.events.append(numbered)
+        for subscriber in self.subscribers:
+            subscriber.offer(numbered)
+        return numbered
+
+    def replay(self, last_seq: int) -> Optional[List[Dict[str, Any]]]:
+        """Events after last_seq, or None when some of them are no longer kept"""
+        if last_seq > self.seq:
+            return None
+        oldest = self.events[0]["seq"] if self.events else self.seq + 1
+        if last_seq + 1 < oldest:
+            return None
+        return [event for event in self.events if event["seq"] > last_seq]
+
+    def subscribe(self, max_pending: int) -> Subscriber:
+        subscriber = Subscriber(max_pending)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self.subscribers.discard(subscriber)
+
+    @property
+    def in_use(self) -> bool:
+        return bool(self.subscribers or self.running_turns)
+
+
+class ChannelRegistry:
+    """The channels of this process, by session id"""
+
+    def __init__(self):
+        self._channels: Dict[str, SessionChannel] = {}
+
+    def open(self, session_id: str) -> SessionChannel:
+        """The session's channel (new if it expired or never existed)"""
+        self.prune()
+        channel = self._channels.get(session_id)
+        if channel is None:
+            channel = self._channels[session_id] = SessionChannel(session_id, settings.WS_RESUME_BUFFER)
+        channel.idle_since = None
+        return channel
+
+    def release(self, channel: SessionChannel) -> None:
+        """Start the channel's resume window once nothing uses it"""
+        if not channel.in_use:
+            channel.idle_since = time.monotonic()
+
+    def prune(self) -> None:
+        """Drop channels idle for longer than WS_RESUME_TTL_SECONDS"""
+        cutoff = time.monotonic() - settings.WS_RESUME_TTL_SECONDS
+        for session_id, channel in list(self._channels.items()):
+            if channel.idle_since is not None and channel.idle_since < cutoff:
+                del self._channels[session_id]
+
+    def get(self, session_id: str) -> Optional[SessionChannel]:
+        return self._channels.get(session_id)
+
+
+# Singleton instance
+channels = ChannelRegistry()
@@ -0,0 +1,279 @@
+"""
+Bulk export of sessions with their messages and assessments for analytics.
+
+Sessions are read through a server-side cursor in chunks of chunk_size rows
+(columns only, no ORM objects); each chunk's messages and assessments are
+fetched with one query each, so memory stays bounded by the chunk no matter
+how large the export is. Output is NDJSON (one session per line, streamed
+over HTTP or to a file) or Parquet (one row group per chunk).
+
+Exports are incremental by updated_at: records satisfy
+since < updated_at <= until, and until is the watermark to pass as since on
+the next run. updated_at is stamped before commit, so the default until
+trails the export start by EXPORT_WATERMARK_LAG_SECONDS; exports read the
+primary, never a lagging replica.
+
+    python -m app.services.export --format parquet --output sessions.parquet \
+        --watermark-file .export_watermark
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.models import DiagnosticResult, Message, Session
+
+DEFAULT_CHUNK_SIZE = 500
+
+SESSION_COLUMNS = (
+    Session.id,
+    Session.user_id,
+    Session.status,
+    Session.patient_info,
+    Session.has_critical_red_flags,
+    Session.created_at,
+    Session.updated_at,
+)
+
+
+def default_watermark() -> datetime:
+    """Latest updated_at an export can safely cover: writes stamped later may still be uncommitted"""
+    return datetime.utcnow() - timedelta(seconds=settings.EXPORT_WATERMARK_LAG_SECONDS)
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+async def _assessments_by_session(db: AsyncSession, ids: List[str]) -> Dict[str, List[dict]]:
+    result = await db.execute(
+        select(
+            DiagnosticResult.session_id,
+            DiagnosticResult.assessment_json,
+            DiagnosticResult.confidence_score,
+            DiagnosticResult.created_at
+        )
+        .where(DiagnosticResult.session_id.in_(ids))
+        .order_by(DiagnosticResult.session_id, DiagnosticResult.created_at)
+    )
+    grouped: Dict[str, List[dict]] = {}
+    for row in result:
+        grouped.setdefault(row.session_id, []).append({
+            "assessment": row.assessment_json,
+            "confidence_score": row.confidence_score,
+            "created_at": row.created_at,
+        })
+    return grouped
+
+
+async def _messages_by_session(db: AsyncSession, ids: List[str]) -> Dict[str, List[dict]]:
+    result = await db.execute(
+        select(Message.session_id, Message.id, Message.role, Message.content, Message.images, Message.timestamp)
+        .where(Message.session_id.in_(ids))
+        .order_by(Message.session_id, Message.id)
+    )
+    grouped: Dict[str, List[dict]] = {}
+    for row in result:
+        grouped.setdefault(row.session_id, []).append({
+            "id": row.id,
+            "role": row.role.value,
+            "content": row.content,
+            "images": row.images,
+            "timestamp": row.timestamp,
+        })
+    return grouped
+
+
+async def iter_export_chunks(
+    db: AsyncSession,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    include_messages: bool = True,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> AsyncIterator[List[dict]]:
+    """
+    Yield lists of session records (at most chunk_size each), ordered by
+    (updated_at, id). Each record carries the session metadata, its
+    assessments and, with include_messages, its messages.
+    """
+    query = select(*SESSION_COLUMNS).order_by(Session.updated_at, Session.id)
+    if since is not None:
+        query = query.where(Session.updated_at > since)
+    if until is not None:
+        query = query.where(Session.updated_at <= until)
+
+    result = await db.stream(query.execution_options(yield_per=chunk_size))
+    async for rows in result.partitions():
+        ids = [row.id for row in rows]
+        assessments = await _assessments_by_session(db, ids)
+        messages = await _messages_by_session(db, ids) if include_messages else {}
+
+        records = []
+        for row in rows:
+            record = {
+                "session_id": row.id,
+                "user_id": row.user_id,
+                "status": row.status.value,
+                "patient_info": row.patient_info,
+                "has_critical_red_flags": row.has_critical_red_flags,
+                "created_at": row.created_at,
+                "updated_at": row.updated_at,
+                "assessments": assessments.get(row.id, []),
+            }
+            if include_messages:
+                record["messages"] = messages.get(row.id, [])
+            records.append(record)
+        yield records
+
+
+async def stream_ndjson(
+    session_factory: Callable[[], AsyncSession],
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    include_messages: bool = True,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """NDJSON export, one encoded chunk at a time (opens its own DB session)"""
+    async with session_factory() as db:
+        async for records in iter_export_chunks(db, since, until, include_messages, chunk_size):
+            yield "".join(
+                json.dumps(record, default=_json_default, ensure_ascii=False) + "\n"
+                for record in records
+            ).encode()
+
+
+def _parquet_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("session_id", pa.string()),
+        ("user_id", pa.string()),
+        ("status", pa.string()),
+        ("patient_info", pa.string()),  # JSON
+        ("has_critical_red_flags", pa.bool_()),
+        ("created_at", pa.timestamp("us")),
+        ("updated_at", pa.timestamp("us")),
+        ("assessment_count", pa.int32()),
+        ("latest_confidence_score", pa.float64()),
+        ("assessments", pa.string()),  # JSON array
+        ("message_count", pa.int32()),
+        ("messages", pa.string()),  # JSON array (null without messages)
+    ])
+
+
+def _to_columns(records: List[dict]) -> Dict[str, list]:
+    def dumps(value):
+        return json.dumps(value, default=_json_default, ensure_ascii=False)
+
+    return {
+        "session_id": [r["session_id"] for r in records],
+        "user_id": [r["user_id"] for r in records],
+        "status": [r["status"] for r in records],
+        "patient_info": [dumps(r["patient_info"]) for r in records],
+        "has_critical_red_flags": [r["has_critical_red_flags"] for r in records],
+        "created_at": [r["created_at"] for r in records],
+        "updated_at": [r["updated_at"] for r in records],
+        "assessment_count": [len(r["assessments"]) for r in records],
+        "latest_confidence_score": [
+            r["assessments"][-1]["confidence_score"] if r["assessments"] else None for r in records
+        ],
+        "assessments": [dumps(r["assessments"]) for r in records],
+        "message_count": [len(r["messages"]) if "messages" in r else None for r in records],
+        "messages": [dumps(r["messages"]) if "messages" in r else None for r in records],
+    }
+
+
+async def write_parquet(
+    session_factory: Callable[[], AsyncSession],
+    path: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    include_messages: bool = True,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> int:
+    """Write the export to a Parquet file (one row group per chunk); returns the row count"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    schema = _parquet_schema()
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        async with session_factory() as db:
+            async for records in iter_export_chunks(db, since, until, include_messages, chunk_size):
+                table = pa.Table.from_pydict(_to_columns(records), schema=schema)
+                await asyncio.to_thread(writer.write_table, table)
+                rows += len(records)
+    return rows
+
+
+async def write_ndjson(
+    session_factory: Callable[[], AsyncSession],
+    path: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    include_messages: bool = True,
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> int:
+    """Write the NDJSON export to a file ("-" for stdout); returns the row count"""
+    out = sys.stdout.buffer if path == "-" else open(path, "wb")
+    rows = 0
+    try:
+        async for chunk in stream_ndjson(session_factory, since, until, include_messages, chunk_size):
+            out.write(chunk)
+            rows += chunk.count(b"\n")
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    return rows
+
+
+async def main(args) -> None:
+    from app.db.base import AsyncSessionLocal
+
+    since = datetime.fromisoformat(args.since) if args.since else None
+    watermark_file = Path(args.watermark_file) if args.watermark_file else None
+    if since is None and watermark_file and watermark_file.exists():
+        since = datetime.fromisoformat(watermark_file.read_text().strip())
+    until = default_watermark()
+
+    writer = write_parquet if args.format == "parquet" else write_ndjson
+    rows = await writer(
+        AsyncSessionLocal,
+        args.output,
+        since=since,
+        until=until,
+        include_messages=not args.no_messages,
+        chunk_size=args.chunk_size
+    )
+
+    # Only advance the watermark after a complete export
+    if watermark_file:
+        watermark_file.write_text(until.isoformat())
+    print(f"Exported {rows} sessions (since={since}, until={until.isoformat()})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export sessions and assessments")
+    parser.add_argument("--format", choices=["ndjson", "parquet"], default="ndjson")
+    parser.add_argument("--output", default="-", help="File path ('-' for stdout, NDJSON only)")
+    parser.add_argument("--since", help="Only sessions updated after this ISO timestamp (UTC)")
+    parser.add_argument("--watermark-file", help="Read since from / write the new watermark to this file")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--no-messages", action="store_true")
+    args = parser.parse_args()
+    if args.format == "parquet" and args.output == "-":
+        parser.error("--output is required for Parquet")
+    asyncio.run(main(args))
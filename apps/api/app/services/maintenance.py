@@ -0,0 +1,462 @@
+"""
+Maintenance jobs: session retention, archival and blob garbage collection.
+
+- mark_abandoned_sessions: active sessions idle (last_activity_at) for
+  SESSION_IDLE_TTL_HOURS become ABANDONED; updated_at moves, so incremental
+  exports see the status change.
+- archive_sessions: completed/abandoned sessions idle for
+  SESSION_RETENTION_DAYS are written to cold storage as one gzipped JSON
+  bundle per session (session, messages, state, assessments, image refs) and
+  removed from the database together with their graph checkpoints (their
+  assessment facts stay, so /v1/stats keeps counting them).
+- gc_orphaned_blobs: stored images whose session no longer exists (and is
+  not archived) are deleted through StorageService.delete_image.
+
+Every job works in bounded batches (MAINTENANCE_BATCH_SIZE rows, one short
+transaction each, MAINTENANCE_BATCH_PAUSE_SECONDS between batches and at
+most MAINTENANCE_MAX_BATCHES per run) so it does not contend with live
+traffic. The API runs them periodically when MAINTENANCE_ENABLED; they can
+also be run by hand:
+
+    python -m app.services.maintenance --job all
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import selectinload
+
+from app.core.config import settings
+from app.core.coordination import coordination
+from app.db.base import AsyncSessionLocal
+from app.db.models import AssessmentFact, DiagnosticResult, Message, SearchDocument, Session, SessionStatus
+from app.services.session_service import build_state
+from app.services.storage import StorageService, storage_service
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT_VERSION = 1
+
+
+class ArchiveStore:
+    """Cold storage for archived session bundles (local directory or S3)"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.use_s3 = settings.use_s3
+        if not self.use_s3:
+            self.local_path = Path(path or settings.ARCHIVE_PATH)
+            self.local_path.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(session_id: str) -> str:
+        return f"{session_id}.json.gz"
+
+    def _s3_client(self):
+        import boto3
+
+        return boto3.client(
+            's3',
+            region_name=settings.S3_REGION,
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+        )
+
+    async def write(self, session_id: str, content: bytes) -> str:
+        """Store a bundle and return its location"""
+        if self.use_s3:
+            key = settings.ARCHIVE_S3_PREFIX + self.key(session_id)
+            await asyncio.to_thread(
+                self._s3_client().put_object,
+                Bucket=settings.S3_BUCKET,
+                Key=key,
+                Body=content,
+                ContentType="application/gzip",
+                StorageClass=settings.ARCHIVE_S3_STORAGE_CLASS,
+                ServerSideEncryption='AES256'
+            )
+            return f"s3://{settings.S3_BUCKET}/{key}"
+
+        file_path = self.local_path / self.key(session_id)
+        tmp_path = file_path.with_suffix(".tmp")
+        await asyncio.to_thread(tmp_path.write_bytes, content)
+        tmp_path.replace(file_path)
+        return str(file_path)
+
+    async def read(self, session_id: str) -> Optional[dict]:
+        """Load an archived bundle, or None if the session is not archived"""
+        if self.use_s3:
+            try:
+                obj = await asyncio.to_thread(
+                    self._s3_client().get_object,
+                    Bucket=settings.S3_BUCKET,
+                    Key=settings.ARCHIVE_S3_PREFIX + self.key(session_id)
+                )
+            except Exception:
+                return None
+            content = await asyncio.to_thread(obj["Body"].read)
+        else:
+            file_path = self.local_path / self.key(session_id)
+            if not file_path.exists():
+                return None
+            content = await asyncio.to_thread(file_path.read_bytes)
+        return json.loads(gzip.decompress(content))
+
+    async def exists(self, session_id: str) -> bool:
+        if self.use_s3:
+            try:
+                await asyncio.to_thread(
+                    self._s3_client().head_object,
+                    Bucket=settings.S3_BUCKET,
+                    Key=settings.ARCHIVE_S3_PREFIX + self.key(session_id)
+                )
+                return True
+            except Exception:
+                return False
+        return (self.local_path / self.key(session_id)).exists()
+
+
+def image_refs(messages: List[Message]) -> List[str]:
+    """URLs of the images referenced by a session's messages"""
+    refs = []
+    for msg in messages:
+        for image in msg.images or []:
+            url = image.get("url") if isinstance(image, dict) else image
+            if isinstance(url, str) and url not in refs:
+                refs.append(url)
+    return refs
+
+
+def build_bundle(session: Session, archived_at: datetime) -> bytes:
+    """Serialize a session (with messages and results loaded) as gzipped JSON"""
+    messages = sorted(session.messages, key=lambda m: m.id)
+    results = sorted(session.diagnostic_results, key=lambda r: r.created_at)
+    bundle = {
+        "format": ARCHIVE_FORMAT_VERSION,
+        "archived_at": archived_at,
+        "session": {
+            "id": session.id,
+            "user_id": session.user_id,
+            "status": session.status.value,
+            "patient_info": session.patient_info,
+            "has_critical_red_flags": session.has_critical_red_flags,
+            "usage": {
+                "input_tokens": session.input_tokens,
+                "output_tokens": session.output_tokens,
+                "llm_calls": session.llm_calls,
+                "cost_usd": session.cost_usd,
+                "by_agent": session.token_usage,
+            },
+            "created_at": session.created_at,
+            "updated_at": session.updated_at,
+            "last_activity_at": session.last_activity_at,
+        },
+        "messages": [
+            {
+                "id": msg.id,
+                "role": msg.role.value,
+                "content": msg.content,
+                "images": msg.images,
+                "message_metadata": msg.message_metadata,
+                "timestamp": msg.timestamp,
+            }
+            for msg in messages
+        ],
+        "state": build_state(session, messages, results[-1] if results else None),
+        "assessments": [
+            {
+                "assessment": result.assessment_json,
+                "confidence_score": result.confidence_score,
+                "created_at": result.created_at,
+            }
+            for result in results
+        ],
+        "images": image_refs(messages),
+    }
+    return gzip.compress(json.dumps(bundle, default=str, ensure_ascii=False).encode(), compresslevel=6)
+
+
+async def _pause() -> None:
+    if settings.MAINTENANCE_BATCH_PAUSE_SECONDS > 0:
+        await asyncio.sleep(settings.MAINTENANCE_BATCH_PAUSE_SECONDS)
+
+
+async def mark_abandoned_sessions(
+    db_factory: Callable = AsyncSessionLocal,
+    now: Optional[datetime] = None,
+    batch_size: Optional[int] = None,
+    max_batches: Optional[int] = None
+) -> int:
+    """Mark active sessions idle past SESSION_IDLE_TTL_HOURS as abandoned"""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(hours=settings.SESSION_IDLE_TTL_HOURS)
+    batch_size = batch_size or settings.MAINTENANCE_BATCH_SIZE
+    max_batches = max_batches or settings.MAINTENANCE_MAX_BATCHES
+    total = 0
+
+    for batch in range(max_batches):
+        async with db_factory() as db:
+            result = await db.execute(
+                select(Session.id)
+                .where(Session.status == SessionStatus.ACTIVE, Session.last_activity_at < cutoff)
+                .order_by(Session.last_activity_at)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            ids = list(result.scalars().all())
+            if not ids:
+                break
+
+            # updated_at moves (incremental exports pick up the status change);
+            # retention keeps counting from last_activity_at
+            await db.execute(
+                update(Session)
+                .where(Session.id.in_(ids), Session.status == SessionStatus.ACTIVE)
+                .values(status=SessionStatus.ABANDONED)
+            )
+            await db.commit()
+
+        total += len(ids)
+        if len(ids) < batch_size:
+            break
+        await _pause()
+
+    if total:
+        logger.info(f"Marked {total} idle sessions as abandoned")
+    return total
+
+
+async def archive_sessions(
+    db_factory: Callable = AsyncSessionLocal,
+    store: Optional[ArchiveStore] = None,
+    checkpointer: Any = None,
+    storage: StorageService = storage_service,
+    now: Optional[datetime] = None,
+    batch_size: Optional[int] = None,
+    max_batches: Optional[int] = None
+) -> int:
+    """
+    Move completed/abandoned sessions past SESSION_RETENTION_DAYS to cold
+    storage and delete them (messages, results, checkpoints) from the database.
+    Bundles are written with no transaction open; the rows are then locked
+    in a short transaction and only deleted if they are unchanged since they
+    were read, so a session touched meanwhile stays (its bundle is simply
+    rewritten when it is archived later) and an interrupted batch is
+    archived again on the next run.
+    """
+    store = store or ArchiveStore()
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=settings.SESSION_RETENTION_DAYS)
+    batch_size = batch_size or settings.MAINTENANCE_BATCH_SIZE
+    max_batches = max_batches or settings.MAINTENANCE_MAX_BATCHES
+    archivable = Session.status.in_([SessionStatus.COMPLETED, SessionStatus.ABANDONED])
+    total = 0
+
+    for batch in range(max_batches):
+        async with db_factory() as db:
+            result = await db.execute(
+                select(Session)
+                .where(archivable, Session.last_activity_at < cutoff)
+                .order_by(Session.last_activity_at)
+                .limit(batch_size)
+                .options(selectinload(Session.messages), selectinload(Session.diagnostic_results))
+            )
+            sessions = list(result.scalars().all())
+            await db.commit()
+        if not sessions:
+            break
+
+        images = {}
+        for session in sessions:
+            bundle = await asyncio.to_thread(build_bundle, session, now)
+            await store.write(session.id, bundle)
+            images[session.id] = image_refs(session.messages)
+        read_at = {session.id: session.updated_at for session in sessions}
+
+        async with db_factory() as db:
+            result = await db.execute(
+                select(Session.id, Session.updated_at)
+                .where(
+                    Session.id.in_(list(read_at)),
+                    archivable,
+                    Session.last_activity_at < cutoff
+                )
+                .with_for_update(skip_locked=True)
+            )
+            ids = [
+                session_id for session_id, updated_at in result.all()
+                if updated_at == read_at[session_id]
+            ]
+            if ids:
+                # Facts hold only labels and stay (detached from their results),
+                # so rebuilding the daily rollup keeps the archived counts
+                await db.execute(
+                    update(AssessmentFact)
+                    .where(AssessmentFact.diagnostic_result_id.in_(
+                        select(DiagnosticResult.id).where(DiagnosticResult.session_id.in_(ids))
+                    ))
+                    .values(diagnostic_result_id=None)
+                )
+                await db.execute(delete(SearchDocument).where(SearchDocument.session_id.in_(ids)))
+                await db.execute(delete(Message).where(Message.session_id.in_(ids)))
+                await db.execute(delete(DiagnosticResult).where(DiagnosticResult.session_id.in_(ids)))
+                await db.execute(delete(Session).where(Session.id.in_(ids)))
+            await db.commit()
+
+        if checkpointer is not None:
+            for session_id in ids:
+                await checkpointer.adelete_thread(session_id)
+
+        if settings.ARCHIVE_DELETE_IMAGES:
+            for session_id in ids:
+                for url in images[session_id]:
+                    await storage.delete_image(url)
+
+        total += len(ids)
+        if len(sessions) < batch_size:
+            break
+        await _pause()
+
+    if total:
+        logger.info(f"Archived {total} sessions")
+    return total
+
+
+async def gc_orphaned_blobs(
+    db_factory: Callable = AsyncSessionLocal,
+    store: Optional[ArchiveStore] = None,
+    storage: StorageService = storage_service,
+    now: Optional[datetime] = None,
+    batch_size: Optional[int] = None,
+    max_batches: Optional[int] = None
+) -> int:
+    """
+    Delete stored images whose session is gone. Images of archived sessions
+    are kept (the bundle references them) unless ARCHIVE_DELETE_IMAGES.
+    Only files older than ORPHAN_BLOB_GRACE_HOURS are considered, so uploads
+    still being processed are never touched.
+    """
+    store = store or ArchiveStore()
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(hours=settings.ORPHAN_BLOB_GRACE_HOURS)
+    batch_size = batch_size or settings.MAINTENANCE_BATCH_SIZE
+    max_batches = max_batches or settings.MAINTENANCE_MAX_BATCHES
+    deleted = 0
+    batches = 0
+
+    async for images in storage.list_images(cutoff, batch_size=batch_size):
+        by_session: Dict[str, List[str]] = {}
+        for url, _ in images:
+            session_id = storage.session_id_from_url(url)
+            if session_id:
+                by_session.setdefault(session_id, []).append(url)
+
+        async with db_factory() as db:
+            result = await db.execute(select(Session.id).where(Session.id.in_(list(by_session))))
+            live = set(result.scalars().all())
+
+        for session_id, urls in by_session.items():
+            if session_id in live:
+                continue
+            if not settings.ARCHIVE_DELETE_IMAGES and await store.exists(session_id):
+                continue
+            for url in urls:
+                if await storage.delete_image(url):
+                    deleted += 1
+
+        batches += 1
+        if batches >= max_batches:
+            break
+        await _pause()
+
+    if deleted:
+        logger.info(f"Deleted {deleted} orphaned images")
+    return deleted
+
+
+JOBS = {
+    "abandon": "mark_abandoned_sessions",
+    "archive": "archive_sessions",
+    "gc": "gc_orphaned_blobs",
+}
+
+
+class MaintenanceRunner:
+    """
+    Runs the maintenance jobs periodically in the API process; with several
+    workers, each round runs in whichever worker takes the lock first
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self, jobs: Optional[List[str]] = None) -> Dict[str, int]:
+        """Run the selected jobs (all by default) once; a failing job does not stop the others"""
+        from app.agents.graph import agent_checkpointer
+
+        results = {}
+        for job in jobs or list(JOBS):
+            try:
+                if job == "abandon":
+                    results[job] = await mark_abandoned_sessions()
+                elif job == "archive":
+                    results[job] = await archive_sessions(checkpointer=agent_checkpointer)
+                elif job == "gc":
+                    results[job] = await gc_orphaned_blobs()
+            except Exception as e:
+                logger.warning(f"Maintenance job {job} failed: {str(e)}")
+        return results
+
+    async def run_if_leader(self) -> Optional[Dict[str, int]]:
+        """
+        Run the jobs unless another worker is running them (maintenance lock
+        of the coordination backend); returns None when it was skipped
+        """
+        async with coordination.try_lock("maintenance") as leader:
+            if not leader:
+                logger.info("Maintenance already running in another worker, skipping this round")
+                return None
+            return await self.run_once()
+
+    async def _loop(self) -> None:
+        while True:
+            # A failed round (e.g. the coordination backend is down) is retried
+            # on the next interval instead of ending the loop
+            try:
+                await self.run_if_leader()
+            except Exception:
+                logger.exception("Maintenance round failed")
+            await asyncio.sleep(settings.MAINTENANCE_INTERVAL_SECONDS)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Singleton instance
+maintenance_runner = MaintenanceRunner()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run maintenance jobs once")
+    parser.add_argument("--job", choices=["all", *JOBS], default="all")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    jobs = None if args.job == "all" else [args.job]
+    print(asyncio.run(maintenance_runner.run_once(jobs)))
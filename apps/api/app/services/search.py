@@ -0,0 +1,212 @@
+"""
+Full-text search over session transcripts, symptoms and diagnoses.
+
+Documents (SearchDocument rows) are written in the same transaction as the
+message, symptom list or diagnosis they index, so the search index is
+maintained incrementally on write:
+
+- PostgreSQL: GIN index on to_tsvector('spanish', <content without
+  accents>) (stemmed and accent-insensitive, so "dolores toracicos" matches
+  "dolor torácico"); queries use websearch_to_tsquery and ts_rank,
+  snippets come from ts_headline.
+- SQLite (local runs, tests): FTS5 table kept in sync by triggers,
+  diacritic-insensitive, ranked with bm25.
+
+Results are grouped by session (best matching document), ranked by score
+weighted by document source, and paginated with limit/offset.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, insert, literal_column, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import (
+    SEARCH_CONFIG,
+    SEARCH_FOLD_FROM,
+    SEARCH_FOLD_TO,
+    DiagnosticResult,
+    Message,
+    MessageRole,
+    SearchDocument,
+    Session,
+    search_folded,
+    search_vector,
+)
+
+# Score multipliers: what the case was about ranks above conversation text,
+# and the assistant's own questions rank last
+SOURCE_WEIGHTS = {
+    "diagnosis": 1.0,
+    "symptoms": 1.0,
+    "user_message": 0.6,
+    "assistant_message": 0.2,
+}
+
+SNIPPET_START = "«"
+SNIPPET_STOP = "»"
+SNIPPET_WORDS = 12
+
+FOLD_ACCENTS = str.maketrans(SEARCH_FOLD_FROM, SEARCH_FOLD_TO)
+
+
+async def index_messages(db: AsyncSession, messages: List[Message]) -> None:
+    """
+    Insert the documents of flushed messages (caller commits). Documents need
+    no ids back, so this is one executemany instead of a flush per row.
+    """
+    if not messages:
+        return
+    await db.execute(insert(SearchDocument), [
+        {
+            "session_id": message.session_id,
+            "message_id": message.id,
+            "source": "user_message" if message.role == MessageRole.USER else "assistant_message",
+            "content": message.content,
+        }
+        for message in messages
+    ])
+
+
+def diagnosis_document(session_id: str, result: DiagnosticResult) -> Optional[SearchDocument]:
+    """Document with the differential names of an assessment"""
+    names = [
+        str(dx["name"]) for dx in (result.assessment_json or {}).get("differentials") or []
+        if isinstance(dx, dict) and dx.get("name")
+    ]
+    if not names:
+        return None
+    return SearchDocument(session_id=session_id, diagnostic_result=result, source="diagnosis", content=". ".join(names))
+
+
+async def replace_symptoms_document(db: AsyncSession, session_id: str, symptoms: List[str]) -> None:
+    """Replace the session's symptoms document (caller commits)"""
+    await db.execute(
+        delete(SearchDocument).where(SearchDocument.session_id == session_id, SearchDocument.source == "symptoms")
+    )
+    if symptoms:
+        db.add(SearchDocument(session_id=session_id, source="symptoms", content=". ".join(symptoms)))
+
+
+def fts5_query(query: str) -> str:
+    """Quote each word so user input cannot use FTS5 syntax (implicit AND)"""
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", query))
+
+
+def _source_weight(source_column):
+    return case(SOURCE_WEIGHTS, value=source_column, else_=0.5)
+
+
+async def _search_postgresql(db: AsyncSession, query: str, limit: int, offset: int):
+    config = literal_column(f"'{SEARCH_CONFIG}'")
+    tsquery = func.websearch_to_tsquery(config, query.translate(FOLD_ACCENTS))
+    vector = search_vector(SearchDocument.content)
+    score = (func.ts_rank(vector, tsquery) * _source_weight(SearchDocument.source)).label("score")
+
+    # Best document per session, then the page; headlines only for the page
+    best = (
+        select(
+            SearchDocument.session_id,
+            SearchDocument.source,
+            SearchDocument.message_id,
+            SearchDocument.content,
+            score,
+        )
+        .where(vector.op("@@")(tsquery))
+        .order_by(SearchDocument.session_id, score.desc())
+        .distinct(SearchDocument.session_id)
+        .subquery()
+    )
+    page = (
+        select(best.c.session_id, best.c.source, best.c.message_id, best.c.score, best.c.content)
+        .order_by(best.c.score.desc(), best.c.session_id)
+        .limit(limit + 1)
+        .offset(offset)
+        .subquery()
+    )
+    headline_options = f"StartSel={SNIPPET_START}, StopSel={SNIPPET_STOP}, MaxWords={SNIPPET_WORDS * 2}, MinWords={SNIPPET_WORDS // 2}"
+    result = await db.execute(
+        select(
+            page.c.session_id,
+            page.c.source,
+            page.c.message_id,
+            page.c.score,
+            # Over the folded text, so highlights match (snippets lose accents)
+            func.ts_headline(config, search_folded(page.c.content), tsquery, headline_options).label("snippet"),
+            Session.status,
+            Session.updated_at,
+        )
+        .join(Session, Session.id == page.c.session_id)
+        .order_by(page.c.score.desc(), page.c.session_id)
+    )
+    return result.all()
+
+
+async def _search_sqlite(db: AsyncSession, query: str, limit: int, offset: int):
+    match = fts5_query(query)
+    if not match:
+        return []
+
+    weights = " ".join(f"WHEN '{source}' THEN {weight}" for source, weight in SOURCE_WEIGHTS.items())
+    result = await db.execute(
+        text(f"""
+            WITH matches AS (
+                SELECT d.session_id, d.source, d.message_id,
+                       -bm25(search_documents_fts) * (CASE d.source {weights} ELSE 0.5 END) AS score,
+                       snippet(search_documents_fts, 0, :start, :stop, '…', :words) AS snippet
+                FROM search_documents_fts
+                JOIN search_documents d ON d.id = search_documents_fts.rowid
+                WHERE search_documents_fts MATCH :match
+            ),
+            ranked AS (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY score DESC) AS position
+                FROM matches
+            )
+            SELECT r.session_id, r.source, r.message_id, r.score, r.snippet, s.status, s.updated_at
+            FROM ranked r JOIN sessions s ON s.id = r.session_id
+            WHERE r.position = 1
+            ORDER BY r.score DESC, r.session_id
+            LIMIT :limit OFFSET :offset
+        """).columns(status=Session.__table__.c.status.type, updated_at=Session.__table__.c.updated_at.type),
+        {
+            "match": match,
+            "start": SNIPPET_START,
+            "stop": SNIPPET_STOP,
+            "words": SNIPPET_WORDS,
+            "limit": limit + 1,
+            "offset": offset,
+        }
+    )
+    return result.all()
+
+
+async def search_sessions(
+    db: AsyncSession,
+    query: str,
+    limit: int = 20,
+    offset: int = 0
+) -> Tuple[List[dict], bool]:
+    """
+    Sessions matching a free-text query, best first.
+    Returns (hits, has_more); each hit carries the best matching document's
+    source, message_id (for message hits) and a highlighted snippet.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        rows = await _search_postgresql(db, query, limit, offset)
+    else:
+        rows = await _search_sqlite(db, query, limit, offset)
+
+    hits = [
+        {
+            "session_id": row.session_id,
+            "status": row.status,
+            "updated_at": row.updated_at,
+            "score": round(float(row.score), 6),
+            "source": row.source,
+            "message_id": row.message_id,
+            "snippet": row.snippet,
+        }
+        for row in rows[:limit]
+    ]
+    return hits, len(rows) > limit
@@ -2,21 +2,37 @@
 Session Service: Manages conversation sessions with the database.
 """
 
+import asyncio
+import base64
+import hashlib
+import logging
 import uuid
-from typing import Optional, List
-from sqlalchemy import select
+from typing import Optional, List, Any, Tuple, Dict
+from sqlalchemy import select, type_coerce, literal_column, func, tuple_
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, joinedload
 from datetime import datetime
 
+from app.db.base import write_tracker
 from app.db.models import Session, Message, DiagnosticResult, SessionStatus, MessageRole
 from app.agents.state import create_initial_state, ConversationState
+from app.agents.usage import UsageLedger, empty_totals
+from app.core import tracing
+from app.core.config import settings
+from app.core.tracing import traced
+from app.services.similar_cases import similar_case_index
+from app.services import analytics, search
 
+logger = logging.getLogger(__name__)
 
+
+@traced()
 async def create_session(
     db: AsyncSession,
     user_id: Optional[str] = None,
-    patient_info: Optional[dict] = None
+    patient_info: Optional[dict] = None,
+    clinic_id: Optional[str] = None
 ) -> Session:
     """Create a new conversation session"""
     session_id = str(uuid.uuid4())
@@ -24,17 +40,20 @@ async def create_session(
     session = Session(
         id=session_id,
         user_id=user_id,
+        clinic_id=clinic_id,
         status=SessionStatus.ACTIVE,
         patient_info=patient_info or {}
     )
     
     db.add(session)
     await db.commit()
+    await write_tracker.mark_written(session_id)
     await db.refresh(session)
     
     return session
 
 
+@traced()
 async def get_session(
     db: AsyncSession,
     session_id: str,
@@ -50,6 +69,7 @@ async def get_session(
     return result.scalar_one_or_none()
 
 
+@traced()
 async def add_message(
     db: AsyncSession,
     session_id: str,
@@ -68,18 +88,22 @@ async def add_message(
     )
     
     db.add(message)
+    await db.flush()
+    await search.index_messages(db, [message])
     
     # Update session updated_at
     session = await get_session(db, session_id)
     if session:
-        session.updated_at = datetime.utcnow()
+        session.updated_at = session.last_activity_at = datetime.utcnow()
     
     await db.commit()
+    await write_tracker.mark_written(session_id)
     await db.refresh(message)
     
     return message
 
 
+@traced()
 async def get_session_messages(
     db: AsyncSession,
     session_id: str,
@@ -95,6 +119,182 @@ async def get_session_messages(
     return result.scalars().all()
 
 
+@traced()
+async def get_messages_page(
+    db: AsyncSession,
+    session_id: str,
+    limit: int = 50,
+    before: Optional[int] = None,
+    since: Optional[int] = None
+) -> Tuple[List[Message], bool]:
+    """
+    Keyset page of a session's messages, ordered by id (oldest first).
+    
+    Args:
+        since: Only messages newer than this id (delta sync); the page starts
+            right after it
+        before: Only messages older than this id (scrolling back); the page
+            ends right before it
+        limit: Maximum number of messages
+    
+    Without a cursor the latest messages are returned.
+    
+    Returns:
+        (messages, has_more) where has_more tells if there are more messages
+        past the page in the direction of the request
+    """
+    query = select(Message).where(Message.session_id == session_id)
+    
+    if since is not None:
+        query = query.where(Message.id > since)
+    if before is not None:
+        query = query.where(Message.id < before)
+    
+    # Delta sync reads forward; otherwise read backward from the newest message
+    if since is not None:
+        query = query.order_by(Message.id)
+    else:
+        query = query.order_by(Message.id.desc())
+    
+    result = await db.execute(query.limit(limit + 1))
+    messages = list(result.scalars().all())
+    
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if since is None:
+        messages.reverse()
+    
+    return messages, has_more
+
+
+def session_etag(session: Session, include_messages: bool = True) -> str:
+    """
+    ETag for the session state.
+    Every write to a session (messages, patient info, diagnosis, status)
+    bumps updated_at, so it identifies the version of the session; the
+    representation with and without messages gets different tags.
+    """
+    version = f"{session.id}:{session.updated_at.isoformat()}:{session.status.value}:{int(include_messages)}"
+    return f'W/"{hashlib.sha1(version.encode()).hexdigest()}"'
+
+
+def encode_session_cursor(session: Session) -> str:
+    """Opaque keyset cursor for the session listing"""
+    raw = f"{session.updated_at.isoformat()}|{session.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_session_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inverse of encode_session_cursor; raises ValueError on malformed cursors"""
+    try:
+        updated_at, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(updated_at), session_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+@traced()
+async def list_sessions(
+    db: AsyncSession,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    user_id: Optional[str] = None,
+    status: Optional[SessionStatus] = None,
+    updated_from: Optional[datetime] = None,
+    updated_to: Optional[datetime] = None,
+    critical_only: bool = False
+) -> Tuple[List[Session], Optional[str]]:
+    """
+    Sessions ordered by last activity (newest first), keyset-paginated on
+    (updated_at, id) so every page costs the same regardless of depth.
+    Only session columns are loaded; see count_session_activity for counts.
+    
+    Returns:
+        (sessions, next_cursor) where next_cursor is None on the last page
+    """
+    query = select(Session)
+    
+    if user_id is not None:
+        query = query.where(Session.user_id == user_id)
+    if status is not None:
+        query = query.where(Session.status == status)
+    if updated_from is not None:
+        query = query.where(Session.updated_at >= updated_from)
+    if updated_to is not None:
+        query = query.where(Session.updated_at < updated_to)
+    if critical_only:
+        query = query.where(Session.has_critical_red_flags)  # matches the partial index predicate
+    if cursor:
+        cursor_updated_at, cursor_id = decode_session_cursor(cursor)
+        query = query.where(tuple_(Session.updated_at, Session.id) < (cursor_updated_at, cursor_id))
+    
+    query = query.order_by(Session.updated_at.desc(), Session.id.desc()).limit(limit + 1)
+    
+    result = await db.execute(query)
+    sessions = list(result.scalars().all())
+    
+    next_cursor = None
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        next_cursor = encode_session_cursor(sessions[-1])
+    
+    return sessions, next_cursor
+
+
+@traced()
+async def count_session_activity(
+    db: AsyncSession,
+    session_ids: List[str]
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Message and diagnosis counts for a page of sessions.
+    One GROUP BY per table over the page's ids (served by the session_id
+    leading indexes), instead of loading the relationships.
+    """
+    counts = {
+        session_id: {"message_count": 0, "diagnosis_count": 0, "last_message_at": None}
+        for session_id in session_ids
+    }
+    if not session_ids:
+        return counts
+    
+    message_counts = await db.execute(
+        select(Message.session_id, func.count(), func.max(Message.timestamp))
+        .where(Message.session_id.in_(session_ids))
+        .group_by(Message.session_id)
+    )
+    for session_id, count, last_message_at in message_counts:
+        counts[session_id]["message_count"] = count
+        counts[session_id]["last_message_at"] = last_message_at
+    
+    diagnosis_counts = await db.execute(
+        select(DiagnosticResult.session_id, func.count())
+        .where(DiagnosticResult.session_id.in_(session_ids))
+        .group_by(DiagnosticResult.session_id)
+    )
+    for session_id, count in diagnosis_counts:
+        counts[session_id]["diagnosis_count"] = count
+    
+    return counts
+
+
+@traced()
+async def get_user_usage(db: AsyncSession, user_id: str) -> Dict[str, Any]:
+    """Session count and summed LLM usage of a user's sessions"""
+    result = await db.execute(
+        select(
+            func.count(Session.id).label("session_count"),
+            func.coalesce(func.sum(Session.input_tokens), 0).label("input_tokens"),
+            func.coalesce(func.sum(Session.output_tokens), 0).label("output_tokens"),
+            func.coalesce(func.sum(Session.llm_calls), 0).label("llm_calls"),
+            func.coalesce(func.sum(Session.cost_usd), 0.0).label("cost_usd"),
+        )
+        .where(Session.user_id == user_id)
+    )
+    return dict(result.one()._mapping)
+
+
+@traced()
 async def save_diagnostic_result(
     db: AsyncSession,
     session_id: str,
@@ -105,7 +305,8 @@ async def save_diagnostic_result(
     result = DiagnosticResult(
         session_id=session_id,
         assessment_json=assessment,
-        confidence_score=confidence_score
+        confidence_score=confidence_score,
+        created_at=datetime.utcnow()
     )
     
     db.add(result)
@@ -114,14 +315,29 @@ async def save_diagnostic_result(
     session = await get_session(db, session_id)
     if session:
         session.status = SessionStatus.COMPLETED
-        session.updated_at = datetime.utcnow()
+        session.has_critical_red_flags = has_critical_red_flags(assessment)
+        session.updated_at = session.last_activity_at = datetime.utcnow()
+        await analytics.record_assessment(db, session, result)
+        document = search.diagnosis_document(session_id, result)
+        if document is not None:
+            db.add(document)
     
     await db.commit()
+    await write_tracker.mark_written(session_id)
     await db.refresh(result)
     
     return result
 
 
+def has_critical_red_flags(assessment: Optional[dict]) -> bool:
+    """Whether an assessment contains at least one critical red flag"""
+    return any(
+        isinstance(flag, dict) and flag.get("severity") == "critical"
+        for flag in (assessment or {}).get("red_flags", [])
+    )
+
+
+@traced()
 async def get_diagnostic_result(
     db: AsyncSession,
     session_id: str
@@ -135,6 +351,41 @@ async def get_diagnostic_result(
     return result.scalar_one_or_none()
 
 
+@traced()
+async def find_diagnostic_results_by_differential(
+    db: AsyncSession,
+    name: str,
+    limit: int = 50
+) -> List[DiagnosticResult]:
+    """
+    Diagnostic results whose assessment lists a differential with this exact name.
+    Uses the GIN index on assessment_json -> 'differentials' on PostgreSQL.
+    """
+    if db.bind.dialect.name == "postgresql":
+        # Same expression as the index, with the key inlined so it matches
+        # under prepared statements too
+        differentials = type_coerce(DiagnosticResult.assessment_json, JSONB).op(
+            "->", return_type=JSONB
+        )(literal_column("'differentials'"))
+        query = (
+            select(DiagnosticResult)
+            .where(differentials.contains([{"name": name}]))
+            .order_by(DiagnosticResult.created_at.desc())
+            .limit(limit)
+        )
+        result = await db.execute(query)
+        return list(result.scalars().all())
+    
+    # Other databases (local development): filter in Python
+    result = await db.execute(select(DiagnosticResult).order_by(DiagnosticResult.created_at.desc()))
+    matches = [
+        r for r in result.scalars()
+        if any(d.get("name") == name for d in (r.assessment_json or {}).get("differentials", []))
+    ]
+    return matches[:limit]
+
+
+@traced()
 async def load_state_from_db(
     db: AsyncSession,
     session_id: str
@@ -148,16 +399,28 @@ async def load_state_from_db(
     if not session:
         raise ValueError(f"Session {session_id} not found")
     
+    # Load diagnostic result if exists
+    diag_result = await get_diagnostic_result(db, session_id)
+    
+    return build_state(session, session.messages, diag_result)
+
+
+def build_state(
+    session: Session,
+    messages: List[Message],
+    diag_result: Optional[DiagnosticResult] = None
+) -> ConversationState:
+    """Build a ConversationState from already loaded rows"""
     # Create initial state
-    state = create_initial_state(session_id)
+    state = create_initial_state(session.id)
     
     # Load patient info
     state["patient_info"] = session.patient_info or {}
     
     # Load messages
-    messages = []
-    for msg in session.messages:
-        messages.append({
+    state_messages = []
+    for msg in messages:
+        state_messages.append({
             "role": msg.role.value,
             "content": msg.content
         })
@@ -168,24 +431,22 @@ async def load_state_from_db(
                 if isinstance(img_data, dict) and img_data not in state["images"]:
                     state["images"].append(img_data)
     
-    state["messages"] = messages
+    state["messages"] = state_messages
     
-    # Extract symptoms and other metadata from messages if stored
-    # In practice, you might want to store these explicitly or extract them
+    state["symptoms"] = list(session.symptoms or [])
     
-    # Load diagnostic result if exists
-    diag_result = await get_diagnostic_result(db, session_id)
     if diag_result:
         state["final_assessment"] = diag_result.assessment_json
         state["confidence_score"] = diag_result.confidence_score or 0.0
         state["ready_for_diagnosis"] = True
     
     # Update turn count
-    state["turn_count"] = len([m for m in messages if m["role"] == "user"])
+    state["turn_count"] = len([m for m in state_messages if m["role"] == "user"])
     
     return state
 
 
+@traced()
 async def sync_state_to_db(
     db: AsyncSession,
     state: ConversationState
@@ -199,12 +460,18 @@ async def sync_state_to_db(
     if not session:
         return
     
-    # Update patient info
+    # Update patient info and symptoms
     session.patient_info = state["patient_info"]
-    session.updated_at = datetime.utcnow()
+    if list(state.get("symptoms") or []) != list(session.symptoms or []):
+        session.symptoms = list(state["symptoms"])
+        await search.replace_symptoms_document(db, session.id, session.symptoms)
+    session.updated_at = session.last_activity_at = datetime.utcnow()
     
     # If diagnosis is complete, save it
-    if state.get("final_assessment") and not await get_diagnostic_result(db, state["session_id"]):
+    new_diagnosis = bool(
+        state.get("final_assessment") and not await get_diagnostic_result(db, state["session_id"])
+    )
+    if new_diagnosis:
         await save_diagnostic_result(
             db=db,
             session_id=state["session_id"],
@@ -213,3 +480,197 @@ async def sync_state_to_db(
         )
     
     await db.commit()
+    await write_tracker.mark_written(state["session_id"])
+    
+    if new_diagnosis:
+        await index_similar_case(state)
+
+
+@traced()
+async def index_similar_case(state: ConversationState) -> None:
+    """Add a completed case to the similar-case index (best effort)"""
+    if not settings.SIMILAR_CASES_ENABLED:
+        return
+    
+    try:
+        await asyncio.to_thread(
+            similar_case_index.add_case,
+            state["session_id"],
+            state["symptoms"],
+            state["final_assessment"],
+        )
+    except Exception as e:
+        logger.warning(f"Failed to index case {state['session_id']}: {str(e)}")
+
+
+# ============= UNIT OF WORK =============
+
+async def _end_read(db: AsyncSession) -> None:
+    """
+    End a read-only transaction, returning its connection to the pool. The
+    loaded objects stay usable (expire_on_commit=False) and the next
+    statement begins a new transaction.
+    """
+    if db.in_transaction():
+        await db.commit()
+
+
+class SessionUnitOfWork:
+    """
+    Reads and writes of one conversation turn.
+    
+    The session and its diagnostic results are loaded with a single query;
+    the message history is only fetched if the graph needs to seed its state
+    (no checkpoint). Each read ends its transaction right away, so the turn
+    holds no pooled connection while the agents run (the checkpointer takes
+    its own). Messages and state changes are staged in memory and written by
+    commit() in one transaction, with the message inserts batched.
+    
+    Usage:
+        uow = await SessionUnitOfWork.load(db, session_id)
+        uow.add_message(MessageRole.USER, content)
+        with track_usage(uow.session.total_tokens) as ledger:
+            state = await process_user_message(
+                session_id, content, load_state=uow.load_state, count_user_messages=uow.count_user_messages
+            )
+        uow.apply_state(state)
+        uow.record_usage(ledger)
+        assistant_msg = uow.add_message(MessageRole.ASSISTANT, ...)
+        await uow.commit()
+    """
+    
+    def __init__(self, db: AsyncSession, session: Session):
+        self.db = db
+        self.session = session
+        self._messages: List[Message] = []
+        self._new_diagnosis: Optional[ConversationState] = None
+        self._symptoms_changed = False
+    
+    @classmethod
+    @traced("session_service.SessionUnitOfWork.load")
+    async def load(cls, db: AsyncSession, session_id: str) -> Optional["SessionUnitOfWork"]:
+        """Load the session for a turn, or None if it does not exist"""
+        query = (
+            select(Session)
+            .where(Session.id == session_id)
+            .options(joinedload(Session.diagnostic_results))
+        )
+        result = await db.execute(query)
+        session = result.unique().scalar_one_or_none()
+        await _end_read(db)
+        if session is None:
+            return None
+        return cls(db, session)
+    
+    @property
+    def latest_diagnosis(self) -> Optional[DiagnosticResult]:
+        if not self.session.diagnostic_results:
+            return None
+        return max(self.session.diagnostic_results, key=lambda r: r.created_at)
+    
+    async def count_user_messages(self) -> int:
+        """Committed user messages of the session (excluding staged ones)"""
+        count = await self.db.scalar(
+            select(func.count())
+            .select_from(Message)
+            .where(Message.session_id == self.session.id, Message.role == MessageRole.USER)
+        )
+        await _end_read(self.db)
+        return count
+    
+    async def load_state(self) -> ConversationState:
+        """Build the conversation state from the stored history (excluding staged messages)"""
+        with tracing.span("session_service.SessionUnitOfWork.load_state", session_id=self.session.id):
+            messages = await get_session_messages(self.db, self.session.id)
+            await _end_read(self.db)
+            return build_state(self.session, messages, self.latest_diagnosis)
+    
+    def add_message(
+        self,
+        role: MessageRole,
+        content: str,
+        images: Optional[List[Any]] = None,
+        message_metadata: Optional[dict] = None
+    ) -> Message:
+        """Stage a message; its id is assigned on commit"""
+        message = Message(
+            session_id=self.session.id,
+            role=role,
+            content=content,
+            images=images or [],
+            message_metadata=message_metadata or {},
+            timestamp=datetime.utcnow()
+        )
+        self._messages.append(message)
+        return message
+    
+    def apply_state(self, state: ConversationState) -> None:
+        """Stage the session changes from an updated state"""
+        self.session.patient_info = state["patient_info"]
+        if "symptoms" in state and list(state["symptoms"]) != list(self.session.symptoms or []):
+            self.session.symptoms = list(state["symptoms"])
+            self._symptoms_changed = True
+        
+        # If diagnosis is complete, save it
+        if state.get("final_assessment") and self.latest_diagnosis is None:
+            self._new_diagnosis = state
+    
+    def record_usage(self, ledger: UsageLedger) -> None:
+        """Stage the LLM usage of this request on the session totals"""
+        if not ledger.calls:
+            return
+        session = self.session
+        session.input_tokens = (session.input_tokens or 0) + ledger.input_tokens
+        session.output_tokens = (session.output_tokens or 0) + ledger.output_tokens
+        session.llm_calls = (session.llm_calls or 0) + ledger.calls
+        session.cost_usd = (session.cost_usd or 0.0) + ledger.cost_usd
+        
+        by_agent = {agent: dict(totals) for agent, totals in (session.token_usage or {}).items()}
+        for agent, totals in ledger.by_agent.items():
+            stored = by_agent.setdefault(agent, empty_totals())
+            for key, value in totals.items():
+                stored[key] = stored.get(key, 0) + value
+        session.token_usage = by_agent
+    
+    async def commit(self) -> None:
+        """Write all staged changes in one transaction"""
+        with tracing.span("session_service.SessionUnitOfWork.commit", session_id=self.session.id):
+            await self._commit()
+    
+    async def _commit(self) -> None:
+        now = datetime.utcnow()
+        self.session.updated_at = self.session.last_activity_at = now
+        
+        if self._new_diagnosis is not None:
+            result = DiagnosticResult(
+                assessment_json=self._new_diagnosis["final_assessment"],
+                confidence_score=self._new_diagnosis.get("confidence_score", 0.0),
+                created_at=now
+            )
+            self.session.diagnostic_results.append(result)
+            await analytics.record_assessment(self.db, self.session, result)
+            document = search.diagnosis_document(self.session.id, result)
+            if document is not None:
+                self.db.add(document)
+            self.session.status = SessionStatus.COMPLETED
+            self.session.has_critical_red_flags = has_critical_red_flags(
+                self._new_diagnosis["final_assessment"]
+            )
+        
+        if self._symptoms_changed:
+            await search.replace_symptoms_document(self.db, self.session.id, self.session.symptoms)
+            self._symptoms_changed = False
+        
+        # Flushed as multi-row INSERTs (insertmanyvalues with RETURNING)
+        self.db.add_all(self._messages)
+        if self._messages:
+            await self.db.flush()
+            await search.index_messages(self.db, self._messages)
+        await self.db.commit()
+        await write_tracker.mark_written(self.session.id)
+        
+        new_diagnosis, self._new_diagnosis = self._new_diagnosis, None
+        self._messages = []
+        
+        if new_diagnosis is not None:
+            await index_similar_case(new_diagnosis)
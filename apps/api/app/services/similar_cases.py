@@ -0,0 +1,473 @@
+"""
+Similar Case Index: Local vector index over past diagnostic results.
+
+Each case is embedded as a signed, hashed bag of words (sublinear TF) over its
+symptoms, patient summary and differential names. Rows are L2-normalised
+float32 vectors appended to a flat file that is memory-mapped for search, so
+the index builds and queries fully offline with NumPy only.
+
+Query terms are re-weighted with IDF computed from the document frequencies
+of the indexed cases, which keeps appends O(1) (no refitting of stored rows).
+
+Several worker processes can share one index directory: appends hold an
+exclusive file lock, and each process picks up the rows other processes
+appended (cases.jsonl grew) before its next search or append.
+"""
+
+import fcntl
+import json
+import logging
+import math
+import re
+import threading
+import unicodedata
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per matrix-vector product; bounds resident memory on huge indexes
+SEARCH_CHUNK_ROWS = 65536
+
+# Rough chars-per-token ratio used to enforce the prompt budget
+CHARS_PER_TOKEN = 4
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = {
+    "con", "sin", "por", "para", "los", "las", "del", "una", "uno", "unos", "unas",
+    "que", "como", "mas", "muy", "desde", "hace", "sus", "este", "esta", "estos",
+    "estas", "ese", "esa", "entre", "sobre", "tiene", "tener", "paciente", "caso",
+    "the", "and", "with", "for",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, strip accents and split text into indexable tokens"""
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    ascii_text = normalized.encode("ascii", "ignore").decode("ascii")
+    return [
+        token for token in TOKEN_PATTERN.findall(ascii_text)
+        if len(token) > 2 and token not in STOPWORDS
+    ]
+
+
+def build_case_text(symptoms: Sequence[str], assessment: Dict[str, Any]) -> str:
+    """Build the text that represents a case in the index"""
+    differentials = [dx.get("name", "") for dx in assessment.get("differentials", [])]
+    parts = [
+        " ".join(symptoms),
+        assessment.get("patient_summary", ""),
+        # Differential names are the strongest signal, so weight them twice
+        " ".join(differentials),
+        " ".join(differentials),
+    ]
+    return " ".join(part for part in parts if part)
+
+
+@dataclass
+class SimilarCase:
+    """A past case returned by a similarity search"""
+    session_id: str
+    score: float
+    patient_summary: str = ""
+    differentials: List[str] = field(default_factory=list)
+    symptoms: List[str] = field(default_factory=list)
+
+
+class SimilarCaseIndex:
+    """Append-only, memory-mapped cosine similarity index"""
+
+    HEADER_FILE = "index.json"
+    VECTORS_FILE = "vectors.f32"
+    CASES_FILE = "cases.jsonl"
+    DF_FILE = "df.npy"
+    LOCK_FILE = "index.lock"
+
+    def __init__(self, path: str, dim: int = 1024):
+        self.path = Path(path)
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._cases: List[Dict[str, Any]] = []
+        self._rows_by_session: Dict[str, int] = {}
+        self._df = np.zeros(dim, dtype=np.float64)
+        self._matrix: Optional[np.memmap] = None
+        self._cases_bytes = 0  # Bytes of cases.jsonl already read
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._cases)
+
+    # ----- Vectorization -----
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed text into an L2-normalised hashed TF vector"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        # Signed counts: colliding tokens add or cancel instead of the last
+        # one deciding the sign of the whole bucket
+        counts: Dict[int, int] = {}
+        for token in tokenize(text):
+            digest = zlib.crc32(token.encode("utf-8"))
+            bucket = digest % self.dim
+            sign = 1 if (digest >> 31) & 1 else -1
+            counts[bucket] = counts.get(bucket, 0) + sign
+
+        for bucket, count in counts.items():
+            if count:
+                vector[bucket] = math.copysign(1.0 + math.log(abs(count)), count)
+
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def _idf(self) -> np.ndarray:
+        n_cases = len(self._cases)
+        return (np.log((1.0 + n_cases) / (1.0 + self._df)) + 1.0).astype(np.float32)
+
+    # ----- Persistence -----
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            self._refresh()
+            return
+        with self._lock:
+            if not self._loaded:
+                self.path.mkdir(parents=True, exist_ok=True)
+                with self._file_lock(fcntl.LOCK_EX):
+                    self._load()
+                self._loaded = True
+
+    def _file_lock(self, mode: int) -> "_FileLock":
+        """Lock shared with the other processes using this directory"""
+        return _FileLock(self.path / self.LOCK_FILE, mode)
+
+    def _read_cases(self, start: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Complete lines of cases.jsonl from byte `start`, and the offset after them"""
+        cases_path = self.path / self.CASES_FILE
+        if not cases_path.exists():
+            return [], start
+        with open(cases_path, "rb") as f:
+            f.seek(start)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        cases = [json.loads(line) for line in data[:end].decode("utf-8").splitlines() if line.strip()]
+        return cases, start + end
+
+    def _refresh(self) -> None:
+        """Pick up rows appended by other processes since the last read"""
+        cases_path = self.path / self.CASES_FILE
+        try:
+            size = cases_path.stat().st_size
+        except FileNotFoundError:
+            return
+        if size == self._cases_bytes:
+            return
+        with self._lock, self._file_lock(fcntl.LOCK_SH):
+            self._catch_up()
+
+    def _catch_up(self) -> None:
+        # Callers hold self._lock and the file lock, so appends are complete
+        new_cases, end = self._read_cases(self._cases_bytes)
+        if not new_cases:
+            return
+        first_row = len(self._cases)
+        for offset, case in enumerate(new_cases):
+            self._rows_by_session[case["session_id"]] = first_row + offset
+        self._cases.extend(new_cases)
+        self._cases_bytes = end
+        df_path = self.path / self.DF_FILE
+        if df_path.exists():
+            self._df = np.load(df_path)
+        self._matrix = None
+
+    def _load(self) -> None:
+
+        header_path = self.path / self.HEADER_FILE
+        if header_path.exists():
+            header = json.loads(header_path.read_text())
+            if header.get("dim") != self.dim:
+                raise ValueError(
+                    f"Similar-case index at {self.path} has dim={header.get('dim')}, "
+                    f"expected {self.dim}. Rebuild the index or adjust SIMILAR_CASES_DIM."
+                )
+        else:
+            header_path.write_text(json.dumps({"version": 1, "dim": self.dim}))
+
+        self._cases, self._cases_bytes = self._read_cases(0)
+
+        # A crash between the vector and metadata writes can leave them out of
+        # step; keep only rows that have both.
+        vectors_path = self.path / self.VECTORS_FILE
+        row_bytes = self.dim * 4
+        stored_rows = vectors_path.stat().st_size // row_bytes if vectors_path.exists() else 0
+        n_rows = min(stored_rows, len(self._cases))
+        cases_path = self.path / self.CASES_FILE
+        if n_rows < len(self._cases) or (cases_path.exists() and cases_path.stat().st_size != self._cases_bytes):
+            self._cases = self._cases[:n_rows]
+            self._rewrite_cases()
+        if vectors_path.exists() and vectors_path.stat().st_size != n_rows * row_bytes:
+            with open(vectors_path, "r+b") as f:
+                f.truncate(n_rows * row_bytes)
+
+        df_path = self.path / self.DF_FILE
+        if df_path.exists() and n_rows == stored_rows:
+            self._df = np.load(df_path)
+        elif n_rows:
+            self._df = (np.abs(self._open_matrix(n_rows)) > 0).sum(axis=0, dtype=np.float64)
+
+        self._rows_by_session = {case["session_id"]: row for row, case in enumerate(self._cases)}
+
+    def _rewrite_cases(self) -> None:
+        with open(self.path / self.CASES_FILE, "w", encoding="utf-8") as f:
+            for case in self._cases:
+                f.write(json.dumps(case, ensure_ascii=False) + "\n")
+        self._cases_bytes = (self.path / self.CASES_FILE).stat().st_size
+
+    def _open_matrix(self, n_rows: int) -> np.ndarray:
+        if n_rows == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.memmap(
+            self.path / self.VECTORS_FILE,
+            dtype=np.float32,
+            mode="r",
+            shape=(n_rows, self.dim),
+        )
+
+    def _get_matrix(self) -> np.ndarray:
+        if self._matrix is None or self._matrix.shape[0] != len(self._cases):
+            self._matrix = self._open_matrix(len(self._cases))
+        return self._matrix
+
+    # ----- Writes -----
+
+    def add_case(
+        self,
+        session_id: str,
+        symptoms: Sequence[str],
+        assessment: Dict[str, Any],
+    ) -> bool:
+        """
+        Index a completed case.
+
+        Returns:
+            True if the case was added, False if it was already indexed
+        """
+        vector = self.embed(build_case_text(symptoms, assessment))
+        case = {
+            "session_id": session_id,
+            "patient_summary": assessment.get("patient_summary", ""),
+            "differentials": [dx.get("name", "") for dx in assessment.get("differentials", [])],
+            "symptoms": list(symptoms),
+        }
+        return self.add_vectors(vector[np.newaxis, :], [case]) == 1
+
+    def add_vectors(self, vectors: np.ndarray, cases: List[Dict[str, Any]]) -> int:
+        """
+        Append pre-computed, L2-normalised vectors with their case metadata.
+        Cases whose session is already indexed are skipped.
+
+        Returns:
+            Number of rows appended
+        """
+        self._ensure_loaded()
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of shape (n, {self.dim}), got {vectors.shape}")
+
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            self._catch_up()
+            keep = [
+                i for i, case in enumerate(cases)
+                if case["session_id"] not in self._rows_by_session
+            ]
+            if not keep:
+                return 0
+            if len(keep) != len(cases):
+                vectors = vectors[keep]
+                cases = [cases[i] for i in keep]
+
+            # Vectors first, metadata second: _load() trims rows without metadata
+            with open(self.path / self.VECTORS_FILE, "ab") as f:
+                f.write(np.ascontiguousarray(vectors).tobytes())
+            with open(self.path / self.CASES_FILE, "ab") as f:
+                data = "".join(json.dumps(case, ensure_ascii=False) + "\n" for case in cases).encode("utf-8")
+                f.write(data)
+            self._cases_bytes += len(data)
+
+            first_row = len(self._cases)
+            for offset, case in enumerate(cases):
+                self._rows_by_session[case["session_id"]] = first_row + offset
+            self._cases.extend(cases)
+
+            self._df += (vectors != 0).sum(axis=0)
+            np.save(self.path / self.DF_FILE, self._df)
+            self._matrix = None
+
+        return len(cases)
+
+    # ----- Queries -----
+
+    def search(
+        self,
+        symptoms: Sequence[str],
+        text: str = "",
+        k: int = 3,
+        exclude_session_id: Optional[str] = None,
+        min_score: float = 0.0,
+    ) -> List[SimilarCase]:
+        """
+        Find the k most similar past cases by cosine similarity.
+
+        Args:
+            symptoms: Symptoms of the current case
+            text: Additional free text (e.g. patient summary or chief complaint)
+            k: Maximum number of cases to return
+            exclude_session_id: Session to leave out of the results (the current one)
+            min_score: Minimum cosine similarity for a case to be returned
+        """
+        self._ensure_loaded()
+        with self._lock:
+            n_rows = len(self._cases)
+            if n_rows == 0 or k <= 0:
+                return []
+            matrix = self._get_matrix()
+            query = self.embed(" ".join(list(symptoms) + [text])) * self._idf()
+            exclude_row = self._rows_by_session.get(exclude_session_id) if exclude_session_id else None
+
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query /= norm
+
+        scores = self._score(matrix, query)
+        if exclude_row is not None:
+            scores[exclude_row] = -np.inf
+
+        k = min(k, n_rows)
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+
+        results = []
+        for row in top:
+            score = float(scores[row])
+            if score < min_score:
+                break
+            case = self._cases[row]
+            results.append(SimilarCase(
+                session_id=case["session_id"],
+                score=score,
+                patient_summary=case.get("patient_summary", ""),
+                differentials=case.get("differentials", []),
+                symptoms=case.get("symptoms", []),
+            ))
+        return results
+
+    @staticmethod
+    def _score(matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+        scores = np.empty(matrix.shape[0], dtype=np.float32)
+        for start in range(0, matrix.shape[0], SEARCH_CHUNK_ROWS):
+            end = start + SEARCH_CHUNK_ROWS
+            np.dot(matrix[start:end], query, out=scores[start:end])
+        return scores
+
+
+class _FileLock:
+    """flock() on a lock file, held for the with block"""
+
+    def __init__(self, path: Path, mode: int):
+        self.path = path
+        self.mode = mode
+        self._file = None
+
+    def __enter__(self) -> "_FileLock":
+        self._file = open(self.path, "a")
+        fcntl.flock(self._file, self.mode)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+def format_similar_cases(cases: Iterable[SimilarCase], token_budget: int) -> str:
+    """
+    Render similar cases for the diagnostic prompt, stopping before the
+    estimated token count exceeds the budget.
+    """
+    char_budget = token_budget * CHARS_PER_TOKEN
+    lines: List[str] = []
+    used = 0
+    for i, case in enumerate(cases, 1):
+        entry = (
+            f"{i}. (similitud {case.score:.2f}) "
+            f"Diferenciales: {', '.join(case.differentials[:3]) or 'N/D'}. "
+            f"Resumen: {case.patient_summary}"
+        )
+        if used + len(entry) > char_budget:
+            remaining = char_budget - used
+            # Keep a truncated entry only if it still carries the differentials
+            if remaining > 120:
+                lines.append(entry[:remaining - 3] + "...")
+            break
+        lines.append(entry)
+        used += len(entry) + 1
+    return "\n".join(lines)
+
+
+async def rebuild_from_db(index: "SimilarCaseIndex", batch_size: int = 500) -> Tuple[int, int]:
+    """
+    Index every stored diagnostic result that is not yet in the index.
+
+    Returns:
+        Tuple of (results scanned, cases added)
+    """
+    from sqlalchemy import select
+    from app.db.base import AsyncSessionLocal
+    from app.db.models import DiagnosticResult, Session
+
+    scanned = added = 0
+    async with AsyncSessionLocal() as db:
+        # Symptoms come from the session state, as when cases are indexed live
+        stream = await db.stream(
+            select(DiagnosticResult.session_id, Session.symptoms, DiagnosticResult.assessment_json)
+            .join(Session, Session.id == DiagnosticResult.session_id)
+            .order_by(DiagnosticResult.id)
+            .execution_options(yield_per=batch_size)
+        )
+        async for partition in stream.partitions(batch_size):
+            vectors = []
+            cases = []
+            for session_id, symptoms, assessment in partition:
+                scanned += 1
+                symptoms = list(symptoms or [])
+                vectors.append(index.embed(build_case_text(symptoms, assessment)))
+                cases.append({
+                    "session_id": session_id,
+                    "patient_summary": assessment.get("patient_summary", ""),
+                    "differentials": [dx.get("name", "") for dx in assessment.get("differentials", [])],
+                    "symptoms": symptoms,
+                })
+            if vectors:
+                added += index.add_vectors(np.vstack(vectors), cases)
+    return scanned, added
+
+
+# Singleton instance (files are opened lazily on first use)
+similar_case_index = SimilarCaseIndex(settings.SIMILAR_CASES_INDEX_PATH, settings.SIMILAR_CASES_DIM)
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    scanned, added = asyncio.run(rebuild_from_db(similar_case_index))
+    print(f"Scanned {scanned} diagnostic results, indexed {added} new cases "
+          f"({len(similar_case_index)} total) at {similar_case_index.path}")
@@ -1,10 +1,13 @@
 import os
 import uuid
+import asyncio
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Optional, Tuple, List, AsyncIterator
 import aiofiles
 from fastapi import UploadFile, HTTPException
 from app.core.config import settings
+from app.core.tracing import traced
 from PIL import Image
 import io
 
@@ -20,6 +23,7 @@ class StorageService:
             self.local_path = Path(settings.LOCAL_STORAGE_PATH)
             self.local_path.mkdir(parents=True, exist_ok=True)
 
+    @traced("storage.save_image")
     async def save_image(self, file: UploadFile, session_id: str) -> Tuple[str, dict]:
         """
         Save an uploaded image file.
@@ -124,6 +128,7 @@ class StorageService:
                 detail=f"Failed to upload to S3: {str(e)}"
             )
 
+    @traced("storage.delete_image")
     async def delete_image(self, file_url: str) -> bool:
         """Delete an image from storage"""
         if self.use_s3:
@@ -168,6 +173,66 @@ class StorageService:
         except Exception:
             return False
 
+    async def list_images(
+        self,
+        older_than: datetime,
+        batch_size: int = 500
+    ) -> AsyncIterator[List[Tuple[str, datetime]]]:
+        """
+        Iterate over stored images last modified before older_than (naive UTC),
+        in batches of (file_url, modified_at). Used by maintenance jobs.
+        """
+        if self.use_s3:
+            async for batch in self._list_s3(older_than, batch_size):
+                yield batch
+            return
+        
+        batch = []
+        for entry in os.scandir(self.local_path):
+            if not entry.is_file():
+                continue
+            modified_at = datetime.utcfromtimestamp(entry.stat().st_mtime)
+            if modified_at < older_than:
+                batch.append((f"/uploads/{entry.name}", modified_at))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def _list_s3(self, older_than: datetime, batch_size: int) -> AsyncIterator[List[Tuple[str, datetime]]]:
+        """List images in S3 (one page per batch)"""
+        import boto3
+        
+        s3_client = boto3.client(
+            's3',
+            region_name=settings.S3_REGION,
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
+        )
+        base_url = f"https://{settings.S3_BUCKET}.s3.{settings.S3_REGION}.amazonaws.com/"
+        kwargs = {"Bucket": settings.S3_BUCKET, "Prefix": "medical-images/", "MaxKeys": batch_size}
+        
+        while True:
+            page = await asyncio.to_thread(s3_client.list_objects_v2, **kwargs)
+            batch = []
+            for obj in page.get("Contents", []):
+                modified_at = obj["LastModified"].astimezone(timezone.utc).replace(tzinfo=None)
+                if modified_at < older_than:
+                    batch.append((base_url + obj["Key"], modified_at))
+            if batch:
+                yield batch
+            if not page.get("IsTruncated"):
+                return
+            kwargs["ContinuationToken"] = page["NextContinuationToken"]
+
+    @staticmethod
+    def session_id_from_url(file_url: str) -> Optional[str]:
+        """Session id encoded in a stored image name ({session_id}_{uuid}{ext})"""
+        filename = file_url.split('/')[-1]
+        session_id, sep, _ = filename.partition('_')
+        return session_id if sep else None
+
     def get_image_path(self, file_url: str) -> Optional[Path]:
         """Get local file path for an image (only for local storage)"""
         if self.use_s3:
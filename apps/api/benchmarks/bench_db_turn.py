@@ -0,0 +1,108 @@
+"""
+Database cost of one conversation turn: legacy per-call commits vs the
+SessionUnitOfWork. The agent graph is replaced by a fixed reply, so only the
+session_service round trips are measured. Reports statements, commits and
+time per turn.
+
+Usage:
+    python -m benchmarks.bench_db_turn --history 10 100 500
+    python -m benchmarks.bench_db_turn --database-url postgresql+asyncpg://...
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.db.base import Base
+from app.db.metrics import count_queries, instrument_engine
+from app.db.models import MessageRole
+from app.services import session_service
+
+
+def reply(state):
+    state["messages"].append({"role": "assistant", "content": "¿Desde cuándo tiene los síntomas?"})
+    return state
+
+
+async def legacy_turn(db: AsyncSession, session_id: str, content: str) -> None:
+    """The request flow before the unit of work"""
+    await session_service.get_session(db, session_id)
+    await session_service.add_message(db, session_id, MessageRole.USER, content)
+    state = reply(await session_service.load_state_from_db(db, session_id))
+    await session_service.sync_state_to_db(db, state)
+    await session_service.add_message(db, session_id, MessageRole.ASSISTANT, state["messages"][-1]["content"])
+
+
+async def uow_turn(db: AsyncSession, session_id: str, content: str, with_history: bool) -> None:
+    """The same turn through SessionUnitOfWork (with_history: no checkpoint, state seeded from DB)"""
+    uow = await session_service.SessionUnitOfWork.load(db, session_id)
+    uow.add_message(MessageRole.USER, content)
+    if with_history:
+        state = await uow.load_state()
+    else:
+        # The graph state comes from the checkpoint; only the delta is used here
+        state = {"patient_info": uow.session.patient_info, "messages": []}
+    state = reply(state)
+    uow.apply_state(state)
+    uow.add_message(MessageRole.ASSISTANT, state["messages"][-1]["content"])
+    await uow.commit()
+
+
+async def run(database_url: str, histories, turns: int) -> None:
+    engine = instrument_engine(create_async_engine(database_url))
+    commits = [0]
+    event.listen(engine.sync_engine, "commit", lambda conn: commits.__setitem__(0, commits[0] + 1))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    variants = {
+        "legacy": lambda db, sid, c: legacy_turn(db, sid, c),
+        "uow+history": lambda db, sid, c: uow_turn(db, sid, c, with_history=True),
+        "uow+checkpoint": lambda db, sid, c: uow_turn(db, sid, c, with_history=False),
+    }
+
+    print(f"{'history':>8}  {'variant':>15}  {'queries':>8}  {'commits':>8}  {'ms/turn':>8}")
+    for history in histories:
+        for name, turn in variants.items():
+            async with factory() as db:
+                session = await session_service.create_session(db)
+                for i in range(history // 2):
+                    await session_service.add_message(db, session.id, MessageRole.USER, f"mensaje {i}")
+                    await session_service.add_message(db, session.id, MessageRole.ASSISTANT, f"pregunta {i}")
+
+            commits[0] = 0
+            with count_queries() as counter:
+                start = time.perf_counter()
+                for i in range(turns):
+                    async with factory() as db:
+                        await turn(db, session.id, f"respuesta {i}")
+                elapsed_ms = (time.perf_counter() - start) / turns * 1e3
+
+            print(
+                f"{history:>8}  {name:>15}  {counter.count / turns:>8.1f}  "
+                f"{commits[0] / turns:>8.1f}  {elapsed_ms:>8.2f}"
+            )
+
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--database-url", default="")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}"
+        asyncio.run(run(database_url, args.history, args.turns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Diagnosis wall time, one call vs fan-out (DIAGNOSTIC_FANOUT_ENABLED), against
+the fake LLM.
+
+The fake OpenAI server (loadtest/fake_openai.py) is served by uvicorn in this
+process, with a time to first token and a token rate, so generation time
+grows with the length of each answer and streamed answers arrive chunk by
+chunk. The scenarios' differentials carry few details; --detail-items
+pads their lists (causes, findings, complications, tests...) to the size of
+a real assessment. Reports per mode the median and p95 wall time of
+DiagnosticAgent.run, the median time until the first red flag reaches a live
+client (assessment_partial event), and the LLM calls and completion tokens
+per diagnosis.
+
+Usage:
+    python -m benchmarks.bench_diagnostic_fanout --runs 3 --latency-ms 400 --tokens-per-second 40 --detail-items 3
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import uvicorn
+from langchain_openai import ChatOpenAI
+
+from app.agents import events
+from app.agents.diagnostic import DiagnosticAgent
+from app.core.config import settings
+from benchmarks.bench_workers import free_port
+from loadtest.fake_openai import FakeConfig, create_app
+from loadtest.run import percentile
+from loadtest.scenarios import SCENARIOS
+
+DETAIL_LISTS = (
+    "general_causes", "patient_specific_factors", "risk_factors", "supporting_findings",
+    "contradicting_findings", "complications", "recommended_tests",
+)
+
+
+def pad_details(items: int) -> None:
+    """Fill each differential's detail lists up to `items` entries (in this process)"""
+    for scenario in SCENARIOS:
+        for dx in scenario.assessment["differentials"]:
+            for key in DETAIL_LISTS:
+                dx[key] = dx[key] + [
+                    f"{key.replace('_', ' ')} {i + 1} de {dx['name'].lower()}, descripto con detalle clínico"
+                    for i in range(len(dx[key]), items)
+                ]
+            dx["prognosis"] = dx["prognosis"] or f"Pronóstico de {dx['name'].lower()} según evolución y tratamiento."
+
+
+def scenario_state(scenario) -> dict:
+    messages = []
+    for question, turn in zip(scenario.questions, scenario.turns):
+        messages += [{"role": "user", "content": turn.text}, {"role": "assistant", "content": question}]
+    return {
+        "session_id": f"bench-{scenario.name}",
+        "messages": messages,
+        "symptoms": [symptom for turn in scenario.turns for symptom in turn.symptoms],
+        "patient_info": {key: value for turn in scenario.turns for key, value in turn.patient_info.items()},
+        "images": [],
+    }
+
+
+async def run(args) -> None:
+    if args.detail_items:
+        pad_details(args.detail_items)
+    settings.SIMILAR_CASES_ENABLED = False
+    settings.DIAGNOSTIC_FANOUT_CONCURRENCY = args.concurrency
+    fake = create_app(FakeConfig(
+        latency_ms=args.latency_ms, latency_sigma=0, tokens_per_second=args.tokens_per_second, seed=7
+    ))
+    stats = fake.state.completions.stats
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(fake, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    try:
+        while not server.started:
+            await asyncio.sleep(0.05)
+        agent = DiagnosticAgent()
+        agent.llm = ChatOpenAI(model="fake", api_key="fake", base_url=f"http://127.0.0.1:{port}/v1")
+        results = {}
+        for mode, fan_out in (("single", False), ("fan-out", True)):
+            settings.DIAGNOSTIC_FANOUT_ENABLED = fan_out
+            calls, tokens = sum(stats.calls.values()), stats.completion_tokens
+            times, red_flags = [], []
+            for i in range(args.runs):
+                for scenario in SCENARIOS:
+                    first = []
+
+                    def listener(event, data):
+                        if event == "assessment_partial" and data["section"] == "red_flags" and not first:
+                            first.append(time.perf_counter())
+
+                    start = time.perf_counter()
+                    with events.listen(listener):
+                        await agent.run(scenario_state(scenario))
+                    times.append(time.perf_counter() - start)
+                    red_flags.append((first[0] if first else time.perf_counter()) - start)
+            results[mode] = (
+                times, red_flags,
+                (sum(stats.calls.values()) - calls) / len(times), (stats.completion_tokens - tokens) / len(times)
+            )
+    finally:
+        server.should_exit = True
+        await serving
+
+    print(
+        f"fake LLM: {args.latency_ms:.0f} ms to first token, {args.tokens_per_second:.0f} tokens/s, "
+        f"{args.detail_items} detail items, concurrency {args.concurrency}"
+    )
+    print(f"{'mode':>7}  {'p50':>8}  {'p95':>8}  {'red flag p50':>12}  {'calls':>5}  {'output tokens':>13}")
+    for mode, (times, red_flags, calls, tokens) in results.items():
+        ms = [t * 1000 for t in times]
+        print(
+            f"{mode:>7}  {statistics.median(ms):>5.0f} ms  {percentile(ms, 95):>5.0f} ms  "
+            f"{statistics.median(red_flags) * 1000:>9.0f} ms  {calls:>5.1f}  {tokens:>13.0f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="Diagnoses per scenario and mode")
+    parser.add_argument("--latency-ms", type=float, default=400.0, help="Fake LLM time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0, help="Fake LLM generation speed")
+    parser.add_argument("--detail-items", type=int, default=3, help="Entries per detail list of each differential")
+    parser.add_argument("--concurrency", type=int, default=4, help="DIAGNOSTIC_FANOUT_CONCURRENCY")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
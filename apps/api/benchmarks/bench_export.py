@@ -0,0 +1,145 @@
+"""
+Bulk export throughput and memory: per-session API-style reads (N+1) vs the
+chunked server-side cursor export, to NDJSON and Parquet. Seeds sessions
+with messages and an assessment each, then reports rows/sec and peak Python
+memory (tracemalloc) per export size; the chunked export's peak should stay
+flat as the size grows.
+
+Usage:
+    python -m benchmarks.bench_export --sessions 1000 5000 20000
+    python -m benchmarks.bench_export --database-url postgresql+asyncpg://...
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.db.base import Base
+from app.db.models import DiagnosticResult, Message, MessageRole, Session, SessionStatus
+from app.services import export, session_service
+
+ASSESSMENT = {
+    "summary": "Cuadro compatible con bronquitis aguda. " * 10,
+    "differentials": [{"name": "Bronquitis aguda", "probability": 0.6}, {"name": "Neumonía", "probability": 0.2}],
+    "red_flags": [],
+}
+
+
+async def seed(factory, count: int, messages_per_session: int) -> None:
+    start = datetime.utcnow() - timedelta(days=1)
+    async with factory() as db:
+        for table in (Message, DiagnosticResult, Session):
+            await db.execute(delete(table))
+        for offset in range(0, count, 1000):
+            sessions, messages, results = [], [], []
+            for i in range(offset, min(offset + 1000, count)):
+                sid = str(uuid.uuid4())
+                ts = start + timedelta(seconds=i)
+                sessions.append({
+                    "id": sid, "status": SessionStatus.COMPLETED, "patient_info": {"age": 30 + i % 50},
+                    "created_at": ts, "updated_at": ts, "has_critical_red_flags": False,
+                })
+                for j in range(messages_per_session):
+                    role = MessageRole.USER if j % 2 == 0 else MessageRole.ASSISTANT
+                    messages.append({
+                        "session_id": sid, "role": role, "content": f"mensaje {j} " * 20,
+                        "images": [], "message_metadata": {}, "timestamp": ts,
+                    })
+                results.append({
+                    "session_id": sid, "assessment_json": ASSESSMENT,
+                    "confidence_score": 0.7, "created_at": ts,
+                })
+            await db.execute(insert(Session), sessions)
+            await db.execute(insert(Message), messages)
+            await db.execute(insert(DiagnosticResult), results)
+        await db.commit()
+
+
+async def n_plus_one(factory, path: str) -> int:
+    """What a client does today: list ids, then one session + messages + diagnosis read per id"""
+    import json
+
+    rows = 0
+    async with factory() as db:
+        ids = (await db.execute(select(Session.id).order_by(Session.updated_at))).scalars().all()
+        with open(path, "w") as out:
+            for sid in ids:
+                session = await session_service.get_session(db, sid)
+                messages = await session_service.get_session_messages(db, sid)
+                result = await session_service.get_diagnostic_result(db, sid)
+                out.write(json.dumps({
+                    "session_id": session.id,
+                    "messages": [m.content for m in messages],
+                    "assessment": result.assessment_json if result else None,
+                }) + "\n")
+                rows += 1
+                db.expunge_all()
+    return rows
+
+
+async def measure(fn) -> tuple:
+    """Timed run, then a second run under tracemalloc for the memory peak"""
+    start = time.perf_counter()
+    rows = await fn()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    await fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, rows / elapsed, peak / 2**20
+
+
+async def run(database_url: str, sizes, messages_per_session: int, chunk_size: int, tmp: Path) -> None:
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    variants = {
+        "n+1": lambda: n_plus_one(factory, str(tmp / "n1.ndjson")),
+        "ndjson": lambda: export.write_ndjson(factory, str(tmp / "out.ndjson"), chunk_size=chunk_size),
+    }
+    try:
+        import pyarrow  # noqa: F401
+        variants["parquet"] = lambda: export.write_parquet(factory, str(tmp / "out.parquet"), chunk_size=chunk_size)
+    except ImportError:
+        print("pyarrow not installed: skipping Parquet")
+
+    print(f"messages/session={messages_per_session} chunk_size={chunk_size}")
+    print(f"{'sessions':>9}  {'variant':>8}  {'rows/s':>9}  {'peak MiB':>9}  {'out MiB':>8}")
+    for size in sizes:
+        await seed(factory, size, messages_per_session)
+        for name, fn in variants.items():
+            rows, rate, peak = await measure(fn)
+            out = {"n+1": "n1.ndjson", "ndjson": "out.ndjson", "parquet": "out.parquet"}[name]
+            out_mib = os.path.getsize(tmp / out) / 2**20
+            print(f"{rows:>9}  {name:>8}  {rate:>9.0f}  {peak:>9.1f}  {out_mib:>8.1f}")
+
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--messages", type=int, default=10, help="Messages per session")
+    parser.add_argument("--chunk-size", type=int, default=export.DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--database-url", default="")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}"
+        asyncio.run(run(database_url, args.sessions, args.messages, args.chunk_size, Path(tmp)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Connection pool load test: checkout wait time against concurrency.
+
+Each worker repeatedly checks out a connection and runs a short query
+(pg_sleep on PostgreSQL) standing in for a request's DB work. Reports
+checkout wait percentiles, pool wait counters and throughput per
+concurrency level, for the pool settings given on the command line.
+
+Usage:
+    python -m benchmarks.bench_pool --database-url postgresql+asyncpg://... \
+        --pool-size 10 --max-overflow 10 --concurrency 5 10 20 50 100
+"""
+
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.db.metrics import get_pool_metrics
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_level(engine, concurrency: int, iterations: int, query_ms: float) -> dict:
+    waits = []
+    statement = (
+        text("SELECT pg_sleep(:seconds)").bindparams(seconds=query_ms / 1000)
+        if engine.dialect.name == "postgresql"
+        else text("SELECT 1")
+    )
+
+    async def worker():
+        for _ in range(iterations):
+            start = time.perf_counter()
+            async with engine.connect() as conn:
+                waits.append(time.perf_counter() - start)
+                await conn.execute(statement)
+
+    metrics = get_pool_metrics("bench")
+    metrics.reset()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "p50_ms": percentile(waits, 0.50) * 1000,
+        "p95_ms": percentile(waits, 0.95) * 1000,
+        "p99_ms": percentile(waits, 0.99) * 1000,
+        "waits": metrics.waits,
+        "checkouts": metrics.checkouts,
+        "timeouts": metrics.timeouts,
+        "qps": len(waits) / elapsed,
+    }
+
+
+async def run(args) -> None:
+    settings.DB_POOL_SIZE = args.pool_size
+    settings.DB_MAX_OVERFLOW = args.max_overflow
+    settings.DB_POOL_TIMEOUT = args.pool_timeout
+    settings.DB_ECHO = False
+
+    from app.db.base import build_engine
+    engine = build_engine(args.database_url, name="bench")
+
+    # Open the pool before measuring
+    await run_level(engine, args.pool_size, 1, 0)
+
+    print(f"pool_size={args.pool_size} max_overflow={args.max_overflow} query={args.query_ms}ms")
+    print(f"{'conc':>5}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}  {'waits':>7}  {'timeouts':>8}  {'q/s':>8}")
+    for concurrency in args.concurrency:
+        r = await run_level(engine, concurrency, args.iterations, args.query_ms)
+        print(
+            f"{concurrency:>5}  {r['p50_ms']:>8.2f}  {r['p95_ms']:>8.2f}  {r['p99_ms']:>8.2f}  "
+            f"{r['waits']:>7}  {r['timeouts']:>8}  {r['qps']:>8.0f}"
+        )
+
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--pool-size", type=int, default=settings.DB_POOL_SIZE)
+    parser.add_argument("--max-overflow", type=int, default=settings.DB_MAX_OVERFLOW)
+    parser.add_argument("--pool-timeout", type=float, default=settings.DB_POOL_TIMEOUT)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[5, 10, 20, 50, 100])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--query-ms", type=float, default=5.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Profiling overhead: full patient flows (loadtest/run.py) through the API in
+process with profiling off, with the background samplers at their defaults
+(slow request capture at PROFILING_SAMPLE_INTERVAL_MS plus the loop
+monitor) and with an on-demand profile running at 5 ms. Modes alternate over
+several rounds; reports the median seconds per flow and the overhead against
+profiling off.
+
+The fake LLM answers instantly by default, so a flow is only database, graph
+and serialization work and the overhead is an upper bound.
+
+Usage:
+    python -m benchmarks.bench_profiling --patients 20 --rounds 5
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from loadtest.fake_openai import add_arguments
+from loadtest.run import Recorder, configure_environment, drive, start_fake_server
+
+MODES = ["off", "background", "profile-5ms"]
+
+
+async def run(args, tmp: Path) -> None:
+    fake_app, server, task, openai_base_url = await start_fake_server(args)
+    configure_environment(tmp, openai_base_url, args)
+
+    from app.core import profiling
+    from app.core.config import settings
+    from app.db.base import Base, engine
+    from app.main import app
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    # Capture no request: measure the samplers, not the slow request bookkeeping
+    settings.PROFILING_SLOW_REQUEST_MS = 600_000
+    timings = {mode: [] for mode in MODES}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            await drive(client, Recorder(), args)  # warm up
+            for _ in range(args.rounds):
+                for mode in MODES:
+                    profile = None
+                    if mode == "background":
+                        profiling.profiler.start()
+                    elif mode == "profile-5ms":
+                        profile = asyncio.create_task(profiling.profiler.profile(3600, 0.005))
+                    start = time.perf_counter()
+                    totals = await drive(client, Recorder(), args)
+                    timings[mode].append((time.perf_counter() - start) / totals["flows"])
+                    await profiling.profiler.stop()
+                    if profile is not None:
+                        profile.cancel()
+                        await asyncio.gather(profile, return_exceptions=True)
+    finally:
+        server.should_exit = True
+        await task
+        await engine.dispose()
+
+    baseline = statistics.median(timings["off"])
+    print(f"{'mode':<12}  {'ms/flow':>8}  {'overhead':>8}")
+    for mode in MODES:
+        per_flow = statistics.median(timings[mode])
+        print(f"{mode:<12}  {per_flow * 1000:>8.1f}  {(per_flow / baseline - 1) * 100:>+7.1f}%")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=20, help="Flows per mode and round")
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--no-image", action="store_true")
+    parser.add_argument("--finalize-pacing", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--database-url", default="")
+    add_arguments(parser)
+    parser.set_defaults(latency_ms=0.0, latency_sigma=0.0, tokens_per_second=0.0, seed=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(args, Path(tmp)))
+
+
+if __name__ == "__main__":
+    main()
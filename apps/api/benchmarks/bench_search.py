@@ -0,0 +1,154 @@
+"""
+Search latency over a seeded corpus: search_sessions (GIN tsvector index on
+PostgreSQL, FTS5 on SQLite) vs an ILIKE scan over messages and assessments,
+the only option before the search index. Reports p50/p95 per query and
+corpus size. The indexed search reads only matching documents (each query
+matches about 1/8 of the seeded sessions here), while the scan reads every
+message and assessment; the ILIKE baseline also misses unaccented and
+inflected queries.
+
+Usage:
+    python -m benchmarks.bench_search --sessions 1000 10000
+    python -m benchmarks.bench_search --database-url postgresql+asyncpg://...
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import String, cast, delete, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.db.base import Base
+from app.db.models import DiagnosticResult, Message, MessageRole, SearchDocument, Session, SessionStatus
+from app.services import search
+
+COMPLAINTS = [
+    "Tengo dolor torácico que se irradia al brazo",
+    "Fiebre alta y tos con flema desde hace tres días",
+    "Me duele mucho la cabeza y me molesta la luz",
+    "Dolor abdominal en la parte baja derecha",
+    "Picazón y ronchas en la piel después de comer",
+    "Me falta el aire al subir escaleras",
+    "Ardor al orinar y ganas de ir al baño seguido",
+    "Dolor de rodilla al correr",
+]
+QUESTIONS = ["¿Desde cuándo tiene los síntomas?", "¿Tiene fiebre?", "¿Toma alguna medicación?", "¿Le pasó antes?"]
+DIAGNOSES = [
+    "Síndrome coronario agudo", "Neumonía adquirida en la comunidad", "Migraña", "Apendicitis aguda",
+    "Urticaria alérgica", "Insuficiencia cardíaca", "Infección urinaria", "Tendinitis rotuliana",
+]
+QUERIES = ["neumonia", "dolor torácico", "migraña", "infeccion urinaria", "ronchas piel"]
+
+
+async def seed(factory, count: int, messages_per_session: int) -> None:
+    rng = random.Random(count)
+    start = datetime.utcnow() - timedelta(days=30)
+    async with factory() as db:
+        for table in (SearchDocument, Message, DiagnosticResult, Session):
+            await db.execute(delete(table))
+        for offset in range(0, count, 1000):
+            sessions, messages, results, documents = [], [], [], []
+            for i in range(offset, min(offset + 1000, count)):
+                sid = str(uuid.uuid4())
+                ts = start + timedelta(seconds=i)
+                case = rng.randrange(len(COMPLAINTS))
+                sessions.append({
+                    "id": sid, "status": SessionStatus.COMPLETED, "patient_info": {}, "symptoms": [],
+                    "created_at": ts, "updated_at": ts, "has_critical_red_flags": False,
+                })
+                for j in range(messages_per_session):
+                    user = j % 2 == 0
+                    content = COMPLAINTS[case] if j == 0 else (f"Sí, {j} días" if user else rng.choice(QUESTIONS))
+                    messages.append({
+                        "session_id": sid, "role": MessageRole.USER if user else MessageRole.ASSISTANT,
+                        "content": content, "images": [], "message_metadata": {}, "timestamp": ts,
+                    })
+                    documents.append({
+                        "session_id": sid, "source": "user_message" if user else "assistant_message", "content": content,
+                    })
+                assessment = {"differentials": [{"name": DIAGNOSES[case]}, {"name": rng.choice(DIAGNOSES)}]}
+                results.append({"session_id": sid, "assessment_json": assessment, "confidence_score": 0.7, "created_at": ts})
+                documents.append({
+                    "session_id": sid, "source": "diagnosis",
+                    "content": ". ".join(dx["name"] for dx in assessment["differentials"]),
+                })
+            await db.execute(insert(Session), sessions)
+            await db.execute(insert(Message), messages)
+            await db.execute(insert(DiagnosticResult), results)
+            await db.execute(insert(SearchDocument), documents)
+        await db.commit()
+
+
+async def ilike_scan(db: AsyncSession, query: str, limit: int = 20) -> list:
+    """Substring match over raw messages and assessment JSON (no ranking, no stemming)"""
+    pattern = f"%{query}%"
+    matching = select(Message.session_id).where(Message.content.ilike(pattern)).union(
+        select(DiagnosticResult.session_id).where(cast(DiagnosticResult.assessment_json, String).ilike(pattern))
+    ).subquery()
+    result = await db.execute(
+        select(Session.id).where(Session.id.in_(select(matching.c.session_id)))
+        .order_by(Session.updated_at.desc()).limit(limit)
+    )
+    return result.scalars().all()
+
+
+async def latency(factory, fn, query: str, runs: int) -> tuple:
+    timings = []
+    async with factory() as db:
+        for _ in range(runs):
+            start = time.perf_counter()
+            found = await fn(db, query)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1], found
+
+
+async def run(database_url: str, sizes, messages_per_session: int, runs: int) -> None:
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    variants = {
+        "search": lambda db, q: search.search_sessions(db, q, limit=20),
+        "ilike": ilike_scan,
+    }
+
+    print(f"{engine.dialect.name} messages/session={messages_per_session} runs={runs}")
+    print(f"{'sessions':>9}  {'query':>18}  {'variant':>7}  {'p50 ms':>8}  {'p95 ms':>8}  {'hits':>5}")
+    for size in sizes:
+        await seed(factory, size, messages_per_session)
+        if engine.dialect.name == "postgresql":
+            async with engine.begin() as conn:
+                await conn.exec_driver_sql("ANALYZE")
+        for query in QUERIES:
+            for name, fn in variants.items():
+                p50, p95, found = await latency(factory, fn, query, runs)
+                hits = len(found[0]) if name == "search" else len(found)
+                print(f"{size:>9}  {query:>18}  {name:>7}  {p50:>8.2f}  {p95:>8.2f}  {hits:>5}")
+
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--messages", type=int, default=10, help="Messages per session")
+    parser.add_argument("--runs", type=int, default=30, help="Timed runs per query")
+    parser.add_argument("--database-url", default="")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}"
+        asyncio.run(run(database_url, args.sessions, args.messages, args.runs))
+
+
+if __name__ == "__main__":
+    main()
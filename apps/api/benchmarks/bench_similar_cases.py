@@ -0,0 +1,96 @@
+"""
+Query latency benchmark for the similar-case index.
+
+Builds synthetic indexes of increasing size in a temporary directory and
+reports top-k query latency percentiles. Runs offline.
+
+Usage:
+    python -m benchmarks.bench_similar_cases --sizes 10000 100000 1000000
+"""
+
+import argparse
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.similar_cases import SimilarCaseIndex
+
+VOCABULARY = [
+    "fiebre", "tos", "disnea", "cefalea", "dolor", "toracico", "abdominal", "nauseas",
+    "vomitos", "diarrea", "mareos", "sincope", "palpitaciones", "edema", "erupcion",
+    "prurito", "lesion", "pigmentada", "fatiga", "perdida", "peso", "artralgia",
+    "mialgia", "odinofagia", "rinorrea", "disuria", "hematuria", "lumbalgia",
+    "neumonia", "migrana", "gastroenteritis", "melanoma", "infarto", "asma",
+    "faringitis", "pielonefritis", "apendicitis", "dermatitis", "anemia", "influenza",
+]
+
+BUILD_BATCH = 50_000
+TERMS_PER_CASE = 24
+
+
+def synthetic_vectors(rng: np.random.Generator, n: int, dim: int) -> np.ndarray:
+    """Sparse, signed, L2-normalised rows shaped like hashed case vectors"""
+    vectors = np.zeros((n, dim), dtype=np.float32)
+    rows = np.repeat(np.arange(n), TERMS_PER_CASE)
+    cols = rng.integers(0, dim, size=n * TERMS_PER_CASE)
+    vectors[rows, cols] = rng.choice([-1.0, 1.0], size=n * TERMS_PER_CASE).astype(np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+    return vectors
+
+
+def build_index(path: str, size: int, dim: int, seed: int) -> float:
+    rng = np.random.default_rng(seed)
+    index = SimilarCaseIndex(path, dim)
+    start = time.perf_counter()
+    for offset in range(0, size, BUILD_BATCH):
+        n = min(BUILD_BATCH, size - offset)
+        cases = [
+            {"session_id": f"bench-{offset + i}", "patient_summary": "", "differentials": [], "symptoms": []}
+            for i in range(n)
+        ]
+        index.add_vectors(synthetic_vectors(rng, n, dim), cases)
+    return time.perf_counter() - start
+
+
+def run(size: int, dim: int, queries: int, k: int, seed: int) -> None:
+    with tempfile.TemporaryDirectory(prefix="similar-cases-bench-") as path:
+        build_seconds = build_index(path, size, dim, seed)
+
+        # Fresh instance: measures cold load + memory-mapped search
+        index = SimilarCaseIndex(path, dim)
+        rnd = random.Random(seed)
+        load_start = time.perf_counter()
+        index.search(["fiebre"], k=k)
+        first_query_ms = (time.perf_counter() - load_start) * 1000
+
+        latencies = []
+        for _ in range(queries):
+            symptoms = rnd.sample(VOCABULARY, 5)
+            start = time.perf_counter()
+            index.search(symptoms, k=k)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(
+            f"{size:>9,} cases  dim={dim:<5} build={build_seconds:7.2f}s  "
+            f"first={first_query_ms:8.2f}ms  p50={p50:7.2f}ms  p95={p95:7.2f}ms  p99={p99:7.2f}ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.dim, args.queries, args.k, args.seed)
+
+
+if __name__ == "__main__":
+    main()
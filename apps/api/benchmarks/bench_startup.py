@@ -0,0 +1,97 @@
+"""
+Cold start of an API worker: each run is a fresh interpreter that imports
+app.main, answers a first GET /health and then gets ready to run the graph
+(the warm-up a lifespan does, or nothing on trees that build everything at
+import). Reports the median time of each step and the peak RSS after import
+and once ready.
+
+Point --app-dir at another checkout's apps/api to compare trees, e.g. before
+and after a change:
+    git worktree add /tmp/before HEAD~1
+    python -m benchmarks.bench_startup --app-dir /tmp/before/apps/api
+
+Usage:
+    python -m benchmarks.bench_startup --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+CHILD = r"""
+import asyncio, json, resource, time
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+rss_import = rss_mb()
+
+import httpx
+
+async def first_request():
+    transport = httpx.ASGITransport(app=app.main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        assert (await client.get("/health")).status_code == 200
+
+asyncio.run(first_request())
+served = time.perf_counter()
+
+try:
+    from app.agents.registry import registry
+except ImportError:
+    registry = None  # agents and graph were built at import
+if registry is not None:
+    registry.warm_up()
+ready = time.perf_counter()
+
+print(json.dumps({
+    "import_s": imported - start,
+    "first_health_s": served - start,
+    "ready_s": ready - start,
+    "rss_import_mb": rss_import,
+    "rss_ready_mb": rss_mb(),
+}))
+"""
+
+COLUMNS = ["import_s", "first_health_s", "ready_s", "rss_import_mb", "rss_ready_mb"]
+
+
+def run_once(app_dir: Path) -> dict:
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "sk-bench",
+        "DATABASE_URL": "sqlite+aiosqlite:///./bench_startup.db",
+        "MAINTENANCE_ENABLED": "false",
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=app_dir, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--app-dir", type=Path, default=Path(__file__).resolve().parents[1])
+    args = parser.parse_args()
+
+    run_once(args.app_dir)  # compile bytecode, warm the page cache
+    runs = [run_once(args.app_dir) for _ in range(args.runs)]
+
+    print(f"{'step':<16}  {'median':>8}")
+    for column in COLUMNS:
+        value = statistics.median(run[column] for run in runs)
+        unit = "ms" if column.endswith("_s") else "MB"
+        shown = value * 1000 if unit == "ms" else value
+        print(f"{column:<16}  {shown:>6.0f} {unit}")
+
+
+if __name__ == "__main__":
+    main()
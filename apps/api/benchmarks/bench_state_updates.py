@@ -0,0 +1,96 @@
+"""
+Per-turn cost of state updates as the conversation history grows.
+
+Compares the legacy pattern (every node copies the full lists and the graph
+merges with {**state, **updates}) against delta updates folded in by the
+ConversationState reducers. Reports time and bytes allocated per turn.
+
+Usage:
+    python -m benchmarks.bench_state_updates --history 10 100 1000 10000
+"""
+
+import argparse
+import time
+import tracemalloc
+from typing import Any, Callable, Dict
+
+from app.agents.state import ConversationState, apply_state_updates, create_initial_state
+
+
+def seeded_state(history: int) -> ConversationState:
+    state = create_initial_state("bench")
+    for i in range(history):
+        role = "user" if i % 2 == 0 else "assistant"
+        state["messages"].append({"role": role, "content": f"mensaje {i} " * 8})
+        if role == "assistant":
+            state["questions_asked"].append(f"pregunta {i}")
+    state["symptoms"] = [f"sintoma {i}" for i in range(min(history, 40))]
+    state["images"] = [{"url": f"/uploads/{i}.png", "analysis": {}} for i in range(min(history // 10, 20))]
+    return state
+
+
+def legacy_turn(state: Dict[str, Any], turn: int) -> Dict[str, Any]:
+    """User message, interviewer extraction + question, as before the reducers"""
+    messages = state["messages"].copy()
+    messages.append({"role": "user", "content": f"respuesta {turn}"})
+    state = {**state, "messages": messages}
+
+    symptoms = state["symptoms"].copy()
+    if f"nuevo {turn}" not in symptoms:
+        symptoms.append(f"nuevo {turn}")
+    state = {**state, "symptoms": symptoms, "patient_info": {**state["patient_info"], "turn": turn}}
+
+    messages = state["messages"].copy()
+    messages.append({"role": "assistant", "content": f"pregunta {turn}"})
+    questions = state["questions_asked"].copy()
+    questions.append(f"pregunta {turn}")
+    return {**state, "messages": messages, "questions_asked": questions, "turn_count": turn}
+
+
+def delta_turn(state: Dict[str, Any], turn: int) -> Dict[str, Any]:
+    """The same turn emitted as deltas and folded in by the reducers"""
+    apply_state_updates(state, {"messages": [{"role": "user", "content": f"respuesta {turn}"}]})
+    apply_state_updates(state, {"symptoms": [f"nuevo {turn}"], "patient_info": {"turn": turn}})
+    return apply_state_updates(state, {
+        "messages": [{"role": "assistant", "content": f"pregunta {turn}"}],
+        "questions_asked": [f"pregunta {turn}"],
+        "turn_count": turn,
+    })
+
+
+def measure(turn_fn: Callable, history: int, turns: int) -> tuple:
+    state = seeded_state(history)
+
+    start = time.perf_counter()
+    for turn in range(turns):
+        state = turn_fn(state, turn)
+    elapsed_us = (time.perf_counter() - start) / turns * 1e6
+
+    state = seeded_state(history)
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    kept = []
+    for turn in range(turns):
+        state = turn_fn(state, turn)
+        kept.append(state)  # keep intermediate states alive, as node outputs are
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed_us, (allocated - baseline) / turns
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'history':>8}  {'legacy us/turn':>15}  {'legacy B/turn':>14}  {'delta us/turn':>14}  {'delta B/turn':>13}")
+    for history in args.history:
+        legacy_us, legacy_bytes = measure(legacy_turn, history, args.turns)
+        delta_us, delta_bytes = measure(delta_turn, history, args.turns)
+        print(f"{history:>8}  {legacy_us:>15.1f}  {legacy_bytes:>14.0f}  {delta_us:>14.1f}  {delta_bytes:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Tracing overhead: full patient flows (loadtest/run.py) through the API in
+process with tracing off, on but unsampled, and fully sampled to a JSON-lines
+file. Modes alternate over several rounds; reports the median seconds per
+flow, the overhead against tracing off and the spans exported per flow.
+
+With the fake LLM answering instantly (the default) a flow is only
+database, graph and serialization work, so the overhead is an upper bound:
+with real LLM latency the same span cost is a much smaller fraction.
+
+Usage:
+    python -m benchmarks.bench_tracing --patients 20 --rounds 5
+    python -m benchmarks.bench_tracing --latency-ms 300
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from loadtest.fake_openai import add_arguments
+from loadtest.run import Recorder, configure_environment, drive, start_fake_server
+
+MODES = ["off", "unsampled", "sampled"]
+
+
+async def run(args, tmp: Path) -> None:
+    fake_app, server, task, openai_base_url = await start_fake_server(args)
+    configure_environment(tmp, openai_base_url, args)
+    # LLM clients are built with the retry-counting hook, as in production
+    os.environ["TRACING_ENABLED"] = "true"
+
+    from app.core import tracing
+    from app.db.base import Base, engine
+    from app.main import app
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    spans_path = Path(os.environ["TRACING_JSONL_PATH"])
+    timings = {mode: [] for mode in MODES}
+    spans_per_flow = 0.0
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            await drive(client, Recorder(), args)  # warm up
+            for _ in range(args.rounds):
+                for mode in MODES:
+                    if mode != "off":
+                        tracing.configure_tracing(
+                            exporter=tracing.create_exporter("jsonl"),
+                            sample_ratio=1.0 if mode == "sampled" else 0.0,
+                        )
+                    start = time.perf_counter()
+                    totals = await drive(client, Recorder(), args)
+                    timings[mode].append((time.perf_counter() - start) / totals["flows"])
+                    tracing.shutdown_tracing()
+                    if mode == "sampled":
+                        spans_per_flow = count_lines(spans_path) / totals["flows"]
+                        spans_path.unlink(missing_ok=True)
+    finally:
+        server.should_exit = True
+        await task
+        await engine.dispose()
+
+    baseline = statistics.median(timings["off"])
+    print(f"{'mode':<10}  {'ms/flow':>8}  {'overhead':>8}")
+    for mode in MODES:
+        per_flow = statistics.median(timings[mode])
+        print(f"{mode:<10}  {per_flow * 1000:>8.1f}  {(per_flow / baseline - 1) * 100:>+7.1f}%")
+    print(f"\nspans per flow (sampled): {spans_per_flow:.0f}")
+
+
+def count_lines(path: Path) -> int:
+    if not path.exists():
+        return 0
+    with open(path, encoding="utf-8") as file:
+        return sum(1 for _ in file)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=20, help="Flows per mode and round")
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--no-image", action="store_true")
+    parser.add_argument("--finalize-pacing", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--database-url", default="")
+    add_arguments(parser)
+    parser.set_defaults(latency_ms=0.0, latency_sigma=0.0, tokens_per_second=0.0, seed=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["TRACING_JSONL_PATH"] = str(Path(tmp) / "spans.jsonl")
+        asyncio.run(run(args, Path(tmp)))
+
+
+if __name__ == "__main__":
+    main()
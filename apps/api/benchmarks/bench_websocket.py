@@ -0,0 +1,149 @@
+"""
+Interview turns over HTTP vs the WebSocket channel, against the fake LLM.
+
+The fake OpenAI server (loadtest/fake_openai.py, with a time to first token
+and a token rate) and one API worker run as subprocesses on a fresh SQLite
+database. Each patient answers --turns questions:
+    http       POST /messages then GET the session, a new connection per
+               request (what the web client did)
+    websocket  one connection per patient; a turn is a "message" frame, the
+               answer streams back as token events
+Reports, per transport, the median and p95 time until the first characters
+of the answer are visible, until the turn is complete, and the TCP
+connections opened per turn.
+
+Usage:
+    python -m benchmarks.bench_websocket --patients 5 --turns 3 --latency-ms 400 --tokens-per-second 40
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import websockets
+
+from benchmarks.bench_workers import free_port, reset_schema, wait_ready
+from loadtest.run import percentile
+from loadtest.scenarios import SCENARIOS
+
+
+async def http_patient(api_url: str, scenario, turns: int, samples: list) -> int:
+    """Returns the connections opened"""
+    connections = 0
+
+    async def request(method: str, path: str, **kwargs) -> httpx.Response:
+        nonlocal connections
+        connections += 1
+        async with httpx.AsyncClient(base_url=api_url, timeout=120) as client:
+            response = await client.request(method, path, **kwargs)
+            response.raise_for_status()
+            return response
+
+    session_id = (await request("POST", "/v1/sessions", json={})).json()["id"]
+    for turn in scenario.turns[:turns]:
+        start = time.perf_counter()
+        await request("POST", f"/v1/sessions/{session_id}/messages", json={"content": turn.text})
+        answered = time.perf_counter()
+        await request("GET", f"/v1/sessions/{session_id}", params={"include_messages": "false"})
+        samples.append((answered - start, time.perf_counter() - start))
+    return connections
+
+
+async def websocket_patient(api_url: str, scenario, turns: int, samples: list) -> int:
+    async with httpx.AsyncClient(base_url=api_url, timeout=120) as client:
+        session_id = (await client.post("/v1/sessions", json={})).json()["id"]
+    ws_url = api_url.replace("http", "ws", 1)
+    async with websockets.connect(f"{ws_url}/v1/sessions/{session_id}/ws", max_size=None) as socket:
+        assert json.loads(await socket.recv())["type"] == "hello"
+        for turn in scenario.turns[:turns]:
+            start = time.perf_counter()
+            first = None
+            await socket.send(json.dumps({"type": "message", "content": turn.text}))
+            while True:
+                event = json.loads(await socket.recv())
+                if event["type"] == "token" and first is None:
+                    first = time.perf_counter()
+                if event["type"] == "error":
+                    raise RuntimeError(event["error"])
+                if event["type"] == "message":
+                    done = time.perf_counter()
+                    break
+            samples.append(((first or done) - start, done - start))
+    # Session creation plus the socket
+    return 2
+
+
+async def run(args) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        database_url = f"sqlite+aiosqlite:///{tmp / 'bench.db'}"
+        await reset_schema(database_url)
+        fake_port, api_port = free_port(), free_port()
+        fake = subprocess.Popen(
+            [sys.executable, "-m", "loadtest.fake_openai", "--port", str(fake_port),
+             "--latency-ms", str(args.latency_ms), "--latency-sigma", "0",
+             "--tokens-per-second", str(args.tokens_per_second), "--seed", "7"],
+        )
+        env = {
+            **os.environ,
+            "DATABASE_URL": database_url,
+            "CHECKPOINT_DATABASE_URL": database_url,
+            "OPENAI_API_KEY": "sk-bench",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+            "MAINTENANCE_ENABLED": "false",
+            "SIMILAR_CASES_ENABLED": "false",
+            "DB_ECHO": "false",
+            "S3_BUCKET": "",
+            "LOCAL_STORAGE_PATH": str(tmp / "uploads"),
+        }
+        api = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(api_port), "--log-level", "warning"],
+            env=env,
+        )
+        api_url = f"http://127.0.0.1:{api_port}"
+        results = {}
+        try:
+            await wait_ready(f"http://127.0.0.1:{fake_port}/stats", fake)
+            await wait_ready(f"{api_url}/health", api)
+            for name, patient in (("http", http_patient), ("websocket", websocket_patient)):
+                samples, connections = [], 0
+                for i in range(args.patients):
+                    scenario = SCENARIOS[i % len(SCENARIOS)]
+                    connections += await patient(api_url, scenario, args.turns, samples)
+                results[name] = (samples, connections)
+        finally:
+            for process in (api, fake):
+                process.terminate()
+                process.wait(timeout=30)
+
+    print(f"fake LLM: {args.latency_ms:.0f} ms to first token, {args.tokens_per_second:.0f} tokens/s")
+    print(f"{'transport':>9}  {'first text p50':>14}  {'p95':>7}  {'turn p50':>8}  {'p95':>7}  {'conns/turn':>10}")
+    for name, (samples, connections) in results.items():
+        first = [s[0] * 1000 for s in samples]
+        total = [s[1] * 1000 for s in samples]
+        print(
+            f"{name:>9}  {statistics.median(first):>11.0f} ms  {percentile(first, 95):>4.0f} ms  "
+            f"{statistics.median(total):>5.0f} ms  {percentile(total, 95):>4.0f} ms  {connections / len(samples):>10.2f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=400.0, help="Fake LLM time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=40.0, help="Fake LLM generation speed")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
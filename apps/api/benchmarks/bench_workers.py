@@ -0,0 +1,161 @@
+"""
+Throughput of the fake-LLM load test (loadtest/run.py) against 1..N API
+workers started with the launcher (python -m app.serve --workers N).
+
+For each worker count the schema of --database-url is recreated, the fake
+OpenAI server and the API run as subprocesses (PostgreSQL, shared
+coordination backend, maintenance off) and the same patients are driven over
+HTTP. Reports completed flows per second, requests per second, p95 latency of
+the interview turns, errors, and whether /metrics counted every request
+(the workers' samples merged through PROMETHEUS_MULTIPROC_DIR).
+
+Scaling is bounded by the cores available to the benchmark (reported
+first): the load generator and the fake server share them with the workers.
+
+Usage:
+    python -m benchmarks.bench_workers --database-url postgresql+asyncpg://... --workers 1 2 4
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from app.serve import available_cores
+from loadtest.run import Recorder, drive, percentile
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_ready(url: str, process: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with {process.returncode}")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise TimeoutError(f"{url} not ready after {timeout:.0f}s")
+
+
+async def reset_schema(database_url: str) -> None:
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from app.db.base import Base
+    import app.db.models  # noqa: F401
+
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+
+
+def counted_requests(exposition: str) -> int:
+    return int(sum(
+        float(value) for value in re.findall(r'^http_request_duration_seconds_count\{.*\} (\S+)$', exposition, re.M)
+    ))
+
+
+async def run_workers(workers: int, fake_url: str, args, tmp: Path) -> dict:
+    await reset_schema(args.database_url)
+    port = free_port()
+    env = {
+        **os.environ,
+        "DATABASE_URL": args.database_url,
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": fake_url,
+        "COORDINATION_BACKEND": "postgres",
+        "MAINTENANCE_ENABLED": "false",
+        "FINALIZE_PROGRESS_PACING": "0",
+        "DB_ECHO": "false",
+        "S3_BUCKET": "",
+        "LOCAL_STORAGE_PATH": str(tmp / f"uploads-{workers}"),
+        "SIMILAR_CASES_INDEX_PATH": str(tmp / f"similar_cases-{workers}"),
+        "PROMETHEUS_MULTIPROC_DIR": str(tmp / f"prometheus-{workers}"),
+    }
+    api = subprocess.Popen(
+        [sys.executable, "-m", "app.serve", "--workers", str(workers), "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    api_url = f"http://127.0.0.1:{port}"
+    try:
+        await wait_ready(f"{api_url}/health", api)
+        recorder = Recorder()
+        async with httpx.AsyncClient(base_url=api_url, timeout=args.timeout) as client:
+            totals = await drive(client, recorder, args)
+            exposition = (await client.get("/metrics")).text
+    finally:
+        api.terminate()
+        api.wait(timeout=30)
+
+    turns = [s.seconds * 1000 for s in recorder.samples if s.endpoint == "POST /v1/sessions/{id}/messages"]
+    return {
+        "workers": workers,
+        "flows_s": totals["completed"] / totals["seconds"],
+        "requests_s": len(recorder.samples) / totals["seconds"],
+        "turn_p95_ms": percentile(turns, 95) if turns else 0.0,
+        "errors": sum(not s.ok for s in recorder.samples),
+        "metrics_ok": counted_requests(exposition) >= len(recorder.samples),
+    }
+
+
+async def run(args) -> None:
+    print(f"cores available: {available_cores()}")
+    with tempfile.TemporaryDirectory() as tmp:
+        fake_port = free_port()
+        fake = subprocess.Popen(
+            [sys.executable, "-m", "loadtest.fake_openai", "--port", str(fake_port),
+             "--latency-ms", str(args.latency_ms), "--tokens-per-second", "0", "--seed", "7"],
+        )
+        try:
+            await wait_ready(f"http://127.0.0.1:{fake_port}/stats", fake)
+            results = []
+            for workers in args.workers:
+                results.append(await run_workers(workers, f"http://127.0.0.1:{fake_port}/v1", args, Path(tmp)))
+        finally:
+            fake.terminate()
+            fake.wait(timeout=30)
+
+    base = results[0]["flows_s"]
+    print(f"{'workers':>7}  {'flows/s':>8}  {'speedup':>7}  {'req/s':>7}  {'turn p95 ms':>11}  {'errors':>6}  {'metrics':>7}")
+    for row in results:
+        print(
+            f"{row['workers']:>7}  {row['flows_s']:>8.2f}  {row['flows_s'] / base:>6.2f}x  {row['requests_s']:>7.1f}  "
+            f"{row['turn_p95_ms']:>11.1f}  {row['errors']:>6}  {'ok' if row['metrics_ok'] else 'MISSING':>7}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True, help="PostgreSQL database (its schema is recreated)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--patients", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--no-image", action="store_true")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Fake LLM latency")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+"""
+Microbenchmarks of the pure-Python hot paths: prompt building, interviewer
+message/context building and JSON parsing, confidence scoring, assessment
+validation and state reconstruction from the database.
+
+Each case runs on synthetic sessions from 5 to 200 turns and 0 to 20 images
+and reports the best time per call and the peak memory allocated by one
+call (tracemalloc). Results are compared with a stored baseline; the run
+fails (exit code 1) when a case is slower or allocates more than the
+threshold allows. Runs offline: state reconstruction uses a temporary SQLite
+database and no LLM request is made.
+
+Timings only compare on the same machine, so baselines are per machine;
+allocations are stable across machines with the same Python version
+(--metric alloc for CI).
+
+Usage:
+    python -m benchmarks.micro                        # compare with the baseline
+    python -m benchmarks.micro --save-baseline        # record a new baseline
+    python -m benchmarks.micro --only prompt --threshold 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.agents.diagnostic import build_diagnostic_prompt
+from app.agents.state import REQUIRED_INFO_CATEGORIES, ConversationState, calculate_confidence_score, create_initial_state
+from app.core.config import settings
+from app.models.clinical import ClinicalAssessment
+from app.services.similar_cases import SimilarCase
+
+DEFAULT_BASELINE = Path(__file__).parent / "baselines" / "micro.json"
+DEFAULT_THRESHOLD = 0.25
+ALLOC_SLACK_BYTES = 1024  # Ignore allocation changes smaller than this
+TIME_SLACK_US = 2.0  # ... and timing changes smaller than this (timer noise on tiny cases)
+
+# (turns, images) of the synthetic sessions
+SESSION_SIZES = [(5, 0), (50, 5), (200, 20)]
+ASSESSMENT_SIZES = [3, 10, 30]  # Differentials
+
+
+# ============= SYNTHETIC DATA =============
+
+PATIENT_ANSWERS = [
+    "Tengo dolor en el pecho desde hace dos días, empeora cuando respiro hondo y a veces se va a la espalda.",
+    "Tengo 54 años, soy hipertenso y tomo losartán 50 mg todos los días; no tengo alergias conocidas.",
+    "También me falta el aire al subir la escalera y tuve algo de fiebre anoche, 37,8 más o menos.",
+    "Fumé durante veinte años pero dejé hace cinco; mi padre tuvo un infarto a los 60.",
+]
+QUESTIONS = [
+    "¿Desde cuándo tenés el dolor y cómo cambió desde que empezó?",
+    "¿Tenés alguna enfermedad crónica o tomás medicación habitualmente?",
+    "¿Notaste falta de aire, fiebre, tos o palpitaciones?",
+    "¿Fumás o fumaste? ¿Hay antecedentes cardíacos en tu familia?",
+]
+
+
+def synthetic_state(turns: int, images: int) -> ConversationState:
+    """A session after `turns` patient answers and `images` analyzed images"""
+    state = create_initial_state(f"bench-{turns}-{images}")
+    for turn in range(turns):
+        state["messages"].append({"role": "user", "content": PATIENT_ANSWERS[turn % len(PATIENT_ANSWERS)]})
+        question = QUESTIONS[turn % len(QUESTIONS)]
+        state["messages"].append({"role": "assistant", "content": question})
+        state["questions_asked"].append(question)
+    state["symptoms"] = [f"síntoma {i}" for i in range(min(turns, 40))]
+    state["patient_info"] = {"edad": 54, "sexo": "M", "medicación": "losartán", "tabaquismo": "ex fumador"}
+    for i, category in enumerate(REQUIRED_INFO_CATEGORIES):
+        state["info_categories_covered"][category] = i < min(turns, len(REQUIRED_INFO_CATEGORIES))
+    state["images"] = [synthetic_image(i) for i in range(images)]
+    state["turn_count"] = turns
+    return state
+
+
+def synthetic_image(i: int) -> dict:
+    return {
+        "url": f"/uploads/bench/{i}.png",
+        "analysis": {
+            "description": f"Radiografía de tórax {i} con opacidad basal derecha y senos costofrénicos libres.",
+            "findings": ["opacidad basal derecha", "broncograma aéreo", "silueta cardíaca normal"],
+            "clinical_relevance": "Compatible con proceso consolidativo.",
+            "requires_specialist": False,
+            "specialist_type": "",
+            "disclaimer": "Análisis de apoyo.",
+        },
+        "timestamp": "2024-03-01T10:00:00",
+    }
+
+
+def synthetic_assessment(differentials: int) -> dict:
+    items = [f"elemento clínico {i} con una descripción de longitud realista" for i in range(6)]
+    return {
+        "differentials": [
+            {
+                "name": f"Diagnóstico {i}",
+                "likelihood": max(0, 80 - i * 3),
+                "reasoning": "Razonamiento clínico detallado que integra síntomas, antecedentes y hallazgos. " * 3,
+                "urgency": ("immediate", "urgent", "routine")[i % 3],
+                "general_causes": items,
+                "patient_specific_factors": items,
+                "risk_factors": items,
+                "supporting_findings": items,
+                "contradicting_findings": items,
+                "prognosis": "Pronóstico favorable con tratamiento adecuado y seguimiento.",
+                "complications": items,
+                "recommended_tests": items,
+                "treatment_summary": "Tratamiento de soporte y específico según confirmación.",
+            }
+            for i in range(differentials)
+        ],
+        "red_flags": [
+            {"severity": "warning", "message": f"Alerta {i}", "why_it_matters": "Puede indicar gravedad."}
+            for i in range(5)
+        ],
+        "missing_questions": [f"Pregunta pendiente {i}" for i in range(5)],
+        "action_plan": [
+            {"priority": "urgent", "action": f"Acción {i}", "rationale": "Confirmar diagnóstico."}
+            for i in range(5)
+        ],
+        "soap": {"subjective": "S " * 50, "objective": "O " * 50, "assessment": "A " * 50, "plan": "P " * 50},
+        "patient_summary": "Resumen del caso para el paciente. " * 5,
+        "limitations": "Sin examen físico.",
+    }
+
+
+SIMILAR_CASES = [
+    SimilarCase(
+        session_id=f"past-{i}", score=0.8 - i * 0.1, patient_summary="Paciente con dolor torácico pleurítico y fiebre.",
+        differentials=["Neumonía", "Pleuritis"], symptoms=["dolor torácico", "fiebre", "disnea"],
+    )
+    for i in range(3)
+]
+
+INTERVIEWER_RESPONSES = {
+    "direct": '{"ready_for_diagnosis": false, "message": "¿Desde cuándo tenés el dolor?"}',
+    "fenced": '```json\n{"ready_for_diagnosis": false, "message": "¿Desde cuándo tenés el dolor?"}\n```',
+    "embedded": 'Claro. {"ready_for_diagnosis": true, "message": "Voy a proceder con el análisis."} Gracias.',
+}
+
+
+# ============= CASES =============
+
+@dataclass
+class Case:
+    name: str
+    param: str
+    fn: Callable[[], Any]
+    is_async: bool = False
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}[{self.param}]"
+
+
+def size_label(turns: int, images: int) -> str:
+    return f"{turns}t/{images}i"
+
+
+async def seed_session_db(tmp: Path, sizes: List[Tuple[int, int]]):
+    """SQLite database with one stored session per size; returns (engine, factory, session ids)"""
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+    from app.db.base import Base
+    from app.db.models import Message, MessageRole, Session, SessionStatus
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp / 'micro.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    session_ids = {}
+    async with factory() as db:
+        for turns, images in sizes:
+            state = synthetic_state(turns, images)
+            session = Session(id=state["session_id"], status=SessionStatus.ACTIVE,
+                              patient_info=state["patient_info"], symptoms=state["symptoms"])
+            db.add(session)
+            for i, message in enumerate(state["messages"]):
+                # Image analyses are stored on the assistant messages
+                attached = state["images"][i // 2:i // 2 + 1] if message["role"] == "assistant" and i // 2 < images else []
+                db.add(Message(session=session, role=MessageRole(message["role"]), content=message["content"],
+                               images=attached, message_metadata={}))
+            session_ids[(turns, images)] = session.id
+        await db.commit()
+    return engine, factory, session_ids
+
+
+def offline_interviewer() -> Any:
+    """
+    An interviewer agent for its prompt and parsing helpers. Without an API
+    key its client points at a local URL, so none is needed (nothing is sent).
+    """
+    from app.agents.interviewer import InterviewerAgent
+
+    if settings.OPENAI_API_KEY or settings.OPENAI_BASE_URL:
+        return InterviewerAgent()
+    settings.OPENAI_BASE_URL = "http://127.0.0.1:9/v1"
+    try:
+        return InterviewerAgent()
+    finally:
+        settings.OPENAI_BASE_URL = ""
+
+
+def build_cases(factory=None, session_ids: Optional[dict] = None) -> List[Case]:
+    from app.services import session_service
+
+    interviewer_agent = offline_interviewer()
+    cases = []
+    for turns, images in SESSION_SIZES:
+        state = synthetic_state(turns, images)
+        label = size_label(turns, images)
+        cases += [
+            Case("build_diagnostic_prompt", label, lambda s=state: build_diagnostic_prompt(s, SIMILAR_CASES)),
+            Case("interviewer.build_messages", label, lambda s=state: interviewer_agent._build_messages(s)),
+            Case("interviewer.context_summary", label, lambda s=state: interviewer_agent._build_context_summary(s)),
+            Case("calculate_confidence_score", label, lambda s=state: calculate_confidence_score(s)),
+        ]
+        if factory is not None:
+            async def load(session_id=session_ids[(turns, images)]):
+                async with factory() as db:
+                    return await session_service.load_state_from_db(db, session_id)
+            cases.append(Case("load_state_from_db", label, load, is_async=True))
+
+    for style, raw in INTERVIEWER_RESPONSES.items():
+        cases.append(Case("interviewer.parse_json_response", style, lambda r=raw: interviewer_agent._parse_json_response(r)))
+
+    for differentials in ASSESSMENT_SIZES:
+        data = synthetic_assessment(differentials)
+        cases.append(Case("ClinicalAssessment.model_validate", f"{differentials}dx",
+                          lambda d=data: ClinicalAssessment.model_validate(d)))
+    return cases
+
+
+# ============= MEASUREMENT =============
+
+def make_runner(case: Case, loop: asyncio.AbstractEventLoop) -> Callable[[], Any]:
+    if case.is_async:
+        return lambda: loop.run_until_complete(case.fn())
+    return case.fn
+
+
+def time_per_call(run: Callable[[], Any], rounds: int, min_time: float) -> float:
+    """Best seconds per call over `rounds` rounds of at least `min_time` each
+
+    The minimum is the least noisy estimate: slower rounds measure
+    interference from the rest of the machine, not the code.
+    """
+    run()  # warm up
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    samples = [elapsed / number]
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        samples.append((time.perf_counter() - start) / number)
+    return min(samples)
+
+
+def peak_allocation(run: Callable[[], Any]) -> int:
+    """Peak bytes allocated while running one call"""
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - start
+
+
+def run_cases(
+    cases: List[Case],
+    loop: asyncio.AbstractEventLoop,
+    rounds: int = 7,
+    min_time: float = 0.05
+) -> Dict[str, Dict[str, float]]:
+    """{case key: {"us": best microseconds per call, "bytes": peak bytes per call}}
+
+    Async cases run on `loop`, the loop their database engine was created on.
+    """
+    results = {}
+    for case in cases:
+        run = make_runner(case, loop)
+        seconds = time_per_call(run, rounds, min_time)
+        results[case.key] = {"us": round(seconds * 1e6, 2), "bytes": peak_allocation(run)}
+    return results
+
+
+# ============= BASELINES =============
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float,
+    metrics: Tuple[str, ...] = ("us", "bytes")
+) -> List[str]:
+    """Descriptions of the cases that regressed beyond the threshold"""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        for metric in metrics:
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            if after - before < (ALLOC_SLACK_BYTES if metric == "bytes" else TIME_SLACK_US):
+                continue
+            if after > before * (1 + threshold):
+                regressions.append(f"{key}: {metric} {before:g} -> {after:g} (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def load_baseline(path: Path) -> Optional[dict]:
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def save_baseline(path: Path, results: Dict[str, Dict[str, float]]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    document = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "recorded": date.today().isoformat(),
+        },
+        "results": results,
+    }
+    path.write_text(json.dumps(document, indent=2, sort_keys=True) + "\n")
+
+
+def print_table(results: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Dict[str, float]]]) -> None:
+    print(f"{'case':<52}  {'us/call':>10}  {'peak KiB':>9}  {'vs base':>8}")
+    for key, current in results.items():
+        delta = ""
+        previous = (baseline or {}).get(key)
+        if previous and previous.get("us"):
+            delta = f"{(current['us'] / previous['us'] - 1) * 100:+.0f}%"
+        print(f"{key:<52}  {current['us']:>10.1f}  {current['bytes'] / 1024:>9.1f}  {delta:>8}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Record these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown (0.25 = 25%%)")
+    parser.add_argument("--metric", choices=["all", "time", "alloc"], default="all", help="Metrics checked against the baseline")
+    parser.add_argument("--only", default="", help="Run only cases whose name contains this text")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.05, help="Minimum seconds per round")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        loop = asyncio.new_event_loop()
+        engine, factory, session_ids = loop.run_until_complete(seed_session_db(Path(tmp), SESSION_SIZES))
+        try:
+            cases = [case for case in build_cases(factory, session_ids) if args.only in case.key]
+            results = run_cases(cases, loop, args.rounds, args.min_time)
+        finally:
+            loop.run_until_complete(engine.dispose())
+            loop.close()
+
+    stored = load_baseline(args.baseline)
+    if stored and stored["meta"].get("python") != platform.python_version():
+        print(f"Baseline recorded with Python {stored['meta'].get('python')}; comparisons may be off")
+    print_table(results, stored["results"] if stored else None)
+
+    if args.save_baseline:
+        merged = {**(stored["results"] if stored and args.only else {}), **results}
+        save_baseline(args.baseline, merged)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+    if not stored:
+        print("\nNo baseline yet; record one with --save-baseline")
+        return
+
+    metrics = {"all": ("us", "bytes"), "time": ("us",), "alloc": ("bytes",)}[args.metric]
+    regressions = compare(results, stored["results"], args.threshold, metrics)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Fake OpenAI-compatible chat/vision completions server for offline load tests.
+
+Answers POST /v1/chat/completions (plain and streamed) with scripted JSON in
+the shape each agent expects, recognized from the prompt: interviewer
+questions, information extraction, image analysis and clinical assessments,
+whole or by section (see loadtest/scenarios.py). Latency is drawn from a log-normal distribution
+around a median time to first token, and the completion is then "generated"
+at a fixed token rate. Errors (HTTP 429/5xx) and malformed JSON can be
+injected at a given rate.
+
+Point the API at it with:
+
+    python -m loadtest.fake_openai --port 8001 --latency-ms 600 --tokens-per-second 60
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 uvicorn app.main:app
+
+GET /stats returns the calls, errors and tokens served per kind of request.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from loadtest.scenarios import SCENARIOS, Scenario, find_scenario, find_turn
+
+# Prompt markers of each agent (app/agents/*.py)
+INTERVIEW_MARKER = "anamnesis"
+EXTRACTION_MARKER = "extraé información estructurada"
+DIAGNOSIS_MARKER = "diagnósticos diferenciales"
+REPAIR_MARKER = "no es JSON válido"
+# Section calls of the fan-out diagnosis (DIAGNOSTIC_FANOUT_ENABLED)
+TRIAGE_MARKER = "Primera etapa"
+DETAILS_MARKER = 'Ampliá el diagnóstico diferencial "'
+PLAN_MARKER = "Generá el plan de acción y la nota SOAP"
+
+READY_MESSAGE = (
+    "Gracias por la información. He recopilado suficientes datos para proceder con un "
+    "análisis diagnóstico completo. Voy a generar una evaluación clínica detallada."
+)
+
+
+@dataclass
+class FakeConfig:
+    latency_ms: float = 400.0  # Median time to first token
+    latency_sigma: float = 0.5  # Log-normal spread (0: constant latency)
+    tokens_per_second: float = 80.0  # Generation speed (0: instant)
+    error_rate: float = 0.0  # Fraction of requests answered with an error status
+    error_statuses: Tuple[int, ...] = (429, 500, 503)
+    malformed_rate: float = 0.0  # Fraction of JSON answers returned truncated
+    interview_turns: int = 6  # Patient answers before the interviewer is ready
+    seed: Optional[int] = None
+
+
+@dataclass
+class FakeStats:
+    calls: Counter = field(default_factory=Counter)
+    errors: Counter = field(default_factory=Counter)
+    malformed: Counter = field(default_factory=Counter)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": dict(self.calls),
+            "errors": dict(self.errors),
+            "malformed": dict(self.malformed),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
+
+
+def content_text(content) -> str:
+    """Text of a message content (string or list of parts)"""
+    if isinstance(content, str):
+        return content
+    return " ".join(part.get("text", "") for part in content or [] if isinstance(part, dict))
+
+
+def has_image(messages: List[dict]) -> bool:
+    return any(
+        isinstance(message.get("content"), list)
+        and any(part.get("type") == "image_url" for part in message["content"] if isinstance(part, dict))
+        for message in messages
+    )
+
+
+def classify(messages: List[dict]) -> str:
+    """Which agent sent the request: vision, extraction, interview, diagnosis or chat"""
+    if has_image(messages):
+        return "vision"
+    text = "\n".join(content_text(message.get("content")) for message in messages)
+    if EXTRACTION_MARKER in text:
+        return "extraction"
+    if INTERVIEW_MARKER in text:
+        return "interview"
+    if DIAGNOSIS_MARKER in text or REPAIR_MARKER in text:
+        return "diagnosis"
+    return "chat"
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeCompletions:
+    """Scripted completions; one instance per server"""
+
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.stats = FakeStats()
+
+    def latency(self) -> float:
+        """Seconds to first token"""
+        median = self.config.latency_ms / 1000
+        if self.config.latency_sigma <= 0:
+            return median
+        return self.random.lognormvariate(0, self.config.latency_sigma) * median
+
+    def generation_time(self, completion_tokens: int) -> float:
+        if self.config.tokens_per_second <= 0:
+            return 0.0
+        return completion_tokens / self.config.tokens_per_second
+
+    def scenario(self, messages: List[dict]) -> Scenario:
+        text = "\n".join(content_text(message.get("content")) for message in messages)
+        found = find_scenario(text)
+        if found is not None:
+            return found
+        return SCENARIOS[sum(map(ord, text[:200])) % len(SCENARIOS)]
+
+    def answer(self, kind: str, messages: List[dict]) -> str:
+        """Scripted completion text for a request"""
+        scenario = self.scenario(messages)
+
+        if kind == "vision":
+            return json.dumps(scenario.image_analysis, ensure_ascii=False)
+
+        if kind == "extraction":
+            prompt = content_text(messages[-1].get("content"))
+            quoted = prompt.split('Respuesta del paciente: "', 1)[-1].split('"\n', 1)[0]
+            turn = find_turn(quoted)
+            if turn is None:
+                return json.dumps({"symptoms": [], "patient_info": {}, "categories": []})
+            return json.dumps(
+                {"symptoms": turn.symptoms, "patient_info": turn.patient_info, "categories": turn.categories},
+                ensure_ascii=False
+            )
+
+        if kind == "interview":
+            answered = sum(
+                1 for message in messages
+                if message.get("role") == "user" and find_turn(content_text(message.get("content"))) is not None
+            )
+            if answered >= self.config.interview_turns:
+                return json.dumps({"ready_for_diagnosis": True, "message": READY_MESSAGE}, ensure_ascii=False)
+            question = scenario.questions[min(answered, len(scenario.questions)) - 1] if answered else (
+                "Contame, ¿cuál es el motivo de tu consulta?"
+            )
+            return json.dumps({"ready_for_diagnosis": False, "message": question}, ensure_ascii=False)
+
+        if kind == "diagnosis":
+            return json.dumps(self.assessment_section(scenario.assessment, messages), ensure_ascii=False)
+
+        return "Entendido."
+
+    def assessment_section(self, assessment: dict, messages: List[dict]) -> dict:
+        """The part of the assessment a diagnostic call asks for (all of it for a single call)"""
+        text = "\n".join(content_text(message.get("content")) for message in messages)
+        if DETAILS_MARKER in text:
+            name = text.split(DETAILS_MARKER, 1)[1].split('"', 1)[0]
+            dx = next((dx for dx in assessment["differentials"] if dx["name"] == name), assessment["differentials"][0])
+            return {key: value for key, value in dx.items() if key not in ("name", "likelihood", "reasoning", "urgency")}
+        if PLAN_MARKER in text:
+            return {key: assessment[key] for key in ("action_plan", "soap", "patient_summary", "limitations")}
+        # Red flags first, as the prompts ask
+        if TRIAGE_MARKER in text:
+            return {
+                "red_flags": assessment["red_flags"],
+                "differentials": [
+                    {key: dx[key] for key in ("name", "likelihood", "reasoning", "urgency")}
+                    for dx in assessment["differentials"]
+                ],
+                "missing_questions": assessment["missing_questions"],
+            }
+        return {"red_flags": assessment["red_flags"], **assessment}
+
+    def maybe_malformed(self, kind: str, content: str) -> str:
+        if kind != "chat" and self.random.random() < self.config.malformed_rate:
+            self.stats.malformed[kind] += 1
+            return content[: len(content) // 2]
+        return content
+
+    def maybe_error(self, kind: str) -> Optional[JSONResponse]:
+        if self.random.random() >= self.config.error_rate:
+            return None
+        status = self.random.choice(self.config.error_statuses)
+        self.stats.errors[kind] += 1
+        error_type = "rate_limit_exceeded" if status == 429 else "server_error"
+        return JSONResponse(
+            status_code=status,
+            content={"error": {"message": f"Injected {status}", "type": error_type, "code": error_type}},
+        )
+
+
+def completion_body(model: str, content: str, prompt_tokens: int, completion_tokens: int) -> dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def chunk_body(completion_id: str, model: str, delta: dict, finish_reason=None, usage=None) -> str:
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage is not None:
+        chunk["choices"] = []
+        chunk["usage"] = usage
+    return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+
+def create_app(config: Optional[FakeConfig] = None) -> FastAPI:
+    config = config or FakeConfig()
+    completions = FakeCompletions(config)
+    app = FastAPI(title="Fake OpenAI")
+    app.state.completions = completions
+
+    @app.get("/stats")
+    async def stats():
+        return completions.stats.as_dict()
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "fake", "object": "model", "owned_by": "loadtest"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        model = body.get("model", "fake")
+        kind = classify(messages)
+        completions.stats.calls[kind] += 1
+
+        await asyncio.sleep(completions.latency())
+        error = completions.maybe_error(kind)
+        if error is not None:
+            return error
+
+        content = completions.maybe_malformed(kind, completions.answer(kind, messages))
+        prompt_tokens = sum(estimate_tokens(content_text(m.get("content"))) for m in messages)
+        completion_tokens = estimate_tokens(content)
+        completions.stats.prompt_tokens += prompt_tokens
+        completions.stats.completion_tokens += completion_tokens
+
+        if not body.get("stream"):
+            await asyncio.sleep(completions.generation_time(completion_tokens))
+            return completion_body(model, content, prompt_tokens, completion_tokens)
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        async def stream():
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+            yield chunk_body(completion_id, model, {"role": "assistant", "content": ""})
+            # About 4 characters per token, in chunks of a few tokens
+            step = 16
+            pause = completions.generation_time(estimate_tokens(content[:step]))
+            for start in range(0, len(content), step):
+                await asyncio.sleep(pause)
+                yield chunk_body(completion_id, model, {"content": content[start:start + step]})
+            yield chunk_body(completion_id, model, {}, finish_reason="stop")
+            if include_usage:
+                yield chunk_body(completion_id, model, {}, usage={
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                })
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def config_from_args(args) -> FakeConfig:
+    return FakeConfig(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        error_statuses=tuple(args.error_statuses),
+        malformed_rate=args.malformed_rate,
+        interview_turns=args.interview_turns,
+        seed=args.seed,
+    )
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Fake server options (shared with the load generator)"""
+    parser.add_argument("--latency-ms", type=float, default=400.0, help="Median time to first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of the latency")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="Generation speed (0: instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-statuses", type=int, nargs="+", default=[429, 500, 503])
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of truncated JSON answers")
+    parser.add_argument("--interview-turns", type=int, default=6, help="Answers before the interviewer is ready")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
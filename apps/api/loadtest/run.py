@@ -0,0 +1,262 @@
+"""
+Load generator: N concurrent simulated patients, each running a full
+interview → image → finalize flow against app.main:app with the agents
+pointed at the fake OpenAI server (loadtest/fake_openai.py). Reports
+p50/p95/p99 latency, errors and database statements per endpoint, flow
+throughput and the LLM calls served.
+
+By default everything runs in this process: the fake server on a free local
+port, the API through httpx's ASGI transport and a temporary SQLite
+database (schema created with create_all). Use --database-url for
+PostgreSQL; SQLite serializes writers, so its numbers at high concurrency
+mostly measure lock waits.
+
+Usage:
+    python -m loadtest.run --patients 50 --concurrency 10
+    python -m loadtest.run --database-url postgresql+asyncpg://... --latency-ms 800 --error-rate 0.02
+    python -m loadtest.run --api-url http://localhost:8000 --fake-url http://localhost:8001
+
+With --api-url the flows go to a running API (started with OPENAI_BASE_URL
+pointing at a fake server). Statements per request come from the API's
+X-DB-Queries header, so they are not reported for streamed responses
+(finalize), whose queries run after the header is sent.
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from loadtest.fake_openai import add_arguments, config_from_args, create_app
+from loadtest.scenarios import SCENARIOS, Scenario
+
+
+@dataclass
+class Sample:
+    endpoint: str
+    ok: bool
+    seconds: float
+    queries: Optional[int]
+
+
+class Recorder:
+    """Times requests and collects one Sample per request"""
+
+    def __init__(self):
+        self.samples: List[Sample] = []
+
+    async def request(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            response = None
+        elapsed = time.perf_counter() - start
+
+        ok = response is not None and response.status_code < 400
+        queries = None
+        if response is not None:
+            streamed = response.headers.get("content-type", "").startswith("text/event-stream")
+            if ok and streamed:
+                ok = "event: complete" in response.text
+            # The header is sent before a streamed body runs its queries
+            if "X-DB-Queries" in response.headers and not streamed:
+                queries = int(response.headers["X-DB-Queries"])
+        self.samples.append(Sample(endpoint, ok, elapsed, queries))
+        return response if ok else None
+
+
+def sample_image() -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), (180, 120, 110)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def run_patient(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    scenario: Scenario,
+    turns: int,
+    image: Optional[bytes]
+) -> bool:
+    """One patient: create a session, answer the interview, upload an image, finalize"""
+    response = await recorder.request(client, "POST /v1/sessions", "POST", "/v1/sessions", json={})
+    if response is None:
+        return False
+    session_id = response.json()["id"]
+    base = f"/v1/sessions/{session_id}"
+
+    for turn in scenario.turns[:turns]:
+        response = await recorder.request(
+            client, "POST /v1/sessions/{id}/messages", "POST", f"{base}/messages", json={"content": turn.text}
+        )
+        if response is None:
+            return False
+
+    if image is not None:
+        response = await recorder.request(
+            client, "POST /v1/sessions/{id}/images", "POST", f"{base}/images",
+            files={"file": ("estudio.png", image, "image/png")}
+        )
+        if response is None:
+            return False
+
+    if await recorder.request(client, "GET /v1/sessions/{id}/finalize", "GET", f"{base}/finalize") is None:
+        return False
+    return await recorder.request(client, "GET /v1/sessions/{id}/diagnosis", "GET", f"{base}/diagnosis") is not None
+
+
+async def drive(client: httpx.AsyncClient, recorder: Recorder, args) -> Dict[str, float]:
+    """Run all patients with bounded concurrency"""
+    rng = random.Random(args.seed)
+    scenarios = [rng.choice(SCENARIOS) for _ in range(args.patients)]
+    image = None if args.no_image else sample_image()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def patient(scenario: Scenario) -> bool:
+        async with semaphore:
+            return await run_patient(client, recorder, scenario, args.turns, image)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(patient(scenario) for scenario in scenarios))
+    elapsed = time.perf_counter() - start
+    return {"flows": len(results), "completed": sum(results), "seconds": elapsed}
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def report(samples: List[Sample], totals: Dict[str, float], llm_stats: Optional[dict]) -> None:
+    by_endpoint: Dict[str, List[Sample]] = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample.endpoint].append(sample)
+
+    print(f"{'endpoint':<36}  {'count':>6}  {'errors':>6}  {'p50 ms':>8}  {'p95 ms':>8}  {'p99 ms':>8}  {'queries':>7}")
+    for endpoint, group in by_endpoint.items():
+        times = [s.seconds * 1000 for s in group]
+        queries = [s.queries for s in group if s.queries is not None]
+        avg_queries = f"{statistics.mean(queries):.1f}" if queries else "-"
+        print(
+            f"{endpoint:<36}  {len(group):>6}  {sum(not s.ok for s in group):>6}  "
+            f"{percentile(times, 50):>8.1f}  {percentile(times, 95):>8.1f}  {percentile(times, 99):>8.1f}  {avg_queries:>7}"
+        )
+
+    seconds = totals["seconds"]
+    print(
+        f"\nflows: {totals['completed']}/{totals['flows']} completed in {seconds:.1f}s "
+        f"({totals['completed'] / seconds:.2f} flows/s, {len(samples) / seconds:.1f} requests/s)"
+    )
+    if llm_stats:
+        calls = ", ".join(f"{kind}={count}" for kind, count in sorted(llm_stats["calls"].items()))
+        errors = sum(llm_stats["errors"].values())
+        malformed = sum(llm_stats["malformed"].values())
+        print(
+            f"LLM calls: {calls} (injected errors={errors}, malformed={malformed}, "
+            f"tokens in/out={llm_stats['prompt_tokens']}/{llm_stats['completion_tokens']})"
+        )
+
+
+async def start_fake_server(args):
+    """Fake OpenAI server on a free local port, as a task of this event loop"""
+    import uvicorn
+
+    fake_app = create_app(config_from_args(args))
+    server = uvicorn.Server(uvicorn.Config(fake_app, host="127.0.0.1", port=0, log_level="warning", lifespan="off"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return fake_app, server, task, f"http://127.0.0.1:{port}/v1"
+
+
+def configure_environment(tmp: Path, openai_base_url: str, args) -> None:
+    """Settings for the in-process API (read when app.* is first imported)"""
+    os.environ.update({
+        "OPENAI_BASE_URL": openai_base_url,
+        "DATABASE_URL": args.database_url or f"sqlite+aiosqlite:///{tmp / 'loadtest.db'}",
+        "LOCAL_STORAGE_PATH": str(tmp / "uploads"),
+        "SIMILAR_CASES_INDEX_PATH": str(tmp / "similar_cases"),
+        "S3_BUCKET": "",
+        "MAINTENANCE_ENABLED": "false",
+        "DB_ECHO": "false",
+        "FINALIZE_PROGRESS_PACING": str(args.finalize_pacing),
+    })
+
+
+async def run_in_process(args, tmp: Path) -> None:
+    fake_app, server, task, openai_base_url = await start_fake_server(args)
+    configure_environment(tmp, openai_base_url, args)
+
+    from app.db.base import Base, engine
+    from app.main import app
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    recorder = Recorder()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as client:
+            totals = await drive(client, recorder, args)
+    finally:
+        server.should_exit = True
+        await task
+        await engine.dispose()
+
+    report(recorder.samples, totals, fake_app.state.completions.stats.as_dict())
+
+
+async def run_remote(args) -> None:
+    recorder = Recorder()
+    async with httpx.AsyncClient(base_url=args.api_url, timeout=args.timeout) as client:
+        totals = await drive(client, recorder, args)
+
+    llm_stats = None
+    if args.fake_url:
+        async with httpx.AsyncClient() as client:
+            llm_stats = (await client.get(f"{args.fake_url.rstrip('/')}/stats")).json()
+    report(recorder.samples, totals, llm_stats)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=20, help="Simulated patients (one flow each)")
+    parser.add_argument("--concurrency", type=int, default=10, help="Patients in flight at once")
+    parser.add_argument("--turns", type=int, default=3, help="Interview answers per patient")
+    parser.add_argument("--no-image", action="store_true", help="Skip the image upload step")
+    parser.add_argument("--finalize-pacing", type=float, default=0.0,
+                        help="FINALIZE_PROGRESS_PACING of the in-process API (1: production pauses)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--database-url", default="", help="In-process API database (default: temporary SQLite)")
+    parser.add_argument("--api-url", default="", help="Drive a running API instead of app.main:app in process")
+    parser.add_argument("--fake-url", default="", help="Fake server of the running API (for LLM call stats)")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.api_url:
+        asyncio.run(run_remote(args))
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run_in_process(args, Path(tmp)))
+
+
+if __name__ == "__main__":
+    main()
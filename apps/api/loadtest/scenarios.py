@@ -0,0 +1,284 @@
+"""
+Scripted patients shared by the fake OpenAI server and the load generator.
+
+The load generator sends a scenario's turns as patient messages; the fake
+server recognizes the same turns in the prompts it receives and answers with
+the scenario's extraction, next question, image analysis or assessment, so
+every agent gets clinically plausible JSON in the exact shape it parses.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+@dataclass
+class Turn:
+    text: str  # What the patient says
+    symptoms: List[str] = field(default_factory=list)
+    patient_info: Dict[str, object] = field(default_factory=dict)
+    categories: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Scenario:
+    name: str
+    turns: List[Turn]
+    questions: List[str]  # Interviewer questions, one per turn
+    image_analysis: dict
+    assessment: dict  # ClinicalAssessment
+
+
+def differential(name, likelihood, urgency, reasoning, tests, treatment):
+    return {
+        "name": name,
+        "likelihood": likelihood,
+        "reasoning": reasoning,
+        "urgency": urgency,
+        "general_causes": [],
+        "patient_specific_factors": [],
+        "risk_factors": [],
+        "supporting_findings": [],
+        "contradicting_findings": [],
+        "prognosis": "",
+        "complications": [],
+        "recommended_tests": tests,
+        "treatment_summary": treatment,
+    }
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario(
+        name="neumonia",
+        turns=[
+            Turn(
+                "Tengo fiebre y tos con flema amarillenta desde hace cuatro días",
+                symptoms=["fiebre", "tos productiva"],
+                categories=["chief_complaint", "symptom_onset"],
+            ),
+            Turn(
+                "Tengo 67 años, soy hombre, y me falta un poco el aire al caminar",
+                symptoms=["disnea de esfuerzo"],
+                patient_info={"edad": 67, "sexo": "M"},
+                categories=["associated_symptoms"],
+            ),
+            Turn(
+                "Fumé 30 años y tomo enalapril para la presión",
+                patient_info={"tabaquismo": "30 años"},
+                categories=["medical_history", "medications", "social_history"],
+            ),
+            Turn(
+                "Anoche tuve 38,9 y escalofríos, me duele el costado derecho al respirar",
+                symptoms=["escalofríos", "dolor pleurítico"],
+                categories=["severity"],
+            ),
+        ],
+        questions=[
+            "¿Qué edad tenés y notás falta de aire?",
+            "¿Fumás o tenés alguna enfermedad o medicación habitual?",
+            "¿Cuánta fiebre tuviste y tenés dolor al respirar?",
+            "¿Tenés alguna alergia a medicamentos?",
+        ],
+        image_analysis={
+            "description": "Radiografía de tórax frontal con opacidad en base derecha.",
+            "findings": ["consolidación basal derecha", "broncograma aéreo"],
+            "clinical_relevance": "Compatible con proceso neumónico en lóbulo inferior derecho.",
+            "requires_specialist": False,
+            "specialist_type": "",
+            "disclaimer": "Análisis de apoyo; requiere informe radiológico.",
+        },
+        assessment={
+            "differentials": [
+                differential(
+                    "Neumonía adquirida en la comunidad", 70, "urgent",
+                    "Fiebre, tos productiva, dolor pleurítico y consolidación radiológica.",
+                    ["Hemograma", "PCR", "Oximetría de pulso"], "Antibiótico empírico según CURB-65.",
+                ),
+                differential(
+                    "EPOC exacerbado", 20, "urgent",
+                    "Tabaquismo prolongado y disnea.", ["Espirometría diferida"], "Broncodilatadores.",
+                ),
+                differential(
+                    "Tromboembolismo pulmonar", 10, "immediate",
+                    "Dolor pleurítico y disnea, menos probable con fiebre.", ["Dímero D"], "Anticoagulación si se confirma.",
+                ),
+            ],
+            "red_flags": [
+                {"severity": "warning", "message": "Edad mayor a 65 años con fiebre alta",
+                 "why_it_matters": "Suma puntos de gravedad en CURB-65."},
+            ],
+            "missing_questions": ["Frecuencia respiratoria", "Estado de conciencia"],
+            "action_plan": [
+                {"priority": "urgent", "action": "Evaluación presencial con oximetría",
+                 "rationale": "Definir manejo ambulatorio u hospitalario."},
+            ],
+            "soap": {
+                "subjective": "Hombre de 67 años, fumador, con fiebre y tos productiva de 4 días.",
+                "objective": "Consolidación basal derecha en radiografía.",
+                "assessment": "Probable neumonía adquirida en la comunidad.",
+                "plan": "Laboratorio, oximetría y antibiótico empírico.",
+            },
+            "patient_summary": "Tus síntomas son compatibles con una neumonía; necesitás una consulta hoy.",
+            "limitations": "Sin examen físico ni signos vitales.",
+        },
+    ),
+    Scenario(
+        name="dolor_toracico",
+        turns=[
+            Turn(
+                "Tengo dolor en el pecho como una presión que se va al brazo izquierdo",
+                symptoms=["dolor torácico opresivo", "irradiación a brazo izquierdo"],
+                categories=["chief_complaint"],
+            ),
+            Turn(
+                "Empezó hace una hora mientras subía la escalera, tengo 58 años",
+                patient_info={"edad": 58},
+                categories=["symptom_onset"],
+            ),
+            Turn(
+                "Estoy sudando y con náuseas, el dolor es 8 de 10",
+                symptoms=["diaforesis", "náuseas"],
+                categories=["associated_symptoms", "severity"],
+            ),
+            Turn(
+                "Soy diabética y tomo metformina, mi padre murió de un infarto",
+                patient_info={"sexo": "F", "diabetes": True},
+                categories=["medical_history", "medications"],
+            ),
+        ],
+        questions=[
+            "¿Cuándo empezó el dolor y qué estabas haciendo?",
+            "¿Tenés sudoración, náuseas o falta de aire? ¿Qué tan fuerte es el dolor?",
+            "¿Tenés diabetes, hipertensión u otros antecedentes?",
+            "¿Tomaste alguna medicación para el dolor?",
+        ],
+        image_analysis={
+            "description": "Fotografía de un electrocardiograma de 12 derivaciones.",
+            "findings": ["supradesnivel ST en cara inferior"],
+            "clinical_relevance": "Sugiere isquemia aguda; requiere evaluación inmediata.",
+            "requires_specialist": True,
+            "specialist_type": "cardiólogo",
+            "disclaimer": "La lectura de una foto de ECG no es diagnóstica.",
+        },
+        assessment={
+            "differentials": [
+                differential(
+                    "Síndrome coronario agudo", 80, "immediate",
+                    "Dolor opresivo irradiado con diaforesis en paciente diabética.",
+                    ["ECG seriado", "Troponina"], "Activación de código infarto.",
+                ),
+                differential(
+                    "Disección aórtica", 10, "immediate",
+                    "Debe descartarse ante dolor torácico agudo intenso.", ["Angio-TC"], "Manejo quirúrgico.",
+                ),
+                differential(
+                    "Enfermedad por reflujo", 10, "routine",
+                    "Menos probable por el cuadro de esfuerzo.", [], "Inhibidores de bomba.",
+                ),
+            ],
+            "red_flags": [
+                {"severity": "critical", "message": "Dolor torácico opresivo con diaforesis",
+                 "why_it_matters": "Posible infarto agudo de miocardio."},
+            ],
+            "missing_questions": ["Presión arterial actual"],
+            "action_plan": [
+                {"priority": "immediate", "action": "Llamar a emergencias",
+                 "rationale": "El tiempo a la reperfusión define el pronóstico."},
+            ],
+            "soap": {
+                "subjective": "Mujer de 58 años, diabética, con dolor torácico opresivo de 1 hora.",
+                "objective": "Supradesnivel ST en la foto del ECG.",
+                "assessment": "Síndrome coronario agudo hasta demostrar lo contrario.",
+                "plan": "Traslado inmediato, ECG y troponina.",
+            },
+            "patient_summary": "Tu dolor puede ser un infarto: llamá a emergencias ahora.",
+            "limitations": "Sin examen físico ni ECG original.",
+        },
+    ),
+    Scenario(
+        name="cefalea",
+        turns=[
+            Turn(
+                "Me duele mucho la cabeza de un lado y me molesta la luz",
+                symptoms=["cefalea hemicraneal", "fotofobia"],
+                categories=["chief_complaint"],
+            ),
+            Turn(
+                "Me pasa desde los 20 años, unas dos veces por mes, tengo 32",
+                patient_info={"edad": 32},
+                categories=["symptom_onset", "medical_history"],
+            ),
+            Turn(
+                "A veces veo luces antes del dolor y tengo náuseas",
+                symptoms=["aura visual", "náuseas"],
+                categories=["associated_symptoms"],
+            ),
+            Turn(
+                "Tomo ibuprofeno pero casi no me hace efecto, no soy alérgica a nada",
+                patient_info={"sexo": "F"},
+                categories=["medications", "allergies"],
+            ),
+        ],
+        questions=[
+            "¿Desde cuándo tenés estos dolores y con qué frecuencia?",
+            "¿Notás algo antes del dolor, como luces o náuseas?",
+            "¿Qué medicación tomás para el dolor?",
+            "¿Cambió el dolor en algo últimamente?",
+        ],
+        image_analysis={
+            "description": "Fotografía de una receta con analgésicos de venta libre.",
+            "findings": ["ibuprofeno 400 mg"],
+            "clinical_relevance": "Sin hallazgos de relevancia diagnóstica.",
+            "requires_specialist": False,
+            "specialist_type": "",
+            "disclaimer": "La imagen no aporta datos clínicos objetivos.",
+        },
+        assessment={
+            "differentials": [
+                differential(
+                    "Migraña con aura", 75, "routine",
+                    "Cefalea hemicraneal recurrente con aura visual, fotofobia y náuseas.",
+                    [], "Triptanes y profilaxis si es frecuente.",
+                ),
+                differential(
+                    "Cefalea por abuso de analgésicos", 15, "routine",
+                    "Uso frecuente de AINEs con poca respuesta.", [], "Retiro gradual.",
+                ),
+                differential(
+                    "Cefalea secundaria", 10, "urgent",
+                    "Descartar si cambia el patrón habitual.", ["Neuroimagen si hay signos de alarma"], "",
+                ),
+            ],
+            "red_flags": [],
+            "missing_questions": ["Uso de anticonceptivos hormonales"],
+            "action_plan": [
+                {"priority": "routine", "action": "Consulta con neurología",
+                 "rationale": "Evaluar tratamiento preventivo."},
+            ],
+            "soap": {
+                "subjective": "Mujer de 32 años con cefalea hemicraneal recurrente con aura.",
+                "objective": "Sin datos de examen físico.",
+                "assessment": "Migraña con aura.",
+                "plan": "Tratamiento de crisis y diario de cefaleas.",
+            },
+            "patient_summary": "Tus dolores son compatibles con migraña; un neurólogo puede ajustar el tratamiento.",
+            "limitations": "Sin examen neurológico.",
+        },
+    ),
+]
+
+
+def find_scenario(text: str) -> Optional[Scenario]:
+    """Scenario whose opening turn appears in the text"""
+    for scenario in SCENARIOS:
+        if scenario.turns[0].text in text:
+            return scenario
+    return None
+
+
+def find_turn(text: str) -> Optional[Turn]:
+    """Scripted turn matching a patient message exactly"""
+    for scenario in SCENARIOS:
+        for turn in scenario.turns:
+            if turn.text == text.strip():
+                return turn
+    return None
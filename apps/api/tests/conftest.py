@@ -0,0 +1,92 @@
+"""
+Shared fixtures: the offline API (SQLite, agents talking to the fake OpenAI
+server in loadtest/fake_openai.py) and helpers for its streams.
+
+Nothing here builds an agent at import: the agents come from the registry
+inside the fixtures, pointed at the fake server, so the offline tests run
+without OPENAI_API_KEY.
+"""
+
+import json
+from typing import List
+
+import httpx
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from loadtest.fake_openai import FakeConfig, create_app
+from loadtest.scenarios import SCENARIOS
+
+SCENARIO = SCENARIOS[0]
+
+FAKE_BASE_URL = "http://fake/v1"
+
+
+def fake_client(config: FakeConfig):
+    fake_app = create_app(config)
+    return fake_app, httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_app), base_url="http://fake")
+
+
+def parse_events(body: str) -> List[dict]:
+    """The events of a Server-Sent Events body, checking each name matches its type"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        name, data = block.split("\n", 1)
+        event = json.loads(data[len("data: "):])
+        assert name == f"event: {event['type']}"
+        events.append(event)
+    return events
+
+
+@pytest.fixture
+async def fake_llm(monkeypatch):
+    """Every agent talking to an in-process fake server (yielded); no API key needed"""
+    from langchain_openai import ChatOpenAI
+
+    from app.agents.registry import registry
+
+    # Agents built from here on get a client for a compatible server (placeholder key)
+    monkeypatch.setattr(settings, "OPENAI_BASE_URL", FAKE_BASE_URL)
+    fake_app, fake_http = fake_client(FakeConfig(latency_ms=0, tokens_per_second=0, seed=7))
+    for name in ("interviewer_agent", "image_analyzer_agent", "diagnostic_agent"):
+        monkeypatch.setattr(registry.get(name), "llm", ChatOpenAI(
+            model="fake", api_key="fake", base_url=FAKE_BASE_URL, http_async_client=fake_http, max_retries=0
+        ))
+
+    yield fake_app
+    await fake_http.aclose()
+
+
+@pytest.fixture
+async def offline_app(fake_llm, tmp_path, monkeypatch):
+    """The API on SQLite with every agent talking to the fake server"""
+    from app.agents import graph
+    from app.agents.checkpointer import SQLAlchemyCheckpointSaver
+    from app.db.base import Base, get_db, get_read_db
+    from app.main import app
+    from app.services.storage import storage_service
+
+    monkeypatch.setattr(settings, "SIMILAR_CASES_ENABLED", False)
+    monkeypatch.setattr(settings, "FINALIZE_PROGRESS_PACING", 0.0)
+    monkeypatch.setattr(storage_service, "local_path", tmp_path)
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def override_get_db():
+        async with factory() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+
+    saver = SQLAlchemyCheckpointSaver(engine)
+    monkeypatch.setattr(graph, "agent_checkpointer", saver)
+    monkeypatch.setattr(graph, "agent_graph", graph.create_agent_graph(saver))
+
+    yield fake_llm
+    app.dependency_overrides.clear()
+    await engine.dispose()
@@ -252,4 +252,128 @@ def test_graph_route_priority():
     
     # Should go directly to diagnostic, not to ready_check
     route = route_from_interviewer(state)
-    assert route == "diagnostic"
\ No newline at end of file
+    assert route == "diagnostic"
+
+def test_apply_state_updates_appends_deltas():
+    """Test that state reducers append and merge node deltas"""
+    from app.agents.state import apply_state_updates
+    
+    state = create_initial_state("test-123")
+    state["messages"] = [{"role": "user", "content": "Hola"}]
+    state["symptoms"] = ["fiebre"]
+    state["patient_info"] = {"age": 30}
+    
+    apply_state_updates(state, {
+        "messages": [{"role": "assistant", "content": "¿Desde cuándo?"}],
+        "symptoms": ["fiebre", "tos"],
+        "patient_info": {"sex": "F"},
+        "info_categories_covered": {"chief_complaint": True},
+        "turn_count": 1,
+    })
+    
+    assert [m["content"] for m in state["messages"]] == ["Hola", "¿Desde cuándo?"]
+    assert state["symptoms"] == ["fiebre", "tos"]
+    assert state["patient_info"] == {"age": 30, "sex": "F"}
+    assert state["info_categories_covered"]["chief_complaint"] == True
+    assert state["info_categories_covered"]["severity"] == False
+    assert state["turn_count"] == 1
+
+
+def test_merge_state_updates_leaves_original_untouched():
+    """Test that merged views do not mutate the source state"""
+    from app.agents.state import merge_state_updates
+    
+    state = create_initial_state("test-123")
+    state["symptoms"] = ["fiebre"]
+    
+    merged = merge_state_updates(state, {"symptoms": ["tos"], "patient_info": {"age": 40}})
+    
+    assert merged["symptoms"] == ["fiebre", "tos"]
+    assert merged["patient_info"] == {"age": 40}
+    assert state["symptoms"] == ["fiebre"]
+    assert state["patient_info"] == {}
+    assert merged["messages"] is state["messages"]
+
+
+def test_state_reducers_do_not_mutate_inputs():
+    """Test that reducers return new containers instead of mutating channel values"""
+    from app.agents.state import add_items, add_unique_items, merge_dict
+    
+    messages = [{"role": "user", "content": "Hola"}]
+    symptoms = ["fiebre"]
+    info = {"age": 30}
+    
+    assert add_items(messages, [{"role": "assistant", "content": "¿Desde cuándo?"}]) is not messages
+    assert add_unique_items(symptoms, ["fiebre", "tos", "tos"]) == ["fiebre", "tos"]
+    assert merge_dict(info, {"sex": "F"}) == {"age": 30, "sex": "F"}
+    assert messages == [{"role": "user", "content": "Hola"}]
+    assert symptoms == ["fiebre"]
+    assert info == {"age": 30}
+
+
+def test_message_field_decoded_while_streaming():
+    """Test that the interviewer's message field is decoded chunk by chunk, escapes included"""
+    import json
+    from app.agents.json_stream import StringFieldStream
+    
+    message = 'Entiendo. ¿Desde cuándo tenés "dolor"?\n😀'
+    raw = "```json\n" + json.dumps({"ready_for_diagnosis": False, "message": message}) + "\n```"
+    
+    for size in (1, 2, 3, 7):
+        field = StringFieldStream("message")
+        pieces = [field.feed(raw[i:i + size]) for i in range(0, len(raw), size)]
+        assert "".join(pieces) == message
+        assert field.done
+    
+    # Nothing is emitted before the field's key
+    field = StringFieldStream("message")
+    assert field.feed('{"ready_for_diagnosis": true, "mess') == ""
+    assert field.feed('age": "Lis') == "Lis"
+
+
+def test_ready_flag_decoded_while_streaming():
+    """Test that ready_for_diagnosis is known as soon as its value is complete"""
+    from app.agents.json_stream import LiteralFieldStream
+    
+    ready = LiteralFieldStream("ready_for_diagnosis")
+    assert not ready.feed('{"ready_for_diagnosis": tr')
+    assert ready.feed('ue, "message": "Gracias')
+    assert ready.value is True
+    assert not ready.feed('"}')
+    
+    score = LiteralFieldStream("score")
+    assert not score.feed('{"score": 12')
+    assert score.feed('.5}')
+    assert score.value == 12.5
+
+
+def test_assessment_items_decoded_while_streaming():
+    """Test that each differential, red flag and the SOAP note are returned as soon as their object closes"""
+    import json
+    from app.agents.json_stream import ItemStream
+    
+    assessment = {
+        "differentials": [{"name": "Migraña {con aura}", "details": {"tests": []}}, {"name": 'Cefalea "tensional"'}],
+        "missing_questions": ["¿Fiebre?"],
+        "red_flags": [{"severity": "critical", "message": "Déficit focal"}],
+        "soap": {"subjective": "Dolor", "plan": {"nested": True}},
+    }
+    raw = "```json\n" + json.dumps(assessment, ensure_ascii=False, indent=2) + "\n```"
+    
+    for size in (1, 5, len(raw)):
+        items = ItemStream(["differentials", "red_flags", "soap"])
+        found = []
+        for i in range(0, len(raw), size):
+            found += items.feed(raw[i:i + size])
+        assert found == [
+            ("differentials", 0, assessment["differentials"][0]),
+            ("differentials", 1, assessment["differentials"][1]),
+            ("red_flags", 0, assessment["red_flags"][0]),
+            ("soap", None, assessment["soap"]),
+        ]
+        assert items.done
+    
+    # The red flag is out before the rest of the assessment is generated
+    items = ItemStream(["red_flags"])
+    assert items.feed('{"red_flags": [{"severity": "critical", "message": "x"') == []
+    assert items.feed('}, {"sev') == [("red_flags", 0, {"severity": "critical", "message": "x"})]
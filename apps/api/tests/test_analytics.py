@@ -0,0 +1,156 @@
+"""
+Tests for assessment facts, the incremental daily rollup and /v1/stats.
+"""
+
+from datetime import date, datetime, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.db.base import Base, get_read_db
+from app.db.models import AssessmentDailyStat, AssessmentFact, DiagnosticResult, FactKind
+from app.main import app
+from app.services import analytics, session_service
+
+
+def assessment(*differentials, red_flags=(), actions=()):
+    return {
+        "differentials": [
+            {"name": name, "likelihood": likelihood, "urgency": urgency, "reasoning": ""}
+            for name, likelihood, urgency in differentials
+        ],
+        "red_flags": [{"severity": severity, "message": message, "why_it_matters": ""} for severity, message in red_flags],
+        "action_plan": [{"priority": priority, "action": action, "rationale": ""} for priority, action in actions],
+    }
+
+
+@pytest.fixture
+async def db_factory(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SIMILAR_CASES_ENABLED", False)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def override_get_read_db():
+        async with factory() as session:
+            yield session
+
+    app.dependency_overrides[get_read_db] = override_get_read_db
+    yield factory
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+
+@pytest.fixture
+async def client(db_factory):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+async def rollup(db):
+    result = await db.execute(
+        select(AssessmentDailyStat.kind, AssessmentDailyStat.level, AssessmentDailyStat.label,
+               AssessmentDailyStat.count, AssessmentDailyStat.likelihood_sum)
+        .order_by(AssessmentDailyStat.kind, AssessmentDailyStat.level, AssessmentDailyStat.label)
+    )
+    return result.all()
+
+
+def test_extract_facts_normalizes_items():
+    """Test that one fact is produced per differential, red flag and action item"""
+    facts = analytics.extract_facts(assessment(
+        ("  Neumonía   adquirida ", "70", "urgent"),
+        ("", 10, "routine"),
+        red_flags=[("critical", "Saturación < 90%")],
+        actions=[("immediate", "Radiografía de tórax")],
+    ))
+
+    assert [(f["kind"], f["label"], f["level"], f["likelihood"]) for f in facts] == [
+        (FactKind.DIFFERENTIAL, "Neumonía adquirida", "urgent", 70),
+        (FactKind.RED_FLAG, "Saturación < 90%", "critical", None),
+        (FactKind.ACTION, "Radiografía de tórax", "immediate", None),
+    ]
+
+
+async def test_saving_results_updates_facts_and_rollup(db_factory):
+    """Test that both save paths write facts and increment the same rollup rows"""
+    async with db_factory() as db:
+        first = await session_service.create_session(db, clinic_id="norte")
+        await session_service.save_diagnostic_result(
+            db, first.id, assessment(("Bronquitis aguda", 60, "routine"), red_flags=[("warning", "Fiebre")]), 0.7
+        )
+
+        second = await session_service.create_session(db, clinic_id="norte")
+        uow = await session_service.SessionUnitOfWork.load(db, second.id)
+        state = await uow.load_state()
+        state["final_assessment"] = assessment(("Bronquitis aguda", 80, "routine"), ("Asma", 20, "urgent"))
+        state["confidence_score"] = 0.8
+        uow.apply_state(state)
+        await uow.commit()
+
+        assert (await db.execute(select(func.count()).select_from(AssessmentFact))).scalar() == 4
+        assert await rollup(db) == [
+            (FactKind.DIFFERENTIAL, "routine", "Bronquitis aguda", 2, 140),
+            (FactKind.DIFFERENTIAL, "urgent", "Asma", 1, 20),
+            (FactKind.RED_FLAG, "warning", "Fiebre", 1, 0),
+        ]
+
+
+async def test_backfill_rebuilds_the_same_rollup(db_factory):
+    """Test that backfilling facts from stored results reproduces the incremental rollup"""
+    async with db_factory() as db:
+        for name in ["Migraña", "Migraña", "Cefalea tensional"]:
+            session = await session_service.create_session(db)
+            await session_service.save_diagnostic_result(db, session.id, assessment((name, 50, "routine")), 0.6)
+        incremental = await rollup(db)
+
+        await db.execute(delete(AssessmentFact))
+        await db.execute(delete(AssessmentDailyStat))
+        await db.commit()
+
+        assert await analytics.backfill_facts(db, batch_size=2) == 3
+        assert await rollup(db) == incremental
+
+
+async def test_stats_endpoint_groups_by_week_and_clinic(client, db_factory):
+    """Test /v1/stats totals, weekly buckets, level grouping and clinic filter"""
+    monday = date(2024, 3, 4)
+    cases = [
+        ("norte", monday, "Gripe"),
+        ("norte", monday + timedelta(days=2), "Gripe"),
+        ("norte", monday + timedelta(days=7), "Sinusitis"),
+        ("sur", monday, "Gripe"),
+    ]
+    async with db_factory() as db:
+        for clinic, day, name in cases:
+            session = await session_service.create_session(db, clinic_id=clinic)
+            result = await session_service.save_diagnostic_result(db, session.id, assessment((name, 40, "routine")), 0.5)
+            await db.execute(
+                update(DiagnosticResult).where(DiagnosticResult.id == result.id).values(created_at=datetime.combine(day, datetime.min.time()))
+            )
+        await db.execute(delete(AssessmentFact))
+        await db.commit()
+        await analytics.backfill_facts(db)
+
+    response = await client.get("/v1/stats", params={"kind": "differential"})
+    assert response.status_code == 200
+    assert [(r["key"], r["count"], r["avg_likelihood"]) for r in response.json()["rows"]] == [
+        ("Gripe", 3, 40.0),
+        ("Sinusitis", 1, 40.0),
+    ]
+
+    response = await client.get("/v1/stats", params={"bucket": "week", "clinic_id": "norte"})
+    assert [(r["period"], r["key"], r["count"]) for r in response.json()["rows"]] == [
+        ("2024-03-04", "Gripe", 2),
+        ("2024-03-11", "Sinusitis", 1),
+    ]
+
+    response = await client.get(
+        "/v1/stats", params={"group_by": "level", "from": "2024-03-04", "to": "2024-03-10"}
+    )
+    assert [(r["key"], r["count"]) for r in response.json()["rows"]] == [("routine", 3)]
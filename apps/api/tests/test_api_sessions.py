@@ -0,0 +1,160 @@
+"""
+Tests for the session read endpoints (history pagination, delta sync, ETags).
+"""
+
+import httpx
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.db.base import Base, get_db, get_read_db
+from app.db.models import MessageRole
+from app.main import app
+from app.services import session_service
+
+
+@pytest.fixture
+async def db_factory(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def override_get_db():
+        async with factory() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    yield factory
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+
+@pytest.fixture
+async def client(db_factory):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+async def create_session_with_messages(db_factory, count):
+    async with db_factory() as db:
+        session = await session_service.create_session(db)
+        for i in range(count):
+            role = MessageRole.USER if i % 2 == 0 else MessageRole.ASSISTANT
+            await session_service.add_message(db, session.id, role, f"mensaje {i}")
+        return session.id
+
+
+async def test_messages_keyset_pagination(client, db_factory):
+    """Test paging back through the history and polling for new messages"""
+    session_id = await create_session_with_messages(db_factory, 5)
+
+    latest = (await client.get(f"/v1/sessions/{session_id}/messages", params={"limit": 2})).json()
+    assert [m["content"] for m in latest["messages"]] == ["mensaje 3", "mensaje 4"]
+    assert latest["has_more"] is True
+
+    older = (await client.get(
+        f"/v1/sessions/{session_id}/messages", params={"limit": 2, "before": latest["first_id"]}
+    )).json()
+    assert [m["content"] for m in older["messages"]] == ["mensaje 1", "mensaje 2"]
+
+    delta = (await client.get(
+        f"/v1/sessions/{session_id}/messages", params={"since": latest["last_id"]}
+    )).json()
+    assert delta["messages"] == []
+    assert delta["last_id"] == latest["last_id"]
+
+    async with db_factory() as db:
+        await session_service.add_message(db, session_id, MessageRole.USER, "mensaje 5")
+
+    delta = (await client.get(
+        f"/v1/sessions/{session_id}/messages", params={"since": latest["last_id"]}
+    )).json()
+    assert [m["content"] for m in delta["messages"]] == ["mensaje 5"]
+    assert delta["has_more"] is False
+
+
+async def test_messages_rejects_both_cursors(client, db_factory):
+    """Test that before and since cannot be combined"""
+    session_id = await create_session_with_messages(db_factory, 1)
+
+    response = await client.get(f"/v1/sessions/{session_id}/messages", params={"before": 1, "since": 1})
+    assert response.status_code == 400
+
+
+async def test_session_etag_not_modified(client, db_factory):
+    """Test that an unchanged session answers 304 and a changed one a new ETag"""
+    session_id = await create_session_with_messages(db_factory, 2)
+
+    first = await client.get(f"/v1/sessions/{session_id}")
+    assert first.status_code == 200
+    assert len(first.json()["messages"]) == 2
+    etag = first.headers["etag"]
+
+    cached = await client.get(f"/v1/sessions/{session_id}", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+
+    async with db_factory() as db:
+        await session_service.add_message(db, session_id, MessageRole.USER, "otra")
+
+    changed = await client.get(f"/v1/sessions/{session_id}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
+async def test_session_etag_depends_on_include_messages(client, db_factory):
+    """Test that a cached body with messages does not validate a request without them, or vice versa"""
+    session_id = await create_session_with_messages(db_factory, 2)
+
+    full = await client.get(f"/v1/sessions/{session_id}")
+    params = {"include_messages": False}
+    bare = await client.get(f"/v1/sessions/{session_id}", params=params, headers={"If-None-Match": full.headers["etag"]})
+    assert bare.status_code == 200
+    assert bare.json()["messages"] is None
+    assert bare.headers["etag"] != full.headers["etag"]
+
+    cached = await client.get(f"/v1/sessions/{session_id}", params=params, headers={"If-None-Match": bare.headers["etag"]})
+    assert cached.status_code == 304
+
+
+async def test_list_sessions_keyset_pages_and_filters(client, db_factory):
+    """Test listing sessions newest first with cursor pagination and filters"""
+    async with db_factory() as db:
+        ids = []
+        for i in range(5):
+            session = await session_service.create_session(db, user_id="dr-a" if i % 2 == 0 else "dr-b")
+            await session_service.add_message(db, session.id, MessageRole.USER, "Hola")
+            ids.append(session.id)
+        await session_service.save_diagnostic_result(
+            db, ids[1], {"red_flags": [{"severity": "critical", "message": "Dolor torácico"}]}, 0.9
+        )
+
+    first = (await client.get("/v1/sessions", params={"limit": 3})).json()
+    assert [s["id"] for s in first["sessions"]] == [ids[1], ids[4], ids[3]]
+    assert first["sessions"][0]["message_count"] == 1
+    assert first["sessions"][0]["diagnosis_count"] == 1
+    assert "messages" not in first["sessions"][0]
+
+    second = (await client.get("/v1/sessions", params={"limit": 3, "cursor": first["next_cursor"]})).json()
+    assert [s["id"] for s in second["sessions"]] == [ids[2], ids[0]]
+    assert second["next_cursor"] is None
+
+    by_user = (await client.get("/v1/sessions", params={"user_id": "dr-b"})).json()
+    assert {s["id"] for s in by_user["sessions"]} == {ids[1], ids[3]}
+
+    completed = (await client.get("/v1/sessions", params={"status": "completed"})).json()
+    assert [s["id"] for s in completed["sessions"]] == [ids[1]]
+
+    critical = (await client.get("/v1/sessions", params={"critical_red_flags": "true"})).json()
+    assert [s["id"] for s in critical["sessions"]] == [ids[1]]
+    assert critical["sessions"][0]["has_critical_red_flags"] is True
+
+    future = (await client.get("/v1/sessions", params={"updated_from": "2999-01-01T00:00:00Z"})).json()
+    assert future["sessions"] == []
+
+
+async def test_list_sessions_rejects_bad_cursor(client, db_factory):
+    """Test that a malformed cursor is a client error"""
+    response = await client.get("/v1/sessions", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
@@ -0,0 +1,108 @@
+"""
+Tests for the SQLAlchemy-backed LangGraph checkpointer (SQLite stand-in).
+"""
+
+import pytest
+from langgraph.graph import StateGraph, END
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.agents.checkpointer import SQLAlchemyCheckpointSaver
+from app.agents.state import ConversationState, create_initial_state
+from app.db.models import GraphCheckpoint
+
+
+@pytest.fixture
+async def saver(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'checkpoints.db'}")
+    yield SQLAlchemyCheckpointSaver(engine, create_tables=True)
+    await engine.dispose()
+
+
+def build_graph(saver, calls, fail_second=False):
+    """Two-node graph that records how many times each node ran"""
+    async def first(state):
+        calls.append("first")
+        return {"messages": [{"role": "assistant", "content": f"q{state['turn_count']}"}], "symptoms": ["tos"]}
+
+    async def second(state):
+        calls.append("second")
+        if fail_second:
+            raise RuntimeError("crash")
+        return {"turn_count": state["turn_count"] + 1}
+
+    workflow = StateGraph(ConversationState)
+    workflow.add_node("first", first)
+    workflow.add_node("second", second)
+    workflow.set_entry_point("first")
+    workflow.add_edge("first", "second")
+    workflow.add_edge("second", END)
+    return workflow.compile(checkpointer=saver)
+
+
+async def test_checkpoint_resumes_with_deltas(saver):
+    """Test that later runs only send the new message and reuse the checkpoint"""
+    config = {"configurable": {"thread_id": "session-1"}}
+    graph = build_graph(saver, [])
+
+    state = create_initial_state("session-1")
+    state["messages"] = [{"role": "user", "content": "Hola"}]
+    await graph.ainvoke(state, config)
+
+    result = await graph.ainvoke({"messages": [{"role": "user", "content": "Tengo tos"}]}, config)
+
+    assert [m["content"] for m in result["messages"]] == ["Hola", "q0", "Tengo tos", "q1"]
+    assert result["symptoms"] == ["tos"]
+    assert result["turn_count"] == 2
+
+    # A fresh graph on the same database sees the same state
+    snapshot = await build_graph(saver, []).aget_state(config)
+    assert snapshot.values["turn_count"] == 2
+    assert len(snapshot.values["messages"]) == 4
+
+
+async def test_interrupted_run_resumes_without_rerunning_nodes(saver):
+    """Test that a crash mid-run resumes from the last completed node"""
+    config = {"configurable": {"thread_id": "session-2"}}
+    state = create_initial_state("session-2")
+    state["messages"] = [{"role": "user", "content": "Hola"}]
+
+    calls = []
+    with pytest.raises(RuntimeError):
+        await build_graph(saver, calls, fail_second=True).ainvoke(state, config)
+    assert calls == ["first", "second"]
+
+    calls = []
+    graph = build_graph(saver, calls)
+    snapshot = await graph.aget_state(config)
+    assert snapshot.next == ("second",)
+
+    result = await graph.ainvoke(None, config)
+
+    assert calls == ["second"]
+    assert result["turn_count"] == 1
+    assert [m["content"] for m in result["messages"]] == ["Hola", "q0"]
+
+
+async def test_prune_keeps_latest_checkpoints(saver):
+    """Test that pruning keeps the latest checkpoints loadable"""
+    config = {"configurable": {"thread_id": "session-3"}}
+    graph = build_graph(saver, [])
+
+    state = create_initial_state("session-3")
+    await graph.ainvoke(state, config)
+    for i in range(3):
+        await graph.ainvoke({"messages": [{"role": "user", "content": f"m{i}"}]}, config)
+
+    deleted = await saver.aprune("session-3", keep=2)
+
+    async with saver.engine.connect() as conn:
+        remaining = await conn.scalar(
+            select(func.count()).select_from(GraphCheckpoint).where(GraphCheckpoint.thread_id == "session-3")
+        )
+    snapshot = await graph.aget_state(config)
+
+    assert deleted > 0
+    assert remaining == 2
+    assert snapshot.values["turn_count"] == 4
+    assert len(snapshot.values["messages"]) == 7
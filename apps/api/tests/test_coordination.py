@@ -0,0 +1,135 @@
+"""
+Tests for the coordination backends (locks and flags shared by workers),
+per-session turn ordering and the multi-worker launcher.
+
+The PostgreSQL backend test needs TEST_DATABASE_URL (see test_schema_indexes.py).
+"""
+
+import asyncio
+import os
+
+import httpx
+import pytest
+
+from app import serve
+from app.core import coordination as coordination_module
+from app.core.config import settings
+from app.core.coordination import LocalBackend, LockTimeout, PostgresBackend
+from app.main import app
+from app.services import maintenance
+from tests.conftest import SCENARIO
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "")
+
+
+async def test_local_locks_and_flags():
+    """Test exclusion, timeouts, try_lock and flag expiry"""
+    backend = LocalBackend()
+    async with backend.lock("session:a", timeout=1):
+        with pytest.raises(LockTimeout):
+            async with backend.lock("session:a", timeout=0.01):
+                pass
+        async with backend.try_lock("session:a") as acquired:
+            assert not acquired
+        async with backend.lock("session:b", timeout=0.01):
+            pass
+    async with backend.try_lock("session:a") as acquired:
+        assert acquired
+    assert backend._locks == {}
+
+    await backend.set_flag("written:s1", ttl=60)
+    await backend.set_flag("written:s2", ttl=0)
+    assert await backend.has_flag("written:s1")
+    assert not await backend.has_flag("written:s2")
+
+
+@pytest.mark.skipif(
+    not TEST_DATABASE_URL.startswith("postgresql"),
+    reason="TEST_DATABASE_URL does not point to PostgreSQL",
+)
+async def test_postgres_backend_is_shared():
+    """Test that locks and flags taken through one backend are seen by another (another worker)"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from app.db.base import Base
+    from app.db.models import CoordinationFlag
+
+    engine = create_async_engine(TEST_DATABASE_URL)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[CoordinationFlag.__table__])
+    await engine.dispose()
+
+    worker_a, worker_b = PostgresBackend(TEST_DATABASE_URL, 2), PostgresBackend(TEST_DATABASE_URL, 2)
+    try:
+        async with worker_a.lock("session:pg", timeout=1):
+            with pytest.raises(LockTimeout):
+                async with worker_b.lock("session:pg", timeout=0.1):
+                    pass
+            async with worker_b.try_lock("session:pg") as acquired:
+                assert not acquired
+        async with worker_b.lock("session:pg", timeout=0.1):
+            pass
+
+        await worker_a.set_flag("written:pg", ttl=60)
+        assert await worker_b.has_flag("written:pg")
+        assert not await worker_b.has_flag("written:other")
+    finally:
+        await worker_a.close()
+        await worker_b.close()
+
+
+async def test_concurrent_turns_of_a_session_run_in_order(offline_app):  # noqa: F811
+    """Test that two messages sent at once are answered one after the other"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        session_id = (await client.post("/v1/sessions", json={})).json()["id"]
+        url = f"/v1/sessions/{session_id}/messages"
+        responses = await asyncio.gather(*(
+            client.post(url, json={"content": turn.text}) for turn in SCENARIO.turns[:2]
+        ))
+        assert [response.status_code for response in responses] == [200, 200]
+
+        # The second turn saw the first one: the interview moved on to the next question
+        assert sorted(response.json()["content"] for response in responses) == sorted(SCENARIO.questions[:2])
+        messages = (await client.get(url)).json()["messages"]
+        assert [message["role"] for message in messages][-4:] == ["user", "assistant", "user", "assistant"]
+
+
+async def test_busy_session_answers_409(offline_app, monkeypatch):  # noqa: F811
+    """Test that a turn waiting longer than SESSION_LOCK_TIMEOUT_SECONDS is rejected"""
+    monkeypatch.setattr(settings, "SESSION_LOCK_TIMEOUT_SECONDS", 0.05)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        session_id = (await client.post("/v1/sessions", json={})).json()["id"]
+        async with coordination_module.coordination.lock(f"session:{session_id}", timeout=1):
+            busy = await client.post(f"/v1/sessions/{session_id}/messages", json={"content": "Hola"})
+        assert busy.status_code == 409
+
+        answered = await client.post(f"/v1/sessions/{session_id}/messages", json={"content": SCENARIO.turns[0].text})
+        assert answered.status_code == 200
+
+
+async def test_maintenance_round_is_skipped_by_followers(monkeypatch):
+    """Test that only the worker holding the maintenance lock runs the jobs"""
+    async def run_once(jobs=None):
+        return {"abandon": 0}
+
+    monkeypatch.setattr(maintenance.maintenance_runner, "run_once", run_once)
+    async with coordination_module.coordination.lock("maintenance", timeout=1):
+        assert await maintenance.maintenance_runner.run_if_leader() is None
+    assert await maintenance.maintenance_runner.run_if_leader() == {"abandon": 0}
+
+
+def test_launcher_sizes_workers(monkeypatch):
+    """Test the default worker count and that several workers need a shared backend"""
+    monkeypatch.setattr(serve, "available_cores", lambda: 8)
+    monkeypatch.setattr(settings, "WEB_WORKERS", 0)
+    monkeypatch.setattr(settings, "COORDINATION_BACKEND", "local")
+    assert serve.default_workers() == 1
+    with pytest.raises(SystemExit):
+        serve.main(["--workers", "4"])
+
+    monkeypatch.setattr(settings, "COORDINATION_BACKEND", "postgres")
+    assert serve.default_workers() == 8
+    monkeypatch.setattr(settings, "WEB_WORKERS", 3)
+    assert serve.default_workers() == 3
@@ -0,0 +1,56 @@
+"""
+Tests for database pool telemetry and slow query logging.
+"""
+
+import asyncio
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.db.metrics import InstrumentedQueuePool, count_queries, instrument_engine, pool_stats
+
+
+async def test_pool_records_checkout_waits(tmp_path):
+    """Test that checkouts beyond pool capacity are counted as waits"""
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_logging_name="test-pool",
+    )
+    instrument_engine(engine, name="test-pool")
+
+    async def hold_connection():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            await asyncio.sleep(0.05)
+
+    with count_queries() as counter:
+        await asyncio.gather(*(hold_connection() for _ in range(3)))
+
+    stats = pool_stats()["test-pool"]
+    assert stats["checkouts"] == 3
+    assert stats["waits"] == 2
+    assert stats["wait_seconds_max"] >= 0.04
+    assert stats["size"] == 1
+    assert counter.count == 3
+    await engine.dispose()
+
+
+async def test_slow_queries_are_logged(tmp_path, caplog):
+    """Test that statements over the threshold are logged and counted"""
+    engine = instrument_engine(
+        create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'slow.db'}"),
+        name="test-slow",
+        slow_query_ms=0.000001,
+    )
+
+    with caplog.at_level(logging.WARNING, logger="app.db.metrics"):
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    assert "Slow query on test-slow" in caplog.text
+    assert pool_stats()["test-slow"]["slow_queries"] == 1
+    await engine.dispose()
@@ -0,0 +1,114 @@
+"""
+Tests for the fan-out diagnosis (DIAGNOSTIC_FANOUT_ENABLED): a triage call,
+then per-differential details and the plan concurrently, against the fake
+server.
+"""
+
+import httpx
+
+from app.core.config import settings
+from app.main import app
+from app.models.clinical import ClinicalAssessment
+from loadtest.fake_openai import FakeCompletions, TRIAGE_MARKER, DETAILS_MARKER, PLAN_MARKER
+from tests.conftest import SCENARIO, parse_events
+
+
+async def finalize(client: httpx.AsyncClient) -> list:
+    session_id = (await client.post("/v1/sessions", json={})).json()["id"]
+    await client.post(f"/v1/sessions/{session_id}/messages", json={"content": SCENARIO.turns[0].text})
+    return parse_events((await client.get(f"/v1/sessions/{session_id}/finalize")).text)
+
+
+async def test_fanout_streams_sections_and_merges_assessment(offline_app, monkeypatch):
+    """Test that the sections stream as assessment_partial events and merge into the single-call assessment"""
+    monkeypatch.setattr(settings, "DIAGNOSTIC_FANOUT_ENABLED", True)
+    monkeypatch.setattr(settings, "DIAGNOSTIC_FANOUT_CONCURRENCY", 2)
+    stats = offline_app.state.completions.stats
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        calls = stats.calls["diagnosis"]
+        events = await finalize(client)
+
+    differentials = SCENARIO.assessment["differentials"]
+    # Triage, one details call per differential and the plan
+    assert stats.calls["diagnosis"] - calls == 2 + len(differentials)
+    assert events[-1]["type"] == "complete"
+    expected = ClinicalAssessment.model_validate(SCENARIO.assessment).model_dump()
+    assert events[-1]["assessment"] == expected
+
+    partials = [event for event in events if event["type"] == "assessment_partial"]
+    sections = {event["section"] for event in partials}
+    assert sections == {"red_flags", "differentials", "action_plan", "soap"}
+    # Each differential is sent from the triage, then again with its details
+    sent = [(event["index"], event["item"]) for event in partials if event["section"] == "differentials"]
+    assert len(sent) == 2 * len(differentials)
+    assert sent[0][1]["recommended_tests"] == []
+    assert {index: item for index, item in sent} == dict(enumerate(expected["differentials"]))
+
+
+async def test_fanout_degrades_per_section(offline_app, monkeypatch):
+    """Test that bad details keep the triage fields and an unparsable triage falls back to one call"""
+    monkeypatch.setattr(settings, "DIAGNOSTIC_FANOUT_ENABLED", True)
+    broken = SCENARIO.assessment["differentials"][1]["name"]
+    section = FakeCompletions.assessment_section
+
+    def bad_details(self, assessment, messages):
+        if f'{DETAILS_MARKER}{broken}"' in str(messages):
+            return {"complications": "no es una lista"}
+        return section(self, assessment, messages)
+
+    monkeypatch.setattr(FakeCompletions, "assessment_section", bad_details)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        assessment = (await finalize(client))[-1]["assessment"]
+    assert assessment["differentials"][1]["name"] == broken
+    assert assessment["differentials"][1]["recommended_tests"] == []
+    assert assessment["differentials"][0]["recommended_tests"] == SCENARIO.assessment["differentials"][0]["recommended_tests"]
+
+    def bad_triage(self, assessment, messages):
+        if TRIAGE_MARKER in str(messages):
+            return {"differentials": []}
+        return section(self, assessment, messages)
+
+    monkeypatch.setattr(FakeCompletions, "assessment_section", bad_triage)
+    stats = offline_app.state.completions.stats
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        calls = stats.calls["diagnosis"]
+        events = await finalize(client)
+    # Triage and its repair, then the single call
+    assert stats.calls["diagnosis"] - calls == 3
+    # Only the single call's pieces, streamed as they close
+    partials = [event for event in events if event["type"] == "assessment_partial"]
+    assert len(partials) == sum(len(SCENARIO.assessment[key]) for key in ("differentials", "red_flags", "action_plan")) + 1
+    assert events[-1]["assessment"] == ClinicalAssessment.model_validate(SCENARIO.assessment).model_dump()
+
+
+async def test_fanout_survives_failing_calls(offline_app, monkeypatch):
+    """Test that a failing plan, details repair or triage call degrades only its own section"""
+    monkeypatch.setattr(settings, "DIAGNOSTIC_FANOUT_ENABLED", True)
+    broken = SCENARIO.assessment["differentials"][1]["name"]
+    section = FakeCompletions.assessment_section
+
+    def failing_calls(self, assessment, messages):
+        text = str(messages)
+        if PLAN_MARKER in text or ("no es JSON válido" in text and broken in text):
+            raise RuntimeError("upstream failure")
+        if f'{DETAILS_MARKER}{broken}"' in text:
+            return {"complications": "no es una lista"}
+        return section(self, assessment, messages)
+
+    monkeypatch.setattr(FakeCompletions, "assessment_section", failing_calls)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        assessment = (await finalize(client))[-1]["assessment"]
+    assert assessment["action_plan"][0]["action"] == "Revisar caso manualmente"
+    assert assessment["differentials"][1]["recommended_tests"] == []
+    assert assessment["differentials"][0]["recommended_tests"] == SCENARIO.assessment["differentials"][0]["recommended_tests"]
+    assert assessment["red_flags"] == ClinicalAssessment.model_validate(SCENARIO.assessment).model_dump()["red_flags"]
+
+    def failing_triage(self, assessment, messages):
+        if TRIAGE_MARKER in str(messages):
+            raise RuntimeError("upstream failure")
+        return section(self, assessment, messages)
+
+    monkeypatch.setattr(FakeCompletions, "assessment_section", failing_triage)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        assessment = (await finalize(client))[-1]["assessment"]
+    assert assessment == ClinicalAssessment.model_validate(SCENARIO.assessment).model_dump()
@@ -0,0 +1,116 @@
+"""
+Tests for the bulk session export (NDJSON endpoint, chunking, Parquet).
+"""
+
+import json
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.db.base import Base, get_sessionmaker
+from app.db.models import MessageRole, Session
+from app.main import app
+from app.services import export, session_service
+
+
+@pytest.fixture
+async def db_factory(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SIMILAR_CASES_ENABLED", False)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    app.dependency_overrides[get_sessionmaker] = lambda: factory
+    yield factory
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+
+@pytest.fixture
+async def client(db_factory):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+async def seed(db_factory, count: int, updated_at: datetime) -> list:
+    ids = []
+    async with db_factory() as db:
+        for i in range(count):
+            session = await session_service.create_session(db, user_id=f"u{i}")
+            await session_service.add_message(db, session.id, MessageRole.USER, f"síntoma {i}")
+            await session_service.save_diagnostic_result(db, session.id, {"summary": f"dx {i}"}, 0.5)
+            await db.execute(
+                update(Session).where(Session.id == session.id).values(updated_at=updated_at + timedelta(seconds=i))
+            )
+            ids.append(session.id)
+        await db.commit()
+    return ids
+
+
+async def test_export_streams_ndjson_incrementally(client, db_factory):
+    """Test that the export streams every session once and the watermark resumes it"""
+    start = datetime.utcnow() - timedelta(hours=1)
+    first_ids = await seed(db_factory, 3, start)
+
+    response = await client.get("/v1/export/sessions", params={"chunk_size": 2})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["session_id"] for r in records] == first_ids
+    assert records[0]["assessments"][0]["assessment"] == {"summary": "dx 0"}
+    assert records[0]["messages"][0]["content"] == "síntoma 0"
+    watermark = response.headers["X-Export-Watermark"]
+
+    new_ids = await seed(db_factory, 2, datetime.utcnow() + timedelta(seconds=1))
+    response = await client.get(
+        "/v1/export/sessions",
+        params={"since": watermark, "until": (datetime.utcnow() + timedelta(minutes=1)).isoformat(), "include_messages": False}
+    )
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["session_id"] for r in records] == new_ids
+    assert "messages" not in records[0]
+
+
+async def test_export_watermark_trails_recent_writes(client, db_factory, monkeypatch):
+    """Test that sessions updated within the watermark lag are left for the next export"""
+    monkeypatch.setattr(settings, "EXPORT_WATERMARK_LAG_SECONDS", 600)
+    old_ids = await seed(db_factory, 2, datetime.utcnow() - timedelta(hours=1))
+    recent_ids = await seed(db_factory, 1, datetime.utcnow() - timedelta(minutes=1))
+
+    response = await client.get("/v1/export/sessions")
+    assert [json.loads(line)["session_id"] for line in response.text.splitlines()] == old_ids
+    watermark = datetime.fromisoformat(response.headers["X-Export-Watermark"])
+    assert watermark < datetime.utcnow() - timedelta(minutes=9)
+
+    monkeypatch.setattr(settings, "EXPORT_WATERMARK_LAG_SECONDS", 0)
+    response = await client.get("/v1/export/sessions", params={"since": watermark.isoformat()})
+    assert [json.loads(line)["session_id"] for line in response.text.splitlines()] == recent_ids
+
+
+async def test_export_chunks_are_bounded(db_factory):
+    """Test that records are produced in chunks of at most chunk_size"""
+    await seed(db_factory, 5, datetime.utcnow() - timedelta(hours=1))
+
+    async with db_factory() as db:
+        sizes = [len(chunk) async for chunk in export.iter_export_chunks(db, chunk_size=2)]
+    assert sizes == [2, 2, 1]
+
+
+async def test_export_writes_parquet(db_factory, tmp_path):
+    """Test that the Parquet export writes one row per session"""
+    pq = pytest.importorskip("pyarrow.parquet")
+    ids = await seed(db_factory, 3, datetime.utcnow() - timedelta(hours=1))
+
+    path = tmp_path / "sessions.parquet"
+    rows = await export.write_parquet(db_factory, str(path), chunk_size=2)
+
+    table = pq.read_table(path)
+    assert rows == 3
+    assert table.column("session_id").to_pylist() == ids
+    assert table.column("assessment_count").to_pylist() == [1, 1, 1]
+    assert pq.ParquetFile(path).num_row_groups == 2
@@ -0,0 +1,83 @@
+"""
+Tests for the fake OpenAI server and the load generator's patient flow.
+"""
+
+import json
+
+import httpx
+
+from app.agents import interviewer
+from app.agents.diagnostic import DIAGNOSTIC_SYSTEM_PROMPT
+from app.agents.interviewer import INTERVIEWER_SYSTEM_PROMPT
+from app.main import app
+from app.models.clinical import ClinicalAssessment
+from loadtest.fake_openai import FakeConfig
+from loadtest.run import Recorder, run_patient, sample_image
+from tests.conftest import SCENARIO, fake_client
+
+
+async def complete(client, messages, **options):
+    return await client.post("/v1/chat/completions", json={"model": "gpt-4o", "messages": messages, **options})
+
+
+async def test_fake_server_answers_in_each_agents_format(fake_llm):
+    """Test that scripted answers parse the way the agents parse them"""
+    _, client = fake_client(FakeConfig(latency_ms=0, tokens_per_second=0))
+    async with client:
+        interview = await complete(client, [
+            {"role": "system", "content": INTERVIEWER_SYSTEM_PROMPT},
+            {"role": "user", "content": SCENARIO.turns[0].text},
+        ])
+        parsed = interviewer.interviewer_agent._parse_json_response(interview.json()["choices"][0]["message"]["content"])
+        assert parsed == {"ready_for_diagnosis": False, "message": SCENARIO.questions[0]}
+
+        diagnosis = await complete(client, [
+            {"role": "system", "content": DIAGNOSTIC_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Paciente: {SCENARIO.turns[0].text}"},
+        ])
+        body = diagnosis.json()
+        assessment = ClinicalAssessment.model_validate_json(body["choices"][0]["message"]["content"])
+        assert assessment.differentials[0].name == SCENARIO.assessment["differentials"][0]["name"]
+        assert body["usage"]["completion_tokens"] > 0
+
+        streamed = await complete(client, [
+            {"role": "system", "content": DIAGNOSTIC_SYSTEM_PROMPT},
+            {"role": "user", "content": SCENARIO.turns[0].text},
+        ], stream=True)
+        chunks = [
+            json.loads(line[len("data: "):]) for line in streamed.text.splitlines()
+            if line.startswith("data: ") and line != "data: [DONE]"
+        ]
+        content = "".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks)
+        assert content == body["choices"][0]["message"]["content"]
+
+
+async def test_fake_server_injects_errors():
+    """Test error injection and the per-kind call stats"""
+    _, client = fake_client(FakeConfig(latency_ms=0, error_rate=1.0, error_statuses=(429,)))
+    async with client:
+        response = await complete(client, [{"role": "user", "content": "Hola"}])
+        assert response.status_code == 429
+        assert response.json()["error"]["type"] == "rate_limit_exceeded"
+        assert (await client.get("/stats")).json()["errors"] == {"chat": 1}
+
+
+async def test_patient_flow_completes_offline(offline_app):
+    """Test a full interview → image → finalize flow without a real LLM"""
+    recorder = Recorder()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        assert await run_patient(client, recorder, SCENARIO, turns=3, image=sample_image())
+
+    assert [(s.endpoint, s.ok) for s in recorder.samples] == [
+        ("POST /v1/sessions", True),
+        ("POST /v1/sessions/{id}/messages", True),
+        ("POST /v1/sessions/{id}/messages", True),
+        ("POST /v1/sessions/{id}/messages", True),
+        ("POST /v1/sessions/{id}/images", True),
+        ("GET /v1/sessions/{id}/finalize", True),
+        ("GET /v1/sessions/{id}/diagnosis", True),
+    ]
+    assert recorder.samples[1].queries is not None
+    assert recorder.samples[5].queries is None  # streamed
+    assert offline_app.state.completions.stats.calls == {"extraction": 3, "interview": 3, "vision": 1, "diagnosis": 1}
@@ -0,0 +1,209 @@
+"""
+Tests for the retention, archival and blob GC jobs (SQLite stand-in).
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.db.base import Base
+from app.db.models import AssessmentFact, FactKind, Message, MessageRole, Session, SessionStatus
+from app.services import analytics, maintenance, session_service
+from app.services.storage import StorageService
+
+
+@pytest.fixture
+async def db_factory(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SIMILAR_CASES_ENABLED", False)
+    monkeypatch.setattr(settings, "MAINTENANCE_BATCH_PAUSE_SECONDS", 0)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_STORAGE_PATH", str(tmp_path / "uploads"))
+    return StorageService()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return maintenance.ArchiveStore(str(tmp_path / "archive"))
+
+
+async def make_session(db_factory, idle: timedelta, status=SessionStatus.ACTIVE, images=None) -> str:
+    async with db_factory() as db:
+        session = await session_service.create_session(db, patient_info={"age": 50})
+        await session_service.add_message(db, session.id, MessageRole.USER, "Dolor de pecho", images=images)
+        await session_service.add_message(db, session.id, MessageRole.ASSISTANT, "¿Desde cuándo?")
+        if status == SessionStatus.COMPLETED:
+            await session_service.save_diagnostic_result(db, session.id, {"summary": "Angina estable"}, 0.8)
+        await db.execute(
+            update(Session)
+            .where(Session.id == session.id)
+            .values(status=status, updated_at=datetime.utcnow() - idle, last_activity_at=datetime.utcnow() - idle)
+        )
+        await db.commit()
+        return session.id
+
+
+def write_image(storage: StorageService, session_id: str, age: timedelta) -> str:
+    path = storage.local_path / f"{session_id}_abc123.png"
+    path.write_bytes(b"png")
+    mtime = time.time() - age.total_seconds()
+    os.utime(path, (mtime, mtime))
+    return f"/uploads/{path.name}"
+
+
+async def test_idle_sessions_are_marked_abandoned_in_batches(db_factory):
+    """Test that only active sessions past the idle TTL are abandoned, moving updated_at but not last_activity_at"""
+    idle_ids = [await make_session(db_factory, timedelta(hours=30)) for _ in range(5)]
+    fresh_id = await make_session(db_factory, timedelta(hours=1))
+    done_id = await make_session(db_factory, timedelta(hours=30), SessionStatus.COMPLETED)
+
+    async with db_factory() as db:
+        before = (await db.execute(
+            select(Session.updated_at, Session.last_activity_at).where(Session.id == idle_ids[0])
+        )).one()
+
+    assert await maintenance.mark_abandoned_sessions(db_factory, batch_size=2) == 5
+
+    async with db_factory() as db:
+        statuses = dict((await db.execute(select(Session.id, Session.status))).all())
+        after = (await db.execute(
+            select(Session.updated_at, Session.last_activity_at).where(Session.id == idle_ids[0])
+        )).one()
+    assert all(statuses[sid] == SessionStatus.ABANDONED for sid in idle_ids)
+    assert statuses[fresh_id] == SessionStatus.ACTIVE
+    assert statuses[done_id] == SessionStatus.COMPLETED
+    # Incremental exports (since < updated_at) see the status change
+    assert after.updated_at > before.updated_at
+    assert after.last_activity_at == before.last_activity_at
+
+
+async def test_archive_writes_bundle_and_deletes_rows(db_factory, store, storage):
+    """Test that old finished sessions are bundled to cold storage and removed from the DB"""
+    old_id = await make_session(
+        db_factory, timedelta(days=100), SessionStatus.COMPLETED, images=["/uploads/x_1.png"]
+    )
+    recent_id = await make_session(db_factory, timedelta(days=10), SessionStatus.COMPLETED)
+    active_id = await make_session(db_factory, timedelta(days=100))
+
+    class Checkpointer:
+        deleted = []
+
+        async def adelete_thread(self, thread_id):
+            self.deleted.append(thread_id)
+
+    checkpointer = Checkpointer()
+    archived = await maintenance.archive_sessions(
+        db_factory, store=store, checkpointer=checkpointer, storage=storage
+    )
+    assert archived == 1
+    assert checkpointer.deleted == [old_id]
+
+    bundle = await store.read(old_id)
+    assert bundle["session"]["id"] == old_id
+    assert [m["content"] for m in bundle["messages"]] == ["Dolor de pecho", "¿Desde cuándo?"]
+    assert bundle["assessments"][0]["assessment"] == {"summary": "Angina estable"}
+    assert bundle["state"]["patient_info"] == {"age": 50}
+    assert bundle["images"] == ["/uploads/x_1.png"]
+
+    async with db_factory() as db:
+        remaining = set((await db.execute(select(Session.id))).scalars().all())
+        orphan_messages = (await db.execute(select(Message).where(Message.session_id == old_id))).all()
+    assert remaining == {recent_id, active_id}
+    assert orphan_messages == []
+
+
+async def test_archive_keeps_sessions_touched_while_bundling(db_factory, store, storage):
+    """Test that a session changed after it was bundled is not deleted with the batch"""
+    touched_id = await make_session(db_factory, timedelta(days=100), SessionStatus.COMPLETED)
+    other_id = await make_session(db_factory, timedelta(days=100), SessionStatus.COMPLETED)
+    write = store.write
+
+    async def write_and_touch(session_id, content):
+        if session_id == touched_id:
+            async with db_factory() as db:
+                await session_service.save_diagnostic_result(db, touched_id, {"summary": "Revisado"}, 0.9)
+        return await write(session_id, content)
+
+    store.write = write_and_touch
+    assert await maintenance.archive_sessions(db_factory, store=store, storage=storage) == 1
+
+    async with db_factory() as db:
+        remaining = set((await db.execute(select(Session.id))).scalars().all())
+    assert remaining == {touched_id}
+    assert await store.read(other_id) is not None
+
+
+async def test_archived_sessions_stay_in_the_stats(db_factory, store, storage):
+    """Test that archiving keeps the assessment facts, so rebuilding the rollup keeps their counts"""
+    old_id = await make_session(db_factory, timedelta(days=100), SessionStatus.COMPLETED)
+    async with db_factory() as db:
+        await session_service.save_diagnostic_result(db, old_id, {
+            "differentials": [{"name": "Angina estable", "likelihood": 70, "urgency": "urgent"}]
+        }, 0.8)
+        await db.execute(
+            update(Session).where(Session.id == old_id).values(last_activity_at=datetime.utcnow() - timedelta(days=100))
+        )
+        await db.commit()
+
+    assert await maintenance.archive_sessions(db_factory, store=store, storage=storage) == 1
+
+    async with db_factory() as db:
+        # The backfill finds no result without facts but rebuilds the whole rollup
+        assert await analytics.backfill_facts(db) == 0
+        facts = (await db.execute(select(AssessmentFact.session_id, AssessmentFact.diagnostic_result_id))).all()
+        stats = await analytics.query_stats(db, FactKind.DIFFERENTIAL)
+    assert facts == [(old_id, None)]
+    assert [(row["key"], row["count"]) for row in stats] == [("Angina estable", 1)]
+
+
+async def test_gc_deletes_only_orphaned_old_blobs(db_factory, store, storage):
+    """Test that GC keeps images of live, archived and recent uploads"""
+    live_id = await make_session(db_factory, timedelta(hours=1))
+    archived_id = "archived-session"
+    await store.write(archived_id, b"")
+
+    live = write_image(storage, live_id, timedelta(days=3))
+    archived = write_image(storage, archived_id, timedelta(days=3))
+    orphan = write_image(storage, "deleted-session", timedelta(days=3))
+    recent_orphan = write_image(storage, "uploading-session", timedelta(minutes=5))
+
+    assert await maintenance.gc_orphaned_blobs(db_factory, store=store, storage=storage, batch_size=2) == 1
+
+    remaining = {f"/uploads/{name}" for name in os.listdir(storage.local_path)}
+    assert remaining == {live, archived, recent_orphan}
+    assert orphan not in remaining
+
+
+async def test_runner_keeps_looping_after_a_failed_round(monkeypatch):
+    """Test that an exception in one maintenance round does not stop the loop"""
+    monkeypatch.setattr(settings, "MAINTENANCE_INTERVAL_SECONDS", 0)
+    runner = maintenance.MaintenanceRunner()
+    rounds = []
+
+    async def run_if_leader():
+        rounds.append(len(rounds))
+        if len(rounds) == 1:
+            raise ConnectionError("coordination backend unavailable")
+        return {}
+
+    monkeypatch.setattr(runner, "run_if_leader", run_if_leader)
+    runner.start()
+    for _ in range(100):
+        if len(rounds) >= 3:
+            break
+        await asyncio.sleep(0)
+    await runner.stop()
+    assert len(rounds) >= 3
@@ -0,0 +1,43 @@
+"""
+Tests for the streamed messages endpoint (POST /v1/sessions/{id}/messages/stream).
+"""
+
+import httpx
+
+from app.core import metrics
+from app.main import app
+from tests.conftest import SCENARIO, parse_events
+
+
+async def test_stream_sends_tokens_then_persisted_message(offline_app):
+    """Test that the interviewer's message streams as tokens and ends with the persisted message"""
+    first_tokens = metrics.LLM_FIRST_TOKEN.labels(agent="interviewer", model="fake")
+    observed = first_tokens._sum.get(), sum(bucket.get() for bucket in first_tokens._buckets)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        session_id = (await client.post("/v1/sessions", json={})).json()["id"]
+        response = await client.post(
+            f"/v1/sessions/{session_id}/messages/stream", json={"content": SCENARIO.turns[0].text}
+        )
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = parse_events(response.text)
+
+        messages = (await client.get(f"/v1/sessions/{session_id}/messages")).json()["messages"]
+
+    kinds = [event["type"] for event in events]
+    assert kinds[:2] == ["extraction", "ready"] and kinds[-1] == "complete"
+    assert set(kinds[2:-1]) == {"token"}
+    assert events[1]["ready_for_diagnosis"] is False
+    assert "".join(event["text"] for event in events if event["type"] == "token") == SCENARIO.questions[0]
+
+    message = events[-1]["message"]
+    assert message == messages[-1]
+    assert message["content"] == SCENARIO.questions[0]
+    assert set(message["message_metadata"]) == {"confidence_score", "phase", "usage"}
+    assert sum(bucket.get() for bucket in first_tokens._buckets) == observed[1] + 1
+
+
+async def test_stream_reports_errors_as_events(offline_app):
+    """Test that an unknown session ends the stream with an error event"""
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/v1/sessions/nope/messages/stream", json={"content": "Hola"})
+    assert parse_events(response.text) == [{"type": "error", "status": 404, "error": "Session not found"}]
@@ -0,0 +1,62 @@
+"""
+Tests for the Prometheus series and the /metrics endpoint.
+"""
+
+import httpx
+
+from app.core import metrics
+from app.main import app
+from loadtest.run import Recorder, run_patient, sample_image
+from tests.conftest import SCENARIO
+
+MESSAGES_ROUTE = {"method": "POST", "route": "/v1/sessions/{session_id}/messages"}
+
+
+def sample(name, **labels):
+    return metrics.registry.get_sample_value(name, labels) or 0.0
+
+
+def snapshot():
+    return {
+        "messages": sample("http_request_duration_seconds_count", **MESSAGES_ROUTE),
+        "interviewer": sample("agent_node_duration_seconds_count", node="interviewer"),
+        "diagnostic": sample("agent_node_duration_seconds_count", node="diagnostic"),
+        "interviewer_calls": sample("llm_request_duration_seconds_count", agent="interviewer", model="fake"),
+        "output_tokens": sample("llm_tokens_total", agent="interviewer", model="fake", direction="output"),
+        "uploads": sample("image_upload_bytes_count"),
+        "processing": sample("image_processing_seconds_count"),
+        "finalize": sample("sse_stream_duration_seconds_count", stream="finalize", outcome="complete"),
+    }
+
+
+async def test_patient_flow_is_measured(offline_app):  # noqa: F811
+    """Test that a full flow updates the endpoint, node, LLM, upload and SSE series"""
+    before = snapshot()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        assert await run_patient(client, Recorder(), SCENARIO, turns=2, image=sample_image())
+        exposition = (await client.get("/metrics")).text
+
+    delta = {key: value - before[key] for key, value in snapshot().items()}
+    assert delta == {
+        "messages": 2,
+        "interviewer": 2,
+        "diagnostic": 1,
+        "interviewer_calls": 4,  # extraction + question per turn
+        "output_tokens": delta["output_tokens"],
+        "uploads": 1,
+        "processing": 1,
+        "finalize": 1,
+    }
+    assert delta["output_tokens"] > 0
+    assert sample("image_analysis_queue_depth") == 0
+
+    assert 'http_request_duration_seconds_bucket{le="0.005",method="POST",route="/v1/sessions/{session_id}/messages"}' in exposition
+    assert 'llm_tokens_total{agent="diagnostic",direction="input",model="fake"}' in exposition
+    assert 'db_pool_checkouts_total{engine="primary"}' in exposition
+
+
+def test_label_children_are_bound_once():
+    """Test that repeated lookups reuse the bound children"""
+    assert metrics.http_duration("GET", "/health") is metrics.http_duration("GET", "/health")
+    assert metrics.llm_children("diagnostic.assessment", "m") is metrics.llm_children("diagnostic.assessment", "m")
@@ -0,0 +1,55 @@
+"""
+Tests for the microbenchmark harness: regression detection against a
+baseline and a quick run of every case.
+"""
+
+import asyncio
+
+from app.agents.state import calculate_confidence_score
+from benchmarks.micro import ALLOC_SLACK_BYTES, SESSION_SIZES, build_cases, compare, run_cases, seed_session_db, synthetic_state
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    """Test that only changes beyond the threshold (and the slack) are reported"""
+    baseline = {
+        "a[1]": {"us": 100.0, "bytes": 100_000},
+        "b[1]": {"us": 100.0, "bytes": 100_000},
+        "c[1]": {"us": 1.0, "bytes": 100},
+    }
+    results = {
+        "a[1]": {"us": 120.0, "bytes": 100_000},  # within 25%
+        "b[1]": {"us": 140.0, "bytes": 200_000},  # slower and bigger
+        "c[1]": {"us": 2.0, "bytes": 100 + ALLOC_SLACK_BYTES - 1},  # below the slack
+        "new[1]": {"us": 1e6, "bytes": 1e9},  # not in the baseline
+    }
+
+    regressions = compare(results, baseline, threshold=0.25)
+    assert [r.split(":")[0] for r in regressions] == ["b[1]", "b[1]"]
+    assert compare(results, baseline, threshold=0.25, metrics=("bytes",)) == [regressions[1]]
+
+
+def test_synthetic_state_sizes():
+    """Test that synthetic sessions have the requested turns and images"""
+    state = synthetic_state(200, 20)
+    assert len(state["messages"]) == 400
+    assert len(state["images"]) == 20
+    assert 0 < calculate_confidence_score(state) <= 1
+
+
+def test_every_case_runs(tmp_path):
+    """Test a one-round run of every case, including state reconstruction"""
+    loop = asyncio.new_event_loop()
+    try:
+        engine, factory, session_ids = loop.run_until_complete(seed_session_db(tmp_path, SESSION_SIZES))
+        cases = build_cases(factory, session_ids)
+        results = run_cases(cases, loop, rounds=1, min_time=0)
+        largest = next(case for case in cases if case.key == "load_state_from_db[200t/20i]")
+        state = loop.run_until_complete(largest.fn())
+        loop.run_until_complete(engine.dispose())
+    finally:
+        loop.close()
+
+    assert set(results) == {case.key for case in cases}
+    assert all(result["us"] > 0 and result["bytes"] > 0 for result in results.values())
+    assert len(state["messages"]) == 400
+    assert len(state["images"]) == 20
@@ -0,0 +1,106 @@
+"""
+Tests for the profiling endpoints, slow request capture and the loop monitor.
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.core import profiling
+from app.core.config import settings
+from app.main import app
+from tests.conftest import SCENARIO
+
+
+@pytest.fixture
+def profiling_enabled(monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(settings, "PROFILING_ADMIN_TOKEN", "secret")
+
+
+def burn_cpu(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def block_loop():
+    time.sleep(0.25)
+
+
+async def test_admin_endpoints_need_a_token(monkeypatch):
+    """Test that profiling without PROFILING_ADMIN_TOKEN keeps the admin endpoints hidden"""
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(settings, "PROFILING_ADMIN_TOKEN", "")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for path in ("/admin/profile", "/admin/slow-requests", "/admin/loop-stalls"):
+            assert (await client.get(path, headers={"X-Admin-Token": ""})).status_code == 404
+
+
+async def test_profile_endpoint_returns_folded_stacks(profiling_enabled):
+    """Test that an on-demand profile sees code running on the event loop"""
+    async def busy():
+        await asyncio.sleep(0.05)
+        burn_cpu(0.2)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        assert (await client.get("/admin/profile", params={"seconds": 0.1})).status_code == 403
+
+        headers = {"X-Admin-Token": "secret"}
+        response, _ = await asyncio.gather(
+            client.get("/admin/profile", params={"seconds": 0.4, "interval_ms": 5, "mode": "cpu"}, headers=headers),
+            busy(),
+        )
+
+    assert response.status_code == 200
+    assert int(response.headers["X-Profile-Samples"]) > 10
+    lines = response.text.splitlines()
+    stack, weight = lines[0].rsplit(" ", 1)
+    assert "burn_cpu (tests/test_profiling.py:" in stack.split(";")[-1]
+    assert int(weight) > 0
+
+
+async def test_slow_requests_keep_breakdown_and_profile(offline_app, profiling_enabled, monkeypatch):  # noqa: F811
+    """Test that requests over the threshold keep their time breakdown and loop samples"""
+    monkeypatch.setattr(settings, "PROFILING_SLOW_REQUEST_MS", 1.0)
+    monkeypatch.setattr(settings, "PROFILING_SAMPLE_INTERVAL_MS", 2.0)
+    monkeypatch.setattr(settings, "PROFILING_LOOP_STALL_MS", 0.0)
+    profiling.profiler.slow_requests.clear()
+    profiling.profiler.start()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            session_id = (await client.post("/v1/sessions", json={})).json()["id"]
+            response = await client.post(f"/v1/sessions/{session_id}/messages", json={"content": SCENARIO.turns[0].text})
+            assert response.status_code == 200
+            captured = (await client.get("/admin/slow-requests", headers={"X-Admin-Token": "secret"})).json()
+    finally:
+        await profiling.profiler.stop()
+
+    turn = next(entry for entry in captured["slow_requests"] if entry["route"] == "/v1/sessions/{session_id}/messages")
+    assert turn["status_code"] == 200
+    assert "db" in turn["breakdown"]  # the test engine is not instrumented
+    assert turn["breakdown"]["node.interviewer"]["count"] == 1
+    assert turn["breakdown"]["llm.interviewer.question"]["count"] == 1
+    assert turn["samples"] == sum(int(line.rsplit(" ", 1)[1]) for line in turn["profile"].splitlines())
+
+
+async def test_loop_monitor_reports_blocking_callback():
+    """Test that a stall is reported with the stack of the callback blocking the loop"""
+    stalls = []
+    monitor = profiling.LoopMonitor(0.02, 0.1, lambda lag, stack: stalls.append((lag, stack)))
+    monitor.start(profiling.threading.get_ident())
+    try:
+        await asyncio.sleep(0.05)
+        block_loop()
+        await asyncio.sleep(0.05)
+    finally:
+        await monitor.stop()
+
+    lag, stack = stalls[0]
+    assert lag >= 0.2
+    assert stack.split(";")[-1].startswith("block_loop (tests/test_profiling.py:")
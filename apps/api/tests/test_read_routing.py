@@ -0,0 +1,71 @@
+"""
+Tests for read replica routing with read-your-writes stickiness (SQLite stand-ins).
+"""
+
+import httpx
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.db import base
+from app.db.routing import WriteTracker
+from app.main import app
+from app.services import session_service
+
+
+@pytest.fixture
+async def databases(tmp_path, monkeypatch):
+    """Primary and an (always lagging) empty replica"""
+    primary = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}")
+    replica = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    for engine in (primary, replica):
+        async with engine.begin() as conn:
+            await conn.run_sync(base.Base.metadata.create_all)
+
+    primary_factory = async_sessionmaker(primary, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(base, "engine", primary)
+    monkeypatch.setattr(base, "read_engine", replica)
+    monkeypatch.setattr(base, "AsyncSessionLocal", primary_factory)
+    monkeypatch.setattr(base, "AsyncReadSessionLocal", async_sessionmaker(replica, class_=AsyncSession))
+    tracker = WriteTracker(window_seconds=60)
+    monkeypatch.setattr(base, "write_tracker", tracker)
+    monkeypatch.setattr(session_service, "write_tracker", tracker)
+
+    yield primary_factory, tracker
+    await primary.dispose()
+    await replica.dispose()
+
+
+async def test_recent_writes_read_from_primary(databases):
+    """Test that a just-written session is read from the primary, others from the replica"""
+    primary_factory, tracker = databases
+    async with primary_factory() as db:
+        session = await session_service.create_session(db)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        sticky = await client.get(f"/v1/sessions/{session.id}")
+        assert sticky.status_code == 200
+
+        # Outside the window the replica serves the read (it has not caught up here)
+        tracker.window_seconds = 0
+        replica_read = await client.get(f"/v1/sessions/{session.id}")
+        assert replica_read.status_code == 404
+
+
+async def test_write_tracker_window_and_pruning(monkeypatch):
+    """Test stickiness expiry and bounded memory"""
+    now = [100.0]
+    monkeypatch.setattr("app.db.routing.time.monotonic", lambda: now[0])
+    tracker = WriteTracker(window_seconds=5, max_keys=2)
+
+    await tracker.mark_written("a")
+    assert await tracker.is_sticky("a")
+    assert not await tracker.is_sticky("b")
+    assert not await tracker.is_sticky(None)
+
+    now[0] = 106.0
+    assert not await tracker.is_sticky("a")
+
+    await tracker.mark_written("b")
+    await tracker.mark_written("c")
+    assert set(tracker._written_at) == {"b", "c"}
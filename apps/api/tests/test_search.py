@@ -0,0 +1,113 @@
+"""
+Tests for full-text search over transcripts, symptoms and diagnoses (SQLite FTS5).
+"""
+
+import httpx
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.db.base import Base, get_read_db
+from app.db.models import MessageRole, SearchDocument
+from app.main import app
+from app.services import session_service
+
+
+@pytest.fixture
+async def db_factory(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SIMILAR_CASES_ENABLED", False)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def override_get_read_db():
+        async with factory() as session:
+            yield session
+
+    app.dependency_overrides[get_read_db] = override_get_read_db
+    yield factory
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+
+@pytest.fixture
+async def client(db_factory):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+async def run_turn(db, session_id, content, symptoms=None, diagnosis=None):
+    uow = await session_service.SessionUnitOfWork.load(db, session_id)
+    uow.add_message(MessageRole.USER, content)
+    state = await uow.load_state()
+    if symptoms is not None:
+        state["symptoms"] = symptoms
+    if diagnosis is not None:
+        state["final_assessment"] = {"differentials": [{"name": name} for name in diagnosis]}
+        state["confidence_score"] = 0.8
+    uow.apply_state(state)
+    uow.add_message(MessageRole.ASSISTANT, "¿Desde cuándo?")
+    await uow.commit()
+
+
+async def test_search_ranks_sessions_by_best_document(client, db_factory):
+    """Test that diagnoses outrank passing mentions and each session appears once"""
+    async with db_factory() as db:
+        pneumonia = await session_service.create_session(db)
+        await run_turn(db, pneumonia.id, "Tengo fiebre y tos con flema", diagnosis=["Neumonía adquirida en la comunidad"])
+        await run_turn(db, pneumonia.id, "Mi vecino tuvo neumonía el año pasado")
+
+        mention = await session_service.create_session(db)
+        await run_turn(db, mention.id, "Me preocupa que sea neumonía, pero solo me duele la cabeza")
+
+        await run_turn(db, (await session_service.create_session(db)).id, "Dolor de rodilla al correr")
+
+    response = await client.get("/v1/search", params={"q": "neumonia"})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["session_id"] for r in results] == [pneumonia.id, mention.id]
+    assert results[0]["source"] == "diagnosis"
+    assert "«Neumon" in results[0]["snippet"]  # accents are folded in PostgreSQL headlines
+    assert results[1]["source"] == "user_message"
+    assert results[1]["message_id"] is not None
+
+
+async def test_search_indexes_current_symptoms(client, db_factory):
+    """Test that the symptoms document follows the session's symptom list"""
+    async with db_factory() as db:
+        session = await session_service.create_session(db)
+        await run_turn(db, session.id, "Hola", symptoms=["dolor torácico"])
+        await run_turn(db, session.id, "Sigo igual", symptoms=["dolor torácico", "disnea"])
+
+        documents = (await db.execute(
+            select(SearchDocument.content).where(SearchDocument.source == "symptoms")
+        )).scalars().all()
+        assert documents == ["dolor torácico. disnea"]
+        assert (await session_service.load_state_from_db(db, session.id))["symptoms"] == ["dolor torácico", "disnea"]
+
+    response = await client.get("/v1/search", params={"q": "dolor toracico"})
+    hit = response.json()["results"][0]
+    assert (hit["session_id"], hit["source"]) == (session.id, "symptoms")
+
+
+async def test_search_paginates_and_tolerates_query_syntax(client, db_factory):
+    """Test offset pagination and that FTS operators in the query are treated as text"""
+    async with db_factory() as db:
+        for i in range(5):
+            session = await session_service.create_session(db)
+            await session_service.add_message(db, session.id, MessageRole.USER, f"Cefalea intensa día {i}")
+
+    first = (await client.get("/v1/search", params={"q": "cefalea", "limit": 3})).json()
+    assert len(first["results"]) == 3
+    assert first["next_offset"] == 3
+    second = (await client.get("/v1/search", params={"q": "cefalea", "limit": 3, "offset": 3})).json()
+    assert len(second["results"]) == 2
+    assert second["next_offset"] is None
+    assert not {r["session_id"] for r in first["results"]} & {r["session_id"] for r in second["results"]}
+
+    response = await client.get("/v1/search", params={"q": 'cefalea) "intensa*'})
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 5
@@ -0,0 +1,147 @@
+"""
+Tests for the per-turn unit of work in session_service (SQLite stand-in).
+"""
+
+import httpx
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.db.base import Base
+from app.db.metrics import count_queries, instrument_engine
+from app.core.config import settings
+from app.db.models import DiagnosticResult, MessageRole, SessionStatus
+from app.services import session_service
+from tests.conftest import SCENARIO
+
+
+@pytest.fixture
+async def db(tmp_path):
+    engine = instrument_engine(create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}"))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
+async def test_unit_of_work_writes_turn_in_one_transaction(db):
+    """Test that a turn loads the session once and writes everything on commit"""
+    session = await session_service.create_session(db, patient_info={"age": 40})
+
+    with count_queries() as counter:
+        uow = await session_service.SessionUnitOfWork.load(db, session.id)
+        uow.add_message(MessageRole.USER, "Tengo tos")
+        state = await uow.load_state()
+        state["patient_info"] = {"age": 40, "sex": "F"}
+        uow.apply_state(state)
+        assistant_msg = uow.add_message(MessageRole.ASSISTANT, "¿Desde cuándo?")
+        await uow.commit()
+
+    # Session load, history load, session update, the message inserts (a
+    # single multi-row INSERT on PostgreSQL; SQLite executes one per row) and
+    # one executemany for their search documents
+    assert counter.count <= 6
+    assert state["messages"] == []
+    assert assistant_msg.id is not None
+
+    messages = await session_service.get_session_messages(db, session.id)
+    assert [m.content for m in messages] == ["Tengo tos", "¿Desde cuándo?"]
+    refreshed = await session_service.get_session(db, session.id)
+    assert refreshed.patient_info == {"age": 40, "sex": "F"}
+
+
+async def test_unit_of_work_releases_connection_between_reads(db):
+    """Test that the turn's reads end their transaction, so no connection is held while the agents run"""
+    session = await session_service.create_session(db)
+
+    uow = await session_service.SessionUnitOfWork.load(db, session.id)
+    assert not db.in_transaction()
+    uow.add_message(MessageRole.USER, "Tengo tos")
+    await uow.load_state()
+    assert await uow.count_user_messages() == 0
+    assert not db.in_transaction()
+
+    uow.add_message(MessageRole.ASSISTANT, "¿Desde cuándo?")
+    await uow.commit()
+    assert await uow.count_user_messages() == 1
+
+
+async def test_unit_of_work_saves_diagnosis_once(db, monkeypatch):
+    """Test that a new assessment is saved and completes the session"""
+    monkeypatch.setattr(settings, "SIMILAR_CASES_ENABLED", False)
+    session = await session_service.create_session(db)
+
+    for _ in range(2):
+        uow = await session_service.SessionUnitOfWork.load(db, session.id)
+        state = await uow.load_state()
+        state["final_assessment"] = {"summary": "Bronquitis aguda"}
+        state["confidence_score"] = 0.8
+        uow.apply_state(state)
+        await uow.commit()
+
+    count = await db.scalar(select(func.count()).select_from(DiagnosticResult))
+    assert count == 1
+    uow = await session_service.SessionUnitOfWork.load(db, session.id)
+    assert uow.session.status == SessionStatus.COMPLETED
+    state = await uow.load_state()
+    assert state["final_assessment"] == {"summary": "Bronquitis aguda"}
+    assert state["ready_for_diagnosis"] is True
+
+
+async def test_failed_commit_does_not_duplicate_the_turn(offline_app, monkeypatch):
+    """Test that a turn whose commit failed is reused on retry, and dropped for a different message"""
+    from app.agents import graph
+    from app.main import app
+
+    commit = session_service.SessionUnitOfWork._commit
+    failures = []
+
+    async def failing_commit(self):
+        if failures:
+            raise ConnectionError(failures.pop())
+        await commit(self)
+
+    monkeypatch.setattr(session_service.SessionUnitOfWork, "_commit", failing_commit)
+    stats = offline_app.state.completions.stats
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        session_id = (await client.post("/v1/sessions", json={})).json()["id"]
+
+        failures.append("database unavailable")
+        url = f"/v1/sessions/{session_id}/messages"
+        assert (await client.post(url, json={"content": SCENARIO.turns[0].text})).status_code == 500
+        calls = sum(stats.calls.values())
+        assert (await client.post(url, json={"content": SCENARIO.turns[0].text})).status_code == 200
+        assert sum(stats.calls.values()) == calls
+
+        failures.append("database unavailable")
+        assert (await client.post(url, json={"content": SCENARIO.turns[1].text})).status_code == 500
+        assert (await client.post(url, json={"content": "Otra respuesta"})).status_code == 200
+
+        stored = (await client.get(url)).json()["messages"]
+
+    state = await graph.load_session_state(session_id, load_state=None)
+    users = [m["content"] for m in state["messages"] if m["role"] == "user"]
+    assert users == [SCENARIO.turns[0].text, "Otra respuesta"]
+    assert [m["content"] for m in stored if m["role"] == "user"] == users
+
+
+async def test_unit_of_work_missing_session(db):
+    """Test that loading an unknown session returns None"""
+    assert await session_service.SessionUnitOfWork.load(db, "missing") is None
+
+
+async def test_find_diagnostic_results_by_differential(db):
+    """Test searching assessments by exact differential name"""
+    for name in ["Neumonía", "Bronquitis aguda"]:
+        session = await session_service.create_session(db)
+        db.add(DiagnosticResult(
+            session_id=session.id,
+            assessment_json={"differentials": [{"name": name}, {"name": "Asma"}]}
+        ))
+    await db.commit()
+
+    results = await session_service.find_diagnostic_results_by_differential(db, "Neumonía")
+    assert [r.assessment_json["differentials"][0]["name"] for r in results] == ["Neumonía"]
+    assert len(await session_service.find_diagnostic_results_by_differential(db, "Asma")) == 2
+    assert await session_service.find_diagnostic_results_by_differential(db, "Neumo") == []
@@ -0,0 +1,150 @@
+"""
+Tests for the local similar-case index.
+"""
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.db import base
+from app.services import session_service
+from app.services.similar_cases import (
+    SimilarCase,
+    SimilarCaseIndex,
+    build_case_text,
+    format_similar_cases,
+    rebuild_from_db,
+    tokenize,
+)
+
+
+def _assessment(summary, *differentials):
+    return {
+        "patient_summary": summary,
+        "differentials": [{"name": name} for name in differentials],
+    }
+
+
+def test_tokenize_strips_accents_and_stopwords():
+    """Test that tokens are normalized for matching"""
+    tokens = tokenize("Dolor torácico con disnea desde ayer")
+    assert tokens == ["dolor", "toracico", "disnea", "ayer"]
+
+
+def test_colliding_tokens_add_their_signs():
+    """Test that tokens hashed to one bucket accumulate signed counts"""
+    index = SimilarCaseIndex("unused", dim=1)
+
+    # "fiebre" and "vomito" hash with opposite signs and cancel out
+    assert not index.embed("fiebre vomito").any()
+    assert index.embed("fiebre vomito disnea")[0] == 1.0
+    assert index.embed("vomito vomito fiebre")[0] == -1.0
+
+
+def test_search_returns_most_similar_case(tmp_path):
+    """Test that the closest past case ranks first"""
+    index = SimilarCaseIndex(str(tmp_path), dim=512)
+    index.add_case("s1", ["fiebre", "tos productiva"], _assessment("Adulto con fiebre y tos", "Neumonía"))
+    index.add_case("s2", ["cefalea pulsátil", "fotofobia"], _assessment("Cefalea recurrente", "Migraña"))
+    index.add_case("s3", ["lesión pigmentada"], _assessment("Lesión cutánea asimétrica", "Melanoma"))
+
+    results = index.search(["cefalea", "fotofobia"], k=2)
+
+    assert results[0].session_id == "s2"
+    assert results[0].differentials == ["Migraña"]
+    assert results[0].score > results[-1].score
+
+
+def test_search_excludes_current_session_and_duplicates(tmp_path):
+    """Test that the current session is excluded and re-adding is a no-op"""
+    index = SimilarCaseIndex(str(tmp_path), dim=512)
+    assert index.add_case("s1", ["fiebre"], _assessment("Fiebre", "Influenza"))
+    assert not index.add_case("s1", ["fiebre"], _assessment("Fiebre", "Influenza"))
+    index.add_case("s2", ["fiebre", "odinofagia"], _assessment("Fiebre y dolor de garganta", "Faringitis"))
+
+    results = index.search(["fiebre"], k=5, exclude_session_id="s1")
+
+    assert len(index) == 2
+    assert [case.session_id for case in results] == ["s2"]
+
+
+def test_index_persists_and_appends_incrementally(tmp_path):
+    """Test that a reopened index keeps its rows and accepts appends"""
+    index = SimilarCaseIndex(str(tmp_path), dim=256)
+    index.add_case("s1", ["disuria"], _assessment("Disuria y fiebre", "Pielonefritis"))
+
+    reopened = SimilarCaseIndex(str(tmp_path), dim=256)
+    reopened.add_case("s2", ["erupción"], _assessment("Erupción pruriginosa", "Dermatitis"))
+
+    assert len(reopened) == 2
+    assert reopened.search(["disuria"], k=1)[0].session_id == "s1"
+
+
+def test_add_vectors_appends_in_bulk(tmp_path):
+    """Test bulk appends of pre-computed vectors"""
+    index = SimilarCaseIndex(str(tmp_path), dim=64)
+    vectors = np.eye(64, dtype=np.float32)[:3]
+    cases = [{"session_id": f"s{i}", "patient_summary": "", "differentials": [], "symptoms": []} for i in range(3)]
+
+    assert index.add_vectors(vectors, cases) == 3
+    assert index.add_vectors(vectors, cases) == 0
+    assert len(index) == 3
+
+
+def test_build_case_text_includes_differentials():
+    """Test that differential names are part of the indexed text"""
+    text = build_case_text(["tos"], _assessment("Resumen", "Asma"))
+    assert "tos" in text and "Asma" in text and "Resumen" in text
+
+
+def test_format_similar_cases_respects_token_budget():
+    """Test that rendered cases stay within the token budget"""
+    cases = [
+        SimilarCase(session_id=f"s{i}", score=0.9, patient_summary="x" * 400, differentials=["Neumonía"])
+        for i in range(10)
+    ]
+
+    text = format_similar_cases(cases, token_budget=200)
+
+    assert len(text) <= 200 * 4
+    assert text.startswith("1. (similitud 0.90) Diferenciales: Neumonía.")
+
+
+def test_processes_sharing_a_directory_see_each_others_cases(tmp_path):
+    """Test that an index picks up rows appended through another instance (another worker)"""
+    first = SimilarCaseIndex(str(tmp_path), dim=256)
+    second = SimilarCaseIndex(str(tmp_path), dim=256)
+    first.add_case("s1", ["disuria"], _assessment("Disuria y fiebre", "Pielonefritis"))
+    assert second.search(["disuria"], k=1)[0].session_id == "s1"
+
+    assert second.add_case("s2", ["erupción"], _assessment("Erupción pruriginosa", "Dermatitis"))
+    assert not first.add_case("s2", ["erupción"], _assessment("Erupción pruriginosa", "Dermatitis"))
+    assert len(first) == len(second) == 2
+    assert first.search(["erupción"], k=1)[0].session_id == "s2"
+    assert np.array_equal(first._df, second._df)
+
+
+async def test_rebuild_embeds_cases_like_live_indexing(tmp_path, monkeypatch):
+    """Test that rebuilt cases take their symptoms from the stored session"""
+    monkeypatch.setattr(settings, "SIMILAR_CASES_ENABLED", False)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(base.Base.metadata.create_all)
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(base, "AsyncSessionLocal", factory)
+
+    assessment = _assessment("Adulto con fiebre y tos", "Neumonía")
+    async with factory() as db:
+        session = await session_service.create_session(db)
+        session.symptoms = ["fiebre", "tos productiva"]
+        await db.commit()
+        await session_service.save_diagnostic_result(db, session.id, assessment, 0.8)
+    await engine.dispose()
+
+    live = SimilarCaseIndex(str(tmp_path / "live"), dim=256)
+    live.add_case(session.id, ["fiebre", "tos productiva"], assessment)
+    rebuilt = SimilarCaseIndex(str(tmp_path / "rebuilt"), dim=256)
+
+    assert await rebuild_from_db(rebuilt) == (1, 1)
+    assert np.array_equal(rebuilt._get_matrix(), live._get_matrix())
+    assert rebuilt.search(["fiebre"], k=1)[0].symptoms == ["fiebre", "tos productiva"]
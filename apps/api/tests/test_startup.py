@@ -0,0 +1,74 @@
+"""
+Tests for lazy agent construction and the startup warm-up.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.agents import graph, interviewer
+from app.agents.registry import AgentRegistry, registry
+from app.db.base import warm_up_pool
+
+API_DIR = Path(__file__).resolve().parents[1]
+
+IMPORT_CHECK = """
+import json, sys
+import app.main
+from app.agents.registry import registry
+print(json.dumps({
+    "heavy": sorted(m for m in ("langchain_core", "langchain_openai", "langgraph", "openai") if m in sys.modules),
+    "built": [name for name in ("interviewer_agent", "agent_graph") if registry.built(name)],
+}))
+"""
+
+
+def test_importing_the_app_builds_nothing():
+    """Test that app.main imports without an API key, agents or langchain"""
+    env = {**os.environ, "OPENAI_API_KEY": "", "OPENAI_BASE_URL": ""}
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_CHECK], cwd=API_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.splitlines()[-1]) == {"heavy": [], "built": []}
+
+
+def test_singletons_resolve_through_the_registry():
+    """Test that the module attributes and the graph nodes share the registry's instances"""
+    assert interviewer.interviewer_agent is registry.get("interviewer_agent")
+    assert graph.get_agent_graph() is graph.agent_graph
+
+    from langgraph.graph import END
+    assert graph.END == END
+
+
+def test_warm_up_skips_failing_factories():
+    """Test that warm-up reports what it built and leaves failures for first use"""
+    calls = []
+
+    def broken():
+        calls.append("broken")
+        raise ValueError("no API key")
+
+    local = AgentRegistry()
+    local.register("ok", object)
+    local.register("broken", broken)
+
+    assert list(local.warm_up()) == ["ok"]
+    assert local.built("ok") and not local.built("broken")
+    assert local.get("ok") is local.get("ok")
+
+
+async def test_warm_up_pool_opens_connections(tmp_path):
+    """Test that the pool keeps the warmed-up connections"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'warm.db'}", poolclass=AsyncAdaptedQueuePool)
+    try:
+        assert await warm_up_pool(engine, 2) == 2
+        assert engine.pool.checkedin() == 2
+    finally:
+        await engine.dispose()
@@ -0,0 +1,107 @@
+"""
+Tests for request, graph, LLM and database tracing spans.
+
+Needs opentelemetry-sdk (optional dependency); skipped without it.
+"""
+
+import httpx
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+pytest.importorskip("opentelemetry.sdk")
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter  # noqa: E402
+
+from app.core import tracing  # noqa: E402
+from app.db import metrics  # noqa: E402
+from app.main import app  # noqa: E402
+from tests.conftest import SCENARIO  # noqa: E402
+
+
+@pytest.fixture
+def exporter():
+    exporter = InMemorySpanExporter()
+    tracing.configure_tracing(exporter=exporter, sample_ratio=1.0)
+    yield exporter
+    tracing.shutdown_tracing()
+
+
+def finished(exporter):
+    tracing.force_flush()
+    return exporter.get_finished_spans()
+
+
+async def test_message_turn_spans(exporter, offline_app):  # noqa: F811
+    """Test that one /messages request traces its nodes and LLM calls under the request span"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        session_id = (await client.post("/v1/sessions", json={})).json()["id"]
+        exporter.clear()
+        response = await client.post(f"/v1/sessions/{session_id}/messages", json={"content": SCENARIO.turns[0].text})
+        assert response.status_code == 200
+
+    spans = {span.name: span for span in finished(exporter)}
+    request = spans["POST /v1/sessions/{session_id}/messages"]
+    assert request.attributes["session.id"] == session_id
+    assert request.attributes["http.status_code"] == 200
+
+    for name in (
+        "session_service.SessionUnitOfWork.load",
+        "graph.load_checkpoint",
+        "graph.run",
+        "graph.interviewer",
+        "llm.interviewer.extraction",
+        "llm.interviewer.question",
+        "checkpoint.serialize",
+        "session_service.SessionUnitOfWork.commit",
+    ):
+        assert spans[name].context.trace_id == request.context.trace_id, name
+        assert spans[name].attributes["session.id"] == session_id, name
+
+    question = spans["llm.interviewer.question"]
+    assert question.parent.span_id == spans["graph.interviewer"].context.span_id
+    assert question.attributes["gen_ai.request.model"] == "fake"
+    assert question.attributes["gen_ai.usage.input_tokens"] > 0
+    assert question.attributes["gen_ai.usage.output_tokens"] > 0
+    assert spans["graph.load_checkpoint"].attributes["checkpoint.hit"] is False
+
+
+async def test_database_statement_spans(exporter, tmp_path):
+    """Test one span per statement on instrumented engines, failed statements included"""
+    engine = metrics.instrument_engine(create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'trace.db'}"), "tracing-test")
+    try:
+        with tracing.span("parent", session_id="s-1"):
+            async with engine.connect() as conn:
+                await conn.execute(text("select 1"))
+                with pytest.raises(Exception):
+                    await conn.execute(text("select * from missing_table"))
+    finally:
+        metrics._engines.pop("tracing-test", None)
+        metrics._pool_metrics.pop("tracing-test", None)
+        await engine.dispose()
+
+    queries = [span for span in finished(exporter) if span.name == "db.query"]
+    assert [span.attributes["db.statement"] for span in queries] == ["select 1", "select * from missing_table"]
+    assert all(span.attributes["session.id"] == "s-1" for span in queries)
+    assert queries[0].status.is_ok
+    assert not queries[1].status.is_ok
+
+
+async def test_sampling_and_disabled_tracing():
+    """Test that dropped traces record nothing and disabled tracing yields no span"""
+    exporter = InMemorySpanExporter()
+    tracing.configure_tracing(exporter=exporter, sample_ratio=0.0)
+    try:
+        with tracing.span("unsampled", {"a": 1}) as current:
+            assert not current.is_recording()
+            # Children of a dropped trace are not created at all
+            with tracing.span("child") as child:
+                assert child is None
+            assert tracing.start_span("db.query") is None
+        assert finished(exporter) == ()
+    finally:
+        tracing.shutdown_tracing()
+
+    with tracing.span("off") as current:
+        assert current is None
+    assert not tracing.tracing_enabled()
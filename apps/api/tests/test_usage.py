@@ -0,0 +1,107 @@
+"""
+Tests for per-session token accounting and the budget degraded modes.
+"""
+
+import httpx
+
+from app.agents import interviewer as interviewer_module
+from app.agents.state import create_initial_state
+from app.agents.usage import track_usage
+from app.core import metrics
+from app.core.config import settings
+from app.main import app
+from tests.conftest import SCENARIO
+
+
+async def send(client, session_id, text):
+    response = await client.post(f"/v1/sessions/{session_id}/messages", json={"content": text})
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_usage_is_aggregated_per_session_and_user(offline_app, monkeypatch):  # noqa: F811
+    """Test that each turn's usage lands in message_metadata, the session and the user totals"""
+    monkeypatch.setattr(settings, "LLM_PRICES", {"fake": (1.0, 2.0)})
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        session_id = (await client.post("/v1/sessions", json={"user_id": "u-usage"})).json()["id"]
+        turns = [await send(client, session_id, turn.text) for turn in SCENARIO.turns[:2]]
+        session = (await client.get(f"/v1/sessions/{session_id}")).json()
+        user = (await client.get("/v1/users/u-usage/usage")).json()
+
+    per_turn = [turn["message_metadata"]["usage"] for turn in turns]
+    assert [turn["calls"] for turn in per_turn] == [2, 2]  # extraction + question
+    assert all(turn["budget_mode"] == "normal" and turn["cost_usd"] > 0 for turn in per_turn)
+
+    usage = session["usage"]
+    assert usage["input_tokens"] == sum(turn["input_tokens"] for turn in per_turn)
+    assert usage["total_tokens"] == per_turn[-1]["session_tokens"]
+    assert usage["llm_calls"] == 4
+    assert usage["by_agent"]["interviewer"]["calls"] == 4
+    assert usage["by_agent"]["interviewer"]["cost_usd"] == usage["cost_usd"]
+
+    assert user["session_count"] == 1
+    assert user["usage"]["total_tokens"] == usage["total_tokens"]
+
+
+async def test_budget_switches_model_and_forces_diagnosis(offline_app, monkeypatch):  # noqa: F811
+    """Test that a session past its budgets moves the interviewer to the cheap model and goes to diagnosis"""
+    def calls(agent, model):
+        return metrics.registry.get_sample_value(
+            "llm_request_duration_seconds_count", {"agent": agent, "model": model}
+        ) or 0.0
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        session_id = (await client.post("/v1/sessions", json={})).json()["id"]
+        first = await send(client, session_id, SCENARIO.turns[0].text)
+        assert first["message_metadata"]["phase"] == "interview"
+
+        spent = first["message_metadata"]["usage"]["session_tokens"]
+        monkeypatch.setattr(settings, "OPENAI_MODEL_CHEAP", "fake-mini")
+        monkeypatch.setattr(settings, "TOKEN_BUDGET_CHEAP_MODEL", 1)
+        monkeypatch.setattr(settings, "TOKEN_BUDGET_FORCE_DIAGNOSIS", spent)
+        before = {key: calls(*key) for key in (("interviewer", "fake-mini"), ("diagnostic", "fake"), ("diagnostic", "fake-mini"))}
+
+        second = await send(client, session_id, SCENARIO.turns[1].text)
+        assert (await client.get(f"/v1/sessions/{session_id}/diagnosis")).status_code == 200
+        session = (await client.get(f"/v1/sessions/{session_id}")).json()
+
+    assert second["message_metadata"]["usage"]["budget_mode"] == "force_diagnosis"
+    assert second["message_metadata"]["usage"]["calls"] == 2  # extraction + diagnosis, no question
+    # The extraction moves to the cheap model; the diagnosis keeps its own
+    assert {key: calls(*key) - count for key, count in before.items()} == {
+        ("interviewer", "fake-mini"): 1, ("diagnostic", "fake"): 1, ("diagnostic", "fake-mini"): 0
+    }
+    assert session["usage"]["budget_mode"] == "force_diagnosis"
+    assert session["usage"]["by_agent"]["diagnostic"]["calls"] == 1
+
+
+def test_budgets_are_off_by_default():
+    """Test that no degraded mode is reached without configured budgets"""
+    from app.core.config import Settings
+
+    defaults = Settings(_env_file=None)
+    assert (defaults.TOKEN_BUDGET_SUMMARIZE, defaults.TOKEN_BUDGET_CHEAP_MODEL, defaults.TOKEN_BUDGET_FORCE_DIAGNOSIS) == (0, 0, 0)
+    assert "diagnostic" not in defaults.CHEAP_MODEL_AGENTS
+
+
+def test_summarize_mode_truncates_history(monkeypatch):
+    """Test that past the summarize budget the interviewer sends only recent messages"""
+    state = create_initial_state("s-summary")
+    state["messages"] = [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"mensaje {i}"} for i in range(10)
+    ]
+    state["questions_asked"] = ["¿Desde cuándo?"]
+    agent = interviewer_module.interviewer_agent
+    monkeypatch.setattr(settings, "TOKEN_BUDGET_SUMMARIZE", 100)
+
+    with track_usage(base_tokens=99):
+        full = agent._build_messages(state)
+    with track_usage(base_tokens=100):
+        summarized = agent._build_messages(state)
+
+    assert len(full) == 10 + 3  # system, context, history, instruction
+    assert len(summarized) == settings.SUMMARY_RECENT_MESSAGES + 3
+    assert summarized[2].content == "mensaje 6"
+    assert "¿Desde cuándo?" in summarized[1].content
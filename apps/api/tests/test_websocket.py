@@ -0,0 +1,174 @@
+"""
+Tests for the WebSocket chat channel (/v1/sessions/{id}/ws), driven over ASGI
+against the offline app.
+"""
+
+import asyncio
+import base64
+import json
+from typing import List, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.main import app
+from app.services.channels import channels
+from loadtest.run import sample_image
+from tests.conftest import SCENARIO
+
+
+class SocketClient:
+    """A WebSocket client talking to the app's ASGI callable directly"""
+
+    def __init__(self, path: str, query: str = "", pending: int = 0):
+        self.scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws",
+            "path": path, "raw_path": path.encode(), "root_path": "", "query_string": query.encode(),
+            "headers": [], "server": ("test", 80), "client": ("test", 1234), "subprotocols": [],
+        }
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        # Bounded: a client that stops reading blocks the server's sends
+        self.outgoing: asyncio.Queue = asyncio.Queue(pending)
+        self.task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> dict:
+        self.task = asyncio.create_task(app(self.scope, self.incoming.get, self.outgoing.put))
+        await self.incoming.put({"type": "websocket.connect"})
+        assert (await self.next_message())["type"] == "websocket.accept"
+        return await self.receive()
+
+    async def next_message(self) -> dict:
+        return await asyncio.wait_for(self.outgoing.get(), 10)
+
+    async def send(self, frame: dict) -> None:
+        await self.incoming.put({"type": "websocket.receive", "text": json.dumps(frame)})
+
+    async def receive(self) -> dict:
+        message = await self.next_message()
+        assert message["type"] == "websocket.send", message
+        return json.loads(message["text"])
+
+    async def until(self, event_type: str) -> List[dict]:
+        """Events up to and including the first of event_type"""
+        received = []
+        while not received or received[-1]["type"] != event_type:
+            received.append(await self.receive())
+        return received
+
+    async def disconnect(self) -> None:
+        await self.incoming.put({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.wait_for(self.task, 10)
+
+
+async def create_session() -> str:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return (await client.post("/v1/sessions", json={})).json()["id"]
+
+
+async def test_socket_streams_turns_and_diagnosis(offline_app):
+    """Test a message, an image and finalize over one connection, with streamed tokens and progress"""
+    session_id = await create_session()
+    socket = SocketClient(f"/v1/sessions/{session_id}/ws")
+    hello = await socket.connect()
+    assert hello == {"type": "hello", "session_id": session_id, "channel": hello["channel"], "seq": 0}
+
+    await socket.send({"type": "message", "content": SCENARIO.turns[0].text, "id": "t1"})
+    turn = await socket.until("message")
+    assert [event["seq"] for event in turn] == list(range(1, len(turn) + 1))
+    assert turn[0]["type"] == "extraction"
+    tokens = [event["text"] for event in turn if event["type"] == "token"]
+    assert len(tokens) > 1
+    assert "".join(tokens) == turn[-1]["message"]["content"] == SCENARIO.questions[0]
+    assert turn[-1]["reply_to"] == "t1"
+
+    data = base64.b64encode(sample_image()).decode()
+    await socket.send({"type": "image", "filename": "lesion.png", "content_type": "image/png", "data": data})
+    upload = await socket.until("message")
+    assert [event["type"] for event in upload] == ["image_analyzed", "image_uploaded", "message"]
+    assert upload[-1]["message"]["images"] == [upload[1]["upload"]["url"]]
+
+    await socket.send({"type": "finalize", "id": "f"})
+    finalize = await socket.until("diagnosis")
+    assert {"similar_cases", "assessment"} <= {e["stage"] for e in finalize if e["type"] == "diagnosis_progress"}
+    assert finalize[-1]["assessment"]["differentials"][0]["name"] == SCENARIO.assessment["differentials"][0]["name"]
+    # Each piece of the assessment streamed, validated, before the whole of it
+    partials = {(e["section"], e["index"]): e["item"] for e in finalize if e["type"] == "assessment_partial"}
+    assessment = finalize[-1]["assessment"]
+    assert partials[("red_flags", 0)] == assessment["red_flags"][0]
+    assert partials[("soap", None)] == assessment["soap"]
+    assert [partials[("differentials", i)] for i in range(len(assessment["differentials"]))] == assessment["differentials"]
+    assert finalize[-1]["reply_to"] == "f"
+    await socket.disconnect()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        messages = (await client.get(f"/v1/sessions/{session_id}/messages")).json()["messages"]
+    assert [m["role"] for m in messages] == ["user", "assistant", "assistant", "assistant"]
+
+
+async def test_socket_resumes_from_last_seq(offline_app):
+    """Test that a turn finishes after the client leaves and its events are replayed on reconnect"""
+    session_id = await create_session()
+    socket = SocketClient(f"/v1/sessions/{session_id}/ws")
+    channel = (await socket.connect())["channel"]
+    await socket.send({"type": "message", "content": SCENARIO.turns[0].text})
+    await socket.disconnect()
+
+    resumed = SocketClient(f"/v1/sessions/{session_id}/ws", f"channel={channel}&last_seq=0")
+    hello = await resumed.connect()
+    missed = await resumed.until("message")
+    assert [event["seq"] for event in missed] == list(range(1, hello["seq"] + 1))
+    assert missed[-1]["message"]["content"] == SCENARIO.questions[0]
+    await resumed.disconnect()
+
+    # Unknown channel (another worker, or expired): the client must resync over HTTP
+    stale = SocketClient(f"/v1/sessions/{session_id}/ws", "channel=other&last_seq=3")
+    await stale.connect()
+    assert await stale.receive() == {"type": "resync"}
+    await stale.disconnect()
+
+
+async def test_socket_heartbeat_and_backpressure(offline_app, monkeypatch):
+    """Test that silent clients are pinged then closed, and clients that stop reading are dropped"""
+    session_id = await create_session()
+    monkeypatch.setattr(settings, "WS_HEARTBEAT_SECONDS", 0.05)
+    silent = SocketClient(f"/v1/sessions/{session_id}/ws")
+    await silent.connect()
+    assert await silent.receive() == {"type": "ping"}
+    assert (await silent.next_message())["code"] == 4408
+    await asyncio.wait_for(silent.task, 10)
+
+    monkeypatch.setattr(settings, "WS_HEARTBEAT_SECONDS", 20.0)
+    monkeypatch.setattr(settings, "WS_SEND_QUEUE_SIZE", 2)
+    slow = SocketClient(f"/v1/sessions/{session_id}/ws", pending=1)
+    slow.task = asyncio.create_task(app(slow.scope, slow.incoming.get, slow.outgoing.put))
+    await slow.incoming.put({"type": "websocket.connect"})
+    while channels.get(session_id) is None or not channels.get(session_id).subscribers:
+        await asyncio.sleep(0.01)
+    subscriber = next(iter(channels.get(session_id).subscribers))
+    await slow.send({"type": "message", "content": SCENARIO.turns[0].text})
+    # Not reading: the turn's events pile up until the connection is dropped
+    await asyncio.wait_for(subscriber.overflowed.wait(), 10)
+    received = []
+    while not received or received[-1]["type"] != "websocket.close":
+        received.append(await slow.next_message())
+    assert received[-1]["code"] == 1013
+    await asyncio.wait_for(slow.task, 10)
+
+
+async def test_socket_unknown_session_and_bad_frames(offline_app):
+    """Test the close code for unknown sessions and errors for invalid frames"""
+    missing = SocketClient("/v1/sessions/nope/ws")
+    assert (await missing.connect())["status"] == 404
+    assert (await missing.next_message())["code"] == 4404
+
+    session_id = await create_session()
+    socket = SocketClient(f"/v1/sessions/{session_id}/ws")
+    await socket.connect()
+    await socket.send({"type": "dance"})
+    assert (await socket.receive())["status"] == 400
+    await socket.send({"type": "message", "content": "", "id": 7})
+    error = await socket.receive()
+    assert (error["type"], error["status"], error["reply_to"]) == ("error", 422, 7)
+    await socket.send({"type": "ping"})
+    assert await socket.receive() == {"type": "pong"}
+    await socket.disconnect()
@@ -18,6 +18,8 @@ interface DifferentialDx {
 
 interface DiagnosticPanelProps {
   assessment: any;
+  // Evaluación en curso: solo las secciones recibidas hasta ahora
+  partial?: boolean;
 }
 
 const urgencyColors = {
@@ -32,7 +34,7 @@ const severityColors = {
   info: "#3b82f6"
 };
 
-export default function DiagnosticPanel({ assessment }: DiagnosticPanelProps) {
+export default function DiagnosticPanel({ assessment, partial = false }: DiagnosticPanelProps) {
   const [expandedSections, setExpandedSections] = useState<Record<string, boolean>>({
     differentials: true,
     redFlags: true,
@@ -105,27 +107,29 @@ export default function DiagnosticPanel({ assessment }: DiagnosticPanelProps) {
         </div>
         <div>
           <h2 style={{ fontSize: 24, fontWeight: 700, color: '#78350f', margin: 0 }}>
-            Evaluación Diagnóstica Completa
+            {partial ? 'Evaluación Diagnóstica en Curso' : 'Evaluación Diagnóstica Completa'}
           </h2>
           <p style={{ fontSize: 14, color: '#92400e', margin: 0 }}>
-            Análisis generado por el sistema de agentes
+            {partial ? 'Las secciones aparecen a medida que se generan' : 'Análisis generado por el sistema de agentes'}
           </p>
         </div>
       </div>
 
       {/* Resumen del Paciente */}
-      <div style={{ 
-        background: 'white', 
-        borderRadius: 12, 
-        padding: 20, 
-        marginBottom: 16,
-        border: '1px solid #e5e7eb'
-      }}>
-        <h3 style={{ fontSize: 16, fontWeight: 700, color: '#2563eb', marginBottom: 8 }}>
-          📝 Resumen del Paciente
-        </h3>
-        <p style={{ color: '#374151', lineHeight: 1.6, margin: 0 }}>{assessment.patient_summary}</p>
-      </div>
+      {assessment.patient_summary && (
+        <div style={{ 
+          background: 'white', 
+          borderRadius: 12, 
+          padding: 20, 
+          marginBottom: 16,
+          border: '1px solid #e5e7eb'
+        }}>
+          <h3 style={{ fontSize: 16, fontWeight: 700, color: '#2563eb', marginBottom: 8 }}>
+            📝 Resumen del Paciente
+          </h3>
+          <p style={{ color: '#374151', lineHeight: 1.6, margin: 0 }}>{assessment.patient_summary}</p>
+        </div>
+      )}
 
       {/* Diagnósticos Diferenciales */}
       {assessment.differentials?.length > 0 && (
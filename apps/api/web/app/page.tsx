@@ -26,9 +26,22 @@ export default function Page() {
   const [showWelcome, setShowWelcome] = useState(true);
   const [diagnosisProgress, setDiagnosisProgress] = useState<string | null>(null);
   const [isGeneratingDiagnosis, setIsGeneratingDiagnosis] = useState(false);
+  // Partes de la evaluación recibidas mientras se genera (assessment_partial)
+  const [partialDiagnostic, setPartialDiagnostic] = useState<any>(null);
   
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  // Sincronización incremental: último mensaje del servidor y ETag de la sesión
+  const lastServerMessageId = useRef<number | null>(null);
+  const sessionEtag = useRef<string | null>(null);
+  // Canal WebSocket: canal y último evento recibido (para reanudar al reconectar)
+  const socketRef = useRef<WebSocket | null>(null);
+  const socketChannel = useRef<string | null>(null);
+  const lastSeq = useRef<number | null>(null);
+  const reconnectAttempts = useRef(0);
   const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
+  const WS_URL = API_URL.replace(/^http/, 'ws');
+  // Id del mensaje del asistente que se está recibiendo token a token
+  const STREAMING_ID = -1;
 
   // Auto-scroll to bottom cuando hay nuevos mensajes
   const scrollToBottom = () => {
@@ -44,6 +57,144 @@ export default function Page() {
     createSession();
   }, []);
 
+  // Un WebSocket por sesión: mensajes, imágenes y diagnóstico por la misma conexión
+  useEffect(() => {
+    if (!sessionId) return;
+    socketChannel.current = null;
+    lastSeq.current = null;
+    reconnectAttempts.current = 0;
+    let closed = false;
+    let retry: ReturnType<typeof setTimeout> | undefined;
+
+    const connect = () => {
+      const resume = socketChannel.current && lastSeq.current !== null
+        ? `?channel=${socketChannel.current}&last_seq=${lastSeq.current}`
+        : '';
+      const socket = new WebSocket(`${WS_URL}/v1/sessions/${sessionId}/ws${resume}`);
+      socketRef.current = socket;
+
+      socket.onmessage = (event) => handleSocketEvent(socket, JSON.parse(event.data));
+      socket.onclose = (event) => {
+        if (socketRef.current === socket) socketRef.current = null;
+        if (closed || event.code === 4404) return;
+        // Reconectar con backoff y reanudar desde el último evento
+        const delay = Math.min(1000 * 2 ** reconnectAttempts.current, 10000);
+        reconnectAttempts.current += 1;
+        retry = setTimeout(connect, delay);
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      socketRef.current?.close();
+      socketRef.current = null;
+    };
+  }, [sessionId]);
+
+  const socketOpen = () => socketRef.current?.readyState === WebSocket.OPEN;
+
+  // Una pieza validada de la evaluación: la misma sección e índice la reemplaza.
+  // El servidor envía los elementos de cada lista en orden, sin huecos
+  const addAssessmentPartial = (data: any) => {
+    setPartialDiagnostic((prev: any) => {
+      const next = { ...(prev || {}) };
+      if (data.index === null || data.index === undefined) {
+        next[data.section] = data.item;
+      } else {
+        const items = [...(next[data.section] || [])];
+        items[data.index] = data.item;
+        next[data.section] = items;
+      }
+      return next;
+    });
+  };
+
+  const handleSocketEvent = (socket: WebSocket | null, data: any) => {
+    if (data.type === 'hello') {
+      reconnectAttempts.current = 0;
+      if (socketChannel.current !== data.channel) {
+        socketChannel.current = data.channel;
+        lastSeq.current = data.seq;
+      }
+      return;
+    }
+    if (data.type === 'ping') {
+      socket?.send(JSON.stringify({ type: 'pong' }));
+      return;
+    }
+    if (data.type === 'resync') {
+      // Los eventos perdidos ya no están en el servidor: traer los mensajes por HTTP
+      refreshSession();
+      return;
+    }
+    if (data.seq !== undefined) {
+      if (lastSeq.current !== null && data.seq <= lastSeq.current) return;
+      lastSeq.current = data.seq;
+    }
+
+    switch (data.type) {
+      case 'token':
+        setTyping(false);
+        setMessages(prev => {
+          const last = prev[prev.length - 1];
+          if (last?.id === STREAMING_ID) {
+            return [...prev.slice(0, -1), { ...last, content: last.content + data.text }];
+          }
+          return [...prev, {
+            id: STREAMING_ID,
+            role: 'assistant',
+            content: data.text,
+            timestamp: new Date().toISOString()
+          }];
+        });
+        break;
+      case 'image_uploaded':
+        setUploading(false);
+        setMessages(prev => [...prev, {
+          id: Date.now(),
+          role: 'user',
+          content: '📷 Imagen subida',
+          images: [data.upload.url],
+          timestamp: new Date().toISOString()
+        }]);
+        break;
+      case 'message': {
+        const msg = data.message;
+        setMessages(prev => [
+          ...prev.filter(m => m.id !== STREAMING_ID && m.id !== msg.id),
+          { id: msg.id, role: msg.role, content: msg.content, images: msg.images, timestamp: msg.timestamp }
+        ]);
+        lastServerMessageId.current = msg.id;
+        setLoading(false);
+        setTyping(false);
+        break;
+      }
+      case 'diagnosis_progress':
+        setDiagnosisProgress(data.message);
+        break;
+      case 'assessment_partial':
+        addAssessmentPartial(data);
+        break;
+      case 'diagnosis':
+        setDiagnostic(data.assessment);
+        setSessionStatus('completed');
+        setDiagnosisProgress(null);
+        setIsGeneratingDiagnosis(false);
+        break;
+      case 'error':
+        setError(data.error || 'Error al comunicarse con el servidor');
+        setMessages(prev => prev.filter(m => m.id !== STREAMING_ID));
+        setLoading(false);
+        setTyping(false);
+        setUploading(false);
+        setDiagnosisProgress(null);
+        setIsGeneratingDiagnosis(false);
+        break;
+    }
+  };
+
   const createSession = async () => {
     const maxRetries = 3;
     const baseDelayMs = 1000;
@@ -67,6 +218,8 @@ export default function Page() {
 
           const data = await response.json();
           setSessionId(data.id);
+          lastServerMessageId.current = null;
+          sessionEtag.current = null;
 
           const welcomeMessage: Message = {
             id: 0,
@@ -110,34 +263,40 @@ export default function Page() {
     setTyping(true);
     setError(null);
 
+    if (socketOpen()) {
+      // La respuesta llega por el socket, token a token
+      socketRef.current!.send(JSON.stringify({ type: 'message', content }));
+      return;
+    }
+
     try {
-      const response = await fetch(`${API_URL}/v1/sessions/${sessionId}/messages`, {
+      // Sin socket: la misma respuesta en streaming por SSE
+      const response = await fetch(`${API_URL}/v1/sessions/${sessionId}/messages/stream`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ content })
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error('Error al enviar el mensaje');
       }
 
-      const data = await response.json();
-      
-      // Agregar respuesta del asistente
-      const assistantMessage: Message = {
-        id: data.id,
-        role: 'assistant',
-        content: data.content,
-        images: data.images,
-        timestamp: data.timestamp
-      };
-      
-      setMessages(prev => [...prev, assistantMessage]);
-
-      // Verificar si hay un diagnóstico en el message_metadata
-      if (data.message_metadata?.final_diagnosis) {
-        // Cargar el diagnóstico
-        loadDiagnosis();
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const blocks = buffer.split('\n\n');
+        buffer = blocks.pop() ?? '';
+        for (const block of blocks) {
+          const dataLine = block.split('\n').find(line => line.startsWith('data: '));
+          if (!dataLine) continue;
+          const event = JSON.parse(dataLine.slice('data: '.length));
+          // complete trae el mensaje persistido (id y metadata), como el evento message del socket
+          handleSocketEvent(null, event.type === 'complete' ? { type: 'message', message: event.message } : event);
+        }
       }
     } catch (err) {
       setError('Error al comunicarse con el servidor');
@@ -154,6 +313,26 @@ export default function Page() {
     setUploading(true);
     setError(null);
 
+    if (socketOpen()) {
+      // El análisis llega por el socket (image_uploaded y luego el mensaje)
+      const reader = new FileReader();
+      reader.onload = () => {
+        const data = (reader.result as string).split(',', 2)[1];
+        socketRef.current?.send(JSON.stringify({
+          type: 'image',
+          filename: file.name,
+          content_type: file.type,
+          data
+        }));
+      };
+      reader.onerror = () => {
+        setError('Error al leer la imagen');
+        setUploading(false);
+      };
+      reader.readAsDataURL(file);
+      return;
+    }
+
     try {
       const formData = new FormData();
       formData.append('file', file);
@@ -198,22 +377,43 @@ export default function Page() {
     if (!sessionId) return;
 
     try {
-      const response = await fetch(`${API_URL}/v1/sessions/${sessionId}`);
+      // Solo el estado de la sesión; 304 si nada cambió desde la última consulta
+      const headers: Record<string, string> = {};
+      if (sessionEtag.current) {
+        headers['If-None-Match'] = sessionEtag.current;
+      }
+      const sessionResponse = await fetch(
+        `${API_URL}/v1/sessions/${sessionId}?include_messages=false`,
+        { headers, cache: 'no-store' }
+      );
+
+      if (sessionResponse.status === 304 || !sessionResponse.ok) return;
+      sessionEtag.current = sessionResponse.headers.get('ETag');
+
+      // Traer solo los mensajes nuevos
+      const since = lastServerMessageId.current;
+      const query = since !== null ? `?since=${since}` : '';
+      const response = await fetch(`${API_URL}/v1/sessions/${sessionId}/messages${query}`);
       
       if (!response.ok) return;
 
       const data = await response.json();
       
-      // Actualizar mensajes con los del servidor
-      if (data.messages && data.messages.length > messages.length) {
-        const serverMessages = data.messages.map((msg: any) => ({
-          id: msg.id,
-          role: msg.role,
-          content: msg.content,
-          images: msg.images,
-          timestamp: msg.timestamp
-        }));
-        setMessages(serverMessages);
+      if (data.messages && data.messages.length > 0) {
+        const newMessages: Message[] = data.messages
+          .filter((msg: any) => since === null || msg.id > since)
+          .map((msg: any) => ({
+            id: msg.id,
+            role: msg.role,
+            content: msg.content,
+            images: msg.images,
+            timestamp: msg.timestamp
+          }));
+        lastServerMessageId.current = data.last_id;
+        setMessages(prev => {
+          const known = new Set(prev.map(m => m.id));
+          return [...prev, ...newMessages.filter(m => !known.has(m.id))];
+        });
       }
     } catch (err) {
       console.error('Error al refrescar la sesión:', err);
@@ -245,8 +445,14 @@ export default function Page() {
 
     setIsGeneratingDiagnosis(true);
     setDiagnosisProgress('Iniciando análisis diagnóstico...');
+    setPartialDiagnostic(null);
     setError(null);
 
+    if (socketOpen()) {
+      socketRef.current!.send(JSON.stringify({ type: 'finalize' }));
+      return;
+    }
+
     try {
       // Use EventSource for Server-Sent Events
       const eventSource = new EventSource(`${API_URL}/v1/sessions/${sessionId}/finalize`);
@@ -256,6 +462,10 @@ export default function Page() {
         setDiagnosisProgress(data.message);
       });
       
+      eventSource.addEventListener('assessment_partial', (event) => {
+        addAssessmentPartial(JSON.parse(event.data));
+      });
+      
       eventSource.addEventListener('complete', (event) => {
         const data = JSON.parse(event.data);
         setDiagnostic(data.assessment);
@@ -294,7 +504,10 @@ export default function Page() {
 
   const startNewSession = () => {
     setMessages([]);
+    lastServerMessageId.current = null;
+    sessionEtag.current = null;
     setDiagnostic(null);
+    setPartialDiagnostic(null);
     setSessionStatus('active');
     setError(null);
     setShowWelcome(true);
@@ -617,6 +830,11 @@ export default function Page() {
             </div>
           )}
 
+          {/* Evaluación parcial mientras se genera */}
+          {!diagnostic && isGeneratingDiagnosis && partialDiagnostic && (
+            <DiagnosticPanel assessment={partialDiagnostic} partial />
+          )}
+
           {/* Panel de diagnóstico */}
           {diagnostic && (
             <DiagnosticPanel assessment={diagnostic} />